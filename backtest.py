@@ -0,0 +1,414 @@
+"""
+平仓信号回测模块
+用存档的历史成交（见 fill_archive.py）和本地K线回放机器人的决策：
+- 信号由 SignalRuleEngine 逐笔判定，与实盘使用同一套规则
+- 只交易 TRADING_PAIRS 中的币种，同一币种开单后在平仓前不再开单（与 trade_state 一致），
+  rearm=False 时每个币种只开一次（未启用对账时的实盘行为）
+- 开空后按止盈、止损、强平和最长持仓时间离场
+
+离场计算用 NumPy 向量化：每个入场K线预先计算持仓期间的最高涨幅/最大跌幅（单调序列），
+所有参数组合同时二分查找首次触发的K线，参数扫描的耗时与组合数近似线性
+
+用法:
+    python backtest.py --bars BTCUSDT=BTCUSDT-1m.csv --bars ETHUSDT=ETHUSDT-1m.csv \\
+        --leverage 5 10 20 --tp 0 0.02 0.05 --sl 0 0.03 --hold-hours 4 24 72
+"""
+import argparse
+import csv
+import logging
+import time
+from itertools import product
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+from signal_rules import SignalRuleEngine
+
+logger = logging.getLogger(__name__)
+
+# 维持保证金率（近似值，用于估算逐仓空单的强平价）
+MAINTENANCE_MARGIN_RATE = 0.004
+# 币安U本位合约吃单手续费率
+TAKER_FEE_RATE = 0.0005
+
+# 离场原因
+EXIT_HOLD = 0  # 达到最长持仓时间（或K线数据结束）
+EXIT_TAKE_PROFIT = 1
+EXIT_STOP_LOSS = 2
+EXIT_LIQUIDATION = 3
+
+# 参数网格的列
+GRID_COLUMNS = ('leverage', 'position_size_usdc', 'take_profit_pct', 'stop_loss_pct', 'max_hold_hours', 'proportional')
+
+
+def load_price_bars(path: str) -> Dict[str, np.ndarray]:
+    """
+    读取币安K线CSV（data.binance.vision 格式：开盘时间,开,高,低,收,...，可带表头）
+
+    Args:
+        path: CSV文件路径
+
+    Returns:
+        包含 time(毫秒)/open/high/low/close 数组的字典，按时间升序
+    """
+    rows = []
+    with open(path, newline='') as f:
+        for row in csv.reader(f):
+            if row and row[0].strip().isdigit():
+                rows.append(row[:5])
+    data = np.array(rows, dtype=np.float64).reshape(-1, 5)
+    data = data[np.argsort(data[:, 0], kind='stable')]
+    times = data[:, 0].astype(np.int64)
+    if len(times) and times[0] > 10 ** 14:
+        times //= 1000  # 新版数据的时间为微秒
+    return {'time': times, 'open': data[:, 1], 'high': data[:, 2], 'low': data[:, 3], 'close': data[:, 4]}
+
+
+def extract_signals(fills: Iterable[Dict], rule_engine: SignalRuleEngine, address: str) -> Dict[str, np.ndarray]:
+    """
+    按时间顺序用规则引擎判定平仓信号（与实盘 parse_fills 完全一致）
+
+    Args:
+        fills: 按时间升序的 userFills 格式成交
+        rule_engine: 平仓信号规则引擎
+        address: 成交所属的地址
+
+    Returns:
+        包含 time/coin/close_fraction 数组的字典
+    """
+    signals = rule_engine.parse_fills(fills, address, set())
+    return {
+        'time': np.array([s['timestamp'] for s in signals], dtype=np.int64),
+        'coin': np.array([s['coin'] for s in signals], dtype=object),
+        'close_fraction': np.array([s.get('close_fraction', 1.0) or 1.0 for s in signals], dtype=np.float64)
+    }
+
+
+def make_grid(**params) -> Dict[str, np.ndarray]:
+    """
+    生成参数网格（各参数取值的笛卡尔积）
+
+    Args:
+        params: GRID_COLUMNS 中的参数名 -> 取值列表，未给出的参数使用默认值
+
+    Returns:
+        参数名 -> 等长数组的字典
+    """
+    defaults = {
+        'leverage': [10], 'position_size_usdc': [100.0], 'take_profit_pct': [0.0],
+        'stop_loss_pct': [0.0], 'max_hold_hours': [24.0], 'proportional': [False]
+    }
+    unknown = set(params) - set(defaults)
+    if unknown:
+        raise ValueError(f"未知的回测参数: {', '.join(sorted(unknown))}")
+    values = [list(params.get(name, defaults[name])) for name in GRID_COLUMNS]
+    combos = list(product(*values))
+    return {name: np.array([combo[i] for combo in combos]) for i, name in enumerate(GRID_COLUMNS)}
+
+
+def _first_reach(matrix: np.ndarray, rows: np.ndarray, levels: np.ndarray) -> np.ndarray:
+    """
+    对每行单调不减的矩阵做向量化二分查找
+
+    Args:
+        matrix: 每行单调不减的二维数组
+        rows: 每个查询使用的行号
+        levels: 每个查询的阈值
+
+    Returns:
+        每个查询在对应行中第一个 >= 阈值的列号，达不到时为列数
+    """
+    columns = matrix.shape[1]
+    lo = np.zeros(len(rows), dtype=np.int64)
+    hi = np.full(len(rows), columns, dtype=np.int64)
+    while True:
+        searching = lo < hi
+        if not searching.any():
+            return lo
+        mid = (lo + hi) // 2
+        below = matrix[rows, np.minimum(mid, columns - 1)] < levels
+        lo = np.where(searching & below, mid + 1, lo)
+        hi = np.where(searching & ~below, mid, hi)
+
+
+class Backtester:
+    """平仓信号跟单开空的回测类"""
+
+    def __init__(self, signals: Dict[str, np.ndarray], bars: Dict[str, Dict[str, np.ndarray]],
+                 trading_pairs: Dict[str, str], latency_ms: int = 0, slippage_bps: float = 0.0,
+                 fee_rate: float = TAKER_FEE_RATE, rearm: bool = True, min_scale: float = 0.1):
+        """
+        初始化回测
+
+        Args:
+            signals: extract_signals 返回的信号
+            bars: 交易对 -> load_price_bars 返回的K线
+            trading_pairs: 币种 -> 币安交易对
+            latency_ms: 信号到下单的延迟，入场价取延迟后第一根K线的开盘价
+            slippage_bps: 入场滑点（基点）
+            fee_rate: 开仓和平仓的手续费率
+            rearm: 平仓后是否重新允许该币种开单（对应启用对账），False 时每个币种只开一次
+            min_scale: 按比例开仓时的最小缩放比例（POSITION_SIZE_MIN_SCALE）
+        """
+        self.signals = signals
+        self.bars = bars
+        self.trading_pairs = trading_pairs
+        self.latency_ms = latency_ms
+        self.slippage = slippage_bps / 10000
+        self.fee_rate = fee_rate
+        self.rearm = rearm
+        self.min_scale = min_scale
+
+    def run(self, grid: Dict[str, np.ndarray]) -> Dict:
+        """
+        对参数网格中的所有组合同时回测
+
+        Args:
+            grid: make_grid 返回的参数网格
+
+        Returns:
+            {'grid': 参数网格, 'summary': 每个组合的统计数组, 'trades': 全部交易明细数组}
+        """
+        started = time.perf_counter()
+        configs = len(grid['leverage'])
+        leverage = grid['leverage'].astype(np.float64)
+        liquidation_level = 1.0 / leverage - MAINTENANCE_MARGIN_RATE
+        stop_level = np.where(grid['stop_loss_pct'] > 0,
+                              np.minimum(grid['stop_loss_pct'], liquidation_level), liquidation_level)
+        take_profit_level = np.where(grid['take_profit_pct'] > 0, grid['take_profit_pct'], np.inf)
+
+        trades = []
+        for coin in np.unique(self.signals['coin']):
+            symbol = self.trading_pairs.get(coin)
+            if symbol is None:
+                continue
+            if symbol not in self.bars:
+                logger.warning(f"⚠️  缺少 {symbol} 的K线数据，跳过 {coin} 的信号")
+                continue
+            trades.extend(self._run_coin(coin, self.bars[symbol], grid, stop_level, liquidation_level,
+                                         take_profit_level))
+
+        result = self._summarize(grid, trades, configs)
+        logger.info(f"回测完成: {configs} 个参数组合, {len(result['trades']['config'])} 笔交易, "
+                    f"耗时 {time.perf_counter() - started:.2f}秒")
+        return result
+
+    def _run_coin(self, coin: str, bars: Dict[str, np.ndarray], grid: Dict[str, np.ndarray],
+                  stop_level: np.ndarray, liquidation_level: np.ndarray,
+                  take_profit_level: np.ndarray) -> List[Dict[str, np.ndarray]]:
+        """回测单个币种：所有参数组合同时沿信号序列推进"""
+        mask = self.signals['coin'] == coin
+        order = np.argsort(self.signals['time'][mask], kind='stable')
+        signal_times = self.signals['time'][mask][order]
+        fractions = self.signals['close_fraction'][mask][order]
+
+        bar_count = len(bars['time'])
+        if bar_count < 2:
+            return []
+        interval = int(np.median(np.diff(bars['time'])))
+
+        # 入场K线：延迟后第一根开盘的K线；超出K线数据的信号无法入场
+        entry_bar = np.searchsorted(bars['time'], signal_times + self.latency_ms, side='left')
+        tradable = int(np.searchsorted(entry_bar, bar_count, side='left'))
+        if tradable == 0:
+            return []
+        signal_times, fractions, entry_bar = signal_times[:tradable], fractions[:tradable], entry_bar[:tradable]
+
+        # 同一根K线入场的信号共享持仓路径
+        unique_bars, path_of_signal = np.unique(entry_bar, return_inverse=True)
+        hold_bars = np.maximum(np.ceil(grid['max_hold_hours'] * 3600 * 1000 / interval).astype(np.int64), 1)
+        horizon = int(hold_bars.max())
+        path_index = np.minimum(unique_bars[:, None] + np.arange(horizon)[None, :], bar_count - 1)
+        entry_price = bars['open'][unique_bars] * (1 - self.slippage)
+        rise = (np.maximum.accumulate(bars['high'][path_index], axis=1) / entry_price[:, None] - 1).astype(np.float32)
+        drop = (1 - np.minimum.accumulate(bars['low'][path_index], axis=1) / entry_price[:, None]).astype(np.float32)
+        last_offset = np.minimum(bar_count - 1 - unique_bars, horizon - 1)
+
+        configs = len(hold_bars)
+        all_configs = np.arange(configs)
+        current = np.zeros(configs, dtype=np.int64)
+        trades = []
+        while True:
+            active = current < tradable
+            if not active.any():
+                break
+            config = all_configs[active]
+            signal = current[active]
+            path = path_of_signal[signal]
+
+            # 首次触发止损/强平和止盈的K线（同一根K线内同时触发时按先止损处理）
+            stop_offset = _first_reach(rise, path, stop_level[config].astype(np.float32))
+            take_profit_offset = _first_reach(drop, path, take_profit_level[config].astype(np.float32))
+            hold_offset = np.minimum(hold_bars[config] - 1, last_offset[path])
+            exit_offset = np.minimum(np.minimum(stop_offset, take_profit_offset), hold_offset)
+
+            exit_type = np.full(len(config), EXIT_HOLD, dtype=np.int8)
+            exit_type[take_profit_offset == exit_offset] = EXIT_TAKE_PROFIT
+            stopped = stop_offset == exit_offset
+            liquidated = stopped & (stop_level[config] >= liquidation_level[config])
+            exit_type[stopped] = EXIT_STOP_LOSS
+            exit_type[liquidated] = EXIT_LIQUIDATION
+
+            entry = entry_price[path]
+            exit_bar = unique_bars[path] + exit_offset
+            exit_price = np.where(exit_type == EXIT_TAKE_PROFIT, entry * (1 - take_profit_level[config]),
+                                  np.where(stopped, entry * (1 + stop_level[config]), bars['close'][exit_bar]))
+
+            scale = np.where(grid['proportional'][config], np.clip(fractions[signal], self.min_scale, 1.0), 1.0)
+            margin = grid['position_size_usdc'][config] * scale
+            notional = margin * grid['leverage'][config]
+            pnl = notional * (entry - exit_price) / entry - notional * self.fee_rate * (1 + exit_price / entry)
+            pnl = np.where(liquidated, -margin - notional * self.fee_rate, pnl)
+            exit_time = bars['time'][exit_bar] + interval
+
+            trades.append({
+                'config': config,
+                'coin': np.full(len(config), coin, dtype=object),
+                'entry_time': bars['time'][unique_bars[path]],
+                'exit_time': exit_time,
+                'entry_price': entry,
+                'exit_price': exit_price,
+                'margin': margin,
+                'pnl': pnl,
+                'exit_type': exit_type
+            })
+
+            # 平仓后（对账重置开单状态）下一笔信号才能开单，期间的信号按"已开过单"跳过
+            if self.rearm:
+                current[active] = np.searchsorted(signal_times, exit_time, side='right')
+            else:
+                current[active] = tradable
+        return trades
+
+    @staticmethod
+    def _summarize(grid: Dict[str, np.ndarray], trades: List[Dict[str, np.ndarray]], configs: int) -> Dict:
+        """汇总每个参数组合的收益、回撤和强平次数"""
+        columns = ('config', 'coin', 'entry_time', 'exit_time', 'entry_price', 'exit_price', 'margin', 'pnl', 'exit_type')
+        if trades:
+            table = {column: np.concatenate([t[column] for t in trades]) for column in columns}
+        else:
+            table = {column: np.empty(0, dtype=np.int64) for column in columns}
+            table['pnl'] = np.empty(0, dtype=np.float64)
+
+        config = table['config'].astype(np.int64)
+        pnl = table['pnl'].astype(np.float64)
+        count = np.bincount(config, minlength=configs)
+        wins = np.bincount(config, weights=pnl > 0, minlength=configs)
+
+        # 按平仓时间排列成 [组合, 交易] 矩阵，计算权益曲线的最大回撤
+        order = np.lexsort((table['exit_time'].astype(np.int64), config))
+        config_sorted = config[order]
+        starts = np.concatenate(([0], np.cumsum(count)[:-1]))
+        position = np.arange(len(order)) - starts[config_sorted]
+        equity = np.zeros((configs, max(int(count.max(initial=0)), 1)))
+        equity[config_sorted, position] = pnl[order]
+        equity = np.cumsum(equity, axis=1)
+        peak = np.maximum.accumulate(np.maximum(equity, 0), axis=1)
+
+        summary = {
+            'trades': count,
+            'total_pnl': np.bincount(config, weights=pnl, minlength=configs),
+            'win_rate': np.divide(wins, count, out=np.zeros(configs), where=count > 0),
+            'max_drawdown': (peak - equity).max(axis=1),
+            'liquidations': np.bincount(config, weights=table['exit_type'] == EXIT_LIQUIDATION, minlength=configs).astype(np.int64),
+            'stop_losses': np.bincount(config, weights=table['exit_type'] == EXIT_STOP_LOSS, minlength=configs).astype(np.int64),
+            'take_profits': np.bincount(config, weights=table['exit_type'] == EXIT_TAKE_PROFIT, minlength=configs).astype(np.int64)
+        }
+        return {'grid': grid, 'summary': summary, 'trades': table}
+
+
+def format_results(result: Dict, top: int = 10) -> List[str]:
+    """
+    按总收益排序输出前几个参数组合
+
+    Args:
+        result: Backtester.run 的返回值
+        top: 输出的组合数
+
+    Returns:
+        每个组合一行的描述
+    """
+    grid, summary = result['grid'], result['summary']
+    lines = []
+    for i in np.argsort(-summary['total_pnl'], kind='stable')[:top]:
+        lines.append(
+            f"杠杆 {int(grid['leverage'][i])}x 保证金 {grid['position_size_usdc'][i]:g} "
+            f"止盈 {grid['take_profit_pct'][i]:.2%} 止损 {grid['stop_loss_pct'][i]:.2%} "
+            f"持仓 {grid['max_hold_hours'][i]:g}h{' 按比例' if grid['proportional'][i] else ''} | "
+            f"交易 {summary['trades'][i]} 笔, 收益 {summary['total_pnl'][i]:+.2f} USDC, "
+            f"胜率 {summary['win_rate'][i]:.1%}, 最大回撤 {summary['max_drawdown'][i]:.2f}, "
+            f"强平 {summary['liquidations'][i]} 次"
+        )
+    return lines
+
+
+def main():
+    """命令行入口"""
+    from config import (
+        MONITOR_ADDRESS,
+        TRADING_PAIRS,
+        SIGNAL_RULES,
+        LEVERAGE,
+        POSITION_SIZE_USDC,
+        POSITION_SIZING_MODE,
+        POSITION_SIZE_MIN_SCALE,
+        RECONCILE_ENABLED,
+        FILL_ARCHIVE_DIR
+    )
+    from logger_config import setup_logger
+    from fill_archive import FillArchive
+    from fill_backfill import parse_date
+
+    parser = argparse.ArgumentParser(description='回测平仓信号跟单开空策略')
+    parser.add_argument('--address', default=MONITOR_ADDRESS, help='监控地址（默认 MONITOR_ADDRESS）')
+    parser.add_argument('--archive', default=FILL_ARCHIVE_DIR, help='成交存档目录')
+    parser.add_argument('--bars', action='append', required=True, metavar='SYMBOL=CSV',
+                        help='交易对的K线CSV，如 BTCUSDT=BTCUSDT-1m.csv，可指定多次')
+    parser.add_argument('--start', type=parse_date, help='开始日期')
+    parser.add_argument('--end', type=parse_date, help='结束日期')
+    parser.add_argument('--leverage', type=int, nargs='+', default=[LEVERAGE])
+    parser.add_argument('--size', type=float, nargs='+', default=[POSITION_SIZE_USDC], help='每笔保证金（USDC）')
+    parser.add_argument('--tp', type=float, nargs='+', default=[0.0], help='止盈比例，0表示不止盈')
+    parser.add_argument('--sl', type=float, nargs='+', default=[0.0], help='止损比例，0表示只在强平时离场')
+    parser.add_argument('--hold-hours', type=float, nargs='+', default=[24.0], help='最长持仓小时数')
+    parser.add_argument('--latency-ms', type=int, default=0, help='信号到下单的延迟（毫秒）')
+    parser.add_argument('--slippage-bps', type=float, default=0.0, help='入场滑点（基点）')
+    parser.add_argument('--once', action='store_true', help='每个币种只开一次（未启用对账时的实盘行为）')
+    parser.add_argument('--top', type=int, default=10, help='输出收益最高的组合数')
+    args = parser.parse_args()
+
+    setup_logger(log_file='backtest.log', log_level='INFO')
+
+    bars = {}
+    for item in args.bars:
+        symbol, path = item.split('=', 1)
+        bars[symbol] = load_price_bars(path)
+        logger.info(f"K线 {symbol}: {len(bars[symbol]['time'])} 根")
+
+    archive = FillArchive(args.archive, args.address)
+    signals = extract_signals(archive.iter_fills(args.start, args.end), SignalRuleEngine(SIGNAL_RULES), archive.address)
+    logger.info(f"存档成交 {archive.row_count} 条, 平仓信号 {len(signals['time'])} 个")
+
+    grid = make_grid(
+        leverage=args.leverage,
+        position_size_usdc=args.size,
+        take_profit_pct=args.tp,
+        stop_loss_pct=args.sl,
+        max_hold_hours=args.hold_hours,
+        proportional=[POSITION_SIZING_MODE == 'PROPORTIONAL']
+    )
+    backtester = Backtester(
+        signals, bars, TRADING_PAIRS,
+        latency_ms=args.latency_ms,
+        slippage_bps=args.slippage_bps,
+        rearm=RECONCILE_ENABLED and not args.once,
+        min_scale=POSITION_SIZE_MIN_SCALE
+    )
+    result = backtester.run(grid)
+    logger.info("📈 回测结果（按总收益排序）:")
+    for line in format_results(result, args.top):
+        logger.info(f"  {line}")
+
+
+if __name__ == "__main__":
+    main()
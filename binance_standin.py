@@ -0,0 +1,1036 @@
+"""
+币安U本位合约本地替身服务器
+在本机实现机器人用到的合约REST接口以及行情流和用户数据流。每个接口可以单独配置延迟分布，
+也可以按概率注入 -1021（时间戳超出recvWindow）、-2019（保证金不足）、429（请求过多）和超时，
+响应头带有与币安相同的权重统计，用于在本机可复现地测试下单路径优化和重试逻辑
+
+用法:
+    python binance_standin.py                                        # 监听 127.0.0.1:8765
+    python binance_standin.py --latency order=30:10 --latency '*=5:2'
+    python binance_standin.py --error order=-2019:0.05 --error order=timeout:0.01 --seed 7
+    python binance_standin.py --profile standin_profile.json         # 从JSON读取各接口配置
+
+然后在 config.py 中设置:
+    BINANCE_REST_URL = 'http://127.0.0.1:8765'
+    BINANCE_WS_URL = 'ws://127.0.0.1:8765'
+
+REST接口: ping, time, exchangeInfo, ticker/price, depth, leverage, marginType, order, batchOrders,
+positionRisk, balance, listenKey（名称即 /fapi/v1/ 之后的路径，也用作延迟和错误配置的键）
+数据流: /ws/<symbol>@depth@100ms、/stream?streams=...（组合流）、/ws/<listenKey>（用户数据流）
+行情连接支持 SUBSCRIBE/UNSUBSCRIBE 请求，在不断开连接的情况下增减深度流
+"""
+import argparse
+import base64
+import hashlib
+import json
+import math
+import os
+import queue
+import random
+import struct
+import threading
+import time
+import uuid
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse, parse_qsl
+
+from paper_trader import LatencyModel
+
+logger = logging.getLogger(__name__)
+
+# 各接口的请求权重（与币安文档一致）
+ENDPOINT_WEIGHTS = {
+    'ping': 1, 'time': 1, 'exchangeInfo': 1, 'ticker/price': 1, 'depth': 20,
+    'leverage': 1, 'marginType': 1, 'order': 1, 'batchOrders': 5,
+    'positionRisk': 5, 'balance': 5, 'listenKey': 1
+}
+SIGNED_ENDPOINTS = {'leverage', 'marginType', 'order', 'batchOrders', 'positionRisk', 'balance'}
+ORDER_ENDPOINTS = {'order', 'batchOrders'}
+
+# 可注入的错误类型（也是 --error 和 profile 中 errors 的键）
+FAULT_TIMESTAMP = '-1021'
+FAULT_MARGIN = '-2019'
+FAULT_RATE_LIMIT = '429'
+FAULT_TIMEOUT = 'timeout'
+FAULT_KINDS = (FAULT_TIMESTAMP, FAULT_MARGIN, FAULT_RATE_LIMIT, FAULT_TIMEOUT)
+
+# 数据流的延迟配置键
+STREAM_MARKET = 'marketStream'
+STREAM_USER = 'userStream'
+
+DEFAULT_SYMBOLS = {'BTCUSDC': 60000.0, 'ETHUSDC': 3000.0, 'BTCUSDT': 60000.0, 'ETHUSDT': 3000.0}
+DEFAULT_LEVERAGE = 20
+DEFAULT_RECV_WINDOW = 5000
+ORDER_LIMIT_PER_MINUTE = 1200
+WS_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+
+class StandInError(Exception):
+    """以币安错误格式返回的接口错误"""
+
+    def __init__(self, code: int, msg: str, status: int = 400):
+        super().__init__(msg)
+        self.code = code
+        self.msg = msg
+        self.status = status
+
+
+def encode_frame(payload: bytes, opcode: int = 0x1, mask: bool = False) -> bytes:
+    """
+    编码一个WebSocket帧（服务端发送的帧不加掩码）
+
+    Args:
+        payload: 帧内容
+        opcode: 操作码（1=文本，8=关闭，9=ping，10=pong）
+        mask: 是否加掩码（客户端发送的帧必须加掩码）
+
+    Returns:
+        编码后的字节
+    """
+    header = bytearray([0x80 | opcode])
+    mask_bit = 0x80 if mask else 0
+    length = len(payload)
+    if length < 126:
+        header.append(mask_bit | length)
+    elif length < 65536:
+        header.append(mask_bit | 126)
+        header += struct.pack('!H', length)
+    else:
+        header.append(mask_bit | 127)
+        header += struct.pack('!Q', length)
+    if mask:
+        key = os.urandom(4)
+        header += key
+        payload = bytes(b ^ key[i % 4] for i, b in enumerate(payload))
+    return bytes(header) + payload
+
+
+def read_frame(stream) -> Optional[Tuple[int, bytes]]:
+    """
+    从文件对象读取一个WebSocket帧（不处理分片）
+
+    Args:
+        stream: 套接字的文件对象
+
+    Returns:
+        (操作码, 内容)，连接已关闭时返回None
+    """
+    head = stream.read(2)
+    if len(head) < 2:
+        return None
+    opcode = head[0] & 0x0F
+    length = head[1] & 0x7F
+    if length == 126:
+        length = struct.unpack('!H', stream.read(2))[0]
+    elif length == 127:
+        length = struct.unpack('!Q', stream.read(8))[0]
+    key = stream.read(4) if head[1] & 0x80 else None
+    payload = stream.read(length)
+    if key:
+        payload = bytes(b ^ key[i % 4] for i, b in enumerate(payload))
+    return opcode, payload
+
+
+class SymbolMarket:
+    """单个交易对的模拟行情（随机游走的中间价 + 围绕中间价生成的L2深度）"""
+
+    def __init__(self, symbol: str, price: float, rng: random.Random, levels: int = 20,
+                 volatility_bps: float = 2.0, step_size: float = 0.001):
+        """
+        初始化行情
+
+        Args:
+            symbol: 交易对符号
+            price: 初始中间价
+            rng: 随机数生成器（只在行情线程中使用）
+            levels: 每侧深度档位数
+            volatility_bps: 每次深度更新中间价变化的标准差（基点）
+            step_size: 数量精度
+        """
+        self.symbol = symbol
+        self.quote_asset = 'USDC' if symbol.endswith('USDC') else 'USDT'
+        self.base_asset = symbol[:-len(self.quote_asset)]
+        self.tick_size = 10.0 ** (math.floor(math.log10(price)) - 5)
+        self.price_precision = max(0, -int(math.floor(math.log10(self.tick_size))))
+        self.step_size = step_size
+        self.quantity_precision = max(0, -int(math.floor(math.log10(step_size))))
+        self.level_size = max(step_size, round(50000 / price, self.quantity_precision))  # 每档约5万
+        self.levels = levels
+        self.volatility_bps = volatility_bps
+        self.rng = rng
+        self.mid = price
+        self.update_id = rng.randint(1_000_000, 9_000_000)
+        self.lock = threading.Lock()
+        self.bids, self.asks = self._generate()
+
+    def _generate(self) -> Tuple[Dict[float, float], Dict[float, float]]:
+        """按当前中间价生成深度（买一和卖一相差一个最小价格变动单位）"""
+        best_bid = math.floor(self.mid / self.tick_size - 0.5) * self.tick_size
+        bids, asks = {}, {}
+        for i in range(self.levels):
+            bid = round(best_bid - i * self.tick_size, self.price_precision)
+            ask = round(best_bid + (i + 1) * self.tick_size, self.price_precision)
+            bids[bid] = round(self.level_size * (0.5 + self.rng.random()), self.quantity_precision)
+            asks[ask] = round(self.level_size * (0.5 + self.rng.random()), self.quantity_precision)
+        return bids, asks
+
+    def _format_levels(self, levels) -> List[List[str]]:
+        return [[f"{p:.{self.price_precision}f}", f"{q:.{self.quantity_precision}f}"] for p, q in levels]
+
+    @staticmethod
+    def _diff(old: Dict[float, float], new: Dict[float, float]) -> List[Tuple[float, float]]:
+        """两次深度之间变化的档位，删除的档位数量为0"""
+        changes = [(p, q) for p, q in new.items() if old.get(p) != q]
+        changes += [(p, 0.0) for p in old if p not in new]
+        return changes
+
+    def step(self) -> Dict:
+        """
+        中间价随机游走一步并生成增量深度事件
+
+        Returns:
+            depthUpdate 事件
+        """
+        with self.lock:
+            self.mid *= math.exp(self.rng.gauss(0, self.volatility_bps / 10000))
+            bids, asks = self._generate()
+            previous = self.update_id
+            self.update_id += self.rng.randint(1, 5)
+            event_time = int(time.time() * 1000)
+            event = {
+                'e': 'depthUpdate', 'E': event_time, 'T': event_time, 's': self.symbol,
+                'U': previous + 1, 'u': self.update_id, 'pu': previous,
+                'b': self._format_levels(self._diff(self.bids, bids)),
+                'a': self._format_levels(self._diff(self.asks, asks))
+            }
+            self.bids, self.asks = bids, asks
+        return event
+
+    def snapshot(self, limit: int) -> Dict:
+        """深度快照（/fapi/v1/depth 格式）"""
+        with self.lock:
+            now = int(time.time() * 1000)
+            return {
+                'lastUpdateId': self.update_id, 'E': now, 'T': now,
+                'bids': self._format_levels(sorted(self.bids.items(), reverse=True)[:limit]),
+                'asks': self._format_levels(sorted(self.asks.items())[:limit])
+            }
+
+    def best_price(self, side: str) -> float:
+        """对手方最优价（卖出为买一，买入为卖一）"""
+        with self.lock:
+            return max(self.bids) if side == 'SELL' else min(self.asks)
+
+    def mark_price(self) -> float:
+        with self.lock:
+            return self.mid
+
+    def fill(self, side: str, quantity: float, limit_price: Optional[float] = None) -> Tuple[float, float]:
+        """
+        按对手方深度逐档成交（不改变深度，下一次更新时恢复）
+
+        Args:
+            side: 'SELL' 或 'BUY'
+            quantity: 数量
+            limit_price: 限价（可选），市价单超出深度的部分按最差档位成交
+
+        Returns:
+            (成交数量, 成交均价)
+        """
+        with self.lock:
+            levels = sorted(self.bids.items(), reverse=True) if side == 'SELL' else sorted(self.asks.items())
+        remaining = quantity
+        notional = 0.0
+        price = levels[0][0]
+        for price, size in levels:
+            if limit_price is not None and (price < limit_price if side == 'SELL' else price > limit_price):
+                break
+            take = min(size, remaining)
+            notional += take * price
+            remaining -= take
+            if remaining <= 1e-12:
+                break
+        if limit_price is None and remaining > 1e-12:
+            notional += remaining * price
+            remaining = 0.0
+        filled = round(quantity - max(remaining, 0.0), self.quantity_precision)
+        return filled, (notional / filled if filled > 0 else 0.0)
+
+
+class StandInAccount:
+    """替身服务器上的账户（按API Key区分，首次请求时创建）"""
+
+    def __init__(self, api_key: str, initial_balance: float):
+        self.api_key = api_key
+        self.balances = {'USDT': initial_balance, 'USDC': initial_balance}
+        self.leverage = {}  # 交易对 -> 杠杆
+        self.margin_type = {}  # 交易对 -> 保证金模式
+        self.positions = {}  # (交易对, 持仓方向) -> {'amount': 数量(空头为负), 'entry_price': 开仓均价}
+        self.listen_key = None
+        self.next_order_id = 1
+
+
+class StreamConnection:
+    """一个WebSocket连接的发送端（按模拟延迟依次发送，保持消息顺序）"""
+
+    def __init__(self, sock, latency_model: LatencyModel):
+        self.sock = sock
+        self.latency_model = latency_model
+        self.queue = queue.Queue()
+        self.last_deliver_at = 0.0
+        self.closed = False
+        self.send_lock = threading.Lock()
+        thread = threading.Thread(target=self._writer, daemon=True)
+        thread.start()
+
+    def send(self, message: Dict):
+        """按延迟模型安排一条消息的发送时间"""
+        deliver_at = max(time.monotonic() + self.latency_model.sample() / 1000, self.last_deliver_at)
+        self.last_deliver_at = deliver_at
+        self.queue.put((deliver_at, json.dumps(message).encode()))
+
+    def send_frame(self, payload: bytes, opcode: int):
+        with self.send_lock:
+            self.sock.sendall(encode_frame(payload, opcode))
+
+    def _writer(self):
+        while not self.closed:
+            item = self.queue.get()
+            if item is None:
+                return
+            deliver_at, payload = item
+            delay = deliver_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                self.send_frame(payload, 0x1)
+            except OSError:
+                self.closed = True
+
+    def close(self):
+        self.closed = True
+        self.queue.put(None)
+
+
+class BinanceStandIn:
+    """币安U本位合约本地替身服务器"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8765, symbols: Optional[Dict[str, float]] = None,
+                 profiles: Optional[Dict[str, Dict]] = None, weight_limit: int = 2400,
+                 initial_balance: float = 10000.0, fee_rate: float = 0.0005, clock_offset_ms: int = 0,
+                 timeout_seconds: float = 30.0, depth_interval_ms: int = 100, seed: Optional[int] = None):
+        """
+        初始化替身服务器
+
+        Args:
+            host: 监听地址
+            port: 监听端口（0表示自动分配）
+            symbols: 交易对 -> 初始价格
+            profiles: 接口名 -> 配置，'*' 为默认配置。配置字段:
+                latency_ms/jitter_ms/tail_probability/tail_ms（延迟分布），
+                errors: {'-1021'|'-2019'|'429'|'timeout': 概率}
+            weight_limit: 每分钟请求权重上限，超过后返回429
+            initial_balance: 每个账户 USDT 和 USDC 的初始余额
+            fee_rate: 手续费率
+            clock_offset_ms: 服务器时钟相对本机的偏移（毫秒），用于复现 -1021
+            timeout_seconds: 注入超时时挂起请求的秒数（之后断开连接，不返回响应）
+            depth_interval_ms: 深度更新间隔（毫秒）
+            seed: 随机种子（可选），便于复现延迟和错误
+        """
+        self.host = host
+        self.port = port
+        self.weight_limit = weight_limit
+        self.initial_balance = initial_balance
+        self.fee_rate = fee_rate
+        self.clock_offset_ms = clock_offset_ms
+        self.timeout_seconds = timeout_seconds
+        self.depth_interval = depth_interval_ms / 1000
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+
+        market_rng = random.Random(None if seed is None else seed + 1)
+        self.markets = {
+            symbol: SymbolMarket(symbol, price, market_rng)
+            for symbol, price in (symbols or DEFAULT_SYMBOLS).items()
+        }
+
+        self.profiles = {'*': {}}
+        self.profiles.update(profiles or {})
+        self.latency_models = {}
+        for name, profile in self.profiles.items():
+            self.latency_models[name] = LatencyModel(
+                mean_ms=profile.get('latency_ms', 0.0),
+                jitter_ms=profile.get('jitter_ms', 0.0),
+                tail_probability=profile.get('tail_probability', 0.0),
+                tail_ms=profile.get('tail_ms', 500.0),
+                seed=None if seed is None else self.random.randint(0, 2 ** 31)
+            )
+
+        self.lock = threading.Lock()
+        self.accounts = {}  # API Key -> StandInAccount
+        self.listen_keys = {}  # listenKey -> API Key
+        self.market_streams = {}  # 交易对 -> [(连接, 流名称, 是否组合流)]
+        self.user_streams = {}  # listenKey -> [连接]
+        self.weight_minute = 0
+        self.used_weight = 0
+        self.order_count = 0
+
+        self.server = None
+        self.running = False
+        self.stats = {'requests': {}, 'faults': {}, 'orders': 0, 'rejected': 0}
+
+    @property
+    def rest_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def ws_url(self) -> str:
+        return f"ws://{self.host}:{self.port}"
+
+    def server_time(self) -> int:
+        """服务器时间（毫秒，含时钟偏移）"""
+        return int(time.time() * 1000) + self.clock_offset_ms
+
+    def _profile(self, name: str) -> Tuple[Dict, LatencyModel]:
+        """接口配置和延迟模型（未单独配置的接口使用 '*'）"""
+        key = name if name in self.profiles else '*'
+        return self.profiles[key], self.latency_models[key]
+
+    def _roll(self, name: str, fault: str) -> bool:
+        """按配置的概率决定是否注入错误"""
+        probability = self._profile(name)[0].get('errors', {}).get(fault, 0)
+        if not probability:
+            return False
+        with self.random_lock:
+            hit = self.random.random() < probability
+        if hit:
+            with self.lock:
+                self.stats['faults'][fault] = self.stats['faults'].get(fault, 0) + 1
+        return hit
+
+    def _charge_weight(self, name: str) -> Tuple[int, int]:
+        """计入请求权重和下单数（按自然分钟清零），返回 (已用权重, 已下单数)"""
+        with self.lock:
+            minute = int(time.time() // 60)
+            if minute != self.weight_minute:
+                self.weight_minute = minute
+                self.used_weight = 0
+                self.order_count = 0
+            self.used_weight += ENDPOINT_WEIGHTS.get(name, 1)
+            if name in ORDER_ENDPOINTS:
+                self.order_count += 1
+            self.stats['requests'][name] = self.stats['requests'].get(name, 0) + 1
+            return self.used_weight, self.order_count
+
+    def _account(self, api_key: Optional[str]) -> StandInAccount:
+        if not api_key:
+            raise StandInError(-2014, 'API-key format invalid.', status=401)
+        with self.lock:
+            if api_key not in self.accounts:
+                self.accounts[api_key] = StandInAccount(api_key, self.initial_balance)
+            return self.accounts[api_key]
+
+    def _market(self, symbol: Optional[str]) -> SymbolMarket:
+        market = self.markets.get(symbol or '')
+        if market is None:
+            raise StandInError(-1121, 'Invalid symbol.')
+        return market
+
+    def _check_timestamp(self, params: Dict):
+        """签名接口的时间戳校验（不校验签名本身）"""
+        try:
+            timestamp = int(params['timestamp'])
+        except (KeyError, ValueError):
+            raise StandInError(-1102, "Mandatory parameter 'timestamp' was not sent, was empty/null, or malformed.")
+        recv_window = int(params.get('recvWindow', DEFAULT_RECV_WINDOW))
+        now = self.server_time()
+        if timestamp > now + 1000 or now - timestamp > recv_window:
+            raise StandInError(-1021, 'Timestamp for this request is outside of the recvWindow.')
+
+    def handle_rest(self, method: str, name: str, params: Dict, api_key: Optional[str]) -> Tuple[int, object, Dict]:
+        """
+        处理一个REST请求（延迟、权重、错误注入和接口逻辑）
+
+        Args:
+            method: HTTP方法
+            name: 接口名（/fapi/v1/ 之后的路径）
+            params: 查询参数和表单参数
+            api_key: X-MBX-APIKEY 请求头
+
+        Returns:
+            (HTTP状态码, 响应内容, 响应头)，注入超时时响应内容为 FAULT_TIMEOUT
+        """
+        _, latency_model = self._profile(name)
+        # 延迟一半在处理前（请求到达），一半在处理后（响应返回）
+        latency = latency_model.sample() / 1000
+        time.sleep(latency / 2)
+
+        used_weight, order_count = self._charge_weight(name)
+        headers = {'X-MBX-USED-WEIGHT-1M': str(used_weight)}
+        if name in ORDER_ENDPOINTS:
+            headers['X-MBX-ORDER-COUNT-1M'] = str(order_count)
+
+        try:
+            if used_weight > self.weight_limit or self._roll(name, FAULT_RATE_LIMIT):
+                headers['Retry-After'] = str(60 - int(time.time()) % 60)
+                raise StandInError(
+                    -1003, f'Too many requests; current limit is {self.weight_limit} request weight per 1 MINUTE.',
+                    status=429
+                )
+            timeout = self._roll(name, FAULT_TIMEOUT)
+            if name in SIGNED_ENDPOINTS:
+                if self._roll(name, FAULT_TIMESTAMP):
+                    raise StandInError(-1021, 'Timestamp for this request is outside of the recvWindow.')
+                self._check_timestamp(params)
+            if timeout and name not in ORDER_ENDPOINTS:
+                return 0, FAULT_TIMEOUT, headers
+            body = self._dispatch(method, name, params, api_key)
+            if timeout:
+                # 与真实情况一致：下单请求超时时订单可能已经成交
+                return 0, FAULT_TIMEOUT, headers
+            status = 200
+        except StandInError as e:
+            status, body = e.status, {'code': e.code, 'msg': e.msg}
+            with self.lock:
+                self.stats['rejected'] += 1
+
+        time.sleep(latency / 2)
+        return status, body, headers
+
+    def _dispatch(self, method: str, name: str, params: Dict, api_key: Optional[str]):
+        """按接口名分发"""
+        if name == 'ping':
+            return {}
+        if name == 'time':
+            return {'serverTime': self.server_time()}
+        if name == 'exchangeInfo':
+            return self._exchange_info()
+        if name == 'ticker/price':
+            if 'symbol' in params:
+                market = self._market(params['symbol'])
+                return {'symbol': market.symbol, 'price': f"{market.mark_price():.{market.price_precision}f}",
+                        'time': self.server_time()}
+            return [{'symbol': m.symbol, 'price': f"{m.mark_price():.{m.price_precision}f}", 'time': self.server_time()}
+                    for m in self.markets.values()]
+        if name == 'depth':
+            return self._market(params.get('symbol')).snapshot(int(params.get('limit', 500)))
+        if name == 'listenKey':
+            return self._listen_key(method, api_key)
+
+        account = self._account(api_key)
+        if name == 'leverage' and method == 'POST':
+            market = self._market(params.get('symbol'))
+            leverage = int(params.get('leverage', 0))
+            if not 1 <= leverage <= 125:
+                raise StandInError(-4028, f'Leverage {leverage} is not valid')
+            account.leverage[market.symbol] = leverage
+            return {'leverage': leverage, 'maxNotionalValue': '1000000', 'symbol': market.symbol}
+        if name == 'marginType' and method == 'POST':
+            market = self._market(params.get('symbol'))
+            margin_type = params.get('marginType', 'CROSSED').upper()
+            if account.margin_type.get(market.symbol, 'CROSSED') == margin_type:
+                raise StandInError(-4046, 'No need to change margin type.')
+            account.margin_type[market.symbol] = margin_type
+            return {'code': 200, 'msg': 'success'}
+        if name == 'order' and method == 'POST':
+            return self._place_order(account, params, name)
+        if name == 'batchOrders' and method == 'POST':
+            orders = json.loads(params.get('batchOrders', '[]'))
+            if not 1 <= len(orders) <= 5:
+                raise StandInError(-1130, 'Data sent for parameter \'batchOrders\' is not valid.')
+            results = []
+            for order in orders:
+                try:
+                    results.append(self._place_order(account, order, name))
+                except StandInError as e:
+                    results.append({'code': e.code, 'msg': e.msg})
+            return results
+        if name == 'positionRisk':
+            return self._position_risk(account, params.get('symbol'))
+        if name == 'balance':
+            return self._balance(account)
+        raise StandInError(-1, f'Unsupported endpoint: {method} {name}', status=404)
+
+    def _exchange_info(self) -> Dict:
+        symbols = []
+        for m in self.markets.values():
+            tick = f"{m.tick_size:.{m.price_precision}f}"
+            step = f"{m.step_size:.{m.quantity_precision}f}"
+            symbols.append({
+                'symbol': m.symbol, 'pair': m.symbol, 'contractType': 'PERPETUAL', 'status': 'TRADING',
+                'baseAsset': m.base_asset, 'quoteAsset': m.quote_asset, 'marginAsset': m.quote_asset,
+                'pricePrecision': m.price_precision, 'quantityPrecision': m.quantity_precision,
+                'orderTypes': ['LIMIT', 'MARKET'], 'timeInForce': ['GTC', 'IOC', 'FOK'],
+                'filters': [
+                    {'filterType': 'PRICE_FILTER', 'minPrice': tick, 'maxPrice': '10000000', 'tickSize': tick},
+                    {'filterType': 'LOT_SIZE', 'minQty': step, 'maxQty': '10000', 'stepSize': step},
+                    {'filterType': 'MARKET_LOT_SIZE', 'minQty': step, 'maxQty': '1000', 'stepSize': step},
+                    {'filterType': 'MIN_NOTIONAL', 'notional': '5'}
+                ]
+            })
+        return {
+            'timezone': 'UTC',
+            'serverTime': self.server_time(),
+            'rateLimits': [
+                {'rateLimitType': 'REQUEST_WEIGHT', 'interval': 'MINUTE', 'intervalNum': 1, 'limit': self.weight_limit},
+                {'rateLimitType': 'ORDERS', 'interval': 'MINUTE', 'intervalNum': 1, 'limit': ORDER_LIMIT_PER_MINUTE}
+            ],
+            'symbols': symbols
+        }
+
+    def _listen_key(self, method: str, api_key: Optional[str]) -> Dict:
+        account = self._account(api_key)
+        with self.lock:
+            if method == 'POST':
+                if account.listen_key is None:
+                    account.listen_key = uuid.uuid4().hex + uuid.uuid4().hex
+                    self.listen_keys[account.listen_key] = api_key
+                return {'listenKey': account.listen_key}
+            if method == 'DELETE' and account.listen_key:
+                self.listen_keys.pop(account.listen_key, None)
+                account.listen_key = None
+        return {}
+
+    def _unrealized(self, account: StandInAccount, quote_asset: str) -> Tuple[float, float]:
+        """某保证金资产下的 (未实现盈亏, 占用保证金)"""
+        pnl = margin = 0.0
+        for (symbol, _), position in account.positions.items():
+            market = self.markets[symbol]
+            if market.quote_asset != quote_asset or not position['amount']:
+                continue
+            mark = market.mark_price()
+            pnl += position['amount'] * (mark - position['entry_price'])
+            margin += abs(position['amount']) * mark / account.leverage.get(symbol, DEFAULT_LEVERAGE)
+        return pnl, margin
+
+    def _place_order(self, account: StandInAccount, params: Dict, name: str) -> Dict:
+        """撮合一个订单（立即按深度成交，未成交部分不挂单）"""
+        market = self._market(params.get('symbol'))
+        side = params.get('side', '').upper()
+        order_type = params.get('type', '').upper()
+        position_side = params.get('positionSide', 'BOTH').upper()
+        if side not in ('BUY', 'SELL') or order_type not in ('MARKET', 'LIMIT'):
+            raise StandInError(-1116, 'Invalid orderType.' if side in ('BUY', 'SELL') else 'Invalid side.')
+        try:
+            quantity = float(params.get('quantity', 0))
+        except ValueError:
+            raise StandInError(-1102, "Mandatory parameter 'quantity' was not sent, was empty/null, or malformed.")
+        if quantity <= 0:
+            raise StandInError(-4003, 'Quantity less than or equal to zero.')
+        if abs(quantity / market.step_size - round(quantity / market.step_size)) > 1e-6:
+            raise StandInError(-1111, 'Precision is over the maximum defined for this asset.')
+
+        limit_price = None
+        time_in_force = 'GTC'
+        if order_type == 'LIMIT':
+            if 'price' not in params or 'timeInForce' not in params:
+                raise StandInError(-1102, "Mandatory parameter 'price' was not sent, was empty/null, or malformed.")
+            limit_price = float(params['price'])
+            time_in_force = params['timeInForce'].upper()
+
+        # 开仓方向（单向持仓，或双向持仓中与持仓方向一致）检查保证金
+        signed = quantity if side == 'BUY' else -quantity
+        opening = position_side == 'BOTH' or (position_side == 'SHORT') == (side == 'SELL')
+        leverage = account.leverage.get(market.symbol, DEFAULT_LEVERAGE)
+        with self.lock:
+            unrealized, used_margin = self._unrealized(account, market.quote_asset)
+            available = account.balances[market.quote_asset] + unrealized - used_margin
+        required = quantity * market.best_price(side) / leverage
+        if opening and (required > available or self._roll(name, FAULT_MARGIN)):
+            raise StandInError(-2019, 'Margin is insufficient.')
+
+        filled, avg_price = market.fill(side, quantity, limit_price)
+        with self.lock:
+            order_id = account.next_order_id
+            account.next_order_id += 1
+            self.stats['orders'] += 1
+            if filled > 0:
+                self._apply_fill(account, market, position_side, signed * filled / quantity, avg_price)
+
+        if filled >= quantity:
+            status = 'FILLED'
+        elif time_in_force in ('IOC', 'FOK'):
+            status = 'EXPIRED'
+        else:
+            status = 'PARTIALLY_FILLED' if filled > 0 else 'NEW'
+        update_time = self.server_time()
+        order = {
+            'orderId': order_id, 'symbol': market.symbol, 'status': status,
+            'clientOrderId': params.get('newClientOrderId') or uuid.uuid4().hex[:22],
+            'price': params.get('price', '0'), 'avgPrice': f"{avg_price:.{market.price_precision + 2}f}",
+            'origQty': str(params['quantity']), 'executedQty': f"{filled:.{market.quantity_precision}f}",
+            'cumQuote': f"{filled * avg_price:.8f}", 'timeInForce': time_in_force, 'type': order_type,
+            'reduceOnly': False, 'closePosition': False, 'side': side, 'positionSide': position_side,
+            'stopPrice': '0', 'workingType': 'CONTRACT_PRICE', 'priceProtect': False, 'origType': order_type,
+            'updateTime': update_time
+        }
+        if filled > 0:
+            self._publish_fill(account, market, order, filled, avg_price)
+
+        # 未指定 newOrderRespType 时返回 ACK（与币安一致，只确认受理）
+        if params.get('newOrderRespType', 'ACK').upper() == 'ACK':
+            return dict(order, status='NEW', executedQty='0', cumQuote='0', avgPrice='0.00')
+        return order
+
+    def _apply_fill(self, account: StandInAccount, market: SymbolMarket, position_side: str,
+                    signed_filled: float, price: float):
+        """按成交更新持仓、已实现盈亏和手续费（调用方需持有锁）"""
+        position = account.positions.setdefault((market.symbol, position_side), {'amount': 0.0, 'entry_price': 0.0})
+        old = position['amount']
+        new = round(old + signed_filled, market.quantity_precision)
+        if old == 0 or (old > 0) == (signed_filled > 0):
+            position['entry_price'] = (abs(old) * position['entry_price'] + abs(signed_filled) * price) / abs(new)
+        else:
+            closed = min(abs(old), abs(signed_filled))
+            account.balances[market.quote_asset] += closed * (price - position['entry_price']) * (1 if old > 0 else -1)
+            if new == 0:
+                position['entry_price'] = 0.0
+            elif (new > 0) != (old > 0):
+                position['entry_price'] = price
+        position['amount'] = new
+        account.balances[market.quote_asset] -= abs(signed_filled) * price * self.fee_rate
+
+    def _position_risk(self, account: StandInAccount, symbol: Optional[str] = None) -> List[Dict]:
+        """持仓信息（双向持仓格式，每个交易对返回 LONG 和 SHORT）"""
+        symbols = [self._market(symbol).symbol] if symbol else list(self.markets)
+        result = []
+        with self.lock:
+            for s in symbols:
+                market = self.markets[s]
+                mark = market.mark_price()
+                leverage = account.leverage.get(s, DEFAULT_LEVERAGE)
+                sides = {ps for (sym, ps) in account.positions if sym == s} | {'LONG', 'SHORT'}
+                for ps in sorted(sides):
+                    position = account.positions.get((s, ps), {'amount': 0.0, 'entry_price': 0.0})
+                    amount = position['amount']
+                    result.append({
+                        'symbol': s, 'positionSide': ps,
+                        'positionAmt': f"{amount:.{market.quantity_precision}f}",
+                        'entryPrice': f"{position['entry_price']:.8f}",
+                        'markPrice': f"{mark:.8f}",
+                        'unRealizedProfit': f"{amount * (mark - position['entry_price']):.8f}",
+                        'liquidationPrice': '0', 'leverage': str(leverage),
+                        'maxNotionalValue': '1000000',
+                        'marginType': account.margin_type.get(s, 'CROSSED').lower().replace('crossed', 'cross'),
+                        'isolatedMargin': '0.00000000', 'isAutoAddMargin': 'false',
+                        'notional': f"{amount * mark:.8f}", 'isolatedWallet': '0',
+                        'updateTime': self.server_time()
+                    })
+        return result
+
+    def _balance(self, account: StandInAccount) -> List[Dict]:
+        result = []
+        with self.lock:
+            for asset, balance in account.balances.items():
+                unrealized, used_margin = self._unrealized(account, asset)
+                available = balance + unrealized - used_margin
+                result.append({
+                    'accountAlias': 'standin', 'asset': asset,
+                    'balance': f"{balance:.8f}", 'crossWalletBalance': f"{balance:.8f}",
+                    'crossUnPnl': f"{unrealized:.8f}", 'availableBalance': f"{available:.8f}",
+                    'maxWithdrawAmount': f"{max(available, 0):.8f}", 'marginAvailable': True,
+                    'updateTime': self.server_time()
+                })
+        return result
+
+    def _publish_fill(self, account: StandInAccount, market: SymbolMarket, order: Dict, filled: float, price: float):
+        """成交后向该账户的用户数据流推送 ORDER_TRADE_UPDATE 和 ACCOUNT_UPDATE"""
+        with self.lock:
+            connections = list(self.user_streams.get(account.listen_key, [])) if account.listen_key else []
+            positions = [
+                {'s': symbol, 'pa': f"{p['amount']:.{market.quantity_precision}f}", 'ep': f"{p['entry_price']:.8f}",
+                 'cr': '0', 'up': '0', 'mt': 'cross', 'iw': '0', 'ps': ps}
+                for (symbol, ps), p in account.positions.items() if symbol == market.symbol
+            ]
+            balance = account.balances[market.quote_asset]
+        if not connections:
+            return
+        now = self.server_time()
+        events = [
+            {'e': 'ORDER_TRADE_UPDATE', 'E': now, 'T': now, 'o': {
+                's': market.symbol, 'c': order['clientOrderId'], 'S': order['side'], 'o': order['type'],
+                'f': order['timeInForce'], 'q': order['origQty'], 'p': order['price'], 'ap': order['avgPrice'],
+                'x': 'TRADE', 'X': order['status'], 'i': order['orderId'],
+                'l': order['executedQty'], 'z': order['executedQty'], 'L': f"{price:.8f}",
+                'n': f"{filled * price * self.fee_rate:.8f}", 'N': market.quote_asset,
+                'T': now, 't': order['orderId'], 'ps': order['positionSide']
+            }},
+            {'e': 'ACCOUNT_UPDATE', 'E': now, 'T': now, 'a': {
+                'm': 'ORDER',
+                'B': [{'a': market.quote_asset, 'wb': f"{balance:.8f}", 'cw': f"{balance:.8f}", 'bc': '0'}],
+                'P': positions
+            }}
+        ]
+        for connection in connections:
+            for event in events:
+                connection.send(event)
+
+    def _depth_worker(self):
+        """定时更新各交易对深度并推送给订阅的连接"""
+        while self.running:
+            time.sleep(self.depth_interval)
+            for symbol, market in self.markets.items():
+                event = market.step()
+                with self.lock:
+                    subscribers = list(self.market_streams.get(symbol, []))
+                for connection, stream, combined in subscribers:
+                    connection.send({'stream': stream, 'data': event} if combined else event)
+
+    def _handle_stream_request(self, connection: StreamConnection, payload: bytes, combined: bool):
+        """处理行情连接上的 SUBSCRIBE/UNSUBSCRIBE 请求（只支持深度流）"""
+        try:
+            request = json.loads(payload)
+            method, names = request['method'], request.get('params', [])
+        except (ValueError, KeyError, TypeError):
+            connection.send({'error': {'code': 2, 'msg': 'Invalid request'}, 'id': None})
+            return
+
+        with self.lock:
+            for name in names:
+                symbol = name.split('@')[0].upper()
+                if symbol not in self.markets or '@depth' not in name:
+                    continue
+                subscribers = [s for s in self.market_streams.get(symbol, []) if s[0] is not connection]
+                if method == 'SUBSCRIBE':
+                    subscribers.append((connection, name, combined))
+                self.market_streams[symbol] = subscribers
+        logger.info(f"🔌 数据流{method}: {', '.join(names)}")
+        connection.send({'result': None, 'id': request.get('id')})
+
+    def handle_websocket(self, handler: BaseHTTPRequestHandler):
+        """
+        处理WebSocket连接（在HTTP请求线程中完成握手并读取客户端帧直到断开）
+
+        Args:
+            handler: 当前HTTP请求处理器
+        """
+        url = urlparse(handler.path)
+        if url.path == '/stream':
+            streams = dict(parse_qsl(url.query)).get('streams', '')
+            names, combined = [s for s in streams.split('/') if s], True
+        elif url.path.startswith('/ws/'):
+            names, combined = [url.path[len('/ws/'):]], False
+        else:
+            handler.send_error(404)
+            return
+
+        key = handler.headers.get('Sec-WebSocket-Key', '')
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+        handler.send_response(101, 'Switching Protocols')
+        handler.send_header('Upgrade', 'websocket')
+        handler.send_header('Connection', 'Upgrade')
+        handler.send_header('Sec-WebSocket-Accept', accept)
+        handler.end_headers()
+        handler.close_connection = True
+
+        user_key = names[0] if not combined and names[0] in self.listen_keys else None
+        _, latency_model = self._profile(STREAM_USER if user_key else STREAM_MARKET)
+        connection = StreamConnection(handler.connection, latency_model)
+        with self.lock:
+            if user_key:
+                self.user_streams.setdefault(user_key, []).append(connection)
+            for name in names:
+                symbol = name.split('@')[0].upper()
+                if not user_key and symbol in self.markets and '@depth' in name:
+                    self.market_streams.setdefault(symbol, []).append((connection, name, combined))
+        logger.info(f"🔌 数据流已连接: {', '.join(names)}")
+
+        try:
+            while self.running:
+                frame = read_frame(handler.rfile)
+                if frame is None:
+                    break
+                opcode, payload = frame
+                if opcode == 0x8:
+                    connection.send_frame(payload[:2], 0x8)
+                    break
+                if opcode == 0x9:
+                    connection.send_frame(payload, 0xA)
+                if opcode == 0x1 and not user_key:
+                    self._handle_stream_request(connection, payload, combined)
+        except OSError:
+            pass
+        finally:
+            connection.close()
+            with self.lock:
+                if user_key and connection in self.user_streams.get(user_key, []):
+                    self.user_streams[user_key].remove(connection)
+                for symbol, subscribers in self.market_streams.items():
+                    self.market_streams[symbol] = [s for s in subscribers if s[0] is not connection]
+            logger.info(f"🔌 数据流已断开: {', '.join(names)}")
+
+    def start(self):
+        """在后台线程中启动服务器和行情更新"""
+        standin = self
+
+        class Handler(StandInRequestHandler):
+            server_standin = standin
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.port = self.server.server_address[1]
+        self.running = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        threading.Thread(target=self._depth_worker, daemon=True).start()
+        logger.info(f"🧪 币安替身服务器已启动: {self.rest_url} (数据流 {self.ws_url})")
+
+    def stop(self):
+        """停止服务器，断开所有数据流"""
+        self.running = False
+        with self.lock:
+            connections = [c for subscribers in self.market_streams.values() for c, _, _ in subscribers]
+            connections += [c for subscribers in self.user_streams.values() for c in subscribers]
+        for connection in connections:
+            connection.close()
+            try:
+                connection.sock.shutdown(2)
+            except OSError:
+                pass
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+        logger.info(f"🛑 币安替身服务器已停止，统计: {json.dumps(self.stats, ensure_ascii=False)}")
+
+
+class StandInRequestHandler(BaseHTTPRequestHandler):
+    """替身服务器的HTTP请求处理器（REST接口和WebSocket握手）"""
+
+    protocol_version = 'HTTP/1.1'
+    server_standin: BinanceStandIn = None
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+    def _handle(self, method: str):
+        standin = self.server_standin
+        if method == 'GET' and self.headers.get('Upgrade', '').lower() == 'websocket':
+            standin.handle_websocket(self)
+            return
+
+        url = urlparse(self.path)
+        params = dict(parse_qsl(url.query))
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            params.update(parse_qsl(self.rfile.read(length).decode()))
+
+        if url.path == '/standin/stats':
+            self._send_json(200, standin.stats, {})
+            return
+        parts = url.path.strip('/').split('/', 2)
+        if len(parts) < 3 or parts[0] not in ('fapi', 'api'):
+            self._send_json(404, {'code': -1, 'msg': f'Unknown path: {url.path}'}, {})
+            return
+
+        status, body, headers = standin.handle_rest(method, parts[2], params, self.headers.get('X-MBX-APIKEY'))
+        if body == FAULT_TIMEOUT:
+            # 挂起后断开连接，不返回任何响应
+            time.sleep(standin.timeout_seconds)
+            self.close_connection = True
+            return
+        self._send_json(status, body, headers)
+
+    def _send_json(self, status: int, body, headers: Dict):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+
+def parse_latency(value: str) -> Tuple[str, Dict]:
+    """解析 --latency ENDPOINT=MEAN[:JITTER[:TAIL_PROBABILITY:TAIL_MS]]"""
+    try:
+        name, spec = value.split('=', 1)
+        numbers = [float(v) for v in spec.split(':')]
+        keys = ('latency_ms', 'jitter_ms', 'tail_probability', 'tail_ms')
+        return name, dict(zip(keys, numbers))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无法解析延迟配置: {value}（格式 ENDPOINT=MEAN[:JITTER[:TAIL_PROB:TAIL_MS]]）")
+
+
+def parse_error(value: str) -> Tuple[str, str, float]:
+    """解析 --error ENDPOINT=KIND:PROBABILITY"""
+    try:
+        name, spec = value.split('=', 1)
+        kind, probability = spec.rsplit(':', 1)
+        if kind not in FAULT_KINDS:
+            raise ValueError
+        return name, kind, float(probability)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无法解析错误配置: {value}（格式 ENDPOINT=KIND:PROB，KIND 为 {'/'.join(FAULT_KINDS)}）")
+
+
+def main():
+    """命令行入口"""
+    from logger_config import setup_logger
+
+    parser = argparse.ArgumentParser(description='币安U本位合约本地替身服务器')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址')
+    parser.add_argument('--port', type=int, default=8765, help='监听端口')
+    parser.add_argument('--symbol', action='append', dest='symbols', help='交易对和初始价格，如 BTCUSDC=60000，可指定多次')
+    parser.add_argument('--profile', help='JSON配置文件: {"接口名": {"latency_ms": .., "jitter_ms": .., "errors": {"-2019": 0.05}}}')
+    parser.add_argument('--latency', action='append', type=parse_latency, default=[],
+                        help="接口延迟，如 order=30:10 或 '*=5:2'（'*' 为默认，marketStream/userStream 为数据流）")
+    parser.add_argument('--error', action='append', type=parse_error, default=[],
+                        help='注入错误，如 order=-2019:0.05、order=timeout:0.01、*=429:0.001')
+    parser.add_argument('--weight-limit', type=int, default=2400, help='每分钟请求权重上限')
+    parser.add_argument('--balance', type=float, default=10000.0, help='每个账户的初始余额')
+    parser.add_argument('--clock-offset-ms', type=int, default=0, help='服务器时钟偏移（毫秒）')
+    parser.add_argument('--timeout-seconds', type=float, default=30.0, help='注入超时时挂起请求的秒数')
+    parser.add_argument('--seed', type=int, help='随机种子')
+    args = parser.parse_args()
+
+    setup_logger(log_file='binance_standin.log', log_level='INFO')
+
+    profiles = {}
+    if args.profile:
+        with open(args.profile, 'r', encoding='utf-8') as f:
+            profiles = json.load(f)
+    for name, latency in args.latency:
+        profiles.setdefault(name, {}).update(latency)
+    for name, kind, probability in args.error:
+        profiles.setdefault(name, {}).setdefault('errors', {})[kind] = probability
+
+    symbols = None
+    if args.symbols:
+        symbols = {s.split('=')[0].upper(): float(s.split('=')[1]) for s in args.symbols}
+
+    standin = BinanceStandIn(
+        host=args.host,
+        port=args.port,
+        symbols=symbols,
+        profiles=profiles,
+        weight_limit=args.weight_limit,
+        initial_balance=args.balance,
+        clock_offset_ms=args.clock_offset_ms,
+        timeout_seconds=args.timeout_seconds,
+        seed=args.seed
+    )
+    standin.start()
+    for name, profile in profiles.items():
+        logger.info(f"  {name}: {json.dumps(profile, ensure_ascii=False)}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        standin.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -3,18 +3,64 @@
 用于执行开空单操作
 """
 from binance.client import Client
-from binance.enums import *
+from binance.enums import SIDE_SELL, ORDER_TYPE_MARKET, ORDER_TYPE_LIMIT, TIME_IN_FORCE_IOC
 from binance.exceptions import BinanceAPIException
 import logging
-from typing import Optional, Dict
+import math
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, List
+
+import tracing
 
 logger = logging.getLogger(__name__)
 
+# 币安合约批量下单接口单次最多5个订单
+BATCH_ORDER_LIMIT = 5
+
+# 整批请求被明确拒绝（订单一定未提交）的错误码，只有这些情况才改为逐个重新下单
+BATCH_REJECTED_CODES = {
+    -1003,  # 请求过多（被限流）
+    -1015,  # 下单过多
+    -1021,  # 时间戳超出 recvWindow
+    -1022,  # 签名无效
+    -1102,  # 缺少必要参数
+    -1111,  # 精度超出限制
+    -1130,  # 参数无效
+    -2014,  # API密钥格式无效
+    -2015,  # API密钥、IP或权限无效
+}
+ORDER_NOT_FOUND_CODE = -2013  # 查询的订单不存在
+
+# 下单模式
+EXECUTION_MODE_MARKET = 'MARKET'  # 市价单
+EXECUTION_MODE_IOC = 'IOC'  # 按本地订单簿计算的限价IOC单（限制最大滑点）
+
+
+class BaseUrlClient(Client):
+    """REST请求发往指定地址的币安客户端（如本地替身服务器 binance_standin.py）"""
+    
+    def __init__(self, api_key: str, api_secret: str, base_url: str):
+        """
+        初始化客户端
+        
+        Args:
+            api_key: API密钥
+            api_secret: API密钥
+            base_url: 接口地址，如 'http://127.0.0.1:8765'
+        """
+        # 父类初始化时会格式化并使用这两个地址（初始化中会ping一次现货接口）
+        self.API_URL = f"{base_url.rstrip('/')}/api"
+        self.FUTURES_URL = f"{base_url.rstrip('/')}/fapi"
+        super().__init__(api_key, api_secret)
+
 
 class BinanceTrader:
     """币安交易类"""
     
-    def __init__(self, api_key: str, api_secret: str, testnet: bool = False):
+    def __init__(self, api_key: str, api_secret: str, testnet: bool = False,
+                 order_book=None, execution_mode: str = EXECUTION_MODE_MARKET, max_slippage_bps: float = 20,
+                 base_url: Optional[str] = None):
         """
         初始化币安交易客户端
         
@@ -22,14 +68,31 @@ class BinanceTrader:
             api_key: API密钥
             api_secret: API密钥
             testnet: 是否使用测试网
+            order_book: 本地订单簿管理器（可选，OrderBookManager）
+            execution_mode: 下单模式 ('MARKET' 或 'IOC')
+            max_slippage_bps: IOC模式下相对最优买价的最大滑点（基点）
+            base_url: 自定义接口地址（可选），设置后忽略 testnet
         """
+        self.executor = None  # 并发请求线程池（按需创建）
+        self.symbol_info_cache = {}  # 交易对信息缓存（精度等过滤器很少变化）
+        self.order_book = order_book
+        self.execution_mode = execution_mode
+        self.max_slippage_bps = max_slippage_bps
+        self.primed_leverage = {}  # 交易对 -> 启动时已设置好的杠杆（设置后下单前不再重复设置）
+        self.order_templates = {}  # 交易对 -> 预先构建的下单参数模板
+        
         try:
-            if testnet:
+            if base_url:
+                self.client = BaseUrlClient(api_key, api_secret, base_url)
+                logger.info(f"使用自定义币安接口地址: {base_url}")
+            elif testnet:
                 self.client = Client(api_key, api_secret, testnet=True)
                 logger.info("使用币安测试网")
             else:
                 self.client = Client(api_key, api_secret)
                 logger.info("使用币安正式网")
+            # 处理信号期间的每个请求记录为追踪时间段（其他时候直接转发）
+            self.client = tracing.TracedClient(self.client, 'binance')
             
             # 测试连接
             self.client.ping()
@@ -93,6 +156,44 @@ class BinanceTrader:
             logger.error(f"设置保证金模式时发生错误: {e}")
             return False
     
+    def prime_symbol(self, symbol: str, leverage: int) -> bool:
+        """
+        预先设置保证金模式和杠杆、缓存交易对信息并构建下单参数模板，
+        之后对该交易对下单时跳过这些请求
+        
+        Args:
+            symbol: 交易对符号
+            leverage: 杠杆倍数
+            
+        Returns:
+            是否成功
+        """
+        if not self.get_symbol_info(symbol):
+            return False
+        self.set_margin_type(symbol, 'CROSSED')
+        if not self.set_leverage(symbol, leverage):
+            return False
+        
+        self.order_templates[symbol] = {
+            'symbol': symbol,
+            'side': SIDE_SELL,
+            'type': ORDER_TYPE_MARKET,
+            'positionSide': 'SHORT'
+        }
+        self.primed_leverage[symbol] = leverage
+        return True
+    
+    def forget_symbol(self, symbol: str):
+        """
+        清除交易对的缓存信息、预设杠杆和下单模板（交易对移除或需要重新获取过滤器时调用）
+        
+        Args:
+            symbol: 交易对符号
+        """
+        self.symbol_info_cache.pop(symbol, None)
+        self.primed_leverage.pop(symbol, None)
+        self.order_templates.pop(symbol, None)
+    
     def get_symbol_info(self, symbol: str) -> Optional[Dict]:
         """
         获取交易对信息
@@ -103,12 +204,14 @@ class BinanceTrader:
         Returns:
             交易对信息字典或None
         """
+        if symbol in self.symbol_info_cache:
+            return self.symbol_info_cache[symbol]
+        
         try:
             exchange_info = self.client.futures_exchange_info()
             for s in exchange_info['symbols']:
-                if s['symbol'] == symbol:
-                    return s
-            return None
+                self.symbol_info_cache[s['symbol']] = s
+            return self.symbol_info_cache.get(symbol)
         except Exception as e:
             logger.error(f"获取交易对信息失败: {e}")
             return None
@@ -157,26 +260,132 @@ class BinanceTrader:
             logger.error(f"计算交易数量时发生错误: {e}")
             return 0
     
-    def open_short_position(self, symbol: str, quantity: float) -> Optional[Dict]:
+    def get_filter_value(self, symbol: str, filter_type: str, key: str) -> Optional[float]:
+        """
+        获取交易对过滤器中的数值（使用缓存的交易对信息）
+        
+        Args:
+            symbol: 交易对符号
+            filter_type: 过滤器类型，如 'PRICE_FILTER'
+            key: 字段名，如 'tickSize'
+            
+        Returns:
+            数值或None
+        """
+        symbol_info = self.get_symbol_info(symbol)
+        if not symbol_info:
+            return None
+        for filter_item in symbol_info['filters']:
+            if filter_item['filterType'] == filter_type:
+                return float(filter_item[key])
+        return None
+    
+    def calculate_ioc_price(self, symbol: str, quantity: float) -> Optional[float]:
+        """
+        根据本地订单簿和最大滑点计算IOC卖单的限价（不发起网络请求）
+        
+        Args:
+            symbol: 交易对符号
+            quantity: 交易数量
+            
+        Returns:
+            限价，订单簿不可用时返回None
+        """
+        if self.order_book is None:
+            return None
+        
+        book = self.order_book.get_book(symbol)
+        tick_size = self.get_filter_value(symbol, 'PRICE_FILTER', 'tickSize')
+        if book is None or not tick_size:
+            return None
+        
+        estimate = book.estimate_sell(quantity)
+        if estimate is None:
+            return None
+        
+        # 卖单限价为可接受的最低价，向上取整到最小价格变动单位，保证滑点不超过上限
+        floor_price = estimate['best_bid'] * (1 - self.max_slippage_bps / 10000)
+        precision = len(str(tick_size).rstrip('0').split('.')[-1])
+        price = round(math.ceil(round(floor_price / tick_size, 8)) * tick_size, precision)
+        
+        logger.info(f"{symbol} IOC限价: {price} (最优买价: {estimate['best_bid']}, "
+                    f"预估均价: {estimate['vwap']:.2f}, 最大滑点: {self.max_slippage_bps} bps)")
+        if estimate['worst_price'] < price or estimate['filled'] < quantity:
+            logger.warning(f"⚠️  {symbol} 本地订单簿深度不足，IOC单可能部分成交")
+        return price
+    
+    def build_short_order_params(self, symbol: str, quantity: float) -> Dict:
+        """
+        构建开空单参数（按下单模式选择市价单或限价IOC单）
+        
+        Args:
+            symbol: 交易对符号
+            quantity: 交易数量
+            
+        Returns:
+            下单参数字典
+        """
+        template = self.order_templates.get(symbol)
+        if template:
+            params = template.copy()
+            params['quantity'] = quantity
+        else:
+            params = {
+                'symbol': symbol,
+                'side': SIDE_SELL,
+                'type': ORDER_TYPE_MARKET,
+                'quantity': quantity,
+                'positionSide': 'SHORT'  # 指定持仓方向为空头
+            }
+        
+        if self.execution_mode == EXECUTION_MODE_IOC:
+            price = self.calculate_ioc_price(symbol, quantity)
+            if price is None:
+                logger.warning(f"⚠️  {symbol} 本地订单簿不可用，改用市价单")
+            else:
+                params['type'] = ORDER_TYPE_LIMIT
+                params['timeInForce'] = TIME_IN_FORCE_IOC
+                params['price'] = price
+                params['newOrderRespType'] = 'RESULT'  # 返回最终成交结果
+        
+        return params
+    
+    @staticmethod
+    def is_order_filled(order: Dict) -> bool:
+        """
+        判断订单是否有成交（IOC单可能未成交即过期）
+        
+        Args:
+            order: 下单接口返回的订单信息
+            
+        Returns:
+            是否有成交
+        """
+        if order.get('timeInForce') != TIME_IN_FORCE_IOC:
+            return True
+        return float(order.get('executedQty', 0)) > 0
+    
+    def open_short_position(self, symbol: str, quantity: float, client_order_id: Optional[str] = None) -> Optional[Dict]:
         """
         开空单
         
         Args:
             symbol: 交易对符号
             quantity: 交易数量
+            client_order_id: 自定义订单ID（可选），重新提交批量下单中的订单时沿用原ID
             
         Returns:
             订单信息或None
         """
         try:
-            # 使用市价单开空
-            order = self.client.futures_create_order(
-                symbol=symbol,
-                side=SIDE_SELL,
-                type=ORDER_TYPE_MARKET,
-                quantity=quantity,
-                positionSide='SHORT'  # 指定持仓方向为空头
-            )
+            params = self.build_short_order_params(symbol, quantity)
+            if client_order_id:
+                params['newClientOrderId'] = client_order_id
+            order = self.client.futures_create_order(**params)
+            
+            if not self.is_order_filled(order):
+                logger.error(f"开空单未成交 (IOC已过期): {order}")
+                return None
             
             logger.info(f"成功开空 {symbol}: {order}")
             return order
@@ -188,9 +397,123 @@ class BinanceTrader:
             logger.error(f"开空单时发生错误: {e}")
             return None
     
-    def execute_short_trade(self, coin: str, symbol: str, leverage: int, usdc_amount: float) -> bool:
+    def open_short_batch(self, orders: List[Dict]) -> Dict[str, Optional[Dict]]:
         """
-        执行完整的开空交易流程
+        批量开空单（单次请求最多5个订单）
+        
+        每个订单带有自定义订单ID：请求超时、连接断开或服务端错误时整批订单可能已被接受，
+        先按ID查询订单状态，只重新提交确认不存在的订单，状态无法确认的订单记为失败（避免重复开仓）
+        
+        Args:
+            orders: 订单列表，每项包含 symbol/quantity
+            
+        Returns:
+            交易对到订单信息的字典，失败的订单为None
+        """
+        results = {}
+        for i in range(0, len(orders), BATCH_ORDER_LIMIT):
+            chunk = [dict(o, client_order_id=f"hb-{uuid.uuid4().hex[:24]}") for o in orders[i:i + BATCH_ORDER_LIMIT]]
+            # 批量下单接口要求所有参数为字符串
+            batch_orders = []
+            for o in chunk:
+                params = self.build_short_order_params(o['symbol'], o['quantity'])
+                params['newClientOrderId'] = o['client_order_id']
+                batch_orders.append({key: str(value) for key, value in params.items()})
+            
+            try:
+                response = self.client.futures_place_batch_order(batchOrders=batch_orders)
+            except BinanceAPIException as e:
+                if e.code in BATCH_REJECTED_CODES:
+                    # 整批请求被明确拒绝时改为并发逐个下单
+                    logger.warning(f"批量下单请求被拒绝，改为并发下单: {e}")
+                    results.update(self._open_short_concurrently(chunk))
+                else:
+                    logger.error(f"批量下单请求失败，订单状态未知: {e}")
+                    results.update(self._recover_batch(chunk))
+                continue
+            except Exception as e:
+                logger.error(f"批量下单请求失败，订单状态未知: {e}")
+                results.update(self._recover_batch(chunk))
+                continue
+            
+            # 返回结果与请求顺序一一对应，单个订单失败时返回 {code, msg}
+            for o, item in zip(chunk, response):
+                if isinstance(item, dict) and 'orderId' in item and self.is_order_filled(item):
+                    logger.info(f"成功开空 {o['symbol']}: {item}")
+                    results[o['symbol']] = item
+                else:
+                    logger.error(f"批量开空 {o['symbol']} 失败: {item}")
+                    results[o['symbol']] = None
+        
+        return results
+    
+    def _recover_batch(self, orders: List[Dict]) -> Dict[str, Optional[Dict]]:
+        """
+        批量下单请求结果未知时按自定义订单ID查询各订单，只重新提交确认不存在的订单
+        
+        Args:
+            orders: 订单列表，每项包含 symbol/quantity/client_order_id
+            
+        Returns:
+            交易对到订单信息的字典，失败或状态未知的订单为None
+        """
+        results = {}
+        missing = []
+        for o in orders:
+            try:
+                order = self.client.futures_get_order(symbol=o['symbol'], origClientOrderId=o['client_order_id'])
+            except BinanceAPIException as e:
+                if e.code == ORDER_NOT_FOUND_CODE:
+                    missing.append(o)
+                else:
+                    logger.error(f"❌ 查询 {o['symbol']} 订单 {o['client_order_id']} 失败，状态未知，不重新下单: {e}")
+                    results[o['symbol']] = None
+                continue
+            except Exception as e:
+                logger.error(f"❌ 查询 {o['symbol']} 订单 {o['client_order_id']} 失败，状态未知，不重新下单: {e}")
+                results[o['symbol']] = None
+                continue
+            
+            # 有成交数量，或市价单已被接受（成交可能尚未反映在查询结果中）
+            accepted = order.get('status') in ('NEW', 'PARTIALLY_FILLED', 'FILLED')
+            if float(order.get('executedQty', 0)) > 0 or (accepted and self.is_order_filled(order)):
+                logger.info(f"批量下单已被接受 {o['symbol']}: {order}")
+                results[o['symbol']] = order
+            else:
+                logger.error(f"批量开空 {o['symbol']} 未成交: {order}")
+                results[o['symbol']] = None
+        
+        if missing:
+            logger.warning(f"批量下单未被接受的订单改为并发下单: {', '.join(o['symbol'] for o in missing)}")
+            results.update(self._open_short_concurrently(missing))
+        return results
+    
+    def _open_short_concurrently(self, orders: List[Dict]) -> Dict[str, Optional[Dict]]:
+        """
+        并发逐个开空单
+        
+        Args:
+            orders: 订单列表，每项包含 symbol/quantity，可选 client_order_id
+            
+        Returns:
+            交易对到订单信息的字典，失败的订单为None
+        """
+        open_short = tracing.wrap(self.open_short_position)
+        futures = {
+            o['symbol']: self._get_executor().submit(open_short, o['symbol'], o['quantity'], o.get('client_order_id'))
+            for o in orders
+        }
+        return {symbol: future.result() for symbol, future in futures.items()}
+    
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """获取用于并发请求的线程池（按需创建）"""
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=BATCH_ORDER_LIMIT, thread_name_prefix='binance-leg')
+        return self.executor
+    
+    def prepare_short_order(self, coin: str, symbol: str, leverage: int, usdc_amount: float) -> Optional[float]:
+        """
+        开空前的准备：设置保证金模式和杠杆、获取价格并计算数量
         
         Args:
             coin: 币种 (ETH/BTC)
@@ -199,32 +522,54 @@ class BinanceTrader:
             usdc_amount: USDC保证金金额
             
         Returns:
-            是否成功
+            交易数量，失败时返回None
         """
-        try:
-            position_value = usdc_amount * leverage
-            logger.info(f"开始执行 {coin} 开空交易: {symbol}, 杠杆: {leverage}x, 保证金: {usdc_amount} USDC, 持仓价值: {position_value} USDC")
-            
+        position_value = usdc_amount * leverage
+        logger.info(f"开始执行 {coin} 开空交易: {symbol}, 杠杆: {leverage}x, 保证金: {usdc_amount} USDC, 持仓价值: {position_value} USDC")
+        
+        if self.primed_leverage.get(symbol) != leverage:
             # 1. 设置保证金模式（全仓）
             self.set_margin_type(symbol, 'CROSSED')
             
             # 2. 设置杠杆
             if not self.set_leverage(symbol, leverage):
                 logger.error(f"设置杠杆失败，取消交易")
-                return False
-            
-            # 3. 获取当前价格
+                return None
+        
+        # 3. 获取当前价格（本地订单簿可用时直接使用中间价，省去一次请求）
+        book = self.order_book.get_book(symbol) if self.order_book else None
+        current_price = book.mid_price() if book else None
+        if current_price is None:
             ticker = self.client.futures_symbol_ticker(symbol=symbol)
             current_price = float(ticker['price'])
-            logger.info(f"当前 {coin} 价格: {current_price} USDC")
-            
-            # 4. 计算交易数量
-            quantity = self.calculate_quantity(symbol, usdc_amount, leverage, current_price)
-            if quantity <= 0:
-                logger.error(f"计算数量失败，取消交易")
-                return False
+        logger.info(f"当前 {coin} 价格: {current_price} USDC")
+        
+        # 4. 计算交易数量
+        quantity = self.calculate_quantity(symbol, usdc_amount, leverage, current_price)
+        if quantity <= 0:
+            logger.error(f"计算数量失败，取消交易")
+            return None
+        
+        logger.info(f"计算交易数量: {quantity} {coin}, 预估持仓价值: {quantity * current_price:.2f} USDC")
+        return quantity
+    
+    def execute_short_trade(self, coin: str, symbol: str, leverage: int, usdc_amount: float) -> Optional[Dict]:
+        """
+        执行完整的开空交易流程
+        
+        Args:
+            coin: 币种 (ETH/BTC)
+            symbol: 交易对符号
+            leverage: 杠杆倍数
+            usdc_amount: USDC保证金金额
             
-            logger.info(f"计算交易数量: {quantity} {coin}, 预估持仓价值: {quantity * current_price:.2f} USDC")
+        Returns:
+            订单信息，失败时返回None
+        """
+        try:
+            quantity = self.prepare_short_order(coin, symbol, leverage, usdc_amount)
+            if quantity is None:
+                return None
             
             # 5. 执行开空
             order = self.open_short_position(symbol, quantity)
@@ -237,14 +582,78 @@ class BinanceTrader:
                     actual_value = quantity * avg_price
                     logger.info(f"成交均价: {avg_price}, 实际持仓价值: {actual_value:.2f} USDC")
                 
-                return True
+                return order
             else:
                 logger.error(f"❌ {coin} 开空失败")
-                return False
+                return None
                 
         except Exception as e:
             logger.error(f"执行交易时发生错误: {e}", exc_info=True)
-            return False
+            return None
+    
+    def execute_short_batch(self, legs: List[Dict], leverage: int, usdc_amount: float) -> Dict[str, Optional[Dict]]:
+        """
+        同时对多个币种执行开空交易
+        
+        各币种的准备请求并发执行，订单合并为一次批量下单请求
+        
+        Args:
+            legs: 交易腿列表，每项包含 coin/symbol，可选 size_scale（保证金缩放比例，默认1）
+            leverage: 杠杆倍数
+            usdc_amount: 每个币种的USDC保证金金额（按 size_scale 缩放）
+            
+        Returns:
+            币种到订单信息的字典，失败的币种为None
+        """
+        if len(legs) == 1:
+            leg = legs[0]
+            amount = usdc_amount * leg.get('size_scale', 1.0)
+            return {leg['coin']: self.execute_short_trade(leg['coin'], leg['symbol'], leverage, amount)}
+        
+        results = {leg['coin']: None for leg in legs}
+        
+        try:
+            # 1. 并发准备各币种（保证金模式、杠杆、价格、数量）
+            executor = self._get_executor()
+            futures = {
+                leg['coin']: executor.submit(self.prepare_short_order, leg['coin'], leg['symbol'], leverage,
+                                             usdc_amount * leg.get('size_scale', 1.0))
+                for leg in legs
+            }
+            
+            orders = []
+            symbol_to_coin = {}
+            for leg in legs:
+                try:
+                    quantity = futures[leg['coin']].result()
+                except Exception as e:
+                    logger.error(f"准备 {leg['coin']} 开空时发生错误: {e}", exc_info=True)
+                    continue
+                if quantity is not None:
+                    orders.append({'symbol': leg['symbol'], 'quantity': quantity})
+                    symbol_to_coin[leg['symbol']] = leg['coin']
+            
+            if not orders:
+                return results
+            
+            # 2. 批量下单
+            if len(orders) == 1:
+                order_results = {orders[0]['symbol']: self.open_short_position(orders[0]['symbol'], orders[0]['quantity'])}
+            else:
+                order_results = self.open_short_batch(orders)
+            
+            for symbol, order in order_results.items():
+                coin = symbol_to_coin[symbol]
+                results[coin] = order
+                if order:
+                    logger.info(f"✅ {coin} 开空成功! 订单ID: {order.get('orderId')}")
+                else:
+                    logger.error(f"❌ {coin} 开空失败")
+            
+        except Exception as e:
+            logger.error(f"批量执行交易时发生错误: {e}", exc_info=True)
+        
+        return results
     
     def get_account_balance(self) -> Optional[Dict]:
         """
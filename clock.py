@@ -0,0 +1,241 @@
+"""
+时钟与定时任务模块
+监控器的计时（保活间隔、主循环间隔、重连退避、静默阈值、持仓打印间隔、速率限制）都通过可注入的时钟进行：
+- SystemClock: 系统时间，定时任务在后台线程中执行（生产环境）
+- SimulatedClock: 虚拟时间，定时任务在调用 advance() 的线程中按时间顺序同步执行，
+  可在几秒内运行数天的保活、重连和持仓打印，用于长时间运行测试（内存增长、定时漂移）
+"""
+import time
+import heapq
+import itertools
+import threading
+import logging
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SystemClock:
+    """系统时钟：真实时间，定时任务在后台线程中执行"""
+
+    def time(self) -> float:
+        """当前时间戳（秒）"""
+        return time.time()
+
+    def monotonic(self) -> float:
+        """单调时间（秒）"""
+        return time.monotonic()
+
+    def sleep(self, seconds: float):
+        """等待指定时间"""
+        time.sleep(seconds)
+
+    def wait(self, event: threading.Event, timeout: Optional[float] = None) -> bool:
+        """
+        等待事件
+
+        Args:
+            event: 事件
+            timeout: 最长等待时间（秒），None表示一直等待
+
+        Returns:
+            事件是否已设置
+        """
+        return event.wait(timeout)
+
+    def call_later(self, delay: float, func: Callable, name: Optional[str] = None) -> threading.Timer:
+        """
+        延迟执行一次
+
+        Args:
+            delay: 延迟（秒）
+            func: 执行的函数
+            name: 线程名（可选）
+
+        Returns:
+            任务句柄（cancel() 取消）
+        """
+        timer = threading.Timer(delay, func)
+        timer.daemon = True
+        if name:
+            timer.name = name
+        timer.start()
+        return timer
+
+    def call_every(self, interval: float, func: Callable, name: Optional[str] = None) -> 'PeriodicTask':
+        """
+        按固定间隔重复执行（按开始时间计算下一次，执行耗时不会累积为漂移）
+
+        Args:
+            interval: 间隔（秒）
+            func: 执行的函数
+            name: 线程名（可选）
+
+        Returns:
+            任务句柄（cancel() 取消）
+        """
+        return PeriodicTask(interval, func, name)
+
+
+class PeriodicTask:
+    """系统时钟的周期任务（后台线程）"""
+
+    def __init__(self, interval: float, func: Callable, name: Optional[str] = None):
+        self.interval = interval
+        self.func = func
+        self.cancelled = threading.Event()
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        deadline = time.monotonic() + self.interval
+        while not self.cancelled.wait(max(deadline - time.monotonic(), 0)):
+            try:
+                self.func()
+            except Exception as e:
+                logger.error(f"定时任务 {self.thread.name} 出错: {e}", exc_info=True)
+            deadline += self.interval
+            if deadline < time.monotonic():
+                # 执行时间超过一个间隔时跳过错过的次数，不连续补执行
+                deadline = time.monotonic() + self.interval
+
+    def cancel(self):
+        """取消任务"""
+        self.cancelled.set()
+
+
+SYSTEM_CLOCK = SystemClock()
+
+
+class SimulatedTask:
+    """模拟时钟中的定时任务"""
+
+    __slots__ = ('deadline', 'interval', 'func', 'name', 'cancelled')
+
+    def __init__(self, deadline: float, interval: Optional[float], func: Callable, name: Optional[str]):
+        self.deadline = deadline
+        self.interval = interval
+        self.func = func
+        self.name = name
+        self.cancelled = False
+
+    def cancel(self):
+        """取消任务"""
+        self.cancelled = True
+
+
+class SimulatedClock:
+    """模拟时钟：时间只在调用 advance() 时前进，到期的定时任务按时间顺序在调用线程中执行"""
+
+    def __init__(self, start_time: float = 1700000000.0):
+        """
+        初始化模拟时钟
+
+        Args:
+            start_time: 起始时间戳（秒）
+        """
+        self.start_time = start_time
+        self.now = 0.0
+        self.lock = threading.Lock()
+        self.tasks = []  # (到期时间, 序号, 任务) 小顶堆
+        self.seq = itertools.count()
+        self.driver = None  # 正在执行 advance() 的线程
+        self.tasks_run = 0
+
+    def time(self) -> float:
+        """当前虚拟时间戳（秒）"""
+        return self.start_time + self.now
+
+    def monotonic(self) -> float:
+        """虚拟单调时间（秒）"""
+        return self.now
+
+    def _schedule(self, delay: float, interval: Optional[float], func: Callable, name: Optional[str]) -> SimulatedTask:
+        with self.lock:
+            task = SimulatedTask(self.now + max(delay, 0.0), interval, func, name)
+            heapq.heappush(self.tasks, (task.deadline, next(self.seq), task))
+        return task
+
+    def call_later(self, delay: float, func: Callable, name: Optional[str] = None) -> SimulatedTask:
+        """延迟执行一次（虚拟时间到达时在 advance() 的调用线程中执行）"""
+        return self._schedule(delay, None, func, name)
+
+    def call_every(self, interval: float, func: Callable, name: Optional[str] = None) -> SimulatedTask:
+        """按固定间隔重复执行"""
+        return self._schedule(interval, interval, func, name)
+
+    def wait(self, event: threading.Event, timeout: Optional[float] = None) -> bool:
+        """
+        在其他线程中等待事件，虚拟时间到达超时时返回（不能在定时任务中调用）
+
+        Args:
+            event: 事件
+            timeout: 最长等待的虚拟时间（秒），None表示一直等待
+
+        Returns:
+            事件是否已设置
+        """
+        if threading.get_ident() == self.driver:
+            raise RuntimeError("模拟时钟的定时任务中不能等待，请改用 call_later")
+        if timeout is None:
+            return event.wait()
+        expired = threading.Event()
+        task = self.call_later(timeout, expired.set)
+        while not event.is_set() and not expired.is_set():
+            event.wait(0.001)
+        task.cancel()
+        return event.is_set()
+
+    def sleep(self, seconds: float):
+        """在其他线程中等待指定的虚拟时间"""
+        self.wait(threading.Event(), seconds)
+
+    def advance(self, seconds: float) -> int:
+        """
+        虚拟时间前进，按到期顺序执行期间到期的定时任务（周期任务按到期时间重新安排，不产生漂移）
+
+        Args:
+            seconds: 前进的时间（秒）
+
+        Returns:
+            执行的任务数
+        """
+        target = self.now + seconds
+        executed = 0
+        self.driver = threading.get_ident()
+        try:
+            while True:
+                with self.lock:
+                    if not self.tasks or self.tasks[0][0] > target:
+                        break
+                    deadline, _, task = heapq.heappop(self.tasks)
+                    if task.cancelled:
+                        continue
+                    self.now = max(self.now, deadline)
+                try:
+                    task.func()
+                except Exception as e:
+                    logger.error(f"模拟定时任务 {task.name or task.func} 出错: {e}", exc_info=True)
+                executed += 1
+                if task.interval is not None and not task.cancelled:
+                    with self.lock:
+                        task.deadline = deadline + task.interval
+                        heapq.heappush(self.tasks, (task.deadline, next(self.seq), task))
+            with self.lock:
+                self.now = max(self.now, target)
+        finally:
+            self.driver = None
+        self.tasks_run += executed
+        return executed
+
+    def next_deadline(self) -> Optional[float]:
+        """最早到期任务的虚拟单调时间，没有任务时返回None"""
+        with self.lock:
+            while self.tasks and self.tasks[0][2].cancelled:
+                heapq.heappop(self.tasks)
+            return self.tasks[0][0] if self.tasks else None
+
+    def pending(self) -> int:
+        """尚未执行（未取消）的任务数"""
+        with self.lock:
+            return sum(1 for _, _, task in self.tasks if not task.cancelled)
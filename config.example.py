@@ -11,17 +11,39 @@ BINANCE_API_SECRET = 'your_binance_api_secret_here'
 MONITOR_ADDRESS = '0xc2a30212a8DdAc9e123944d6e29FADdCe994E5f2'
 SCAN_INTERVAL = 5  # 扫描间隔（秒） - 仅用于HTTP轮询模式
 USE_WEBSOCKET = True  # 是否使用WebSocket模式（推荐，避免速率限制）
-POSITION_PRINT_INTERVAL = 300  # 持仓打印间隔（秒），默认300秒=5分钟
+POSITION_PRINT_INTERVAL = 300  # 持仓打印间隔（秒），默认300秒=5分钟（WebSocket模式打印本地持仓镜像，不发起请求）
+POSITION_CONSISTENCY_INTERVAL = 3600  # 全量查询校验持仓镜像的间隔（秒），仅WebSocket模式使用
 USER_FILLS_LIMIT = 20  # 每次获取的订单数量，默认20条（仅HTTP轮询模式使用）
 
 # 交易配置
 LEVERAGE = 100  # 杠杆倍数
 POSITION_SIZE_USDC = 50  # 保证金金额（USDC），实际持仓价值 = 保证金 × 杠杆
 
+# 开仓数量模式
+# 'FIXED'        = 每次固定使用 POSITION_SIZE_USDC 保证金
+# 'PROPORTIONAL' = 按监控地址本次平掉的持仓比例缩放保证金（平掉一半持仓则使用一半保证金）
+POSITION_SIZING_MODE = 'FIXED'
+POSITION_SIZE_MIN_SCALE = 0.1  # 按比例开仓时的最小缩放比例，避免数量过小无法下单
+
+# 多账户配置（可选）
+# 为空时使用上面的 BINANCE_API_KEY / LEVERAGE / POSITION_SIZE_USDC 作为唯一账户
+# 配置后同一个平仓信号会并发分发到所有账户，每个账户独立的密钥、杠杆和保证金
+BINANCE_ACCOUNTS = [
+    # {'name': 'sub1', 'api_key': 'sub1_api_key', 'api_secret': 'sub1_api_secret', 'leverage': 50, 'position_size_usdc': 20},
+    # {'name': 'sub2', 'api_key': 'sub2_api_key', 'api_secret': 'sub2_api_secret', 'leverage': 100, 'position_size_usdc': 50},
+]
+
 # Hyperliquid API配置
 HYPERLIQUID_API_URL = 'https://api.hyperliquid.xyz/info'
 HYPERLIQUID_WS_URL = 'wss://api.hyperliquid.xyz/ws'  # WebSocket地址
-# WebSocket心跳间隔：20秒（自动发送ping保持连接，防止超时断开）
+WS_PING_INTERVAL = 30  # 应用层ping间隔（秒），每个ping与pong匹配计算往返时间（RTT）；不要超过50秒（静默重连阈值）
+WS_RTT_RECYCLE_MS = 1000  # 平滑RTT超过该值（毫秒）时主动重连，0表示不按RTT重连
+WS_PONG_LOSS_LIMIT = 2  # 连续该数量的ping未收到pong时主动重连，0表示只在完全没有消息时重连
+
+# WebSocket信号通道：'userFills' / 'userEvents' / 'orderUpdates'
+# 订阅多个通道时按订单ID去重，由最先到达的通道触发下单，并统计各通道的获胜次数和领先时间
+# userFills 始终订阅（用于更新持仓镜像）；orderUpdates 只在订单完全成交时触发，订单推送不含成交价，已实现盈亏记为未知（不检查 pnl_sign 条件）
+WS_SIGNAL_CHANNELS = ['userFills']
 
 # 交易对配置
 TRADING_PAIRS = {
@@ -29,9 +51,150 @@ TRADING_PAIRS = {
     'BTC': 'BTCUSDC'
 }
 
+# 平仓信号规则
+# 启动时编译为直接作用于原始成交的判断函数，HTTP和WebSocket监控器共用
+SIGNAL_RULES = {
+    'coins': ['ETH', 'BTC'],  # 币种集合，为空表示不限
+    'directions': ['Close Long', 'Long > Short'],  # 成交的 dir 字段（平多、多翻空），为空表示不限
+    'side': 'A',  # 成交缺少 dir 字段时按卖出方向判断
+    'min_size': 0,  # 最小成交数量，0表示不限
+    'min_notional': 0,  # 最小成交金额（数量 × 价格），0表示不限
+    'pnl_sign': 'nonzero',  # 已实现盈亏符号: 'any' / 'nonzero' / 'positive' / 'negative'
+    'address_overrides': {
+        # '0x...': {'min_notional': 10000},  # 对某个监控地址覆盖部分规则字段
+    }
+}
+
+# 下单模式
+# 'MARKET' = 市价单
+# 'IOC'    = 限价IOC单：价格由本地订单簿（深度快照+增量深度流）按最大滑点在本地计算，不增加请求
+ORDER_EXECUTION_MODE = 'MARKET'
+IOC_MAX_SLIPPAGE_BPS = 20  # IOC模式下相对最优买价的最大滑点（基点，20 = 0.2%）
+ORDER_BOOK_STALE_SECONDS = 5  # 本地订单簿超过该秒数未更新则视为过期，自动改用市价单
+
+# 币安接口地址（留空使用币安正式网/测试网）
+# 指向本地替身服务器（python binance_standin.py）时可在本机复现延迟和错误，例如:
+# BINANCE_REST_URL = 'http://127.0.0.1:8765'
+# BINANCE_WS_URL = 'ws://127.0.0.1:8765'
+BINANCE_REST_URL = ''  # REST接口地址
+BINANCE_WS_URL = ''  # 行情流和用户数据流地址
+
+# 执行后端
+# 'BINANCE' = 向币安下单
+# 'PAPER'   = 模拟盘：按本地订单簿（逐档吃买盘）模拟成交，余额和持仓只在内存中，不需要API密钥，不发送任何订单
+EXECUTION_BACKEND = 'BINANCE'
+PAPER_INITIAL_BALANCE = 10000  # 模拟盘每个账户的初始余额（USDC）
+PAPER_LATENCY_MS = 50  # 模拟下单延迟的平均值（毫秒）
+PAPER_LATENCY_JITTER_MS = 20  # 模拟下单延迟的标准差（毫秒）
+PAPER_SLIPPAGE_BPS = 2  # 在订单簿成交价之外额外计入的滑点（基点）
+PAPER_FEE_RATE = 0.0005  # 模拟手续费率（0.05%，币安U本位合约吃单费率）
+
+# 开单状态对账
+# 通过币安用户数据流维护持仓缓存，持仓归零后自动重置该币种的开单状态，状态不一致时发送警报
+RECONCILE_ENABLED = True
+RECONCILE_INTERVAL = 300  # 后台全量刷新持仓的间隔（秒），兜底用户数据流可能遗漏的变化
+RECONCILE_GRACE_SECONDS = 60  # 开单后的宽限时间（秒），期间不会因持仓为空而重置
+
+# 热备（同一台机器上运行两个相同配置的实例）
+# 两个实例都保持监控订阅和下单准备，只有持有租约的主实例下单；
+# 主实例崩溃、卡死或退出后，备用实例在租约过期后（约 STANDBY_LEASE_TTL 秒内）接管，开单状态文件通过文件锁共享
+STANDBY_ENABLED = False
+STANDBY_LEASE_PATH = 'standby_lease.db'  # SQLite租约文件（两个实例必须相同）
+STANDBY_LEASE_TTL = 0.6  # 租约有效期（秒），即最长切换时间
+STANDBY_HEARTBEAT_INTERVAL = 0.1  # 续约/抢占租约的间隔（秒）
+
+# 配置热加载
+# 收到 SIGHUP（kill -HUP <pid>）或检测到本文件被修改时重新加载以下配置，不重新连接、不重新启动：
+# MONITOR_ADDRESS、TRADING_PAIRS、LEVERAGE、POSITION_SIZE_USDC、BINANCE_ACCOUNTS 中的杠杆和保证金、
+# POSITION_SIZING_MODE、POSITION_SIZE_MIN_SCALE、SIGNAL_RULES 以及各种间隔；新配置校验失败时继续使用当前配置
+# 其他配置（API密钥、执行后端、新增账户等）修改后仍需重启
+CONFIG_RELOAD_ENABLED = True
+CONFIG_RELOAD_INTERVAL = 2  # 检查配置文件是否修改的间隔（秒），0表示只响应 SIGHUP
+
+# 优雅退出
+# 收到 SIGINT/SIGTERM 后停止接收新信号，等待正在处理的信号（下单、写入开单状态、通知）完成后
+# 保存开单状态、让出热备租约并退出；再次收到信号时立即退出
+SHUTDOWN_DRAIN_TIMEOUT = 10  # 等待正在处理的信号完成的最长时间（秒）
+
+# 信号追踪
+# 每个平仓信号分配追踪ID，解析、开单检查、每个币安请求、写入开单状态和Telegram通知的耗时
+# 以 Chrome trace-event 格式写入 TRACE_DIR，可在 https://ui.perfetto.dev 中打开，
+# 或用 python tracing.py traces/*.json 列出最慢的信号；只在处理信号时记录，可常开
+TRACE_ENABLED = True
+TRACE_DIR = 'traces'  # 追踪文件目录，每次启动一个文件
+TRACE_MAX_FILES = 20  # 最多保留的追踪文件数量
+
+# 运行时诊断（不停止监控，结果写入 DIAG_OUTPUT_DIR）
+# kill -USR1 <pid>  输出所有线程栈并开始 DIAG_PROFILE_SECONDS 秒的采样分析
+# kill -USR2 <pid>  内存快照（第一次启动 tracemalloc，之后与上一次比较）
+# python diagnostics.py threads | profile 30 | mem | mem stop | status  通过管理套接字发送命令
+DIAG_ENABLED = True
+DIAG_SOCKET_PATH = '/tmp/hyper_binance_diag_{pid}.sock'  # 管理套接字路径（{pid} 替换为进程ID），留空表示只响应信号
+DIAG_OUTPUT_DIR = 'diagnostics'  # 诊断结果目录
+DIAG_PROFILE_SECONDS = 30  # 信号触发的采样分析时长（秒）
+DIAG_SAMPLE_INTERVAL_MS = 5  # 采样间隔（毫秒）
+
+# 信号总线（多进程部署）
+# python main.py --role monitor   只监控，通过 Unix 域套接字广播平仓信号
+# python main.py --role executor  只下单，订阅信号总线（可启动多个下单进程订阅同一个监控进程）
+SIGNAL_BUS_PATH = '/tmp/hyper_binance_signals.sock'
+
+# 分片监控（监控数千个地址）
+# python main.py --role shard --worker shard-0   每个工作进程按一致性哈希认领地址列表中的一部分地址
+# python main.py --role executor                 下单进程默认订阅 SHARD_WORKERS 中所有工作进程的信号总线
+# python sharding.py status                      查看各工作进程的地址数、连接数、吞吐量和内存
+# 工作进程退出或停止心跳超过 SHARD_MEMBER_TTL 秒后，其地址自动由其他工作进程接管
+SHARD_WORKERS = []  # 工作进程名称，如 ['shard-0', 'shard-1', 'shard-2']；为空表示不使用分片
+SHARD_ADDRESSES_FILE = 'addresses.txt'  # 监控地址列表（每行一个地址，# 开头为注释，修改后自动重新分配）
+SHARD_DB_PATH = 'shard_members.db'  # 成员表 SQLite 路径（所有工作进程必须在同一台机器上使用同一个文件）
+SHARD_BUS_PATH = '/tmp/hyper_binance_shard_{worker}.sock'  # 工作进程的信号总线路径（{worker} 替换为名称）
+# Hyperliquid 按IP限制 WebSocket：最多100个连接、1000个订阅，且所有连接上的 userFills 等用户订阅合计最多10个不同地址，
+# 增加每个连接的地址数或连接数不能突破该上限。所有工作进程运行在同一台机器上，监控更多地址需要给机器绑定多个出口IP，
+# 每个IP只分配给一个工作进程，每个连接从其中一个IP发起，每个IP最多订阅10个地址（N 个IP 最多监控 10×N 个地址）。
+# 没有配置出口IP的工作进程使用系统默认出口IP，最多只能有一个；配置超过上限或地址数超过总容量时工作进程拒绝启动，
+# 运行中超出容量（如其他工作进程退出后接管）或被交易所拒绝的地址记为未订阅（不计入监控地址数）并发送警报
+SHARD_SOURCE_ADDRESSES = {}  # 工作进程名称 -> 本机出口IP列表，如 {'shard-0': ['203.0.113.10', '203.0.113.11'], 'shard-1': ['203.0.113.12']}
+SHARD_ADDRESSES_PER_CONNECTION = 10  # 每个 WebSocket 连接订阅的地址数上限（不能超过每个IP的上限10）
+SHARD_HEARTBEAT_INTERVAL = 2  # 心跳和重新分配的间隔（秒）
+SHARD_MEMBER_TTL = 10  # 心跳有效期（秒），超过后其地址由其他工作进程接管
+SHARD_STATS_INTERVAL = 60  # 输出吞吐量和内存统计日志的间隔（秒）
+
+# 低延迟模式
+# 启动时预设各交易对的保证金模式和杠杆并构建下单模板（下单前不再重复设置），冻结启动对象，
+# 下单热路径内暂停垃圾回收，信号横幅和Telegram通知推迟到下单之后，并统计回收停顿
+LATENCY_MODE = False
+
+# 部分成交聚合
+# 一次平仓常拆成多条共享同一 oid 的成交，按订单聚合后只输出一个信号
+# 'OFF'      = 不聚合，每条成交单独判断
+# 'LATENCY'  = 订单的第一条成交立即触发，后续成交只合并不再触发
+# 'ACCURACY' = 订单静默 FILL_AGGREGATION_QUIET_MS 毫秒后输出合并信号（总数量、均价、总盈亏）
+FILL_AGGREGATION_MODE = 'OFF'
+FILL_AGGREGATION_QUIET_MS = 50
+FILL_AGGREGATION_MAX_ORDERS = 1000  # 最多保留的订单数量
+
+# 信号合并窗口（毫秒）
+# 同一帧内的多个平仓信号总是合并为一次批量下单；大于0时还会合并该窗口内陆续到达的信号
+SIGNAL_BATCH_WINDOW_MS = 0
+
 # 日志配置
 LOG_FILE = 'trading_monitor.log'
 LOG_LEVEL = 'INFO'
+LOG_JSON_FILE = None  # JSON-lines 格式的日志文件（如 'trading_monitor.jsonl'），None表示不输出
+# 同一行代码的DEBUG日志和声明限流的高频INFO日志（ping、逐帧日志等）在窗口内最多输出的条数，0表示不限流
+# 下单、成交等其他INFO日志不受限制
+LOG_RATE_LIMIT_WINDOW = 10  # 限流窗口（秒）
+LOG_RATE_LIMIT_MAX = 20
+
+# 启动配置
+# 账户信息、持仓查询和启动通知在订阅完成后于后台并发执行，每个步骤的等待时间上限（秒）
+STARTUP_STEP_BUDGET = 10
+
+# 历史成交回填配置（fill_backfill.py）
+FILL_ARCHIVE_DIR = 'fill_archive'  # 列式存档目录，每个地址一个子目录
+BACKFILL_WORKERS = 4  # 并发回填的时间窗口数
+# 回填请求每分钟的总权重（Hyperliquid 每个IP每分钟1200），留出余量给运行中的监控
+BACKFILL_WEIGHT_PER_MINUTE = 600
 
 # 测试模式（True=使用币安测试网，False=使用正式网）
 USE_TESTNET = False
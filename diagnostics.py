@@ -0,0 +1,456 @@
+"""
+运行时诊断模块
+在不停止监控的情况下排查线上问题（内存持续增长、CPU 突增、线程卡住），结果写入文件：
+- 线程栈：所有线程（WebSocket 读取、保活、主循环、账户线程等）当前的调用栈
+- 采样分析：在后台线程中按固定间隔采样所有线程的调用栈 N 秒，输出折叠栈（可用 flamegraph.pl / speedscope 打开）和热点函数汇总
+- 内存快照：第一次启动 tracemalloc 并记录基线，之后每次与上一次快照比较，输出增长最多的代码行
+- 状态：已注册的内部集合大小（如已处理成交ID数量）
+
+触发方式：
+- kill -USR1 <pid>  输出线程栈并开始一次采样分析
+- kill -USR2 <pid>  记录内存快照（与上一次比较）
+- 本地管理套接字：python diagnostics.py threads | profile 30 | mem | mem stop | status
+"""
+import os
+import sys
+import glob
+import time
+import queue
+import signal
+import socket
+import argparse
+import threading
+import traceback
+import tracemalloc
+import logging
+from collections import Counter
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+TRACEMALLOC_FRAMES = 10  # 内存快照记录的调用栈深度
+TOP_LINES = 30  # 汇总中列出的条目数
+COMMANDS = ('threads', 'profile', 'mem', 'status', 'help')
+# 快照本身的分配（上一次快照的数据）不计入结果；在统计结果上过滤，逐条过滤快照在大堆上需要数秒
+IGNORED_FILES = (tracemalloc.__file__, '<frozen importlib._bootstrap>', '<frozen importlib._bootstrap_external>')
+
+
+def format_thread_stacks() -> str:
+    """
+    格式化所有线程当前的调用栈
+
+    Returns:
+        线程栈文本
+    """
+    names = {thread.ident: thread for thread in threading.enumerate()}
+    lines = [f"线程栈 - {datetime.now().isoformat(timespec='seconds')} (pid {os.getpid()}, {len(names)} 个线程)", '']
+    for ident, frame in sys._current_frames().items():
+        thread = names.get(ident)
+        name = thread.name if thread else '未知线程'
+        daemon = ' daemon' if thread is not None and thread.daemon else ''
+        lines.append(f'--- {name} (ident {ident}{daemon}) ---')
+        lines.extend(line.rstrip('\n') for line in traceback.format_stack(frame))
+        lines.append('')
+    return '\n'.join(lines)
+
+
+class SamplingProfiler:
+    """采样分析器：在后台线程中定期采样所有线程的调用栈"""
+
+    def __init__(self, interval: float = 0.005):
+        """
+        初始化采样分析器
+
+        Args:
+            interval: 采样间隔（秒）
+        """
+        self.interval = interval
+        self.stacks = Counter()  # 折叠栈 -> 采样次数
+        self.samples = 0
+
+    @staticmethod
+    def _frame_name(frame) -> str:
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+    def sample(self, skip_ident: Optional[int] = None):
+        """采样一次所有线程的调用栈"""
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == skip_ident:
+                continue
+            frames = []
+            while frame is not None:
+                frames.append(self._frame_name(frame))
+                frame = frame.f_back
+            frames.append(names.get(ident, str(ident)))
+            self.stacks[';'.join(reversed(frames))] += 1
+        self.samples += 1
+
+    def run(self, seconds: float, stop_event: Optional[threading.Event] = None):
+        """
+        采样指定时间（在调用线程中执行，不采样调用线程自身）
+
+        Args:
+            seconds: 采样时长（秒）
+            stop_event: 提前结束的事件（可选）
+        """
+        ident = threading.get_ident()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            if stop_event is not None and stop_event.is_set():
+                break
+            self.sample(skip_ident=ident)
+            time.sleep(self.interval)
+
+    def folded(self) -> str:
+        """折叠栈格式（每行: 线程;外层函数;...;内层函数 次数）"""
+        return '\n'.join(f'{stack} {count}' for stack, count in self.stacks.most_common()) + '\n'
+
+    def summary(self, top: int = TOP_LINES) -> List[str]:
+        """
+        热点汇总：每个线程自身耗时最多的函数（栈顶），以及所有线程中包含子调用耗时最多的函数
+
+        Args:
+            top: 列出的条目数
+
+        Returns:
+            汇总行列表
+        """
+        threads = Counter()
+        own: Dict[str, Counter] = {}
+        inclusive = Counter()
+        for stack, count in self.stacks.items():
+            parts = stack.split(';')
+            threads[parts[0]] += count
+            if len(parts) > 1:
+                own.setdefault(parts[0], Counter())[parts[-1]] += count
+            for name in set(parts[1:]):
+                inclusive[name] += count
+
+        total = max(sum(threads.values()), 1)
+        lines = [f"采样 {self.samples} 轮（间隔 {self.interval * 1000:.0f}ms），等待中的线程同样计入（栈顶为 wait/select 等）", '']
+        for thread, thread_count in threads.most_common():
+            lines.append(f"线程 {thread} ({thread_count} 次采样) 自身（栈顶）:")
+            lines += [f"  {count / thread_count:7.1%}  {name}" for name, count in own.get(thread, Counter()).most_common(5)]
+        lines += ['', f'所有线程包含子调用（占全部 {total} 次线程采样）:']
+        lines += [f"  {count / total:7.1%}  {name}" for name, count in inclusive.most_common(top)]
+        return lines
+
+
+class Diagnostics:
+    """运行时诊断入口：处理信号和管理套接字发来的诊断命令"""
+
+    def __init__(self, output_dir: str = 'diagnostics', socket_path: Optional[str] = None,
+                 profile_seconds: float = 30, sample_interval_ms: float = 5):
+        """
+        初始化诊断
+
+        Args:
+            output_dir: 诊断结果目录
+            socket_path: 管理套接字路径（可选，None表示只响应信号）
+            profile_seconds: 信号触发的采样分析时长（秒）
+            sample_interval_ms: 采样间隔（毫秒）
+        """
+        self.output_dir = output_dir
+        self.socket_path = socket_path
+        self.profile_seconds = profile_seconds
+        self.sample_interval = sample_interval_ms / 1000
+        self.status_providers: Dict[str, Callable[[], object]] = {}
+
+        self.lock = threading.Lock()
+        self.commands = queue.SimpleQueue()  # 信号处理函数只放入命令，由工作线程执行
+        self.stop_event = threading.Event()
+        self.profile_thread = None
+        self.snapshot = None  # 上一次内存快照
+        self.server = None
+        self.threads: List[threading.Thread] = []
+
+    def add_status(self, name: str, provider: Callable[[], object]):
+        """
+        注册状态项（status 命令和内存快照中输出）
+
+        Args:
+            name: 名称
+            provider: 返回当前值的函数（如集合大小）
+        """
+        self.status_providers[name] = provider
+
+    def _output_path(self, kind: str, suffix: str = 'txt') -> str:
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')[:-3]
+        return os.path.join(self.output_dir, f'{kind}_{stamp}_{os.getpid()}.{suffix}')
+
+    def status(self) -> str:
+        """已注册状态项的当前值"""
+        values = []
+        for name, provider in self.status_providers.items():
+            try:
+                values.append(f"{name}={provider()}")
+            except Exception as e:
+                values.append(f"{name}=<{e}>")
+        memory = f"tracemalloc={'开启' if tracemalloc.is_tracing() else '关闭'}"
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            memory += f" 当前={current / 1024 / 1024:.1f}MB 峰值={peak / 1024 / 1024:.1f}MB"
+        return ', '.join(values + [f"线程数={threading.active_count()}", memory])
+
+    def dump_threads(self) -> str:
+        """
+        输出所有线程的调用栈
+
+        Returns:
+            结果文件路径
+        """
+        path = self._output_path('threads')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(format_thread_stacks())
+        logger.info(f"🩺 线程栈已写入: {path}")
+        return path
+
+    def start_profile(self, seconds: Optional[float] = None) -> str:
+        """
+        在后台开始一次采样分析，结束后写入文件
+
+        Args:
+            seconds: 采样时长（秒），默认为 profile_seconds
+
+        Returns:
+            结果文件路径（采样结束后写入）
+
+        Raises:
+            RuntimeError: 已有采样分析正在进行
+        """
+        seconds = seconds or self.profile_seconds
+        with self.lock:
+            if self.profile_thread and self.profile_thread.is_alive():
+                raise RuntimeError("已有采样分析正在进行")
+            path = self._output_path('profile')
+            self.profile_thread = threading.Thread(target=self._profile_worker, args=(seconds, path),
+                                                   name='diag-profiler', daemon=True)
+            self.profile_thread.start()
+        logger.info(f"🩺 开始采样分析 {seconds} 秒，结果将写入: {path}")
+        return path
+
+    def _profile_worker(self, seconds: float, path: str):
+        profiler = SamplingProfiler(interval=self.sample_interval)
+        started = time.perf_counter()
+        profiler.run(seconds, self.stop_event)
+        elapsed = time.perf_counter() - started
+        folded_path = path[:-len('.txt')] + '.folded'
+        with open(folded_path, 'w', encoding='utf-8') as f:
+            f.write(profiler.folded())
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(f"采样分析 - {elapsed:.1f}秒 (pid {os.getpid()})，折叠栈: {os.path.basename(folded_path)}\n")
+            f.write(f"状态: {self.status()}\n\n")
+            f.write('\n'.join(profiler.summary()) + '\n')
+        logger.info(f"🩺 采样分析完成 ({profiler.samples} 次采样): {path}")
+
+    def memory_snapshot(self) -> str:
+        """
+        记录内存快照：第一次启动 tracemalloc 并记录基线，之后与上一次快照比较
+
+        Returns:
+            结果文件路径
+        """
+        with self.lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+                self.snapshot = None
+            snapshot = tracemalloc.take_snapshot()
+            previous, self.snapshot = self.snapshot, snapshot
+
+        path = self._output_path('memory')
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [
+            f"内存快照 - {datetime.now().isoformat(timespec='seconds')} (pid {os.getpid()})",
+            f"已追踪: 当前 {current / 1024 / 1024:.1f}MB, 峰值 {peak / 1024 / 1024:.1f}MB",
+            f"状态: {self.status()}",
+            ''
+        ]
+        if previous is None:
+            lines.append("已启动 tracemalloc 并记录基线，之后再次触发将输出与本次相比增长最多的代码行")
+            lines.append('')
+        else:
+            lines.append(f"与上一次快照相比增长最多的代码行（前 {TOP_LINES}）:")
+            diff = self._relevant(snapshot.compare_to(previous, 'lineno'))
+            lines += [f"  {stat}" for stat in diff[:TOP_LINES]]
+            lines.append('')
+            lines.append("增长最多的调用栈（前 5）:")
+            for stat in self._relevant(snapshot.compare_to(previous, 'traceback'))[:5]:
+                lines.append(f"  {stat.size_diff / 1024:+.1f} KiB, {stat.count_diff:+d} 个对象")
+                lines += [f"    {line}" for line in stat.traceback.format()]
+            lines.append('')
+        lines.append(f"当前占用最多的代码行（前 {TOP_LINES}）:")
+        lines += [f"  {stat}" for stat in self._relevant(snapshot.statistics('lineno'))[:TOP_LINES]]
+
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        logger.info(f"🩺 内存快照已写入: {path}")
+        return path
+
+    @staticmethod
+    def _relevant(stats: List) -> List:
+        """去掉快照本身和导入机制的分配"""
+        return [stat for stat in stats if stat.traceback[0].filename not in IGNORED_FILES]
+
+    def stop_memory(self) -> str:
+        """停止 tracemalloc（追踪期间内存分配变慢，排查完成后关闭）"""
+        with self.lock:
+            self.snapshot = None
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+        logger.info("🩺 已停止 tracemalloc")
+        return 'tracemalloc 已停止'
+
+    def execute(self, command: str) -> str:
+        """
+        执行一条诊断命令
+
+        Args:
+            command: 命令文本，如 'threads'、'profile 30'、'mem'、'mem stop'、'status'
+
+        Returns:
+            结果（文件路径或状态文本），出错时以 'ERROR' 开头
+        """
+        parts = command.split()
+        if not parts:
+            return 'ERROR 空命令'
+        name, args = parts[0].lower(), parts[1:]
+        try:
+            if name not in COMMANDS:
+                return f"ERROR 未知命令: {name}"
+            if name == 'threads':
+                return self.dump_threads()
+            if name == 'profile':
+                return self.start_profile(float(args[0]) if args else None)
+            if name == 'mem':
+                return self.stop_memory() if args and args[0] == 'stop' else self.memory_snapshot()
+            if name == 'status':
+                return self.status()
+            return '命令: threads | profile [秒] | mem | mem stop | status'
+        except (RuntimeError, ValueError) as e:
+            logger.warning(f"诊断命令 {command!r} 未执行: {e}")
+            return f"ERROR {e}"
+        except Exception as e:
+            logger.error(f"诊断命令 {command!r} 执行失败: {e}", exc_info=True)
+            return f"ERROR {e}"
+
+    def _handle_signal(self, signum, frame):
+        # 信号处理函数中只放入命令，由工作线程写文件，不打断主线程正在进行的处理
+        if signum == signal.SIGUSR1:
+            self.commands.put('threads')
+            self.commands.put('profile')
+        else:
+            self.commands.put('mem')
+
+    def _command_worker(self):
+        while not self.stop_event.is_set():
+            command = self.commands.get()
+            if command is None:
+                break
+            self.execute(command)
+
+    def _serve(self):
+        while not self.stop_event.is_set():
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                break
+            try:
+                conn.settimeout(5)
+                with conn, conn.makefile('rw', encoding='utf-8') as stream:
+                    command = stream.readline().strip()
+                    stream.write(self.execute(command) + '\n')
+                    stream.flush()
+            except OSError as e:
+                logger.warning(f"诊断连接出错: {e}")
+
+    def start(self):
+        """注册 SIGUSR1/SIGUSR2（在主线程中调用时）并启动管理套接字"""
+        worker = threading.Thread(target=self._command_worker, name='diag-commands', daemon=True)
+        worker.start()
+        self.threads.append(worker)
+
+        triggers = []
+        if hasattr(signal, 'SIGUSR1') and threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGUSR1, self._handle_signal)
+            signal.signal(signal.SIGUSR2, self._handle_signal)
+            triggers.append(f"kill -USR1/-USR2 {os.getpid()}")
+
+        if self.socket_path:
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+            self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.server.bind(self.socket_path)
+            os.chmod(self.socket_path, 0o600)
+            self.server.listen(4)
+            server_thread = threading.Thread(target=self._serve, name='diag-socket', daemon=True)
+            server_thread.start()
+            self.threads.append(server_thread)
+            triggers.append(self.socket_path)
+
+        logger.info(f"🩺 运行时诊断已启用: {', '.join(triggers) or '无触发方式'} (结果目录 {self.output_dir})")
+
+    def stop(self):
+        """停止管理套接字、工作线程和正在进行的采样分析"""
+        self.stop_event.set()
+        self.commands.put(None)
+        if self.server:
+            self.server.close()
+            self.server = None
+            try:
+                os.unlink(self.socket_path)
+            except OSError:
+                pass
+
+
+def send_command(socket_path: str, command: str, timeout: float = 60.0) -> str:
+    """
+    通过管理套接字发送诊断命令
+
+    Args:
+        socket_path: 管理套接字路径
+        command: 命令文本
+        timeout: 等待结果的超时时间（秒）
+
+    Returns:
+        结果文本
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.settimeout(timeout)
+        conn.connect(socket_path)
+        with conn.makefile('rw', encoding='utf-8') as stream:
+            stream.write(command + '\n')
+            stream.flush()
+            return stream.readline().strip()
+
+
+def main(argv: Optional[List[str]] = None):
+    """命令行：向运行中的机器人发送诊断命令"""
+    parser = argparse.ArgumentParser(description='向运行中的机器人发送诊断命令')
+    parser.add_argument('command', nargs='+', help='threads | profile [秒] | mem | mem stop | status | help')
+    parser.add_argument('--socket', help='管理套接字路径（默认按 --pid 或唯一的套接字查找）')
+    parser.add_argument('--pid', type=int, help='机器人进程ID')
+    args = parser.parse_args(argv)
+
+    socket_path = args.socket
+    if not socket_path:
+        from config import DIAG_SOCKET_PATH
+        if args.pid:
+            socket_path = DIAG_SOCKET_PATH.format(pid=args.pid)
+        else:
+            candidates = glob.glob(DIAG_SOCKET_PATH.format(pid='*'))
+            if len(candidates) != 1:
+                print(f"找到 {len(candidates)} 个管理套接字，请用 --pid 或 --socket 指定: {candidates}")
+                return 1
+            socket_path = candidates[0]
+
+    result = send_command(socket_path, ' '.join(args.command))
+    print(result)
+    return 1 if result.startswith('ERROR') else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,222 @@
+"""
+部分成交聚合模块
+Hyperliquid 上的一次平仓经常拆成多条共享同一 oid 的 userFills 成交，
+按订单聚合后只输出一个信号（总数量、成交均价、总已实现盈亏）
+"""
+import heapq
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from position_mirror import WatchedAccountMirror
+from signal_rules import CloseSignal
+
+logger = logging.getLogger(__name__)
+
+AGGREGATION_MODE_OFF = 'OFF'
+AGGREGATION_MODE_LATENCY = 'LATENCY'  # 订单的第一条成交立即输出，后续成交只合并不再输出
+AGGREGATION_MODE_ACCURACY = 'ACCURACY'  # 订单静默一段时间后输出合并后的信号
+
+
+class OrderAggregate:
+    """单个订单的成交聚合"""
+
+    __slots__ = ('first', 'size', 'notional', 'closed_pnl', 'fill_ids', 'deadline', 'emitted')
+
+    def __init__(self, signal: Dict):
+        self.first = signal
+        self.size = 0.0
+        self.notional = 0.0
+        self.closed_pnl = 0.0
+        self.fill_ids = []
+        self.deadline = 0.0
+        self.emitted = False
+        self.add(signal)
+
+    def add(self, signal: Dict):
+        """合并一条成交"""
+        self.size += signal['size']
+        self.notional += signal['size'] * signal['price']
+        # 任意一条成交的盈亏未知时合并后的盈亏也未知
+        if self.closed_pnl is not None:
+            self.closed_pnl = None if signal['closed_pnl'] is None else self.closed_pnl + signal['closed_pnl']
+        self.fill_ids.append(signal['fill_id'])
+
+    def to_signal(self) -> CloseSignal:
+        """构造合并后的信号"""
+        signal = CloseSignal(self.first)
+        start_position = signal['start_position']
+        signal.update(
+            size=self.size,
+            price=self.notional / self.size if self.size > 0 else signal['price'],
+            closed_pnl=self.closed_pnl,
+            close_fraction=WatchedAccountMirror.close_fraction(start_position, start_position - self.size),
+            fill_ids=list(self.fill_ids),
+            fill_count=len(self.fill_ids)
+        )
+        return signal
+
+
+class FillAggregator:
+    """按订单ID聚合部分成交的类"""
+
+    def __init__(self, emit: Callable[[List[Dict]], None], mode: str = AGGREGATION_MODE_LATENCY,
+                 quiet_ms: int = 50, max_orders: int = 1000):
+        """
+        初始化成交聚合器
+
+        Args:
+            emit: 信号输出函数，参数为信号列表
+            mode: 聚合模式，'LATENCY' 或 'ACCURACY'
+            quiet_ms: ACCURACY 模式下订单静默多久（毫秒）后输出
+            max_orders: 最多保留的订单数量，超出后淘汰最早的订单
+        """
+        if mode not in (AGGREGATION_MODE_LATENCY, AGGREGATION_MODE_ACCURACY):
+            raise ValueError(f"无效的聚合模式: {mode}")
+
+        self.emit = emit
+        self.mode = mode
+        self.quiet = quiet_ms / 1000.0
+        self.max_orders = max_orders
+
+        self.orders = OrderedDict()  # oid -> OrderAggregate
+        self.deadlines = []  # (到期时间, oid) 小顶堆
+        self.condition = threading.Condition()
+        self.running = False
+        self.timer_thread = None
+
+        # 统计信息
+        self.fills_merged = 0
+        self.signals_emitted = 0
+
+    def add(self, positions: List[Dict]):
+        """
+        加入一批平仓信号（通常来自同一帧）
+
+        Args:
+            positions: parse_fills 输出的信号列表
+        """
+        ready = []
+        with self.condition:
+            for position in positions:
+                oid = position.get('oid')
+                if oid is None:
+                    # 无订单ID的成交无法聚合，直接输出
+                    ready.append(position)
+                    continue
+
+                aggregate = self.orders.get(oid)
+                if aggregate is not None:
+                    aggregate.add(position)
+                    self.fills_merged += 1
+                    if self.mode == AGGREGATION_MODE_ACCURACY and not aggregate.emitted:
+                        aggregate.deadline = time.monotonic() + self.quiet
+                        heapq.heappush(self.deadlines, (aggregate.deadline, oid))
+                    continue
+
+                aggregate = OrderAggregate(position)
+                self.orders[oid] = aggregate
+                if self.mode == AGGREGATION_MODE_LATENCY:
+                    aggregate.emitted = True
+                    ready.append(position)
+                else:
+                    aggregate.deadline = time.monotonic() + self.quiet
+                    heapq.heappush(self.deadlines, (aggregate.deadline, oid))
+                ready.extend(self._evict())
+
+            if self.mode == AGGREGATION_MODE_ACCURACY:
+                self._ensure_timer()
+                self.condition.notify()
+
+        self._emit(ready)
+
+    def _evict(self) -> List[Dict]:
+        """淘汰超出上限的最早订单，尚未输出的订单立即输出（调用方需持有锁）"""
+        evicted = []
+        while len(self.orders) > self.max_orders:
+            _, aggregate = self.orders.popitem(last=False)
+            if not aggregate.emitted:
+                aggregate.emitted = True
+                evicted.append(aggregate.to_signal())
+        return evicted
+
+    def _collect_due(self, now: float) -> List[Dict]:
+        """取出所有已静默到期的订单（调用方需持有锁）"""
+        due = []
+        while self.deadlines and self.deadlines[0][0] <= now:
+            deadline, oid = heapq.heappop(self.deadlines)
+            aggregate = self.orders.get(oid)
+            # 订单已输出、已淘汰或静默期被后续成交延长时跳过过期的堆记录
+            if aggregate is None or aggregate.emitted or aggregate.deadline != deadline:
+                continue
+            aggregate.emitted = True
+            due.append(aggregate.to_signal())
+        return due
+
+    def _timer_worker(self):
+        """单个定时线程：等待最近的到期时间，到期后输出合并信号"""
+        while True:
+            with self.condition:
+                if not self.running:
+                    return
+                timeout = self.deadlines[0][0] - time.monotonic() if self.deadlines else None
+                if timeout is None or timeout > 0:
+                    self.condition.wait(timeout)
+                due = self._collect_due(time.monotonic())
+            self._emit(due)
+
+    def _ensure_timer(self):
+        """按需启动定时线程（调用方需持有锁）"""
+        if self.timer_thread is None:
+            self.running = True
+            self.timer_thread = threading.Thread(target=self._timer_worker)
+            self.timer_thread.daemon = True
+            self.timer_thread.start()
+
+    def flush(self):
+        """立即输出所有尚未输出的订单"""
+        with self.condition:
+            pending = []
+            for aggregate in self.orders.values():
+                if not aggregate.emitted:
+                    aggregate.emitted = True
+                    pending.append(aggregate.to_signal())
+            self.deadlines = []
+        self._emit(pending)
+
+    def stop(self):
+        """输出剩余订单并停止定时线程"""
+        self.flush()
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+
+    def get_order(self, oid) -> Optional[Dict]:
+        """
+        获取某订单当前的合并结果
+
+        Args:
+            oid: 订单ID
+
+        Returns:
+            合并后的信号，订单不存在时返回None
+        """
+        with self.condition:
+            aggregate = self.orders.get(oid)
+            return aggregate.to_signal() if aggregate else None
+
+    def _emit(self, signals: List[Dict]):
+        """调用输出函数"""
+        if not signals:
+            return
+        self.signals_emitted += len(signals)
+        for signal in signals:
+            if signal.get('fill_count', 1) > 1:
+                logger.info(f"🧩 订单 {signal['oid']} 合并 {signal['fill_count']} 条成交: {signal['coin']}, "
+                            f"数量: {signal['size']}, 均价: {signal['price']:.4f}, 盈亏: {signal['closed_pnl']}")
+        try:
+            self.emit(signals)
+        except Exception as e:
+            logger.error(f"输出聚合信号时发生错误: {e}", exc_info=True)
@@ -0,0 +1,307 @@
+"""
+历史成交列式存档模块
+每个监控地址一个目录，成交按时间排序后分块追加，每块的每一列保存为一个 .npy 文件，
+index.json 记录每块的时间范围，按时间查询时只读取重叠的块并以内存映射方式加载，
+同时记录尚未回填完成的时间窗口，下次回填从最早的未完成窗口继续
+"""
+import os
+import json
+import shutil
+import logging
+import threading
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = 'index.json'
+# 合并存档时每块的最大行数
+COMPACT_CHUNK_ROWS = 1_000_000
+
+# 列名 -> 数据类型
+COLUMNS = {
+    'time': np.int64,  # 成交时间（毫秒）
+    'coin': np.int16,  # 币种编码（见 index.json 的 coins）
+    'dir': np.int8,  # 方向编码（见 index.json 的 dirs）
+    'side': np.int8,  # 1=买入(B)，-1=卖出(A)
+    'px': np.float64,
+    'sz': np.float64,
+    'start_position': np.float64,
+    'closed_pnl': np.float64,
+    'fee': np.float64,
+    'oid': np.int64,
+    'tid': np.int64,
+    'crossed': np.bool_
+}
+
+
+class FillArchive:
+    """单个地址的历史成交列式存档类"""
+
+    def __init__(self, root: str, address: str):
+        """
+        初始化存档（目录不存在时自动创建）
+
+        Args:
+            root: 存档根目录
+            address: 地址
+        """
+        self.address = address.lower()
+        self.directory = os.path.join(root, self.address)
+        self.lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self.index = self._load_index()
+
+    def _load_index(self) -> Dict:
+        """读取 index.json，不存在时返回空索引"""
+        path = os.path.join(self.directory, INDEX_FILE)
+        if not os.path.exists(path):
+            return {'address': self.address, 'coins': [], 'dirs': [], 'chunks': [], 'next_chunk': 0}
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _save_index(self):
+        """原子写入 index.json（先写临时文件再替换）"""
+        path = os.path.join(self.directory, INDEX_FILE)
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, path)
+
+    def _code(self, table: str, value: str) -> int:
+        """字符串列的字典编码，新值追加到字典末尾"""
+        values = self.index[table]
+        if value not in values:
+            values.append(value)
+        return values.index(value)
+
+    @property
+    def row_count(self) -> int:
+        """已存档的成交条数"""
+        return sum(chunk['rows'] for chunk in self.index['chunks'])
+
+    @property
+    def time_range(self) -> Optional[tuple]:
+        """已存档成交的时间范围 (最早, 最晚)，空存档返回None"""
+        chunks = self.index['chunks']
+        if not chunks:
+            return None
+        return min(c['t_min'] for c in chunks), max(c['t_max'] for c in chunks)
+
+    @property
+    def incomplete_windows(self) -> List[List[int]]:
+        """尚未回填完成（失败或被中断）的时间窗口 [开始, 结束]（毫秒），按开始时间排序"""
+        return sorted(self.index.get('incomplete', []))
+
+    @property
+    def resume_time(self) -> Optional[int]:
+        """继续回填的开始时间：最早的未完成窗口，没有时为已存档的最新时间，空存档返回None"""
+        incomplete = self.incomplete_windows
+        if incomplete:
+            return incomplete[0][0]
+        time_range = self.time_range
+        return time_range[1] if time_range else None
+
+    def set_incomplete(self, start_ms: int, end_ms: int, windows: Sequence[tuple]):
+        """
+        开始回填前记录本次的时间窗口，[start_ms, end_ms] 内之前记录的未完成窗口由本次回填覆盖
+
+        Args:
+            start_ms: 本次回填的开始时间（毫秒）
+            end_ms: 本次回填的结束时间（毫秒）
+            windows: 本次回填的时间窗口列表
+        """
+        with self.lock:
+            kept = [w for w in self.index.get('incomplete', []) if not (w[0] >= start_ms and w[1] <= end_ms)]
+            self.index['incomplete'] = kept + [[int(s), int(e)] for s, e in windows]
+            self._save_index()
+
+    def mark_complete(self, start_ms: int, end_ms: int):
+        """
+        标记一个时间窗口已回填完成
+
+        Args:
+            start_ms: 窗口开始时间（毫秒）
+            end_ms: 窗口结束时间（毫秒）
+        """
+        with self.lock:
+            self.index['incomplete'] = [w for w in self.index.get('incomplete', []) if w != [start_ms, end_ms]]
+            self._save_index()
+
+    def _chunks_between(self, start_ms: Optional[int], end_ms: Optional[int]) -> List[Dict]:
+        """时间索引：返回与 [start_ms, end_ms] 重叠的块"""
+        return [
+            chunk for chunk in self.index['chunks']
+            if (start_ms is None or chunk['t_max'] >= start_ms) and (end_ms is None or chunk['t_min'] <= end_ms)
+        ]
+
+    def _read_column(self, chunk: Dict, column: str) -> np.ndarray:
+        """以内存映射方式读取一个块的一列"""
+        return np.load(os.path.join(self.directory, chunk['name'], f'{column}.npy'), mmap_mode='r')
+
+    def append(self, fills: List[Dict]) -> int:
+        """
+        追加成交（按成交ID去重，已存档的成交会被跳过）
+
+        Args:
+            fills: Hyperliquid userFills 格式的成交列表
+
+        Returns:
+            实际新增的条数
+        """
+        if not fills:
+            return 0
+
+        with self.lock:
+            columns = {
+                'time': np.array([int(f['time']) for f in fills], dtype=np.int64),
+                'coin': np.array([self._code('coins', f['coin']) for f in fills], dtype=np.int16),
+                'dir': np.array([self._code('dirs', f.get('dir', '')) for f in fills], dtype=np.int8),
+                'side': np.array([1 if f.get('side') == 'B' else -1 for f in fills], dtype=np.int8),
+                'px': np.array([float(f['px']) for f in fills], dtype=np.float64),
+                'sz': np.array([float(f['sz']) for f in fills], dtype=np.float64),
+                'start_position': np.array([float(f.get('startPosition', 0)) for f in fills], dtype=np.float64),
+                'closed_pnl': np.array([float(f.get('closedPnl', 0)) for f in fills], dtype=np.float64),
+                'fee': np.array([float(f.get('fee', 0)) for f in fills], dtype=np.float64),
+                'oid': np.array([int(f.get('oid', 0)) for f in fills], dtype=np.int64),
+                'tid': np.array([int(f.get('tid', 0)) for f in fills], dtype=np.int64),
+                'crossed': np.array([bool(f.get('crossed', False)) for f in fills], dtype=np.bool_)
+            }
+
+            # 批内去重，并跳过时间范围重叠的已存档块中已有的成交
+            _, first = np.unique(columns['tid'], return_index=True)
+            keep = np.zeros(len(fills), dtype=bool)
+            keep[first] = True
+            t_min, t_max = int(columns['time'].min()), int(columns['time'].max())
+            for chunk in self._chunks_between(t_min, t_max):
+                keep &= ~np.isin(columns['tid'], self._read_column(chunk, 'tid'))
+
+            order = np.argsort(columns['time'][keep], kind='stable')
+            rows = len(order)
+            if rows == 0:
+                return 0
+
+            name = f"{self.index.get('next_chunk', 0):06d}"
+            self.index['next_chunk'] = self.index.get('next_chunk', 0) + 1
+            chunk_directory = os.path.join(self.directory, name)
+            os.makedirs(chunk_directory, exist_ok=True)
+            for column, values in columns.items():
+                np.save(os.path.join(chunk_directory, f'{column}.npy'), values[keep][order])
+
+            times = columns['time'][keep][order]
+            self.index['chunks'].append({
+                'name': name,
+                't_min': int(times[0]),
+                't_max': int(times[-1]),
+                'rows': rows
+            })
+            self._save_index()
+
+        logger.debug(f"存档 {self.address}: 新增 {rows} 条成交 (块 {name})")
+        return rows
+
+    def compact(self, chunk_rows: int = COMPACT_CHUNK_ROWS) -> int:
+        """
+        把增量追加产生的小块合并为按时间有序、互不重叠的大块
+
+        Args:
+            chunk_rows: 合并后每块的最大行数
+
+        Returns:
+            合并后的块数
+        """
+        with self.lock:
+            old_chunks = self.index['chunks']
+            if len(old_chunks) <= 1:
+                return len(old_chunks)
+            data = self.load()
+            rows = len(data['time'])
+
+            # 新块使用新的名称，索引替换成功后再删除旧块
+            new_chunks = []
+            for offset in range(0, rows, chunk_rows):
+                name = f"{self.index.get('next_chunk', 0):06d}"
+                self.index['next_chunk'] = self.index.get('next_chunk', 0) + 1
+                chunk_directory = os.path.join(self.directory, name)
+                os.makedirs(chunk_directory, exist_ok=True)
+                for column, values in data.items():
+                    np.save(os.path.join(chunk_directory, f'{column}.npy'), values[offset:offset + chunk_rows])
+                times = data['time'][offset:offset + chunk_rows]
+                new_chunks.append({'name': name, 't_min': int(times[0]), 't_max': int(times[-1]), 'rows': len(times)})
+
+            self.index['chunks'] = new_chunks
+            self._save_index()
+            for chunk in old_chunks:
+                shutil.rmtree(os.path.join(self.directory, chunk['name']), ignore_errors=True)
+
+        logger.info(f"存档 {self.address}: {len(old_chunks)} 块合并为 {len(new_chunks)} 块 ({rows} 条)")
+        return len(new_chunks)
+
+    def load(self, start_ms: Optional[int] = None, end_ms: Optional[int] = None,
+             columns: Optional[Sequence[str]] = None) -> Dict[str, np.ndarray]:
+        """
+        按时间范围读取成交列
+
+        Args:
+            start_ms: 开始时间（毫秒，包含），None表示不限
+            end_ms: 结束时间（毫秒，包含），None表示不限
+            columns: 需要的列，默认全部列
+
+        Returns:
+            列名到数组的字典，所有列按时间升序排列
+        """
+        columns = list(columns or COLUMNS)
+        if 'time' not in columns:
+            columns.append('time')
+
+        parts = {column: [] for column in columns}
+        for chunk in self._chunks_between(start_ms, end_ms):
+            times = self._read_column(chunk, 'time')
+            # 块内按时间有序，二分查找切片
+            lo = 0 if start_ms is None else int(np.searchsorted(times, start_ms, side='left'))
+            hi = len(times) if end_ms is None else int(np.searchsorted(times, end_ms, side='right'))
+            if lo >= hi:
+                continue
+            for column in columns:
+                parts[column].append(self._read_column(chunk, column)[lo:hi])
+
+        result = {
+            column: np.concatenate(values) if values else np.empty(0, dtype=COLUMNS[column])
+            for column, values in parts.items()
+        }
+        if len(parts['time']) > 1:
+            # 多个块时间范围可能重叠，合并后重新排序
+            order = np.argsort(result['time'], kind='stable')
+            result = {column: values[order] for column, values in result.items()}
+        return result
+
+    def iter_fills(self, start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> Iterator[Dict]:
+        """
+        按时间顺序还原为 userFills 格式的成交（供规则引擎和回测使用）
+
+        Args:
+            start_ms: 开始时间（毫秒，包含）
+            end_ms: 结束时间（毫秒，包含）
+
+        Yields:
+            成交字典
+        """
+        data = self.load(start_ms, end_ms)
+        coins = self.index['coins']
+        dirs = self.index['dirs']
+        for i in range(len(data['time'])):
+            yield {
+                'coin': coins[data['coin'][i]],
+                'px': str(data['px'][i]),
+                'sz': str(data['sz'][i]),
+                'side': 'B' if data['side'][i] > 0 else 'A',
+                'time': int(data['time'][i]),
+                'startPosition': str(data['start_position'][i]),
+                'dir': dirs[data['dir'][i]],
+                'closedPnl': str(data['closed_pnl'][i]),
+                'fee': str(data['fee'][i]),
+                'oid': int(data['oid'][i]),
+                'tid': int(data['tid'][i]),
+                'crossed': bool(data['crossed'][i])
+            }
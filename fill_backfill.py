@@ -0,0 +1,299 @@
+"""
+历史成交回填工具
+按时间窗口并发分页调用 userFillsByTime，所有请求共享同一个权重限速器，
+结果增量写入列式存档（见 fill_archive.py）。每个窗口完成后才从存档的未完成窗口中移除，
+重复运行时从最早的未完成窗口（没有时为存档的最新时间）继续，有窗口失败时以非零状态退出
+
+用法:
+    python fill_backfill.py                          # 回填 MONITOR_ADDRESS，从未完成窗口或存档最新时间（或最近30天）开始
+    python fill_backfill.py --start 2024-01-01       # 指定开始日期
+    python fill_backfill.py --address 0x... --address 0x... --workers 8
+"""
+import argparse
+import logging
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import requests
+
+from fill_archive import FillArchive
+
+logger = logging.getLogger(__name__)
+
+# userFillsByTime 每次最多返回的成交条数
+PAGE_LIMIT = 2000
+# 请求权重：基础权重20，每返回20条成交额外增加1
+REQUEST_WEIGHT = 20
+ITEMS_PER_EXTRA_WEIGHT = 20
+# 存档块数超过该值时在回填后合并
+COMPACT_THRESHOLD = 64
+
+
+class WeightRateLimiter:
+    """按请求权重限速的令牌桶（线程安全，多个回填线程共享）"""
+
+    def __init__(self, weight_per_minute: int = 600):
+        """
+        初始化限速器
+
+        Args:
+            weight_per_minute: 每分钟允许的总权重
+        """
+        self.capacity = float(weight_per_minute)
+        self.rate = weight_per_minute / 60.0  # 每秒恢复的权重
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        self.wait_total = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, weight: float):
+        """
+        获取权重，不足时等待
+
+        Args:
+            weight: 本次请求的权重
+        """
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= weight:
+                    self.tokens -= weight
+                    return
+                wait = (weight - self.tokens) / self.rate
+                self.wait_total += wait
+            time.sleep(wait)
+
+    def charge(self, weight: float):
+        """
+        事后扣除额外权重（按返回条数计算的部分），可以扣成负数，由之后的请求等待补足
+
+        Args:
+            weight: 额外权重
+        """
+        with self.lock:
+            self._refill()
+            self.tokens -= weight
+
+
+class FillBackfiller:
+    """单个地址的历史成交回填类"""
+
+    def __init__(self, api_url: str, archive: FillArchive, limiter: WeightRateLimiter,
+                 workers: int = 4, window_ms: int = 24 * 3600 * 1000, max_retries: int = 5):
+        """
+        初始化回填器
+
+        Args:
+            api_url: Hyperliquid API地址
+            archive: 列式存档
+            limiter: 共享的权重限速器
+            workers: 并发回填的时间窗口数
+            window_ms: 每个时间窗口的长度（毫秒）
+            max_retries: 单页请求失败（含429）的最大重试次数
+        """
+        self.api_url = api_url
+        self.archive = archive
+        self.limiter = limiter
+        self.workers = workers
+        self.window_ms = window_ms
+        self.max_retries = max_retries
+
+        # 统计信息
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.error_count = 0
+        self.fetched_count = 0
+        self.stored_count = 0
+        self.failed_count = 0
+
+    def fetch_page(self, start_ms: int, end_ms: int) -> Optional[List[Dict]]:
+        """
+        获取一页成交
+
+        Args:
+            start_ms: 开始时间（毫秒）
+            end_ms: 结束时间（毫秒）
+
+        Returns:
+            按时间升序的成交列表，重试耗尽后返回None
+        """
+        payload = {
+            'type': 'userFillsByTime',
+            'user': self.archive.address,
+            'startTime': start_ms,
+            'endTime': end_ms,
+            'aggregateByTime': False
+        }
+        for attempt in range(self.max_retries):
+            self.limiter.acquire(REQUEST_WEIGHT)
+            with self.lock:
+                self.request_count += 1
+            try:
+                response = requests.post(self.api_url, json=payload, timeout=30)
+                if response.status_code == 200:
+                    fills = response.json() or []
+                    self.limiter.charge(len(fills) // ITEMS_PER_EXTRA_WEIGHT)
+                    return fills
+                if response.status_code == 429:
+                    logger.warning(f"⚠️ API速率限制，{2 ** attempt} 秒后重试")
+                else:
+                    logger.error(f"API请求失败: {response.status_code}, {response.text}")
+            except requests.exceptions.RequestException as e:
+                logger.error(f"请求异常: {e}")
+            with self.lock:
+                self.error_count += 1
+            time.sleep(2 ** attempt)
+        return None
+
+    def backfill_window(self, start_ms: int, end_ms: int) -> int:
+        """
+        分页回填一个时间窗口，每页写入存档，全部页成功后在存档中标记窗口已完成
+
+        Args:
+            start_ms: 开始时间（毫秒）
+            end_ms: 结束时间（毫秒）
+
+        Returns:
+            新增存档的条数
+        """
+        stored = 0
+        cursor = start_ms
+        while cursor <= end_ms:
+            fills = self.fetch_page(cursor, end_ms)
+            if fills is None:
+                # 窗口保留在存档的未完成列表中，下次运行从该窗口开始
+                logger.error(f"❌ 窗口 {start_ms}~{end_ms} 在 {cursor} 处回填失败，已记录为未完成")
+                with self.lock:
+                    self.failed_count += 1
+                    self.stored_count += stored
+                return stored
+            stored += self.archive.append(fills)
+            with self.lock:
+                self.fetched_count += len(fills)
+            if len(fills) < PAGE_LIMIT:
+                break
+            # 下一页从本页最后一笔的时间开始（同一毫秒的成交由存档按成交ID去重）
+            last_time = int(fills[-1]['time'])
+            cursor = last_time if last_time > cursor else cursor + 1
+        self.archive.mark_complete(start_ms, end_ms)
+        with self.lock:
+            self.stored_count += stored
+        return stored
+
+    def run(self, start_ms: int, end_ms: int) -> Dict:
+        """
+        按时间窗口并发回填
+
+        Args:
+            start_ms: 开始时间（毫秒）
+            end_ms: 结束时间（毫秒）
+
+        Returns:
+            统计信息
+        """
+        windows = []
+        cursor = start_ms
+        while cursor <= end_ms:
+            windows.append((cursor, min(cursor + self.window_ms - 1, end_ms)))
+            cursor += self.window_ms
+
+        self.archive.set_incomplete(start_ms, end_ms, windows)
+        started = time.perf_counter()
+        logger.info(f"📥 回填 {self.archive.address}: {len(windows)} 个时间窗口, {self.workers} 个并发")
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='backfill') as executor:
+            futures = {executor.submit(self.backfill_window, *window): window for window in windows}
+            for done, future in enumerate(as_completed(futures), 1):
+                window_start, _ = futures[future]
+                day = datetime.fromtimestamp(window_start / 1000).strftime('%Y-%m-%d %H:%M')
+                logger.info(f"  [{done}/{len(windows)}] {day} 新增 {future.result()} 条")
+
+        stats = {
+            'windows': len(windows),
+            'requests': self.request_count,
+            'errors': self.error_count,
+            'fetched': self.fetched_count,
+            'stored': self.stored_count,
+            'failed': self.failed_count,
+            'total': self.archive.row_count,
+            'seconds': round(time.perf_counter() - started, 2)
+        }
+        logger.info(
+            f"✅ 回填完成 {self.archive.address}: 请求 {stats['requests']} 次, 获取 {stats['fetched']} 条, "
+            f"新增 {stats['stored']} 条, 存档共 {stats['total']} 条, 耗时 {stats['seconds']}秒"
+        )
+        if stats['failed']:
+            logger.error(f"❌ {stats['failed']} 个时间窗口回填失败，下次运行时从 {self.archive.resume_time} 继续")
+        return stats
+
+
+def parse_date(value: str) -> int:
+    """解析 YYYY-MM-DD 或 YYYY-MM-DD HH:MM 为毫秒时间戳"""
+    for fmt in ('%Y-%m-%d %H:%M', '%Y-%m-%d'):
+        try:
+            return int(datetime.strptime(value, fmt).timestamp() * 1000)
+        except ValueError:
+            continue
+    raise argparse.ArgumentTypeError(f"无法解析日期: {value}")
+
+
+def main():
+    """命令行入口"""
+    from config import (
+        HYPERLIQUID_API_URL,
+        MONITOR_ADDRESS,
+        FILL_ARCHIVE_DIR,
+        BACKFILL_WORKERS,
+        BACKFILL_WEIGHT_PER_MINUTE
+    )
+    from logger_config import setup_logger
+
+    parser = argparse.ArgumentParser(description='回填监控地址的历史成交到列式存档')
+    parser.add_argument('--address', action='append', dest='addresses',
+                        help='要回填的地址，可指定多次（默认 MONITOR_ADDRESS）')
+    parser.add_argument('--start', type=parse_date, help='开始日期（默认从最早的未完成窗口或存档最新时间继续，空存档为最近30天）')
+    parser.add_argument('--end', type=parse_date, help='结束日期（默认当前时间）')
+    parser.add_argument('--days', type=int, default=30, help='空存档且未指定 --start 时回填的天数')
+    parser.add_argument('--workers', type=int, default=BACKFILL_WORKERS, help='并发回填的时间窗口数')
+    parser.add_argument('--window-hours', type=int, default=24, help='每个时间窗口的小时数')
+    parser.add_argument('--archive', default=FILL_ARCHIVE_DIR, help='存档目录')
+    args = parser.parse_args()
+
+    setup_logger(log_file='backfill.log', log_level='INFO')
+
+    end_ms = args.end or int(time.time() * 1000)
+    limiter = WeightRateLimiter(BACKFILL_WEIGHT_PER_MINUTE)
+    failed = 0
+    for address in args.addresses or [MONITOR_ADDRESS]:
+        archive = FillArchive(args.archive, address)
+        start_ms = args.start
+        if start_ms is None:
+            start_ms = archive.resume_time
+        if start_ms is None:
+            start_ms = int((datetime.now() - timedelta(days=args.days)).timestamp() * 1000)
+        backfiller = FillBackfiller(
+            api_url=HYPERLIQUID_API_URL,
+            archive=archive,
+            limiter=limiter,
+            workers=args.workers,
+            window_ms=args.window_hours * 3600 * 1000
+        )
+        failed += backfiller.run(start_ms, end_ms)['failed']
+        if len(archive.index['chunks']) > COMPACT_THRESHOLD:
+            archive.compact()
+    if limiter.wait_total:
+        logger.info(f"限速等待共 {limiter.wait_total:.1f} 秒")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
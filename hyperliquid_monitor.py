@@ -7,21 +7,27 @@ Hyperliquid API监控模块
 推荐频率：公开数据接口每秒不超过2-5次
 """
 import requests
-import time
+import threading
 from typing import List, Dict, Optional
 from datetime import datetime
 import logging
 
+import tracing
+from clock import SYSTEM_CLOCK
+from signal_rules import SignalRuleEngine
+
 logger = logging.getLogger(__name__)
 
 # API速率限制配置（保守估计）
 API_REQUEST_DELAY = 0.2  # 每次请求之间至少间隔0.2秒（即每秒最多5次）
+RATE_LIMITED_RETRY_DELAY = 5  # 被限流（429）后等待的时间（秒）
 
 
 class HyperliquidMonitor:
     """Hyperliquid交易监控类"""
     
-    def __init__(self, api_url: str, monitor_address: str, user_fills_limit: int = 20):
+    def __init__(self, api_url: str, monitor_address: str, user_fills_limit: int = 20,
+                 rule_engine: Optional[SignalRuleEngine] = None, clock=None):
         """
         初始化监控器
         
@@ -29,36 +35,46 @@ class HyperliquidMonitor:
             api_url: Hyperliquid API地址
             monitor_address: 要监控的地址
             user_fills_limit: 每次获取的订单数量，默认20条
+            rule_engine: 平仓信号规则引擎（可选），默认使用内置规则
+            clock: 时钟（可选），默认使用系统时钟；测试时可注入模拟时钟
         """
         self.api_url = api_url
+        self.clock = clock or SYSTEM_CLOCK
         self.monitor_address = monitor_address.lower()
         self.user_fills_limit = user_fills_limit
+        self.rule_engine = rule_engine or SignalRuleEngine()
         self.last_processed_time = 0
         self.processed_fills = set()  # 记录已处理的订单ID
         self.last_position_print_time = 0  # 上次打印持仓的时间
+        self.scan_interval = 5  # 扫描间隔（秒），运行中可修改
+        self.position_print_interval = 300  # 持仓打印间隔（秒），运行中可修改
+        self.pending_address = None  # 待切换的监控地址（在扫描线程中切换）
+        self.running = False
+        self.stop_event = threading.Event()  # 退出时立即结束扫描间隔的等待
         self.last_api_request_time = 0  # 上次API请求的时间
         self.api_request_count = 0  # API请求计数
         self.api_error_count = 0  # API错误计数
         
     def _rate_limit_check(self):
         """检查并执行速率限制"""
-        current_time = time.time()
+        current_time = self.clock.time()
         time_since_last_request = current_time - self.last_api_request_time
         
         if time_since_last_request < API_REQUEST_DELAY:
             sleep_time = API_REQUEST_DELAY - time_since_last_request
             logger.debug(f"速率限制：等待 {sleep_time:.2f} 秒")
-            time.sleep(sleep_time)
+            self.clock.sleep(sleep_time)
         
-        self.last_api_request_time = time.time()
+        self.last_api_request_time = self.clock.time()
         self.api_request_count += 1
     
-    def get_user_fills(self, limit: int = 20) -> Optional[List[Dict]]:
+    def get_user_fills(self, limit: int = 20, address: Optional[str] = None) -> Optional[List[Dict]]:
         """
         获取用户的历史订单
         
         Args:
             limit: 返回的最大订单数量，默认20条
+            address: 查询的地址（可选），默认为当前监控地址
         
         Returns:
             订单列表或None（如果请求失败）
@@ -69,7 +85,7 @@ class HyperliquidMonitor:
             
             payload = {
                 "type": "userFills",
-                "user": self.monitor_address
+                "user": address or self.monitor_address
             }
             
             response = requests.post(
@@ -94,7 +110,7 @@ class HyperliquidMonitor:
                 # 速率限制错误
                 self.api_error_count += 1
                 logger.warning(f"⚠️ API速率限制！已触发 {self.api_error_count} 次")
-                time.sleep(5)  # 等待5秒后重试
+                self.clock.sleep(RATE_LIMITED_RETRY_DELAY)  # 等待后重试
                 return None
             else:
                 logger.error(f"API请求失败: {response.status_code}, {response.text}")
@@ -112,60 +128,23 @@ class HyperliquidMonitor:
     
     def parse_fills(self, fills: List[Dict]) -> List[Dict]:
         """
-        解析订单数据，识别平多仓操作
+        解析订单数据，识别平仓信号（规则见 SIGNAL_RULES）
         
         Args:
             fills: 原始订单列表
             
         Returns:
-            平多仓操作列表
+            平仓信号列表
         """
-        close_long_positions = []
-        
         if not fills:
-            return close_long_positions
-        
-        try:
-            for fill in fills:
-                # 获取订单ID，避免重复处理
-                fill_id = fill.get('tid', '')
-                if fill_id in self.processed_fills:
-                    continue
-                
-                # 获取交易信息
-                coin = fill.get('coin', '').upper()
-                side = fill.get('side', '')  # 'A' for Ask (卖出), 'B' for Bid (买入)
-                closed_pnl = fill.get('closedPnl', '0')
-                size = fill.get('sz', '0')
-                price = fill.get('px', '0')
-                timestamp = fill.get('time', 0)
-                
-                # 检测是否为平多仓操作
-                # 平多仓的特征：
-                # 1. side为'A'（卖出）
-                # 2. closedPnl不为'0'（有已实现盈亏，说明是平仓）
-                # 3. 币种为ETH或BTC
-                if (side == 'A' and 
-                    closed_pnl != '0' and 
-                    coin in ['ETH', 'BTC']):
-                    
-                    close_long_positions.append({
-                        'fill_id': fill_id,
-                        'coin': coin,
-                        'size': float(size),
-                        'price': float(price),
-                        'closed_pnl': float(closed_pnl),
-                        'timestamp': timestamp,
-                        'datetime': datetime.fromtimestamp(timestamp / 1000).strftime('%Y-%m-%d %H:%M:%S')
-                    })
-                    
-                    self.processed_fills.add(fill_id)
-                    logger.info(f"检测到平多仓操作: {coin}, 数量: {size}, 价格: {price}, 盈亏: {closed_pnl}")
+            return []
         
-        except Exception as e:
-            logger.error(f"解析订单时发生错误: {e}")
+        close_positions = self.rule_engine.parse_fills(fills, self.monitor_address, self.processed_fills)
+        for position in close_positions:
+            logger.info(f"检测到平多仓操作: {position['coin']}, 数量: {position['size']}, "
+                        f"价格: {position['price']}, 盈亏: {position['closed_pnl']}")
         
-        return close_long_positions
+        return close_positions
     
     def get_user_state(self) -> Optional[Dict]:
         """
@@ -196,7 +175,7 @@ class HyperliquidMonitor:
                 # 速率限制错误
                 self.api_error_count += 1
                 logger.warning(f"⚠️ API速率限制！已触发 {self.api_error_count} 次")
-                time.sleep(5)  # 等待5秒后重试
+                self.clock.sleep(RATE_LIMITED_RETRY_DELAY)  # 等待后重试
                 return None
             else:
                 logger.error(f"获取用户状态失败: {response.status_code}, {response.text}")
@@ -387,6 +366,34 @@ class HyperliquidMonitor:
             logger.error(f"打印最近订单时发生错误: {e}", exc_info=True)
             return False
     
+    def set_monitor_address(self, address: str):
+        """
+        切换监控地址（在下一次扫描时生效）
+        
+        Args:
+            address: 新的监控地址
+        """
+        self.pending_address = address.lower()
+    
+    def _switch_address(self) -> bool:
+        """
+        在扫描线程中切换到待切换的地址：新地址已有的成交只标记为已处理，不触发信号
+        
+        Returns:
+            是否切换成功（获取成交失败时在下一次扫描重试）
+        """
+        address = self.pending_address
+        fills = self.get_user_fills(limit=self.user_fills_limit, address=address)
+        if fills is None:
+            return False
+        
+        self.processed_fills.update(fill.get('tid', '') for fill in fills)
+        logger.warning(f"🔀 切换监控地址: {self.monitor_address} → {address} (已有 {len(fills)} 条成交不触发信号)")
+        self.monitor_address = address
+        if self.pending_address == address:
+            self.pending_address = None
+        return True
+    
     def scan_once(self) -> List[Dict]:
         """
         执行一次扫描
@@ -394,8 +401,13 @@ class HyperliquidMonitor:
         Returns:
             检测到的平多仓操作列表
         """
+        if self.pending_address:
+            self._switch_address()
+            return []
+        
         logger.debug(f"开始扫描地址: {self.monitor_address}")
         
+        started_ns = tracing.now_ns()
         fills = self.get_user_fills(limit=self.user_fills_limit)
         if fills is None:
             return []
@@ -404,10 +416,13 @@ class HyperliquidMonitor:
         
         if close_positions:
             logger.info(f"本次扫描发现 {len(close_positions)} 个平多仓操作")
+            # 每个平仓信号分配追踪ID，记录本次查询和解析的耗时
+            tracing.start_traces(close_positions, started_ns, name='monitor.poll')
         
         return close_positions
     
-    def start_monitoring(self, scan_interval: int, callback, position_print_interval: int = 300):
+    def start_monitoring(self, scan_interval: int, callback, position_print_interval: int = 300,
+                         batch_callback=None, startup_checks: bool = True):
         """
         开始持续监控
         
@@ -415,27 +430,33 @@ class HyperliquidMonitor:
             scan_interval: 扫描间隔（秒）
             callback: 检测到平仓时的回调函数
             position_print_interval: 打印持仓间隔（秒），默认300秒（5分钟）
+            batch_callback: 批量回调函数（可选），设置后同一次扫描的平仓信号以列表形式一次性传入
+            startup_checks: 是否在开始扫描前执行API接口测试和持仓查询；为False时由调用方在后台执行
         """
+        self.scan_interval = scan_interval
+        self.position_print_interval = position_print_interval
         logger.info(f"开始监控地址: {self.monitor_address}, 扫描间隔: {scan_interval}秒")
         logger.info(f"持仓状态打印间隔: {position_print_interval}秒 ({position_print_interval//60}分钟)")
         logger.info("")
         
-        # 1. 测试API接口 - 打印最近一笔订单
-        if not self.print_latest_fill():
-            logger.error("⚠️  API接口测试失败，但程序将继续运行")
-        logger.info("")
-        
-        # 2. 打印当前持仓状态
-        self.print_positions()
-        self.last_position_print_time = time.time()
+        if startup_checks:
+            # 1. 测试API接口 - 打印最近一笔订单
+            if not self.print_latest_fill():
+                logger.error("⚠️  API接口测试失败，但程序将继续运行")
+            logger.info("")
+            
+            # 2. 打印当前持仓状态
+            self.print_positions()
+        self.last_position_print_time = self.clock.time()
         logger.info("")
         
-        while True:
+        self.running = True
+        while self.running:
             try:
-                current_time = time.time()
+                current_time = self.clock.time()
                 
                 # 检查是否需要打印持仓
-                if current_time - self.last_position_print_time >= position_print_interval:
+                if current_time - self.last_position_print_time >= self.position_print_interval:
                     self.print_positions()
                     self.last_position_print_time = current_time
                 
@@ -443,18 +464,31 @@ class HyperliquidMonitor:
                 close_positions = self.scan_once()
                 
                 # 如果检测到平仓操作，调用回调函数
+                if close_positions and batch_callback:
+                    try:
+                        batch_callback(close_positions)
+                    except Exception as e:
+                        logger.error(f"执行批量回调函数时发生错误: {e}")
+                    close_positions = []
+                
                 for position in close_positions:
                     try:
                         callback(position)
                     except Exception as e:
                         logger.error(f"执行回调函数时发生错误: {e}")
                 
-                time.sleep(scan_interval)
+                self.clock.wait(self.stop_event, self.scan_interval)
                 
             except KeyboardInterrupt:
                 logger.info("监控已停止")
                 break
             except Exception as e:
                 logger.error(f"监控循环发生错误: {e}")
-                time.sleep(scan_interval)
+                self.clock.wait(self.stop_event, self.scan_interval)
+        logger.info("✅ HTTP轮询监控已停止")
+    
+    def stop(self):
+        """停止监控（正在执行的扫描和回调会执行完毕）"""
+        self.running = False
+        self.stop_event.set()
 
@@ -5,21 +5,71 @@ Hyperliquid WebSocket监控模块
 根据官方文档: https://hyperliquid.gitbook.io/hyperliquid-docs/for-developers/api/websocket/subscriptions
 """
 import json
-import time
+import socket
+import ssl
 import threading
 import logging
 from typing import List, Dict, Optional, Callable
 from datetime import datetime
+from urllib.parse import urlparse
 import websocket
 import requests
 
+import tracing
+from logger_config import RATE_LIMITED
+from clock import SYSTEM_CLOCK
+from link_quality import LinkQuality
+from position_mirror import WatchedAccountMirror
+from signal_rules import SignalRuleEngine
+from signal_race import (
+    SignalRace, order_update_to_fill, CHANNEL_USER_FILLS, CHANNEL_USER_EVENTS,
+    CHANNEL_ORDER_UPDATES, CHANNEL_MESSAGE_NAMES
+)
+
 logger = logging.getLogger(__name__)
 
+KEEPALIVE_INTERVAL = 30  # 保活检查与应用层ping的间隔（秒）
+SILENCE_TIMEOUT = 50  # 超过该时间没有收到任何消息时主动重连（秒）
+MAIN_LOOP_INTERVAL = 10  # 检查持仓打印和镜像校验的间隔（秒）
+CONNECT_TIMEOUT = 10  # 首次连接等待建立的超时（秒）
+RECONNECT_BASE_DELAY = 5  # 重连退避的初始等待（秒）
+RECONNECT_MAX_DELAY = 30  # 重连退避的最长等待（秒）
+
+
+def open_source_socket(ws_url: str, source_address: str, timeout: float = CONNECT_TIMEOUT) -> socket.socket:
+    """
+    从指定的本机地址建立到 WebSocket 服务器的连接（wss 时完成 TLS 握手）
+
+    Args:
+        ws_url: WebSocket地址
+        source_address: 本机地址（决定出口IP）
+        timeout: 建立连接的超时（秒）
+
+    Returns:
+        已连接的套接字，交给 WebSocketApp 完成 WebSocket 握手
+    """
+    url = urlparse(ws_url)
+    secure = url.scheme == 'wss'
+    sock = socket.create_connection((url.hostname, url.port or (443 if secure else 80)), timeout=timeout,
+                                    source_address=(source_address, 0))
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if secure:
+            sock = ssl.create_default_context().wrap_socket(sock, server_hostname=url.hostname)
+        sock.settimeout(None)  # 与 websocket-client 自己建立的连接一样使用阻塞读
+    except Exception:
+        sock.close()
+        raise
+    return sock
+
 
 class HyperliquidMonitorWS:
     """Hyperliquid WebSocket交易监控类"""
     
-    def __init__(self, api_url: str, ws_url: str, monitor_address: str):
+    def __init__(self, api_url: str, ws_url: str, monitor_address: str,
+                 rule_engine: Optional[SignalRuleEngine] = None, channels: Optional[List[str]] = None,
+                 clock=None, ping_interval: float = KEEPALIVE_INTERVAL, rtt_recycle_ms: float = 0,
+                 pong_loss_limit: int = 0, source_address: Optional[str] = None):
         """
         初始化WebSocket监控器
         
@@ -27,24 +77,53 @@ class HyperliquidMonitorWS:
             api_url: Hyperliquid HTTP API地址（用于获取持仓等信息）
             ws_url: Hyperliquid WebSocket地址
             monitor_address: 要监控的地址
+            rule_engine: 平仓信号规则引擎（可选），默认使用内置规则
+            channels: 订阅的信号通道（可选），默认只订阅userFills；多个通道时由最先到达的通道触发
+            clock: 时钟（可选），默认使用系统时钟；测试时可注入模拟时钟，在几秒内运行数天的保活和重连
+            ping_interval: 应用层ping的间隔（秒），每个ping与pong匹配计算RTT
+            rtt_recycle_ms: 平滑RTT超过该值时主动重连（毫秒），0表示不按RTT重连
+            pong_loss_limit: 连续该数量的ping未收到pong时主动重连，0表示只按静默时间重连
+            source_address: 从该本机地址发起连接（可选），默认由系统选择出口IP
         """
         self.api_url = api_url
+        self.clock = clock or SYSTEM_CLOCK
         self.ws_url = ws_url
         self.monitor_address = monitor_address.lower()
         self.processed_fills = set()  # 记录已处理的订单ID
+        self.mirrored_fills = set()  # 记录已更新到持仓镜像的订单ID（其他通道可能先处理同一成交）
+        self.rule_engine = rule_engine or SignalRuleEngine()
         self.last_position_print_time = 0  # 上次打印持仓的时间
+        self.last_consistency_check_time = 0  # 上次全量校验持仓镜像的时间
+        self.position_print_interval = 300  # 持仓打印间隔（秒），运行中可修改
+        self.consistency_check_interval = 3600  # 全量校验持仓镜像的间隔（秒），运行中可修改
+        self.mirror = WatchedAccountMirror()  # 监控地址持仓镜像（由userFills增量更新）
+        self.channels = list(channels or [CHANNEL_USER_FILLS])
+        if CHANNEL_USER_FILLS not in self.channels:
+            # userFills 用于更新持仓镜像，始终订阅
+            self.channels.insert(0, CHANNEL_USER_FILLS)
+        self.race = SignalRace() if len(self.channels) > 1 else None  # 多通道时按订单ID去重并记录获胜通道
         
         # WebSocket相关
         self.ws = None
         self.ws_connected = False
+        self.connected_event = threading.Event()  # 连接建立时设置，首次连接时等待
         self.ws_thread = None
-        self.keepalive_thread = None  # 保活线程
+        self.keepalive_task = None  # 保活定时任务
+        self.periodic_task = None  # 持仓打印和镜像校验定时任务
+        self.reconnect_task = None  # 等待中的重连任务
         self.callback = None
+        self.batch_callback = None  # 批量回调：同一帧内的所有平仓信号一次性传入
         self.running = False
+        self.stop_event = threading.Event()  # 退出时立即结束主循环的等待
         self.reconnect_count = 0  # 重连次数
         self.last_ping_time = 0  # 上次ping时间
         self.last_pong_time = 0  # 上次pong时间
         self.last_message_time = 0  # 上次收到消息的时间
+        self.ping_interval = ping_interval
+        self.rtt_recycle_ms = rtt_recycle_ms
+        self.pong_loss_limit = pong_loss_limit
+        self.source_address = source_address
+        self.link = LinkQuality()  # 应用层ping/pong的RTT、抖动和丢失统计
         
         # 统计信息
         self.ws_message_count = 0
@@ -52,24 +131,44 @@ class HyperliquidMonitorWS:
         self.fills_received_count = 0
         self.ping_count = 0
         self.pong_count = 0
+        self.subscription_error = None  # 交易所拒绝订阅时返回的错误，订阅成功后清除
         
     def _on_ws_message(self, ws, message):
         """WebSocket消息处理"""
+        received_ns = tracing.now_ns()  # 检测到平仓时作为追踪的起点
         try:
             self.ws_message_count += 1
-            self.last_message_time = time.time()  # 更新最后收到消息的时间
+            self.last_message_time = self.clock.time()  # 更新最后收到消息的时间
             data = json.loads(message)
             
             # 检查消息类型
             channel = data.get('channel')
             
-            if channel == 'subscriptionResponse':
+            if channel == 'pong':
+                # 应用层pong，与发送的ping匹配计算RTT
+                rtt_ms = self.link.pong_received(self.clock.monotonic())
+                if rtt_ms is not None:
+                    logger.debug(f"💗 应用层pong RTT={rtt_ms:.1f}ms")
+            
+            elif channel == 'subscriptionResponse':
                 # 订阅确认消息
+                self.subscription_error = None
                 logger.info(f"✅ WebSocket订阅成功: {data.get('data')}")
+            
+            elif channel == 'error':
+                # 订阅被拒绝（如超过单个IP的地址数上限），该地址不会收到推送
+                self.subscription_error = str(data.get('data', ''))
+                self.ws_error_count += 1
+                logger.error(f"🚫 WebSocket订阅被拒绝，地址 {self.monitor_address} 当前未被监控: {self.subscription_error}")
                 
             elif channel == 'userFills':
                 # 用户成交数据
                 msg_data = data.get('data', {})
+                user = msg_data.get('user')
+                if user and user.lower() != self.monitor_address:
+                    # 切换监控地址后，旧地址退订生效前推送的数据
+                    logger.debug(f"忽略非当前监控地址的成交推送: {user}")
+                    return
                 is_snapshot = msg_data.get('isSnapshot', False)
                 fills = msg_data.get('fills', [])
                 
@@ -80,20 +179,27 @@ class HyperliquidMonitorWS:
                         fill_id = fill.get('tid', '')
                         if fill_id:
                             self.processed_fills.add(fill_id)
-                else:
+                            self.mirrored_fills.add(fill_id)
+                    
+                    # 重连后断线期间的成交可能已错过，重新全量同步持仓镜像
+                    if self.mirror.seeded:
+                        self._resync_mirror_async()
+                elif fills:
                     # 实时数据
-                    if fills:
-                        logger.info(f"📥 收到实时订单数据: {len(fills)} 条")
-                        self.fills_received_count += len(fills)
-                        close_positions = self.parse_fills(fills)
-                        
-                        # 触发回调
-                        if close_positions and self.callback:
-                            for position in close_positions:
-                                try:
-                                    self.callback(position)
-                                except Exception as e:
-                                    logger.error(f"执行回调函数时发生错误: {e}")
+                    self._handle_realtime_fills(CHANNEL_USER_FILLS, fills, received_ns)
+            
+            elif channel == CHANNEL_MESSAGE_NAMES[CHANNEL_USER_EVENTS]:
+                # 用户事件（其中的成交与userFills格式相同）
+                fills = data.get('data', {}).get('fills', [])
+                if fills:
+                    self._handle_realtime_fills(CHANNEL_USER_EVENTS, fills, received_ns)
+            
+            elif channel == CHANNEL_MESSAGE_NAMES[CHANNEL_ORDER_UPDATES]:
+                # 订单状态更新，完全成交的订单转换为成交格式
+                fills = [fill for fill in (order_update_to_fill(update, self.mirror) for update in data.get('data', []))
+                         if fill]
+                if fills:
+                    self._handle_realtime_fills(CHANNEL_ORDER_UPDATES, fills, received_ns)
             
         except json.JSONDecodeError as e:
             logger.error(f"解析WebSocket消息失败: {e}")
@@ -102,6 +208,50 @@ class HyperliquidMonitorWS:
             logger.error(f"处理WebSocket消息时发生错误: {e}")
             self.ws_error_count += 1
     
+    def _handle_realtime_fills(self, source: str, fills: List[Dict], received_ns: Optional[int] = None):
+        """
+        处理某个通道推送的实时成交
+        
+        Args:
+            source: 通道名称
+            fills: 成交格式的数据列表
+            received_ns: 收到该帧的单调时间（纳秒），用于记录解析耗时
+        """
+        if source == CHANNEL_USER_FILLS:
+            logger.info(f"📥 收到实时订单数据: {len(fills)} 条", extra=RATE_LIMITED)
+            self.fills_received_count += len(fills)
+            
+            # 增量更新持仓镜像
+            for fill in fills:
+                fill_id = fill.get('tid', '')
+                if fill_id not in self.mirrored_fills:
+                    self.mirrored_fills.add(fill_id)
+                    self.mirror.apply_fill(fill)
+        
+        if self.race:
+            # 同一订单只由最先到达的通道触发
+            fills = [fill for fill in fills if self.race.arrive(source, fill.get('oid'))]
+        
+        close_positions = self.parse_fills(fills)
+        for position in close_positions:
+            position['channel'] = source
+        if close_positions:
+            # 每个平仓信号分配追踪ID，记录从收到推送到解析完成的耗时
+            tracing.start_traces(close_positions, received_ns or tracing.now_ns(), channel=source)
+        
+        # 触发回调
+        if close_positions and self.batch_callback:
+            try:
+                self.batch_callback(close_positions)
+            except Exception as e:
+                logger.error(f"执行批量回调函数时发生错误: {e}")
+        elif close_positions and self.callback:
+            for position in close_positions:
+                try:
+                    self.callback(position)
+                except Exception as e:
+                    logger.error(f"执行回调函数时发生错误: {e}")
+    
     def _on_ws_error(self, ws, error):
         """WebSocket错误处理"""
         logger.error(f"❌ WebSocket错误: {error}")
@@ -111,90 +261,163 @@ class HyperliquidMonitorWS:
         """WebSocket关闭处理"""
         logger.warning(f"⚠️  WebSocket连接已关闭: {close_status_code} - {close_msg}")
         self.ws_connected = False
+        self.connected_event.clear()
         
-        # 如果还在运行状态，尝试重连
+        # 如果还在运行状态，退避后重连（由时钟调度，不阻塞WebSocket线程）
         if self.running:
             self.reconnect_count += 1
             # 指数退避策略，最多等待30秒
-            wait_time = min(5 * (1.5 ** (self.reconnect_count - 1)), 30)
+            wait_time = min(RECONNECT_BASE_DELAY * (1.5 ** (self.reconnect_count - 1)), RECONNECT_MAX_DELAY)
             logger.info(f"尝试第 {self.reconnect_count} 次重新连接WebSocket（等待 {wait_time:.1f} 秒）...")
-            time.sleep(wait_time)
-            self._connect_websocket()
+            self.reconnect_task = self.clock.call_later(wait_time, self._reconnect, name='ws-reconnect')
+    
+    def _reconnect(self):
+        """退避结束后重新连接（连接失败时关闭回调会安排下一次重连）"""
+        self.reconnect_task = None
+        if self.running:
+            self._start_websocket()
     
     def _on_ws_ping(self, ws, message):
         """WebSocket Ping处理"""
-        self.last_ping_time = time.time()
+        self.last_ping_time = self.clock.time()
         self.ping_count += 1
         logger.debug(f"💓 收到Ping (总计: {self.ping_count})")
     
     def _on_ws_pong(self, ws, message):
         """WebSocket Pong处理"""
-        self.last_pong_time = time.time()
+        self.last_pong_time = self.clock.time()
         self.pong_count += 1
         logger.debug(f"💗 收到Pong (总计: {self.pong_count})")
     
-    def _keepalive_worker(self):
-        """保活工作线程 - 定期发送ping消息并检测连接健康"""
-        while self.running:
-            try:
-                time.sleep(30)  # 每30秒检查一次
-                
-                if not self.ws_connected:
-                    continue
-                
-                current_time = time.time()
-                
-                # 检查是否长时间没有收到消息（超过50秒）
-                if self.last_message_time > 0:
-                    time_since_last_msg = current_time - self.last_message_time
-                    if time_since_last_msg > 50:
-                        logger.warning(f"⚠️  已经 {time_since_last_msg:.0f} 秒没有收到消息，主动重连")
-                        if self.ws:
-                            self.ws.close()
-                        continue
-                
-                # 发送应用层ping消息保持活跃
-                if self.ws and self.ws_connected:
-                    try:
-                        # 发送一个JSON格式的ping（应用层消息）
-                        self.ws.send('{"method":"ping"}')
-                        logger.debug("💓 发送保活ping")
-                    except Exception as e:
-                        logger.debug(f"保活ping发送失败: {e}")
-                        
-            except Exception as e:
-                logger.error(f"保活线程错误: {e}")
+    def _keepalive_check(self):
+        """保活检查（每 ping_interval 秒执行一次）- 发送ping消息并检测连接健康"""
+        try:
+            if not self.running or not self.ws_connected:
+                return
+            
+            current_time = self.clock.time()
+            
+            # 检查是否长时间没有收到消息
+            if self.last_message_time > 0:
+                time_since_last_msg = current_time - self.last_message_time
+                if time_since_last_msg > SILENCE_TIMEOUT:
+                    logger.warning(f"⚠️  已经 {time_since_last_msg:.0f} 秒没有收到消息，主动重连")
+                    if self.ws:
+                        self.ws.close()
+                    return
+            
+            # 上一个ping在一个保活间隔内没有收到pong
+            if self.link.expire_ping():
+                logger.warning(f"⚠️  应用层ping未收到pong（连续 {self.link.consecutive_lost} 次）")
+            
+            # 连接变慢或丢包时主动重连，不等到完全没有消息
+            reason = self.link.degraded(self.rtt_recycle_ms, self.pong_loss_limit)
+            if reason:
+                self.link.recycles += 1
+                logger.warning(f"⚠️  链路质量下降（{reason}），主动重连: {self.link.summary()}")
+                if self.ws:
+                    self.ws.close()
+                return
+            
+            # 发送应用层ping消息保持活跃，记录发送时间用于与pong匹配
+            if self.ws and self.ws_connected:
+                try:
+                    # 发送一个JSON格式的ping（应用层消息）
+                    self.link.ping_sent(self.clock.monotonic())
+                    self.ws.send('{"method":"ping"}')
+                    logger.debug("💓 发送保活ping")
+                except Exception as e:
+                    logger.debug(f"保活ping发送失败: {e}")
+                    
+        except Exception as e:
+            logger.error(f"保活检查错误: {e}")
     
     def _on_ws_open(self, ws):
         """WebSocket连接建立"""
         logger.info("✅ WebSocket连接已建立")
         self.ws_connected = True
         self.reconnect_count = 0  # 重置重连计数器
-        self.last_message_time = time.time()
+        self.last_message_time = self.clock.time()
+        self.connected_event.set()
+        self.link.reset()  # RTT按新连接重新估算
         
         # 发送订阅消息
-        subscribe_msg = {
-            "method": "subscribe",
+        self._subscribe_all(ws)
+        
+        # 启动保活定时任务（重连后沿用）
+        if self.keepalive_task is None and self.running:
+            self.keepalive_task = self.clock.call_every(self.ping_interval, self._keepalive_check, name='ws-keepalive')
+            logger.debug("🔄 保活任务已启动")
+    
+    def _subscribe_all(self, ws):
+        """连接建立后订阅监控地址的所有信号通道"""
+        for channel in self.channels:
+            self._send_subscription(ws, 'subscribe', channel, self.monitor_address)
+    
+    @staticmethod
+    def _send_subscription(ws, method: str, channel: str, address: str):
+        """
+        发送订阅或退订请求
+        
+        Args:
+            ws: WebSocket连接
+            method: 'subscribe' 或 'unsubscribe'
+            channel: 通道名称
+            address: 监控地址
+        """
+        message = {
+            "method": method,
             "subscription": {
-                "type": "userFills",
-                "user": self.monitor_address
+                "type": channel,
+                "user": address
             }
         }
+        logger.info(f"📤 发送{'订阅' if method == 'subscribe' else '退订'}请求: {message}")
+        ws.send(json.dumps(message))
+    
+    def set_monitor_address(self, address: str):
+        """
+        切换监控地址：在现有连接上退订旧地址、订阅新地址，不重新连接
+        
+        新地址的历史快照到达后只标记为已处理（与首次订阅相同），持仓镜像按新地址重新全量同步
         
-        logger.info(f"📤 发送订阅请求: {subscribe_msg}")
-        ws.send(json.dumps(subscribe_msg))
+        Args:
+            address: 新的监控地址
+        """
+        address = address.lower()
+        old_address = self.monitor_address
+        if address == old_address:
+            return
+        
+        logger.warning(f"🔀 切换监控地址: {old_address} → {address}")
+        self.monitor_address = address
+        self.mirror = WatchedAccountMirror()
+        self._resync_mirror_async()
         
-        # 启动保活线程
-        if self.keepalive_thread is None or not self.keepalive_thread.is_alive():
-            self.keepalive_thread = threading.Thread(target=self._keepalive_worker)
-            self.keepalive_thread.daemon = True
-            self.keepalive_thread.start()
-            logger.debug("🔄 保活线程已启动")
+        ws = self.ws
+        if ws and self.ws_connected:
+            try:
+                for channel in self.channels:
+                    self._send_subscription(ws, 'unsubscribe', channel, old_address)
+                    self._send_subscription(ws, 'subscribe', channel, address)
+            except Exception as e:
+                # 发送失败时连接随后会重连，重连后按新地址订阅
+                logger.error(f"切换订阅失败: {e}")
     
-    def _connect_websocket(self):
-        """连接WebSocket"""
+    def _start_websocket(self):
+        """创建WebSocket连接并在新线程中运行（不等待连接建立）"""
         try:
             # websocket.enableTrace(True)  # 调试用
+            options = {}
+            if self.source_address:
+                # websocket-client 不支持指定本机地址，自己建立连接后交给它完成握手
+                try:
+                    options['socket'] = open_source_socket(self.ws_url, self.source_address)
+                except OSError as e:
+                    # 没有走到 run_forever，由关闭回调按退避安排重连
+                    logger.error(f"从 {self.source_address} 连接WebSocket失败: {e}")
+                    self._on_ws_close(None, None, str(e))
+                    return False
             self.ws = websocket.WebSocketApp(
                 self.ws_url,
                 on_open=self._on_ws_open,
@@ -202,7 +425,8 @@ class HyperliquidMonitorWS:
                 on_error=self._on_ws_error,
                 on_close=self._on_ws_close,
                 on_ping=self._on_ws_ping,
-                on_pong=self._on_ws_pong
+                on_pong=self._on_ws_pong,
+                **options
             )
             
             # 在新线程中运行WebSocket
@@ -215,86 +439,61 @@ class HyperliquidMonitorWS:
             )
             self.ws_thread.daemon = True
             self.ws_thread.start()
-            
-            # 等待连接建立
-            timeout = 10
-            start_time = time.time()
-            while not self.ws_connected and time.time() - start_time < timeout:
-                time.sleep(0.1)
-            
-            if not self.ws_connected:
-                logger.error("WebSocket连接超时")
-                return False
-            
-            logger.info(f"💓 保活机制已启用: 每30秒发送一次应用层ping")
             return True
             
         except Exception as e:
             logger.error(f"连接WebSocket失败: {e}")
             return False
     
+    def _connect_websocket(self):
+        """连接WebSocket并等待连接建立"""
+        if not self._start_websocket():
+            return False
+        
+        if not self.clock.wait(self.connected_event, CONNECT_TIMEOUT):
+            logger.error("WebSocket连接超时")
+            return False
+        
+        logger.info(f"💓 保活机制已启用: 每{self.ping_interval}秒发送一次应用层ping")
+        return True
+    
     def parse_fills(self, fills: List[Dict]) -> List[Dict]:
         """
-        解析订单数据，识别平多仓操作
+        解析订单数据，识别平仓信号（规则见 SIGNAL_RULES）
         
         Args:
             fills: 原始订单列表
             
         Returns:
-            平多仓操作列表
+            平仓信号列表
         """
-        close_long_positions = []
-        
         if not fills:
-            return close_long_positions
+            return []
         
-        try:
-            for fill in fills:
-                # 获取订单ID，避免重复处理
-                fill_id = fill.get('tid', '')
-                if fill_id in self.processed_fills:
-                    continue
-                
-                # 获取交易信息
-                coin = fill.get('coin', '').upper()
-                side = fill.get('side', '')  # 'A' for Ask (卖出), 'B' for Bid (买入)
-                closed_pnl = fill.get('closedPnl', '0')
-                size = fill.get('sz', '0')
-                price = fill.get('px', '0')
-                timestamp = fill.get('time', 0)
-                
-                # 检测是否为平多仓操作
-                # 平多仓的特征：
-                # 1. side为'A'（卖出）
-                # 2. closedPnl不为'0'（有已实现盈亏，说明是平仓）
-                # 3. 币种为ETH或BTC
-                if (side == 'A' and 
-                    closed_pnl != '0' and 
-                    coin in ['ETH', 'BTC']):
-                    
-                    close_long_positions.append({
-                        'fill_id': fill_id,
-                        'coin': coin,
-                        'size': float(size),
-                        'price': float(price),
-                        'closed_pnl': float(closed_pnl),
-                        'timestamp': timestamp,
-                        'datetime': datetime.fromtimestamp(timestamp / 1000).strftime('%Y-%m-%d %H:%M:%S')
-                    })
-                    
-                    self.processed_fills.add(fill_id)
-                    logger.info(f"🎯 检测到平多仓操作: {coin}, 数量: {size}, 价格: {price}, 盈亏: {closed_pnl}")
-        
-        except Exception as e:
-            logger.error(f"解析订单时发生错误: {e}")
+        close_positions = self.rule_engine.parse_fills(fills, self.monitor_address, self.processed_fills)
+        for position in close_positions:
+            logger.info(f"🎯 检测到平多仓操作: {position['coin']}, 数量: {position['size']}, "
+                        f"价格: {position['price']}, 盈亏: {position['closed_pnl']}")
         
-        return close_long_positions
+        return close_positions
     
     def get_user_state(self) -> Optional[Dict]:
         """
-        获取用户状态（包括持仓信息）
+        获取用户状态（包括持仓信息），并用结果同步持仓镜像
         使用HTTP API
         
+        Returns:
+            用户状态字典或None（如果请求失败）
+        """
+        user_state = self._request_user_state()
+        if user_state:
+            self.mirror.seed(user_state)
+        return user_state
+    
+    def _request_user_state(self) -> Optional[Dict]:
+        """
+        请求 clearinghouseState（不更新持仓镜像）
+        
         Returns:
             用户状态字典或None（如果请求失败）
         """
@@ -448,6 +647,46 @@ class HyperliquidMonitorWS:
         except Exception as e:
             logger.error(f"打印持仓信息时发生错误: {e}", exc_info=True)
     
+    def _resync_mirror_async(self):
+        """在后台线程中全量同步持仓镜像"""
+        thread = threading.Thread(target=self.get_user_state)
+        thread.daemon = True
+        thread.start()
+    
+    def check_mirror_consistency(self):
+        """全量查询一次持仓，校验并纠正持仓镜像"""
+        user_state = self._request_user_state()
+        if not user_state:
+            logger.warning("⚠️  持仓镜像校验失败：无法获取持仓信息")
+            return
+        
+        differences = self.mirror.diff(user_state)
+        if differences:
+            logger.warning(f"⚠️  持仓镜像与全量状态不一致，已重新同步: {'; '.join(differences)}")
+        else:
+            logger.info(f"✅ 持仓镜像校验一致 (增量成交: {self.mirror.fills_applied}, 自动纠正: {self.mirror.drift_count})")
+        self.mirror.seed(user_state)
+    
+    def print_mirror_positions(self):
+        """打印持仓镜像中的持仓状态（不发起请求）"""
+        summary = self.mirror.get_positions_summary()
+        logger.info("=" * 80)
+        logger.info(f"📊 地址 {self.monitor_address} 的持仓状态（本地镜像）")
+        logger.info("=" * 80)
+        
+        if not summary['positions']:
+            logger.info("当前无持仓")
+        
+        for pos in summary['positions']:
+            position_type = "多头 🟢" if pos['size'] > 0 else "空头 🔴"
+            logger.info(f"\n币种: {pos['coin']}")
+            logger.info(f"  方向: {position_type}")
+            logger.info(f"  持仓量: {pos['size']}")
+            logger.info(f"  入场价格: ${pos['entry_price']:,.2f}")
+            logger.info(f"  持仓价值: ${pos['position_value']:,.2f}")
+        
+        logger.info("=" * 80)
+    
     def print_latest_fill(self) -> bool:
         """
         打印最近一笔订单记录，用于验证API接口正常
@@ -509,29 +748,39 @@ class HyperliquidMonitorWS:
             logger.error(f"打印最近订单时发生错误: {e}", exc_info=True)
             return False
     
-    def start_monitoring(self, callback: Callable, position_print_interval: int = 300):
+    def start_monitoring(self, callback: Callable, position_print_interval: int = 300,
+                         batch_callback: Optional[Callable] = None,
+                         consistency_check_interval: int = 3600, startup_checks: bool = True):
         """
         开始WebSocket监控
         
         Args:
             callback: 检测到平仓时的回调函数
-            position_print_interval: 打印持仓间隔（秒），默认300秒（5分钟）
+            position_print_interval: 打印持仓间隔（秒），默认300秒（5分钟），打印本地持仓镜像
+            batch_callback: 批量回调函数（可选），设置后同一帧内的平仓信号以列表形式一次性传入
+            consistency_check_interval: 全量查询校验持仓镜像的间隔（秒），默认3600秒（1小时）
+            startup_checks: 是否在连接前执行API接口测试和持仓查询；为False时由调用方在后台执行，WebSocket立即连接
         """
         logger.info(f"🚀 开始WebSocket监控地址: {self.monitor_address}")
         logger.info(f"持仓状态打印间隔: {position_print_interval}秒 ({position_print_interval//60}分钟)")
         logger.info("")
         
         self.callback = callback
+        self.batch_callback = batch_callback
+        self.position_print_interval = position_print_interval
+        self.consistency_check_interval = consistency_check_interval
         self.running = True
         
-        # 1. 测试API接口 - 打印最近一笔订单
-        if not self.print_latest_fill():
-            logger.error("⚠️  API接口测试失败，但程序将继续运行")
-        logger.info("")
-        
-        # 2. 打印当前持仓状态
-        self.print_positions()
-        self.last_position_print_time = time.time()
+        if startup_checks:
+            # 1. 测试API接口 - 打印最近一笔订单
+            if not self.print_latest_fill():
+                logger.error("⚠️  API接口测试失败，但程序将继续运行")
+            logger.info("")
+            
+            # 2. 打印当前持仓状态（同时初始化持仓镜像）
+            self.print_positions()
+        self.last_position_print_time = self.clock.time()
+        self.last_consistency_check_time = self.clock.time()
         logger.info("")
         
         # 3. 连接WebSocket
@@ -544,33 +793,55 @@ class HyperliquidMonitorWS:
         logger.info("📡 等待实时订单数据...")
         logger.info("")
         
-        # 4. 主循环 - 定期打印持仓和统计信息
+        # 4. 定期打印持仓和统计信息，等待退出
+        self.periodic_task = self.clock.call_every(MAIN_LOOP_INTERVAL, self._periodic_check, name='ws-periodic')
         try:
-            while self.running:
-                time.sleep(10)  # 每10秒检查一次
-                
-                current_time = time.time()
-                
-                # 检查是否需要打印持仓
-                if current_time - self.last_position_print_time >= position_print_interval:
-                    self.print_positions()
-                    self.last_position_print_time = current_time
-                    
-                    # 打印统计信息
-                    logger.info(f"📊 WebSocket统计: 总消息={self.ws_message_count}, "
-                              f"收到订单={self.fills_received_count}, "
-                              f"Ping={self.ping_count}, Pong={self.pong_count}, "
-                              f"错误={self.ws_error_count}, 重连次数={self.reconnect_count}")
-                
+            self.clock.wait(self.stop_event)
         except KeyboardInterrupt:
             logger.info("监控已停止")
         finally:
             self.stop()
     
+    def _periodic_check(self):
+        """定期检查（每 MAIN_LOOP_INTERVAL 秒执行一次）- 校验持仓镜像、打印持仓和统计信息"""
+        if not self.running:
+            return
+        current_time = self.clock.time()
+        
+        # 检查是否需要全量校验持仓镜像
+        if current_time - self.last_consistency_check_time >= self.consistency_check_interval:
+            self.check_mirror_consistency()
+            self.last_consistency_check_time = current_time
+        
+        # 检查是否需要打印持仓（使用本地镜像，不发起请求）
+        if current_time - self.last_position_print_time >= self.position_print_interval:
+            self.print_mirror_positions()
+            self.last_position_print_time = current_time
+            
+            # 打印统计信息
+            logger.info(f"📊 WebSocket统计: 总消息={self.ws_message_count}, "
+                      f"收到订单={self.fills_received_count}, "
+                      f"Ping={self.ping_count}, Pong={self.pong_count}, "
+                      f"错误={self.ws_error_count}, 重连次数={self.reconnect_count}")
+            logger.info(f"📶 链路质量: {self.link.summary()}")
+            if self.subscription_error:
+                logger.warning(f"🚫 地址 {self.monitor_address} 的订阅仍被拒绝: {self.subscription_error}")
+            if self.race:
+                for line in self.race.summary():
+                    logger.info(f"🏁 信号通道统计: {line}")
+    
     def stop(self):
-        """停止监控"""
+        """停止监控（可重复调用，正在执行的回调会执行完毕）"""
+        if self.stop_event.is_set():
+            return
         logger.info("正在停止WebSocket监控...")
         self.running = False
+        self.stop_event.set()
+        
+        for task in (self.keepalive_task, self.periodic_task, self.reconnect_task):
+            if task:
+                task.cancel()
+        self.keepalive_task = self.periodic_task = self.reconnect_task = None
         
         if self.ws:
             self.ws.close()
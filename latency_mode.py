@@ -0,0 +1,109 @@
+"""
+低延迟模式模块
+- 启动完成后冻结长期存活的对象，使其不再参与垃圾回收扫描
+- 下单热路径内暂停自动垃圾回收，订单发出后再恢复
+- 通过 gc.callbacks 统计观察到的回收停顿以及被推迟的回收
+"""
+import gc
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import List
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyMode:
+    """下单热路径的垃圾回收控制类"""
+
+    def __init__(self, enabled: bool = False):
+        """
+        初始化低延迟模式
+
+        Args:
+            enabled: 是否启用，未启用时 hot_path 不做任何处理
+        """
+        self.enabled = enabled
+        self.depth = 0  # 嵌套进入热路径的层数
+        self.gc_was_enabled = True
+        self.gc_start_time = 0.0
+        self.lock = threading.Lock()
+
+        # 统计信息
+        self.pause_count = 0
+        self.pause_total_ms = 0.0
+        self.pause_max_ms = 0.0
+        self.pause_by_generation = [0, 0, 0]
+        self.hot_path_count = 0
+        self.deferred_count = 0  # 热路径内达到回收阈值、推迟到订单发出后的次数
+        self.frozen_count = 0
+
+    def start(self):
+        """启动完成后调用：整理并冻结现有对象，开始统计回收停顿"""
+        if not self.enabled:
+            return
+        gc.collect()
+        gc.freeze()
+        self.frozen_count = gc.get_freeze_count()
+        if self._on_gc not in gc.callbacks:
+            gc.callbacks.append(self._on_gc)
+        logger.info(f"⚡️ 低延迟模式已启用: 冻结 {self.frozen_count} 个启动对象，回收阈值 {gc.get_threshold()}")
+
+    def stop(self):
+        """停止统计回收停顿"""
+        if self._on_gc in gc.callbacks:
+            gc.callbacks.remove(self._on_gc)
+
+    def _on_gc(self, phase: str, info: dict):
+        """gc.callbacks 回调：记录每次回收的停顿时间"""
+        if phase == 'start':
+            self.gc_start_time = time.perf_counter()
+            return
+        pause_ms = (time.perf_counter() - self.gc_start_time) * 1000
+        self.pause_count += 1
+        self.pause_total_ms += pause_ms
+        self.pause_max_ms = max(self.pause_max_ms, pause_ms)
+        generation = info.get('generation', 0)
+        if 0 <= generation < len(self.pause_by_generation):
+            self.pause_by_generation[generation] += 1
+
+    @contextmanager
+    def hot_path(self):
+        """下单热路径：期间暂停自动垃圾回收，退出后恢复（支持嵌套和多线程）"""
+        if not self.enabled:
+            yield
+            return
+
+        with self.lock:
+            self.depth += 1
+            if self.depth == 1:
+                self.gc_was_enabled = gc.isenabled()
+                gc.disable()
+            self.hot_path_count += 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.depth -= 1
+                if self.depth == 0 and self.gc_was_enabled:
+                    if gc.get_count()[0] >= gc.get_threshold()[0]:
+                        # 热路径内本应发生的回收在恢复后的下一次分配时执行
+                        self.deferred_count += 1
+                    gc.enable()
+
+    def summary(self) -> List[str]:
+        """
+        获取回收停顿统计
+
+        Returns:
+            统计描述列表
+        """
+        if not self.enabled:
+            return []
+        average = self.pause_total_ms / self.pause_count if self.pause_count else 0.0
+        return [
+            f"回收停顿: {self.pause_count} 次 (第0/1/2代: {'/'.join(map(str, self.pause_by_generation))}), "
+            f"平均 {average:.3f}ms, 最大 {self.pause_max_ms:.3f}ms",
+            f"热路径: {self.hot_path_count} 次, 推迟回收: {self.deferred_count} 次, 冻结对象: {self.frozen_count}"
+        ]
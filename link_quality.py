@@ -0,0 +1,149 @@
+"""
+链路质量模块
+记录 WebSocket 应用层 ping 的发送时间并与 pong 匹配，估算往返时间（RTT）和抖动，
+统计丢失的 pong，用于在连接变慢或丢包时主动重连，而不是等到连接完全没有消息
+"""
+import logging
+import threading
+from collections import deque
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+RTT_ALPHA = 1 / 8  # 平滑RTT的权重（与TCP的RTT估算相同）
+RTT_BETA = 1 / 4  # 抖动（RTT平均偏差）的权重
+RTT_SAMPLE_SIZE = 100  # 保留的最近RTT样本数（用于中位数和最大值）
+MIN_RTT_SAMPLES = 3  # 连接建立后至少收到该数量的pong才按RTT判断链路质量
+
+
+class LinkQuality:
+    """应用层 ping/pong 的往返时间、抖动和丢失统计"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending_since = None  # 等待pong的ping的发送时间（单调时间，秒）
+        self.srtt_ms = None  # 平滑RTT
+        self.jitter_ms = 0.0  # RTT平均偏差
+        self.last_rtt_ms = None
+        self.samples = deque(maxlen=RTT_SAMPLE_SIZE)
+        self.connection_samples = 0  # 当前连接收到的pong数
+        self.consecutive_lost = 0  # 连续丢失的pong数
+        self.pings_sent = 0
+        self.pongs_received = 0
+        self.pongs_lost = 0
+        self.recycles = 0  # 因链路质量下降主动重连的次数
+
+    def reset(self):
+        """新连接建立时重置当前连接的估算（累计统计保留）"""
+        with self.lock:
+            self.pending_since = None
+            self.srtt_ms = None
+            self.jitter_ms = 0.0
+            self.connection_samples = 0
+            self.consecutive_lost = 0
+
+    def expire_ping(self) -> bool:
+        """
+        发送下一个ping前调用：上一个ping在一个保活间隔内没有收到pong时记为丢失
+
+        Returns:
+            上一个ping是否丢失
+        """
+        with self.lock:
+            if self.pending_since is None:
+                return False
+            self.pending_since = None
+            self.pongs_lost += 1
+            self.consecutive_lost += 1
+            return True
+
+    def ping_sent(self, now: float):
+        """
+        记录发送应用层ping
+
+        Args:
+            now: 发送时间（单调时间，秒）
+        """
+        with self.lock:
+            self.pending_since = now
+            self.pings_sent += 1
+
+    def pong_received(self, now: float) -> Optional[float]:
+        """
+        收到应用层pong，与等待中的ping匹配并更新RTT估算
+
+        Args:
+            now: 收到时间（单调时间，秒）
+
+        Returns:
+            本次RTT（毫秒），没有等待中的ping时返回None
+        """
+        with self.lock:
+            if self.pending_since is None:
+                return None
+            rtt_ms = (now - self.pending_since) * 1000
+            self.pending_since = None
+            if self.srtt_ms is None:
+                self.srtt_ms = rtt_ms
+                self.jitter_ms = rtt_ms / 2
+            else:
+                self.jitter_ms += RTT_BETA * (abs(rtt_ms - self.srtt_ms) - self.jitter_ms)
+                self.srtt_ms += RTT_ALPHA * (rtt_ms - self.srtt_ms)
+            self.last_rtt_ms = rtt_ms
+            self.samples.append(rtt_ms)
+            self.connection_samples += 1
+            self.consecutive_lost = 0
+            self.pongs_received += 1
+            return rtt_ms
+
+    def degraded(self, rtt_threshold_ms: float, loss_limit: int) -> Optional[str]:
+        """
+        判断当前连接的链路质量是否需要主动重连
+
+        Args:
+            rtt_threshold_ms: 平滑RTT阈值（毫秒），0表示不按RTT判断
+            loss_limit: 连续丢失pong的次数上限，0表示不按丢失判断
+
+        Returns:
+            需要重连的原因，链路正常时返回None
+        """
+        with self.lock:
+            if loss_limit and self.consecutive_lost >= loss_limit:
+                return f"连续 {self.consecutive_lost} 个ping未收到pong"
+            if rtt_threshold_ms and self.connection_samples >= MIN_RTT_SAMPLES and self.srtt_ms > rtt_threshold_ms:
+                return f"平滑RTT {self.srtt_ms:.0f}ms 超过 {rtt_threshold_ms:.0f}ms"
+            return None
+
+    def snapshot(self) -> Dict:
+        """
+        获取链路质量指标
+
+        Returns:
+            指标字典（时间单位为毫秒，没有样本时为None）
+        """
+        def ms(value: Optional[float]) -> Optional[float]:
+            return round(value, 1) if value is not None else None
+
+        with self.lock:
+            samples = sorted(self.samples)
+            return {
+                'rtt_ms': ms(self.srtt_ms),
+                'jitter_ms': ms(self.jitter_ms) if self.srtt_ms is not None else None,
+                'last_rtt_ms': ms(self.last_rtt_ms),
+                'median_rtt_ms': ms(samples[len(samples) // 2]) if samples else None,
+                'max_rtt_ms': ms(samples[-1]) if samples else None,
+                'pings_sent': self.pings_sent,
+                'pongs_received': self.pongs_received,
+                'pongs_lost': self.pongs_lost,
+                'recycles': self.recycles
+            }
+
+    def summary(self) -> str:
+        """链路质量的一行描述（日志和诊断状态中输出）"""
+        stats = self.snapshot()
+        if stats['rtt_ms'] is None:
+            rtt = "RTT=无样本"
+        else:
+            rtt = (f"RTT={stats['rtt_ms']:.1f}ms, 抖动={stats['jitter_ms']:.1f}ms, "
+                   f"最近{len(self.samples)}次中位数={stats['median_rtt_ms']:.1f}ms 最大={stats['max_rtt_ms']:.1f}ms")
+        return f"{rtt}, 丢失pong={stats['pongs_lost']}/{stats['pings_sent']}, 主动重连={stats['recycles']}"
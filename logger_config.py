@@ -1,39 +1,167 @@
 """
 日志配置模块
+
+调用线程只把日志记录放入队列，格式化、写文件和日志轮转全部在后台监听线程中完成；
+同一调用位置的DEBUG日志和声明限流的高频INFO日志（ping、逐帧日志等）按时间窗口限流，下单等其他INFO日志不受限制
 """
+import atexit
+import json
 import logging
+import queue
 import sys
-from logging.handlers import RotatingFileHandler
+import threading
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 from datetime import datetime
+from typing import Optional
+
+# 当前运行的日志监听线程
+_listener = None
+# 当前的限流过滤器（退出时输出剩余的抑制条数）
+_rate_filter = None
+
+# 高频INFO日志（ping、逐帧日志等）通过 logger.info(..., extra=RATE_LIMITED) 声明参与限流
+RATE_LIMITED = {'rate_limit': True}
 
 
-def setup_logger(log_file: str = 'trading_monitor.log', log_level: str = 'INFO'):
+class RateLimitFilter(logging.Filter):
+    """
+    按调用位置限流的过滤器
+
+    只限流DEBUG级别的日志，以及通过 extra=RATE_LIMITED 主动声明的高频INFO日志（ping、逐帧日志等）；
+    下单、成交等其他INFO日志和WARNING及以上级别的日志不受限制
+    """
+
+    def __init__(self, window: float = 10.0, max_per_window: int = 20, sink=None):
+        """
+        初始化限流过滤器
+
+        Args:
+            window: 时间窗口（秒）
+            max_per_window: 每个调用位置在一个窗口内最多输出的条数，0表示不限流
+            sink: 输出抑制汇总记录的函数（接收 LogRecord，不经过过滤器），为空时只在该位置的下一条日志中附带
+        """
+        super().__init__()
+        self.window = window
+        self.max_per_window = max_per_window
+        self.sink = sink
+        self.sites = {}  # (文件, 行号) -> [窗口开始时间, 已输出条数, 已丢弃条数, 日志记录器名称]
+        self.lock = threading.Lock()
+        self.dropped_total = 0
+        self.last_sweep = 0.0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.max_per_window <= 0 or record.levelno >= logging.WARNING:
+            return True
+        if record.levelno > logging.DEBUG and not getattr(record, 'rate_limit', False):
+            self._sweep(record.created)
+            return True
+
+        key = (record.pathname, record.lineno)
+        now = record.created
+        with self.lock:
+            site = self.sites.get(key)
+            if site is None or now - site[0] >= self.window:
+                dropped = site[2] if site else 0
+                self.sites[key] = [now, 1, 0, record.name]
+                if dropped:
+                    # 新窗口的第一条日志附带上一窗口丢弃的条数
+                    record.msg = f"{record.getMessage()} (已抑制 {dropped} 条同类日志)"
+                    record.args = None
+                passed = True
+            elif site[1] < self.max_per_window:
+                site[1] += 1
+                passed = True
+            else:
+                site[2] += 1
+                self.dropped_total += 1
+                passed = False
+        self._sweep(now)
+        return passed
+
+    def _sweep(self, now: float):
+        """窗口结束后仍未输出的抑制条数单独输出一条汇总（每个窗口最多检查一次）"""
+        if self.sink is None or now - self.last_sweep < self.window:
+            return
+        self.last_sweep = now
+        self.flush(now)
+
+    def flush(self, now: Optional[float] = None):
+        """
+        输出已结束窗口（now 为空时为全部窗口）中被抑制的条数
+
+        Args:
+            now: 当前时间戳，为空时输出所有位置的抑制条数（退出时调用）
+        """
+        if self.sink is None:
+            return
+        pending = []
+        with self.lock:
+            for (pathname, lineno), site in self.sites.items():
+                if site[2] and (now is None or now - site[0] >= self.window):
+                    pending.append((pathname, lineno, site[2], site[3]))
+                    site[2] = 0
+        for pathname, lineno, dropped, name in pending:
+            self.sink(logging.LogRecord(name, logging.INFO, pathname, lineno,
+                                        f"⏱️ 已抑制 {dropped} 条同类日志 ({pathname}:{lineno})", None, None))
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """紧凑的 JSON-lines 格式化器，每条日志一行"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            't': round(record.created, 6),
+            'lvl': record.levelname,
+            'name': record.name,
+            'thread': record.threadName,
+            'msg': record.getMessage()
+        }
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, separators=(',', ':'))
+
+
+class DeferredQueueHandler(QueueHandler):
+    """只入队不格式化的队列处理器（格式化在监听线程中进行）"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def setup_logger(log_file: str = 'trading_monitor.log', log_level: str = 'INFO',
+                 json_log_file: Optional[str] = None, rate_limit_window: float = 10.0,
+                 rate_limit_max: int = 20):
     """
     配置日志系统
-    
+
     Args:
         log_file: 日志文件名
         log_level: 日志级别
+        json_log_file: JSON-lines 日志文件名（可选），为空时不输出
+        rate_limit_window: 限流时间窗口（秒）
+        rate_limit_max: 每个调用位置在一个窗口内最多输出的DEBUG日志和声明限流的INFO日志条数，0表示不限流
     """
+    global _listener, _rate_filter
+
     # 创建根日志记录器
     root_logger = logging.getLogger()
     root_logger.setLevel(getattr(logging, log_level.upper()))
-    
-    # 清除现有的处理器
+
+    # 清除现有的处理器（重复初始化时先停止之前的监听线程）
     root_logger.handlers.clear()
-    
+    shutdown_logger()
+
     # 创建格式化器
     formatter = logging.Formatter(
         '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
         datefmt='%Y-%m-%d %H:%M:%S'
     )
-    
+
     # 控制台处理器
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setLevel(logging.INFO)
     console_handler.setFormatter(formatter)
-    root_logger.addHandler(console_handler)
-    
+
     # 文件处理器（带日志轮转）
     file_handler = RotatingFileHandler(
         log_file,
@@ -43,12 +171,55 @@ def setup_logger(log_file: str = 'trading_monitor.log', log_level: str = 'INFO')
     )
     file_handler.setLevel(logging.DEBUG)
     file_handler.setFormatter(formatter)
-    root_logger.addHandler(file_handler)
-    
+    handlers = [console_handler, file_handler]
+
+    # JSON-lines 处理器（可选）
+    if json_log_file:
+        json_handler = RotatingFileHandler(
+            json_log_file,
+            maxBytes=10*1024*1024,  # 10MB
+            backupCount=5,
+            encoding='utf-8'
+        )
+        json_handler.setLevel(logging.DEBUG)
+        json_handler.setFormatter(JsonLinesFormatter())
+        handlers.append(json_handler)
+
+    # 调用线程只入队，所有输出由监听线程完成
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    _rate_filter = RateLimitFilter(rate_limit_window, rate_limit_max, sink=queue_handler.emit)
+    queue_handler.addFilter(_rate_filter)
+    root_logger.addHandler(queue_handler)
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
     # 记录启动信息
     root_logger.info("=" * 60)
     root_logger.info(f"日志系统初始化完成 - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     root_logger.info("=" * 60)
-    
+
     return root_logger
 
+
+def shutdown_logger():
+    """停止日志监听线程，输出队列中剩余的日志并关闭文件"""
+    global _listener, _rate_filter
+    if _listener is None:
+        return
+    if _rate_filter is not None:
+        _rate_filter.flush()
+        _rate_filter = None
+    listener, _listener = _listener, None
+    listener.stop()
+    for handler in listener.handlers:
+        # 退出时输出流可能已被关闭（如测试框架捕获的标准输出），与 logging.shutdown 一样忽略
+        try:
+            handler.flush()
+            handler.close()
+        except (OSError, ValueError):
+            pass
+
+
+atexit.register(shutdown_logger)
@@ -1,115 +1,497 @@
 """
 主程序 - 监控Hyperliquid地址并自动在币安开空单
 """
+import time
+_IMPORT_STARTED = time.perf_counter()
+
+import argparse
 import logging
-from typing import Dict
+import os
+from typing import Dict, List, Optional
 import signal
 import sys
-import json
-import os
+import threading
 from datetime import datetime
 
 from config import (
     BINANCE_API_KEY,
     BINANCE_API_SECRET,
-    MONITOR_ADDRESS,
-    SCAN_INTERVAL,
-    POSITION_PRINT_INTERVAL,
     USER_FILLS_LIMIT,
     LEVERAGE,
     POSITION_SIZE_USDC,
+    BINANCE_ACCOUNTS,
     HYPERLIQUID_API_URL,
     HYPERLIQUID_WS_URL,
-    TRADING_PAIRS,
+    WS_SIGNAL_CHANNELS,
+    WS_PING_INTERVAL,
+    WS_RTT_RECYCLE_MS,
+    WS_PONG_LOSS_LIMIT,
+    SIGNAL_BUS_PATH,
+    SHARD_WORKERS,
+    SHARD_ADDRESSES_FILE,
+    SHARD_DB_PATH,
+    SHARD_BUS_PATH,
+    SHARD_SOURCE_ADDRESSES,
+    SHARD_ADDRESSES_PER_CONNECTION,
+    SHARD_HEARTBEAT_INTERVAL,
+    SHARD_MEMBER_TTL,
+    SHARD_STATS_INTERVAL,
+    STANDBY_ENABLED,
+    STANDBY_LEASE_PATH,
+    STANDBY_LEASE_TTL,
+    STANDBY_HEARTBEAT_INTERVAL,
+    SIGNAL_BATCH_WINDOW_MS,
+    LATENCY_MODE,
+    FILL_AGGREGATION_MODE,
+    FILL_AGGREGATION_QUIET_MS,
+    FILL_AGGREGATION_MAX_ORDERS,
+    ORDER_EXECUTION_MODE,
+    IOC_MAX_SLIPPAGE_BPS,
+    ORDER_BOOK_STALE_SECONDS,
+    BINANCE_REST_URL,
+    BINANCE_WS_URL,
+    EXECUTION_BACKEND,
+    PAPER_INITIAL_BALANCE,
+    PAPER_LATENCY_MS,
+    PAPER_LATENCY_JITTER_MS,
+    PAPER_SLIPPAGE_BPS,
+    PAPER_FEE_RATE,
+    RECONCILE_ENABLED,
+    RECONCILE_INTERVAL,
+    RECONCILE_GRACE_SECONDS,
     LOG_FILE,
     LOG_LEVEL,
+    LOG_JSON_FILE,
+    LOG_RATE_LIMIT_WINDOW,
+    LOG_RATE_LIMIT_MAX,
+    STARTUP_STEP_BUDGET,
+    CONFIG_RELOAD_ENABLED,
+    CONFIG_RELOAD_INTERVAL,
+    SHUTDOWN_DRAIN_TIMEOUT,
+    TRACE_ENABLED,
+    TRACE_DIR,
+    TRACE_MAX_FILES,
+    DIAG_ENABLED,
+    DIAG_SOCKET_PATH,
+    DIAG_OUTPUT_DIR,
+    DIAG_PROFILE_SECONDS,
+    DIAG_SAMPLE_INTERVAL_MS,
     USE_TESTNET,
     USE_WEBSOCKET,
     TELEGRAM_ENABLED,
     TELEGRAM_BOT_TOKEN,
     TELEGRAM_CHAT_ID
 )
-from logger_config import setup_logger
-from hyperliquid_monitor import HyperliquidMonitor
-from hyperliquid_monitor_ws import HyperliquidMonitorWS
-from binance_trader import BinanceTrader
+from logger_config import setup_logger, shutdown_logger
+from latency_mode import LatencyMode
+from fill_aggregator import FillAggregator, AGGREGATION_MODE_OFF
+from signal_batcher import SignalBatcher
+from signal_bus import SignalBusServer, SignalBusClient
+from signal_rules import SignalRuleEngine
+from runtime_config import RuntimeConfig, ConfigReloader
+from diagnostics import Diagnostics
+from shared_state import SharedStateFile
+from shutdown import ShutdownCoordinator
+from startup import StartupTimer, lazy_import, record_import
 from telegram_notifier import TelegramNotifier
+import tracing
+
+# 监控器、币安客户端、订单簿和对账模块依赖较重，按配置的模式在首次使用时导入（见 lazy_import）
+record_import('main', time.perf_counter() - _IMPORT_STARTED)
 
 logger = logging.getLogger(__name__)
 
 # 开单状态文件路径
 TRADE_STATE_FILE = 'trade_state.json'
 
+# 进程角色
+ROLE_ALL = 'all'  # 监控和下单在同一进程
+ROLE_MONITOR = 'monitor'  # 只监控，通过信号总线广播平仓信号
+ROLE_EXECUTOR = 'executor'  # 只下单，从信号总线接收平仓信号
+ROLE_SHARD = 'shard'  # 分片监控工作进程：按一致性哈希监控地址列表中的一部分地址
+
+
+def create_monitor(config: RuntimeConfig):
+    """
+    根据配置创建Hyperliquid监控器
+    
+    Args:
+        config: 运行时配置
+    """
+    logger.info("初始化Hyperliquid监控器...")
+    rule_engine = SignalRuleEngine(config.signal_rules)
+    if USE_WEBSOCKET:
+        logger.info("使用WebSocket模式（实时推送，无速率限制）")
+        HyperliquidMonitorWS = lazy_import('hyperliquid_monitor_ws').HyperliquidMonitorWS
+        return HyperliquidMonitorWS(
+            api_url=HYPERLIQUID_API_URL,
+            ws_url=HYPERLIQUID_WS_URL,
+            monitor_address=config.monitor_address,
+            rule_engine=rule_engine,
+            channels=WS_SIGNAL_CHANNELS,
+            ping_interval=WS_PING_INTERVAL,
+            rtt_recycle_ms=WS_RTT_RECYCLE_MS,
+            pong_loss_limit=WS_PONG_LOSS_LIMIT
+        )
+    
+    logger.info("使用HTTP轮询模式")
+    HyperliquidMonitor = lazy_import('hyperliquid_monitor').HyperliquidMonitor
+    return HyperliquidMonitor(
+        api_url=HYPERLIQUID_API_URL,
+        monitor_address=config.monitor_address,
+        user_fills_limit=USER_FILLS_LIMIT,
+        rule_engine=rule_engine
+    )
+
+
+def start_monitor(monitor, config: RuntimeConfig, callback, batch_callback, startup_checks: bool = True):
+    """
+    开始监控（阻塞）
+    
+    Args:
+        monitor: Hyperliquid监控器
+        config: 运行时配置
+        callback: 单个平仓信号的回调函数
+        batch_callback: 批量平仓信号的回调函数
+        startup_checks: 是否在订阅前同步执行接口测试和持仓打印（由后台启动流程负责时传False）
+    """
+    if USE_WEBSOCKET:
+        # WebSocket模式
+        monitor.start_monitoring(
+            callback=callback,
+            position_print_interval=config.position_print_interval,
+            batch_callback=batch_callback,
+            consistency_check_interval=config.consistency_check_interval,
+            startup_checks=startup_checks
+        )
+    else:
+        # HTTP轮询模式
+        monitor.start_monitoring(
+            scan_interval=config.scan_interval,
+            callback=callback,
+            position_print_interval=config.position_print_interval,
+            batch_callback=batch_callback,
+            startup_checks=startup_checks
+        )
+
+
+def apply_monitor_config(monitor, config: RuntimeConfig, changes: List[str]):
+    """
+    将重新加载的配置应用到监控器（只更新变化的部分，监控连接保持不变）
+    
+    Args:
+        monitor: Hyperliquid监控器
+        config: 新的运行时配置
+        changes: 变化的字段列表
+    """
+    if 'signal_rules' in changes:
+        monitor.rule_engine = SignalRuleEngine(config.signal_rules)
+        logger.info("✅ 平仓信号规则已更新")
+    if 'position_print_interval' in changes:
+        monitor.position_print_interval = config.position_print_interval
+    if USE_WEBSOCKET:
+        if 'consistency_check_interval' in changes:
+            monitor.consistency_check_interval = config.consistency_check_interval
+    elif 'scan_interval' in changes:
+        monitor.scan_interval = config.scan_interval
+    if 'monitor_address' in changes:
+        monitor.set_monitor_address(config.monitor_address)
+
+
+def create_diagnostics(monitor=None) -> Optional[Diagnostics]:
+    """
+    创建运行时诊断（SIGUSR1/SIGUSR2 和管理套接字），并注册监控器中可能持续增长的集合
+
+    Args:
+        monitor: Hyperliquid监控器（可选）
+
+    Returns:
+        诊断对象，未启用时返回None
+    """
+    if not DIAG_ENABLED:
+        return None
+    diagnostics = Diagnostics(
+        output_dir=DIAG_OUTPUT_DIR,
+        socket_path=DIAG_SOCKET_PATH.format(pid=os.getpid()) if DIAG_SOCKET_PATH else None,
+        profile_seconds=DIAG_PROFILE_SECONDS,
+        sample_interval_ms=DIAG_SAMPLE_INTERVAL_MS
+    )
+    if monitor:
+        diagnostics.add_status('processed_fills', lambda: len(monitor.processed_fills))
+        if hasattr(monitor, 'mirrored_fills'):
+            diagnostics.add_status('mirrored_fills', lambda: len(monitor.mirrored_fills))
+        if getattr(monitor, 'race', None):
+            diagnostics.add_status('race_orders', lambda: len(monitor.race.orders))
+        if hasattr(monitor, 'link'):
+            # 链路质量指标（应用层ping/pong的往返时间）
+            for key in ('rtt_ms', 'jitter_ms', 'max_rtt_ms', 'pongs_lost', 'recycles'):
+                diagnostics.add_status(f'ws_{key}', lambda key=key: monitor.link.snapshot()[key])
+    return diagnostics
+
 
 class TradingBot:
     """交易机器人主类"""
     
-    def __init__(self):
-        """初始化交易机器人"""
+    def __init__(self, role: str = ROLE_ALL, bus_paths: Optional[List[str]] = None):
+        """
+        初始化交易机器人
+        
+        Args:
+            role: 进程角色，'all' 或 'executor'（下单进程不创建监控器，从信号总线接收信号）
+            bus_paths: 下单进程订阅的信号总线路径列表
+        """
+        self.role = role
+        # 配置了分片工作进程时，默认订阅所有工作进程的信号总线
+        shard_bus_paths = [SHARD_BUS_PATH.format(worker=worker) for worker in SHARD_WORKERS]
+        self.bus_paths = bus_paths or shard_bus_paths or [SIGNAL_BUS_PATH]
+        self.bus_client = None
         self.running = True
+        self.trade_lock = threading.Lock()
+        
+        # 优雅退出：停止接收 → 等待正在处理的信号 → 保存状态（步骤在 register_shutdown_steps 中注册）
+        self.shutdown = ShutdownCoordinator(drain_timeout=SHUTDOWN_DRAIN_TIMEOUT)
+        
+        # 可热加载的配置（交易对、杠杆、监控地址等），重新加载时整体替换
+        self.config = RuntimeConfig.from_module()
+        self.config_reloader = None
+        self.diagnostics = None  # 运行时诊断（在 run() 中启动）
+        
+        # 启动步骤计时（关键步骤同步执行，信息查询和通知在后台并发执行）
+        self.startup = StartupTimer(default_budget=STARTUP_STEP_BUDGET)
         
         # 开单状态跟踪字典
         # 格式: {币种: {'opened': True/False, 'timestamp': 时间戳, 'order_id': 订单ID}}
         self.trade_state = {}
+        self.state_file = SharedStateFile(TRADE_STATE_FILE)
         
         # 加载之前的开单状态
-        self.load_trade_state()
+        with self.startup.measure('加载开单状态'):
+            self.load_trade_state()
         
         # 初始化Telegram通知器
         logger.info("初始化Telegram通知器...")
-        self.notifier = TelegramNotifier(
-            bot_token=TELEGRAM_BOT_TOKEN,
-            chat_id=TELEGRAM_CHAT_ID,
-            enabled=TELEGRAM_ENABLED
-        )
+        with self.startup.measure('Telegram通知器'):
+            self.notifier = TelegramNotifier(
+                bot_token=TELEGRAM_BOT_TOKEN,
+                chat_id=TELEGRAM_CHAT_ID,
+                enabled=TELEGRAM_ENABLED
+            )
+        
+        # 初始化Hyperliquid监控器（下单进程的信号来自信号总线）
+        with self.startup.measure('Hyperliquid监控器'):
+            self.monitor = create_monitor(self.config) if role == ROLE_ALL else None
+        
+        # IOC模式需要本地订单簿在下单时本地定价，模拟盘按本地订单簿模拟成交
+        self.order_book = None
+        if ORDER_EXECUTION_MODE == 'IOC' or EXECUTION_BACKEND == 'PAPER':
+            if ORDER_EXECUTION_MODE == 'IOC':
+                logger.info(f"使用限价IOC下单模式（最大滑点 {IOC_MAX_SLIPPAGE_BPS} bps），启动本地订单簿...")
+            else:
+                logger.info("模拟盘按本地订单簿成交，启动本地订单簿...")
+            with self.startup.measure('本地订单簿'):
+                OrderBookManager = lazy_import('order_book').OrderBookManager
+                self.order_book = OrderBookManager(
+                    symbols=list(self.config.trading_pairs.values()),
+                    testnet=USE_TESTNET,
+                    stale_seconds=ORDER_BOOK_STALE_SECONDS,
+                    rest_url=BINANCE_REST_URL or None,
+                    ws_url=BINANCE_WS_URL or None
+                )
+                self.order_book.start()
         
-        # 初始化Hyperliquid监控器
-        logger.info("初始化Hyperliquid监控器...")
-        if USE_WEBSOCKET:
-            logger.info("使用WebSocket模式（实时推送，无速率限制）")
-            self.monitor = HyperliquidMonitorWS(
-                api_url=HYPERLIQUID_API_URL,
-                ws_url=HYPERLIQUID_WS_URL,
-                monitor_address=MONITOR_ADDRESS
+        # 初始化币安交易客户端（模拟盘使用相同接口的 PaperTrader）
+        logger.info("初始化币安交易客户端...")
+        with self.startup.measure('币安账户初始化'):
+            MultiAccountTrader = lazy_import('multi_account_trader').MultiAccountTrader
+            backend_options = {'base_url': BINANCE_REST_URL or None}
+            if EXECUTION_BACKEND == 'PAPER':
+                logger.warning("⚠️ 模拟盘模式：订单只在本地模拟成交，不会发送到币安")
+                paper_trader = lazy_import('paper_trader')
+                backend_options = {
+                    'trader_class': paper_trader.PaperTrader,
+                    'latency_model': paper_trader.LatencyModel(PAPER_LATENCY_MS, PAPER_LATENCY_JITTER_MS),
+                    'slippage_model': paper_trader.SlippageModel(fixed_bps=PAPER_SLIPPAGE_BPS),
+                    'initial_balance': PAPER_INITIAL_BALANCE,
+                    'fee_rate': PAPER_FEE_RATE
+                }
+            self.trader = MultiAccountTrader(
+                accounts=self.build_account_configs(),
+                testnet=USE_TESTNET,
+                order_book=self.order_book,
+                execution_mode=ORDER_EXECUTION_MODE,
+                max_slippage_bps=IOC_MAX_SLIPPAGE_BPS,
+                **backend_options
             )
-        else:
-            logger.info("使用HTTP轮询模式")
-            self.monitor = HyperliquidMonitor(
-                api_url=HYPERLIQUID_API_URL,
-                monitor_address=MONITOR_ADDRESS,
-                user_fills_limit=USER_FILLS_LIMIT
+        
+        # 开单状态对账（后台维护持仓缓存，持仓归零后自动重置开单状态）
+        # 对账依赖币安用户数据流，模拟盘不启用
+        self.reconciler = None
+        if RECONCILE_ENABLED and EXECUTION_BACKEND == 'PAPER':
+            logger.info("模拟盘模式不启用开单状态对账")
+        elif RECONCILE_ENABLED:
+            TradeStateReconciler = lazy_import('trade_reconciler').TradeStateReconciler
+            self.reconciler = TradeStateReconciler(
+                accounts=self.trader.accounts,
+                trading_pairs=self.config.trading_pairs,
+                get_trade_state=lambda: self.trade_state,
+                rearm=self.rearm_coin,
+                alert=self.send_state_mismatch_alert,
+                testnet=USE_TESTNET,
+                refresh_interval=RECONCILE_INTERVAL,
+                grace_seconds=RECONCILE_GRACE_SECONDS,
+                state_lock=self.trade_lock,
+                ws_url=BINANCE_WS_URL or None
             )
         
-        # 初始化币安交易客户端
-        logger.info("初始化币安交易客户端...")
-        if not BINANCE_API_KEY or BINANCE_API_KEY == 'your_binance_api_key_here':
-            logger.error("❌ 未配置币安API密钥，请在config.py文件中配置")
-            raise ValueError("未配置币安API密钥")
+        # 热备：与另一个实例竞争租约，只有主实例下单（租约在 run() 中开始心跳）
+        self.lease = None
+        if STANDBY_ENABLED:
+            LeaseManager = lazy_import('standby').LeaseManager
+            self.lease = LeaseManager(
+                path=STANDBY_LEASE_PATH,
+                ttl=STANDBY_LEASE_TTL,
+                heartbeat_interval=STANDBY_HEARTBEAT_INTERVAL,
+                health_check=self.is_signal_source_healthy,
+                on_promote=self.on_promoted,
+                on_demote=self.on_demoted
+            )
         
-        self.trader = BinanceTrader(
-            api_key=BINANCE_API_KEY,
-            api_secret=BINANCE_API_SECRET,
-            testnet=USE_TESTNET
+        # 同一帧或合并窗口内的平仓信号合并为一批处理
+        self.batcher = SignalBatcher(
+            handler=self.on_close_positions_detected,
+            window_ms=SIGNAL_BATCH_WINDOW_MS
         )
+        self.signal_sink = self.batcher.add
+        
+        # 按订单ID聚合部分成交（位于解析和批处理之间）
+        self.aggregator = None
+        if FILL_AGGREGATION_MODE != AGGREGATION_MODE_OFF:
+            self.aggregator = FillAggregator(
+                emit=self.batcher.add,
+                mode=FILL_AGGREGATION_MODE,
+                quiet_ms=FILL_AGGREGATION_QUIET_MS,
+                max_orders=FILL_AGGREGATION_MAX_ORDERS
+            )
+            self.signal_sink = self.aggregator.add
+            logger.info(f"部分成交聚合: {FILL_AGGREGATION_MODE} 模式")
+        
+        # 低延迟模式：预设杠杆和下单模板，下单热路径内暂停垃圾回收
+        self.latency = LatencyMode(enabled=LATENCY_MODE)
+        if LATENCY_MODE:
+            with self.startup.measure('预设交易对'):
+                self.trader.prime_symbols(list(self.config.trading_pairs.values()))
         
         # 设置信号处理
+        self.register_shutdown_steps()
         signal.signal(signal.SIGINT, self.signal_handler)
         signal.signal(signal.SIGTERM, self.signal_handler)
         
         logger.info("✅ 交易机器人初始化完成")
     
+    def register_shutdown_steps(self):
+        """注册退出步骤：先停止接收新信号，再输出缓冲中的信号，最后保存状态并释放资源"""
+        shutdown = self.shutdown
+        
+        # 1. 停止接收（只设置标志和关闭连接，正在执行的回调会执行完毕）
+        if self.monitor:
+            shutdown.on_stop('停止监控', self.monitor.stop)
+        shutdown.on_stop('停止信号总线', lambda: self.bus_client and self.bus_client.stop())
+        shutdown.on_stop('停止配置热加载', lambda: self.config_reloader and self.config_reloader.stop())
+        
+        # 2. 已收到但还在聚合或合并窗口中的信号立即处理
+        if self.aggregator:
+            shutdown.on_drain('输出聚合中的成交', self.aggregator.stop)
+        shutdown.on_drain('输出合并窗口', self.batcher.flush)
+        
+        # 3. 保存状态并释放资源（租约在保存开单状态之后让出，接管的实例读到的是最新状态）
+        if self.reconciler:
+            shutdown.on_flush('停止对账', self.reconciler.stop)
+        shutdown.on_flush('保存开单状态', self.flush_trade_state)
+        if self.lease:
+            shutdown.on_flush('让出租约', self.lease.stop)
+        if self.order_book:
+            shutdown.on_flush('停止订单簿', self.order_book.stop)
+        shutdown.on_flush('关闭下单线程池', self.trader.shutdown)
+        shutdown.on_flush('发送退出通知', self.send_shutdown_message)
+        shutdown.on_flush('关闭追踪文件', tracing.shutdown_tracer)
+        # 诊断最后停止，排空卡住时仍可输出线程栈
+        shutdown.on_flush('停止诊断', lambda: self.diagnostics and self.diagnostics.stop())
+    
+    def flush_trade_state(self):
+        """退出前保存开单状态（等待正在写入的信号处理完成）"""
+        with self.trade_lock:
+            self.save_trade_state()
+    
+    def send_shutdown_message(self):
+        """等待正在发送的通知完成，然后发送退出通知"""
+        if not self.notifier.wait_idle(SHUTDOWN_DRAIN_TIMEOUT):
+            logger.warning("⚠️ 仍有Telegram通知未发送完毕")
+        summary = self.shutdown.summary()
+        self.notifier.send_message(
+            f"🛑 <b>机器人已停止</b>\n\n"
+            f"原因: {summary['reason']}\n"
+            f"排空信号: {summary['drained']} 批\n"
+            f"超时未完成: {summary['abandoned']} 批"
+        )
+    
+    @staticmethod
+    def build_account_configs() -> List[Dict]:
+        """
+        构建币安账户配置列表
+        
+        未配置BINANCE_ACCOUNTS时，使用BINANCE_API_KEY/LEVERAGE/POSITION_SIZE_USDC作为唯一账户；
+        模拟盘模式不检查API密钥
+        
+        Returns:
+            账户配置列表
+        """
+        if BINANCE_ACCOUNTS:
+            accounts = []
+            for index, account in enumerate(BINANCE_ACCOUNTS):
+                api_key = account.get('api_key')
+                if EXECUTION_BACKEND != 'PAPER' and (not api_key or api_key == 'your_binance_api_key_here'):
+                    logger.error(f"❌ 账户 {account.get('name', index)} 未配置币安API密钥")
+                    raise ValueError("未配置币安API密钥")
+                accounts.append({
+                    'name': account.get('name', f'account{index + 1}'),
+                    'api_key': api_key,
+                    'api_secret': account.get('api_secret'),
+                    'leverage': account.get('leverage', LEVERAGE),
+                    'position_size_usdc': account.get('position_size_usdc', POSITION_SIZE_USDC)
+                })
+            return accounts
+        
+        if EXECUTION_BACKEND != 'PAPER' and (not BINANCE_API_KEY or BINANCE_API_KEY == 'your_binance_api_key_here'):
+            logger.error("❌ 未配置币安API密钥，请在config.py文件中配置")
+            raise ValueError("未配置币安API密钥")
+        
+        return [{
+            'name': 'main',
+            'api_key': BINANCE_API_KEY,
+            'api_secret': BINANCE_API_SECRET,
+            'leverage': LEVERAGE,
+            'position_size_usdc': POSITION_SIZE_USDC
+        }]
+    
     def signal_handler(self, signum, frame):
-        """信号处理函数"""
+        """
+        信号处理函数：只请求退出，不在这里退出进程（可能正在下单或写入开单状态），
+        由 run() 在主循环结束后排空并保存状态；再次收到信号时立即退出
+        """
+        if self.shutdown.stopping:
+            logger.error(f"再次收到信号 {signum}，立即退出（正在处理的信号可能未完成）")
+            shutdown_logger()
+            os._exit(1)
         logger.info(f"收到信号 {signum}，准备退出...")
         self.running = False
-        sys.exit(0)
+        self.shutdown.request(f"信号 {signum}")
     
     def load_trade_state(self):
         """从文件加载开单状态"""
         try:
-            if os.path.exists(TRADE_STATE_FILE):
-                with open(TRADE_STATE_FILE, 'r', encoding='utf-8') as f:
-                    self.trade_state = json.load(f)
+            state = self.state_file.load()
+            if state is not None:
+                self.trade_state = state
                 logger.info(f"✅ 已加载开单状态: {self.trade_state}")
             else:
                 logger.info("未找到开单状态文件，将创建新的状态记录")
@@ -121,12 +503,53 @@ class TradingBot:
     def save_trade_state(self):
         """保存开单状态到文件"""
         try:
-            with open(TRADE_STATE_FILE, 'w', encoding='utf-8') as f:
-                json.dump(self.trade_state, f, ensure_ascii=False, indent=2)
+            with tracing.span('state.save'):
+                self.state_file.save(self.trade_state)
             logger.debug(f"已保存开单状态: {self.trade_state}")
         except Exception as e:
             logger.error(f"保存开单状态失败: {e}")
     
+    def refresh_trade_state(self):
+        """开单状态文件被其他实例（或开单状态管理工具）修改后重新加载，未修改时只有一次 stat"""
+        if self.state_file.changed():
+            logger.info("🔄 开单状态文件已被其他进程更新，重新加载")
+            self.load_trade_state()
+    
+    def is_active(self) -> bool:
+        """是否负责下单（未启用热备，或持有主实例租约）"""
+        return self.lease is None or self.lease.is_leader()
+    
+    def confirm_active(self) -> bool:
+        """下单前确认负责下单：未启用热备，或在租约数据库中确认仍是主实例（防止时钟跳变后两个实例同时下单）"""
+        return self.lease is None or self.lease.confirm_leader()
+    
+    def is_signal_source_healthy(self) -> bool:
+        """热备健康检查：WebSocket模式下订阅连接断开的实例不持有租约，由另一个实例接管"""
+        return getattr(self.monitor, 'ws_connected', True)
+    
+    def on_promoted(self, epoch: int):
+        """
+        成为主实例：重新加载共享的开单状态后开始下单
+        
+        Args:
+            epoch: 租约纪元
+        """
+        with self.trade_lock:
+            self.load_trade_state()
+        self.notifier.send_message(
+            f"👑 <b>实例接管下单</b>\n\n"
+            f"实例: <code>{self.lease.holder_id}</code>\n"
+            f"租约纪元: {epoch}"
+        )
+    
+    def on_demoted(self):
+        """失去主实例租约，转为备用实例"""
+        self.notifier.send_message(
+            f"⏸️ <b>实例转为备用</b>\n\n"
+            f"实例: <code>{self.lease.holder_id}</code>\n"
+            f"由另一个实例负责下单"
+        )
+    
     def is_already_opened(self, coin: str) -> bool:
         """
         检查该币种是否已经开过单
@@ -146,19 +569,22 @@ class TradingBot:
                 return True
         return False
     
-    def mark_as_opened(self, coin: str, order_id: str = 'N/A'):
+    def mark_as_opened(self, coin: str, order_id: str = 'N/A', accounts: Optional[Dict] = None):
         """
         标记该币种已开单
         
         Args:
             coin: 币种名称
             order_id: 订单ID
+            accounts: 各账户的执行结果（可选）
         """
         self.trade_state[coin] = {
             'opened': True,
             'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
             'order_id': order_id
         }
+        if accounts:
+            self.trade_state[coin]['accounts'] = accounts
         self.save_trade_state()
         logger.info(f"✅ 已标记 {coin} 为已开单状态")
     
@@ -180,6 +606,42 @@ class TradingBot:
                 logger.info(f"⚠️  {coin} 没有开单记录")
         self.save_trade_state()
     
+    def rearm_coin(self, coin: str, reason: str):
+        """
+        对账发现持仓已归零时重置该币种的开单状态（调用方已持有开单状态锁）
+        
+        Args:
+            coin: 币种名称
+            reason: 重置原因
+        """
+        if not self.is_active():
+            return
+        # 先合并其他进程（开单状态管理工具、另一个实例）的修改，避免保存时覆盖
+        seen = self.trade_state.get(coin)
+        self.refresh_trade_state()
+        if self.trade_state.get(coin) != seen:
+            logger.info(f"🔄 {coin} 开单状态已被其他进程更新，跳过本次自动重置")
+            return
+        logger.warning(f"🔄 自动重置 {coin} 开单状态: {reason}")
+        self.reset_trade_state(coin)
+        self.notifier.send_message(
+            f"🔄 <b>自动重置开单状态</b>\n\n"
+            f"币种: <b>{coin}</b>\n"
+            f"原因: {reason}\n"
+            f"该币种将重新响应平仓信号"
+        )
+    
+    def send_state_mismatch_alert(self, message: str):
+        """
+        发送开单状态与交易所持仓不一致的警报
+        
+        Args:
+            message: 警报内容
+        """
+        if not self.is_active():
+            return
+        self.notifier.send_error_alert("开单状态不一致", message)
+    
     def get_trade_state_summary(self) -> str:
         """
         获取开单状态摘要
@@ -203,105 +665,250 @@ class TradingBot:
         Args:
             position: 平仓信息字典
         """
+        self.on_close_positions_detected([position])
+    
+    def on_close_positions_detected(self, positions: List[Dict]):
+        """
+        当检测到一批平仓操作时的回调函数（同一帧或同一合并窗口内）
+        
+        Args:
+            positions: 平仓信息字典列表
+        """
+        # 排空结束后到达的信号不再处理（下次启动时按快照跳过）
+        if not self.shutdown.begin():
+            logger.error(f"❌ 正在退出，丢弃 {len(positions)} 个平仓信号: {', '.join(p['coin'] for p in positions)}")
+            return
         try:
-            coin = position['coin']
-            size = position['size']
-            price = position['price']
-            closed_pnl = position['closed_pnl']
-            datetime_str = position['datetime']
-            
-            logger.warning("=" * 80)
-            logger.warning(f"🚨 检测到平多仓操作!")
-            logger.warning(f"币种: {coin}")
-            logger.warning(f"数量: {size}")
-            logger.warning(f"价格: {price}")
-            logger.warning(f"已实现盈亏: {closed_pnl}")
-            logger.warning(f"时间: {datetime_str}")
-            logger.warning("=" * 80)
-            
-            # 发送Telegram通知
-            self.notifier.send_position_close_alert(position)
-            
-            # 检查是否为ETH或BTC
-            if coin not in TRADING_PAIRS:
-                logger.warning(f"⚠️  币种 {coin} 不在交易列表中，跳过")
-                return
-            
-            # 检查是否已经开过单
-            if self.is_already_opened(coin):
-                logger.warning(f"⚠️  {coin} 已经开过单，跳过本次开单操作")
-                # 发送Telegram通知
-                self.notifier.send_message(
-                    f"⚠️ <b>跳过重复开单</b>\n\n"
-                    f"币种: <b>{coin}</b>\n"
-                    f"原因: 该币种已经开过单\n"
-                    f"开单时间: {self.trade_state[coin].get('timestamp', 'N/A')}\n"
-                    f"订单ID: <code>{self.trade_state[coin].get('order_id', 'N/A')}</code>"
-                )
-                return
-            
-            # 获取对应的交易对
-            symbol = TRADING_PAIRS[coin]
-            
-            position_value = POSITION_SIZE_USDC * LEVERAGE
-            logger.info(f"准备在币安开空 {coin} ({symbol})...")
-            logger.info(f"杠杆: {LEVERAGE}x, 保证金: {POSITION_SIZE_USDC} USDC, 持仓价值: {position_value} USDC")
-            
-            # 执行开空交易
-            success = self.trader.execute_short_trade(
-                coin=coin,
-                symbol=symbol,
-                leverage=LEVERAGE,
-                usdc_amount=POSITION_SIZE_USDC
-            )
-            
-            if success:
-                logger.warning(f"✅ 成功在币安开空 {coin}!")
+            # 同一批信号共享处理过程中的追踪时间段（下单、写入状态、通知）
+            with tracing.activate(tracing.trace_ids_of(positions)), \
+                    tracing.span('bot.handle_batch', signals=len(positions)):
+                self._process_positions(positions)
+        finally:
+            self.shutdown.end()
+    
+    def _process_positions(self, positions: List[Dict]):
+        """处理一批平仓信号：检查开单状态、下单并写入结果"""
+        # 批处理可能来自不同线程，检查和标记开单状态需要串行
+        with self.trade_lock:
+            # 热备：备用实例不下单也不重复通知；主实例先同步另一个实例可能写入的开单状态
+            if self.lease:
+                if not self.lease.is_leader():
+                    logger.info(f"⏸️ 备用实例收到 {len(positions)} 个平仓信号，由主实例处理")
+                    return
+                self.refresh_trade_state()
+            try:
+                # 低延迟模式下信号横幅和Telegram通知推迟到下单之后
+                announcements = [] if self.latency.enabled else None
+                with self.latency.hot_path():
+                    legs = []
+                    with tracing.span('bot.gate'):
+                        for position in positions:
+                            leg = self.check_position_signal(position, announcements)
+                            if leg and all(l['coin'] != leg['coin'] for l in legs):
+                                legs.append(leg)
+                    
+                    if legs:
+                        if announcements is None:
+                            coins = ', '.join(f"{leg['coin']} ({leg['symbol']})" for leg in legs)
+                            logger.info(f"准备在币安开空 {coins}，账户数: {len(self.trader.accounts)}...")
+                        
+                        if not self.confirm_active():
+                            # 处理信号期间租约已过期或已被另一个实例接管
+                            logger.warning("⚠️ 主实例租约已过期或已被接管，取消本次下单")
+                            legs = []
+                        else:
+                            # 所有账户并发执行开空，同一账户内多个币种批量下单（持仓在热路径结束后查询）
+                            with tracing.span('trader.execute', legs=len(legs), accounts=len(self.trader.accounts)):
+                                results = self.trader.execute_short_trades(legs, fetch_positions=False)
                 
-                # 获取并显示持仓信息
-                positions = self.trader.get_position_info(symbol)
-                trade_info = {
-                    'coin': coin,
-                    'symbol': symbol,
-                    'leverage': LEVERAGE,
-                    'margin': POSITION_SIZE_USDC,
-                    'position_value': position_value,
-                    'quantity': 0,
-                    'entry_price': 0,
-                    'order_id': 'N/A'
-                }
+                if legs:
+                    self.trader.fill_positions(results)
                 
-                if positions:
-                    for pos in positions:
-                        position_amt = float(pos.get('positionAmt', 0))
-                        if position_amt != 0:
-                            entry_price = float(pos.get('entryPrice', 0))
-                            unrealized_pnl = float(pos.get('unRealizedProfit', 0))
-                            logger.info(f"当前 {coin} 持仓:")
-                            logger.info(f"  持仓量: {pos.get('positionAmt')}")
-                            logger.info(f"  入场价格: {entry_price}")
-                            logger.info(f"  持仓价值: {abs(position_amt) * entry_price:.2f} USDC")
-                            logger.info(f"  未实现盈亏: {unrealized_pnl} USDC")
-                            logger.info(f"  杠杆: {pos.get('leverage')}x")
-                            
-                            # 更新交易信息
-                            trade_info['quantity'] = abs(position_amt)
-                            trade_info['entry_price'] = entry_price
+                for announce in announcements or []:
+                    announce()
                 
-                # 标记为已开单
-                self.mark_as_opened(coin, trade_info['order_id'])
+                if not legs:
+                    return
                 
-                # 发送交易成功通知
-                self.notifier.send_trade_success(trade_info)
-            else:
-                logger.error(f"❌ 在币安开空 {coin} 失败!")
-                # 发送交易失败通知
-                self.notifier.send_trade_failure(coin, "开空单失败，请查看日志")
+                for line in self.latency.summary():
+                    logger.info(f"⚡️ {line}")
+                
+                with tracing.span('bot.results'):
+                    for leg in legs:
+                        self.handle_trade_results(leg['coin'], [r for r in results if r['coin'] == leg['coin']])
+                
+                logger.warning("=" * 80)
+                
+            except Exception as e:
+                logger.error(f"处理平仓事件时发生错误: {e}", exc_info=True)
+    
+    def announce_position_signal(self, position: Dict):
+        """
+        记录平仓信号并发送Telegram通知
+        
+        Args:
+            position: 平仓信息字典
+        """
+        coin = position['coin']
+        size = position['size']
+        price = position['price']
+        closed_pnl = position['closed_pnl']
+        datetime_str = position['datetime']
+        
+        logger.warning("=" * 80)
+        logger.warning(f"🚨 检测到平多仓操作!")
+        logger.warning(f"币种: {coin}")
+        logger.warning(f"数量: {size}")
+        logger.warning(f"价格: {price}")
+        logger.warning(f"已实现盈亏: {'未知' if closed_pnl is None else closed_pnl}")
+        logger.warning(f"时间: {datetime_str}")
+        if position.get('trace_id'):
+            logger.warning(f"追踪ID: {position['trace_id']}")
+        logger.warning("=" * 80)
+        
+        # 发送Telegram通知
+        self.notifier.send_position_close_alert(position)
+    
+    def check_position_signal(self, position: Dict, announcements: Optional[List[Dict]] = None) -> Optional[Dict]:
+        """
+        记录平仓信号并检查是否需要开单
+        
+        Args:
+            position: 平仓信息字典
+            announcements: 推迟通知列表（可选），传入时信号横幅和Telegram通知只加入列表（无参函数），
+                由调用方在下单后再执行
             
-            logger.warning("=" * 80)
+        Returns:
+            需要开单时返回交易腿 {coin, symbol}，否则返回None
+        """
+        coin = position['coin']
+        if announcements is None:
+            self.announce_position_signal(position)
+        else:
+            announcements.append(lambda: self.announce_position_signal(position))
+        
+        # 检查是否为ETH或BTC
+        config = self.config
+        if coin not in config.trading_pairs:
+            logger.warning(f"⚠️  币种 {coin} 不在交易列表中，跳过")
+            return None
+        
+        # 检查是否已经开过单
+        if self.is_already_opened(coin):
+            logger.warning(f"⚠️  {coin} 已经开过单，跳过本次开单操作")
+            # 发送Telegram通知（低延迟模式下推迟到同一批的其他币种下单之后）
+            message = (
+                f"⚠️ <b>跳过重复开单</b>\n\n"
+                f"币种: <b>{coin}</b>\n"
+                f"原因: 该币种已经开过单\n"
+                f"开单时间: {self.trade_state[coin].get('timestamp', 'N/A')}\n"
+                f"订单ID: <code>{self.trade_state[coin].get('order_id', 'N/A')}</code>"
+            )
+            if announcements is None:
+                self.notifier.send_message(message)
+            else:
+                announcements.append(lambda: self.notifier.send_message(message))
+            return None
+        
+        # 获取对应的交易对
+        leg = {'coin': coin, 'symbol': config.trading_pairs[coin]}
+        
+        # 按比例开仓：保证金按监控地址本次平掉的持仓比例缩放
+        if config.position_sizing_mode == 'PROPORTIONAL':
+            fraction = position.get('close_fraction', 1.0) or 1.0
+            leg['size_scale'] = min(max(fraction, config.position_size_min_scale), 1.0)
+            logger.info(f"按比例开仓: 平仓比例 {fraction:.2%}, 保证金缩放 {leg['size_scale']:.2%}")
+        
+        return leg
+    
+    def handle_trade_results(self, coin: str, results: List[Dict]):
+        """
+        处理某个币种在各账户上的开单结果：通知并写入开单状态
+        
+        Args:
+            coin: 币种名称
+            results: 该币种在各账户上的执行结果列表
+        """
+        succeeded = [r for r in results if r['success']]
+        failed = [r for r in results if not r['success']]
+        
+        for result in succeeded:
+            logger.warning(f"✅ 账户 {result['account']} 成功在币安开空 {coin}!")
+            logger.info(f"  订单ID: {result['order_id']}")
+            logger.info(f"  持仓量: {result['quantity']}")
+            logger.info(f"  入场价格: {result['entry_price']}")
+            logger.info(f"  杠杆: {result['leverage']}x, 保证金: {result['margin']} USDC")
+            logger.info(f"  下单耗时: {result['latency_ms']:.1f} ms")
             
-        except Exception as e:
-            logger.error(f"处理平仓事件时发生错误: {e}", exc_info=True)
+            # 发送交易成功通知
+            self.notifier.send_trade_success(result)
+        
+        for result in failed:
+            logger.error(f"❌ 账户 {result['account']} 在币安开空 {coin} 失败!")
+            # 发送交易失败通知
+            self.notifier.send_trade_failure(coin, f"账户 {result['account']} 开空单失败，请查看日志")
+        
+        if succeeded:
+            # 标记为已开单（任一账户成功即视为已开单，避免重复开单）
+            self.mark_as_opened(
+                coin,
+                ', '.join(str(r['order_id']) for r in succeeded),
+                accounts={
+                    r['account']: {
+                        'success': r['success'],
+                        'order_id': r['order_id'],
+                        'latency_ms': round(r['latency_ms'], 1)
+                    }
+                    for r in results
+                }
+            )
+    
+    def apply_runtime_config(self, config: RuntimeConfig, changes: List[str]):
+        """
+        应用重新加载的配置：只更新变化的部分，交易对和杠杆的预设在替换配置前完成
+        
+        Args:
+            config: 新的运行时配置
+            changes: 变化的字段列表
+        """
+        old_symbols = set(self.config.trading_pairs.values())
+        new_symbols = set(config.trading_pairs.values())
+        added = sorted(new_symbols - old_symbols)
+        removed = sorted(old_symbols - new_symbols)
+        
+        # 新增交易对先订阅深度流，快照在替换配置前后陆续到达，其他交易对的订单簿不受影响
+        if self.order_book and added:
+            self.order_book.add_symbols(added)
+        
+        # 持有开单锁期间没有正在处理的信号：更新账户参数、重新预设杠杆，然后整体替换配置
+        with self.trade_lock:
+            releveraged = self.trader.update_accounts(config.accounts) if 'accounts' in changes else []
+            if self.latency.enabled:
+                if added:
+                    # 重新获取新增交易对的过滤器并预设杠杆
+                    self.trader.forget_symbols(added)
+                    self.trader.prime_symbols(added)
+                kept = sorted(new_symbols & old_symbols)
+                if releveraged and kept:
+                    self.trader.prime_symbols(kept, account_names=releveraged)
+            if self.reconciler and 'trading_pairs' in changes:
+                self.reconciler.set_trading_pairs(config.trading_pairs)
+            self.config = config
+        
+        if removed:
+            if self.order_book:
+                self.order_book.remove_symbols(removed)
+            self.trader.forget_symbols(removed)
+        
+        if self.monitor:
+            apply_monitor_config(self.monitor, config, changes)
+        
+        logger.info(f"✅ 新配置已生效: {', '.join(changes)}")
+        self.notifier.send_message(
+            f"⚙️ <b>配置已重新加载</b>\n\n"
+            f"变化: {', '.join(changes)}\n"
+            f"交易对: {', '.join(f'{k}→{v}' for k, v in config.trading_pairs.items())}"
+        )
     
     def display_startup_info(self):
         """显示启动信息"""
@@ -309,12 +916,24 @@ class TradingBot:
         logger.info("=" * 80)
         logger.info("🤖 Hyperliquid监控交易机器人")
         logger.info("=" * 80)
-        logger.info(f"监控地址: {MONITOR_ADDRESS}")
-        logger.info(f"监控模式: {'WebSocket (实时推送)' if USE_WEBSOCKET else f'HTTP轮询 (间隔{SCAN_INTERVAL}秒)'}")
-        logger.info(f"杠杆倍数: {LEVERAGE}x")
-        logger.info(f"持仓量: {POSITION_SIZE_USDC} USDC")
-        logger.info(f"交易对: {', '.join([f'{k}→{v}' for k, v in TRADING_PAIRS.items()])}")
+        logger.info(f"监控地址: {self.config.monitor_address}")
+        if self.monitor:
+            logger.info(f"监控模式: {'WebSocket (实时推送)' if USE_WEBSOCKET else f'HTTP轮询 (间隔{self.config.scan_interval}秒)'}")
+        else:
+            logger.info(f"监控模式: 信号总线 ({', '.join(self.bus_paths)})")
+        for account in self.trader.accounts:
+            logger.info(f"币安账户: {account['name']} (杠杆: {account['leverage']}x, 保证金: {account['position_size_usdc']} USDC)")
+        logger.info(f"交易对: {', '.join([f'{k}→{v}' for k, v in self.config.trading_pairs.items()])}")
+        logger.info(f"下单模式: {'限价IOC (最大滑点 ' + str(IOC_MAX_SLIPPAGE_BPS) + ' bps)' if ORDER_EXECUTION_MODE == 'IOC' else '市价单'}")
+        if EXECUTION_BACKEND == 'PAPER':
+            logger.info(f"执行后端: 模拟盘 (初始余额 {PAPER_INITIAL_BALANCE} USDC, 延迟 {PAPER_LATENCY_MS}±{PAPER_LATENCY_JITTER_MS}ms, 滑点 {PAPER_SLIPPAGE_BPS} bps)")
         logger.info(f"测试模式: {'是' if USE_TESTNET else '否'}")
+        if self.lease:
+            logger.info(f"热备: 启用 (实例 {self.lease.holder_id}, 租约有效期 {STANDBY_LEASE_TTL}秒)")
+        if CONFIG_RELOAD_ENABLED:
+            logger.info(f"配置热加载: 启用 (SIGHUP{f' / 每{CONFIG_RELOAD_INTERVAL}秒检查文件' if CONFIG_RELOAD_INTERVAL else ''})")
+        if BINANCE_REST_URL:
+            logger.info(f"币安接口地址: {BINANCE_REST_URL} (行情/用户数据流: {BINANCE_WS_URL or '币安'})")
         logger.info(f"Telegram通知: {'启用' if TELEGRAM_ENABLED and self.notifier.enabled else '禁用'}")
         logger.info("=" * 80)
         logger.info("")
@@ -326,94 +945,296 @@ class TradingBot:
             if line.strip():
                 logger.info(f"  {line}")
         logger.info("")
+    
+    def run_startup_reports(self):
+        """
+        后台启动流程：并发查询账户信息和监控地址持仓，并发送启动通知
         
-        # 显示账户余额
-        try:
-            balance = self.trader.get_account_balance()
-            if balance:
-                logger.info("📊 币安账户余额:")
-                for item in balance:
-                    if float(item['balance']) > 0:
-                        logger.info(f"  {item['asset']}: {item['balance']}")
-                logger.info("")
-        except Exception as e:
-            logger.warning(f"无法获取账户余额: {e}")
+        监控订阅和下单准备已在关键路径上完成，这里的每个步骤都有独立的时间预算，
+        超时的步骤不会阻塞其他步骤，更不会推迟信号处理
+        """
+        # 网络查询并发执行
+        accounts_future = self.startup.submit('币安账户信息', self.trader.get_account_info_summaries)
+        positions_future = None
+        if self.monitor:
+            self.startup.submit('API接口测试', self.monitor.print_latest_fill)
+            self.startup.submit('监控地址持仓', self.monitor.print_positions)
+            positions_future = self.startup.submit('监控地址持仓摘要', self.monitor.get_positions_summary)
         
-        # 发送启动通知
+        # 发送启动通知（通知器的消息按顺序在本线程发送）
         position_value = POSITION_SIZE_USDC * LEVERAGE
         config_info = {
-            'scan_interval': SCAN_INTERVAL,
+            'scan_interval': self.config.scan_interval,
             'leverage': LEVERAGE,
             'position_size': POSITION_SIZE_USDC,
             'position_value': position_value,
-            'trading_pairs': ', '.join([f'{k}→{v}' for k, v in TRADING_PAIRS.items()])
+            'trading_pairs': ', '.join([f'{k}→{v}' for k, v in self.config.trading_pairs.items()])
         }
-        self.notifier.send_startup_message(MONITOR_ADDRESS, config_info)
+        with self.startup.measure('启动通知', background=True):
+            self.notifier.send_startup_message(self.config.monitor_address, config_info)
         
-        # 推送币安账户信息到Telegram
-        try:
-            logger.info("正在获取币安账户信息...")
-            binance_account_info = self.trader.get_account_info_summary()
+        # 显示账户余额并推送币安账户信息到Telegram
+        summaries = self.startup.wait('币安账户信息', accounts_future) or {}
+        for name, binance_account_info in summaries.items():
             if binance_account_info:
+                logger.info(f"📊 币安账户余额 ({name}):")
+                for asset, balance in binance_account_info.get('balances', {}).items():
+                    logger.info(f"  {asset}: {balance}")
+                binance_account_info['account'] = name
                 self.notifier.send_binance_account_info(binance_account_info)
-                logger.info("✅ 已推送币安账户信息到Telegram")
+                logger.info(f"✅ 已推送币安账户 {name} 信息到Telegram")
             else:
-                logger.warning("⚠️  无法获取币安账户信息")
-        except Exception as e:
-            logger.error(f"获取币安账户信息失败: {e}")
+                logger.warning(f"⚠️  无法获取币安账户 {name} 信息")
         
-        # 推送监控地址持仓信息到Telegram
-        try:
-            logger.info("正在获取监控地址持仓信息...")
-            hyperliquid_positions = self.monitor.get_positions_summary()
+        # 推送监控地址持仓信息到Telegram（下单进程由监控进程负责查询，跳过）
+        if positions_future:
+            hyperliquid_positions = self.startup.wait('监控地址持仓摘要', positions_future)
             if hyperliquid_positions:
                 self.notifier.send_hyperliquid_positions(hyperliquid_positions)
                 logger.info("✅ 已推送监控地址持仓信息到Telegram")
             else:
                 logger.warning("⚠️  无法获取监控地址持仓信息")
-        except Exception as e:
-            logger.error(f"获取监控地址持仓信息失败: {e}")
+        
+        self.startup.report()
+        self.startup.shutdown()
     
     def run(self):
         """运行机器人"""
         try:
+            # 启动对象到此已全部创建，冻结后不再参与垃圾回收扫描
+            self.latency.start()
+            
+            # 对账在后台进行，不阻塞启动和信号处理
+            if self.reconciler:
+                self.reconciler.start()
+            
+            # 下单准备完成后再参与租约竞争
+            if self.lease:
+                self.lease.start()
+            
+            # 配置热加载（SIGHUP 处理函数只能在主线程注册）
+            if CONFIG_RELOAD_ENABLED:
+                self.config_reloader = ConfigReloader(
+                    current=self.config,
+                    apply=self.apply_runtime_config,
+                    poll_interval=CONFIG_RELOAD_INTERVAL
+                )
+                self.config_reloader.start()
+            
+            # 运行时诊断（信号处理函数只能在主线程注册）
+            self.diagnostics = create_diagnostics(self.monitor)
+            if self.diagnostics:
+                self.diagnostics.add_status('trade_state', lambda: len(self.trade_state))
+                self.diagnostics.add_status('in_flight', lambda: self.shutdown.in_flight)
+                if self.aggregator:
+                    self.diagnostics.add_status('aggregated_orders', lambda: len(self.aggregator.orders))
+                self.diagnostics.start()
+            
             self.display_startup_info()
             
+            # 账户信息、持仓查询和启动通知在后台进行，不推迟订阅
+            self.startup.run_in_background(self.run_startup_reports)
+            
+            if self.role == ROLE_EXECUTOR:
+                logger.info("🚀 开始接收信号总线...")
+                logger.info("按 Ctrl+C 停止")
+                logger.info("")
+                self.bus_client = SignalBusClient(self.bus_paths, handler=self.signal_sink)
+                self.bus_client.run()
+                return
+            
             logger.info("🚀 开始监控...")
             logger.info("按 Ctrl+C 停止监控")
             logger.info("")
             
             # 开始监控
-            if USE_WEBSOCKET:
-                # WebSocket模式
-                self.monitor.start_monitoring(
-                    callback=self.on_close_position_detected,
-                    position_print_interval=POSITION_PRINT_INTERVAL
-                )
-            else:
-                # HTTP轮询模式
-                self.monitor.start_monitoring(
-                    scan_interval=SCAN_INTERVAL,
-                    callback=self.on_close_position_detected,
-                    position_print_interval=POSITION_PRINT_INTERVAL
-                )
+            start_monitor(self.monitor, self.config, callback=self.on_close_position_detected,
+                          batch_callback=self.signal_sink, startup_checks=False)
             
         except KeyboardInterrupt:
             logger.info("用户中断，停止监控")
         except Exception as e:
             logger.error(f"运行时发生错误: {e}", exc_info=True)
         finally:
+            # 停止接收 → 排空正在处理的信号 → 保存开单状态、让出租约、发送退出通知
+            self.shutdown.drain()
             logger.info("机器人已停止")
+            shutdown_logger()
+
+
+def run_monitor_process(bus_path: str):
+    """
+    运行监控进程：只监控，平仓信号通过信号总线广播给下单进程
+    
+    Args:
+        bus_path: 信号总线的 Unix 域套接字路径
+    """
+    startup = StartupTimer(default_budget=STARTUP_STEP_BUDGET)
+    config = RuntimeConfig.from_module()
+    with startup.measure('Hyperliquid监控器'):
+        monitor = create_monitor(config)
+    with startup.measure('信号总线'):
+        bus = SignalBusServer(bus_path)
+        bus.start()
+    
+    def handle_exit(signum, frame):
+        # 停止监控后 start_monitor 返回，已发布的信号由下单进程处理
+        logger.info(f"收到信号 {signum}，准备退出...")
+        monitor.stop()
+    
+    signal.signal(signal.SIGINT, handle_exit)
+    signal.signal(signal.SIGTERM, handle_exit)
+    
+    # 接口测试和持仓打印在后台进行，不推迟订阅
+    startup.report()
+    startup.submit('API接口测试', monitor.print_latest_fill)
+    startup.submit('监控地址持仓', monitor.print_positions)
+    startup.shutdown()
+    
+    # 监控进程只使用监控地址、信号规则和间隔，其他配置由下单进程各自重新加载
+    reloader = None
+    if CONFIG_RELOAD_ENABLED:
+        reloader = ConfigReloader(
+            current=config,
+            apply=lambda new, changes: apply_monitor_config(monitor, new, changes),
+            poll_interval=CONFIG_RELOAD_INTERVAL
+        )
+        reloader.start()
+    
+    diagnostics = create_diagnostics(monitor)
+    if diagnostics:
+        diagnostics.start()
+    
+    logger.info(f"🚀 监控进程启动，监控地址: {config.monitor_address}")
+    try:
+        start_monitor(monitor, config, callback=lambda position: bus.publish([position]), batch_callback=bus.publish,
+                      startup_checks=False)
+    except KeyboardInterrupt:
+        logger.info("用户中断，停止监控")
+    finally:
+        if reloader:
+            reloader.stop()
+        bus.stop()
+        if diagnostics:
+            diagnostics.stop()
+        tracing.shutdown_tracer()
+        logger.info(f"监控进程已停止 (发送帧: {bus.frames_sent}, 确认: {bus.acks_received})")
+
+
+def run_shard_worker(worker_id: str):
+    """
+    运行分片监控工作进程：认领地址列表中分配给自己的地址，平仓信号通过自己的信号总线发送给下单进程
+    
+    Args:
+        worker_id: 工作进程名称（决定信号总线路径和哈希环上的位置）
+    """
+    from sharding import ShardMembership, ShardWorker, egress_capacity, egress_weights, load_addresses
+    
+    # 每个出口IP最多订阅10个不同地址：配置超过上限或地址列表超过所有出口IP的容量时拒绝启动
+    workers = SHARD_WORKERS or [worker_id]
+    capacity = egress_capacity(workers, SHARD_SOURCE_ADDRESSES, SHARD_ADDRESSES_PER_CONNECTION)
+    try:
+        address_count = len(load_addresses(SHARD_ADDRESSES_FILE))
+    except OSError:
+        address_count = 0  # 地址列表文件稍后创建时由心跳读取
+    if address_count > capacity:
+        raise ValueError(f"地址列表有 {address_count} 个地址，超过所有工作进程出口IP的容量 {capacity}，"
+                         f"请在 SHARD_SOURCE_ADDRESSES 中增加出口IP")
+    
+    config = RuntimeConfig.from_module()
+    bus = SignalBusServer(SHARD_BUS_PATH.format(worker=worker_id))
+    bus.start()
+    notifier = TelegramNotifier(bot_token=TELEGRAM_BOT_TOKEN, chat_id=TELEGRAM_CHAT_ID, enabled=TELEGRAM_ENABLED)
+    worker = ShardWorker(
+        worker_id=worker_id,
+        addresses_path=SHARD_ADDRESSES_FILE,
+        membership=ShardMembership(SHARD_DB_PATH, worker_id, ttl=SHARD_MEMBER_TTL),
+        publish=bus.publish,
+        api_url=HYPERLIQUID_API_URL,
+        ws_url=HYPERLIQUID_WS_URL,
+        addresses_per_connection=SHARD_ADDRESSES_PER_CONNECTION,
+        heartbeat_interval=SHARD_HEARTBEAT_INTERVAL,
+        stats_interval=SHARD_STATS_INTERVAL,
+        rule_engine=SignalRuleEngine(config.signal_rules),
+        link_options={
+            'ping_interval': WS_PING_INTERVAL,
+            'rtt_recycle_ms': WS_RTT_RECYCLE_MS,
+            'pong_loss_limit': WS_PONG_LOSS_LIMIT
+        },
+        alert=lambda message: notifier.send_error_alert("分片订阅被拒绝", message),
+        source_addresses=SHARD_SOURCE_ADDRESSES.get(worker_id),
+        ring_weights=egress_weights(workers, SHARD_SOURCE_ADDRESSES)
+    )
+    stop_event = threading.Event()
+    
+    def handle_exit(signum, frame):
+        logger.info(f"收到信号 {signum}，准备退出...")
+        stop_event.set()
+    
+    signal.signal(signal.SIGINT, handle_exit)
+    signal.signal(signal.SIGTERM, handle_exit)
+    
+    diagnostics = create_diagnostics()
+    if diagnostics:
+        diagnostics.add_status('shard', lambda: worker.last_stats)
+        diagnostics.start()
+    
+    try:
+        worker.start()
+        stop_event.wait()
+    finally:
+        # 立即退出成员表，其他工作进程在下一次心跳时接管地址
+        worker.stop()
+        bus.stop()
+        if diagnostics:
+            diagnostics.stop()
+        tracing.shutdown_tracer()
+        logger.info(f"分片工作进程已停止 (发送帧: {bus.frames_sent}, 确认: {bus.acks_received})")
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='监控Hyperliquid地址并自动在币安开空单')
+    parser.add_argument('--role', choices=[ROLE_ALL, ROLE_MONITOR, ROLE_EXECUTOR, ROLE_SHARD], default=ROLE_ALL,
+                        help='进程角色：all=监控和下单在同一进程，monitor=只监控，executor=只下单，'
+                             'shard=分片监控工作进程')
+    parser.add_argument('--bus', action='append', dest='bus_paths',
+                        help=f'信号总线套接字路径（默认 {SIGNAL_BUS_PATH}），下单进程可指定多次以订阅多个监控进程')
+    parser.add_argument('--worker', help='分片监控工作进程名称（--role shard 时必须指定，如 shard-0）')
+    args = parser.parse_args()
+    if args.role == ROLE_SHARD and not args.worker:
+        parser.error('--role shard 需要指定 --worker')
+    return args
 
 
 def main():
     """主函数"""
+    args = parse_args()
+    
     # 设置日志
-    setup_logger(log_file=LOG_FILE, log_level=LOG_LEVEL)
+    setup_logger(
+        log_file=LOG_FILE,
+        log_level=LOG_LEVEL,
+        json_log_file=LOG_JSON_FILE,
+        rate_limit_window=LOG_RATE_LIMIT_WINDOW,
+        rate_limit_max=LOG_RATE_LIMIT_MAX
+    )
+    
+    # 信号追踪：每个平仓信号的解析、下单、写入状态和通知耗时写入 trace-event 文件
+    if TRACE_ENABLED:
+        trace_path = tracing.setup_tracer(TRACE_DIR, TRACE_MAX_FILES, process_name=f"hyper-binance ({args.role})")
+        logger.info(f"🔍 信号追踪已启用: {trace_path}")
     
     try:
+        if args.role == ROLE_MONITOR:
+            run_monitor_process((args.bus_paths or [SIGNAL_BUS_PATH])[0])
+            return
+        if args.role == ROLE_SHARD:
+            run_shard_worker(args.worker)
+            return
+        
         # 创建并运行机器人
-        bot = TradingBot()
+        bot = TradingBot(role=args.role, bus_paths=args.bus_paths)
         bot.run()
         
     except Exception as e:
@@ -0,0 +1,297 @@
+"""
+多账户交易模块
+将同一个平仓信号并发分发到多个币安账户执行开空
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional
+
+import tracing
+from startup import lazy_import
+
+logger = logging.getLogger(__name__)
+
+
+class MultiAccountTrader:
+    """多账户交易类"""
+
+    def __init__(self, accounts: List[Dict], testnet: bool = False, trader_class=None, **trader_options):
+        """
+        初始化多账户交易客户端
+
+        Args:
+            accounts: 账户配置列表，每项包含 name/api_key/api_secret/leverage/position_size_usdc
+            testnet: 是否使用测试网
+            trader_class: 执行后端类（与 BinanceTrader 接口相同，如模拟盘 PaperTrader），默认 BinanceTrader
+            trader_options: 传给每个执行后端的其他参数（如 order_book/execution_mode/max_slippage_bps）
+        """
+        if not accounts:
+            raise ValueError("未配置任何币安账户")
+        if trader_class is None:
+            trader_class = lazy_import('binance_trader').BinanceTrader
+
+        # 每个账户一个常驻线程，慢账户不会占用其他账户的执行线程
+        self.executor = ThreadPoolExecutor(
+            max_workers=len(accounts),
+            thread_name_prefix='binance-account'
+        )
+
+        # 并发初始化各账户客户端（每个客户端内部持有独立的HTTP会话）
+        self.accounts = []
+        futures = {
+            self.executor.submit(trader_class, account['api_key'], account['api_secret'], testnet, **trader_options): account
+            for account in accounts
+        }
+        for future in as_completed(futures):
+            account = futures[future]
+            name = account.get('name', 'main')
+            try:
+                trader = future.result()
+            except Exception as e:
+                logger.error(f"❌ 账户 {name} 初始化失败，已跳过: {e}")
+                continue
+
+            self.accounts.append({
+                'name': name,
+                'trader': trader,
+                'leverage': account['leverage'],
+                'position_size_usdc': account['position_size_usdc']
+            })
+            logger.info(f"✅ 账户 {name} 初始化完成 (杠杆: {account['leverage']}x, 保证金: {account['position_size_usdc']} USDC)")
+
+        if not self.accounts:
+            raise ValueError("所有币安账户初始化失败")
+
+        # 保持配置中的账户顺序，便于日志和通知对照
+        order = [account.get('name', 'main') for account in accounts]
+        self.accounts.sort(key=lambda a: order.index(a['name']))
+
+    def _execute_for_account(self, account: Dict, legs: List[Dict], fetch_positions: bool = True) -> List[Dict]:
+        """
+        在单个账户上执行开空并查询持仓
+
+        Args:
+            account: 账户字典
+            legs: 交易腿列表，每项包含 coin/symbol，可选 size_scale
+            fetch_positions: 是否在下单后查询持仓（否则由调用方稍后调用 fill_positions）
+
+        Returns:
+            该账户每个交易腿的执行结果列表
+        """
+        trader = account['trader']
+        leverage = account['leverage']
+        margin = account['position_size_usdc']
+
+        start = time.perf_counter()
+        with tracing.span('trader.order', account=account['name'], coins=','.join(leg['coin'] for leg in legs)):
+            orders = trader.execute_short_batch(legs, leverage=leverage, usdc_amount=margin)
+        latency_ms = (time.perf_counter() - start) * 1000
+
+        results = []
+        for leg in legs:
+            result = self._new_result(account, leg)
+            result['latency_ms'] = latency_ms
+            order = orders.get(leg['coin'])
+            if order:
+                result['success'] = True
+                result['order_id'] = order.get('orderId', 'N/A')
+            results.append(result)
+
+        # 订单已发出，再查询持仓不会影响下单延迟
+        if fetch_positions:
+            self._fill_account_positions(account, results)
+
+        return results
+
+    @staticmethod
+    def _fill_account_positions(account: Dict, results: List[Dict]):
+        """
+        查询单个账户中下单成功的交易对的持仓，写入执行结果
+
+        Args:
+            account: 账户字典
+            results: 该账户的执行结果列表（会被更新）
+        """
+        for result in results:
+            if not result['success']:
+                continue
+            with tracing.span('trader.position', account=account['name'], symbol=result['symbol']):
+                positions = account['trader'].get_position_info(result['symbol'])
+            if positions:
+                for pos in positions:
+                    position_amt = float(pos.get('positionAmt', 0))
+                    if position_amt != 0:
+                        result['quantity'] = abs(position_amt)
+                        result['entry_price'] = float(pos.get('entryPrice', 0))
+
+    def fill_positions(self, results: List[Dict]):
+        """
+        并发查询各账户下单成功的交易对的持仓，写入执行结果
+        （execute_short_trades 传入 fetch_positions=False 时，在下单热路径之外调用）
+
+        Args:
+            results: execute_short_trades 返回的执行结果列表（会被更新）
+        """
+        fill = tracing.wrap(self._fill_account_positions)
+        futures = []
+        for account in self.accounts:
+            account_results = [r for r in results if r['account'] == account['name'] and r['success']]
+            if account_results:
+                futures.append((account, self.executor.submit(fill, account, account_results)))
+        for account, future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                logger.error(f"查询账户 {account['name']} 持仓时发生错误: {e}")
+
+    @staticmethod
+    def _new_result(account: Dict, leg: Dict) -> Dict:
+        """创建一个未成功的执行结果字典"""
+        leverage = account['leverage']
+        margin = account['position_size_usdc'] * leg.get('size_scale', 1.0)
+        return {
+            'account': account['name'],
+            'coin': leg['coin'],
+            'symbol': leg['symbol'],
+            'success': False,
+            'latency_ms': 0.0,
+            'leverage': leverage,
+            'margin': margin,
+            'position_value': margin * leverage,
+            'quantity': 0,
+            'entry_price': 0,
+            'order_id': 'N/A'
+        }
+
+    def execute_short_trades(self, legs: List[Dict], fetch_positions: bool = True) -> List[Dict]:
+        """
+        在所有账户上并发执行开空交易
+
+        同一账户内的多个币种合并为一次批量下单
+
+        Args:
+            legs: 交易腿列表，每项包含 coin/symbol，可选 size_scale
+            fetch_positions: 是否在下单后查询持仓，False 时订单返回即结束，持仓由 fill_positions 查询
+
+        Returns:
+            每个账户每个交易腿的执行结果列表（按账户完成顺序）
+        """
+        # 各账户线程继承当前信号的追踪ID
+        execute = tracing.wrap(self._execute_for_account)
+        futures = {
+            self.executor.submit(execute, account, legs, fetch_positions): account
+            for account in self.accounts
+        }
+
+        results = []
+        for future in as_completed(futures):
+            account = futures[future]
+            try:
+                account_results = future.result()
+            except Exception as e:
+                logger.error(f"账户 {account['name']} 执行交易时发生错误: {e}", exc_info=True)
+                account_results = [self._new_result(account, leg) for leg in legs]
+
+            for result in account_results:
+                status = '✅ 成功' if result['success'] else '❌ 失败'
+                logger.info(f"账户 {result['account']} 开空 {result['coin']} {status}, 下单耗时: {result['latency_ms']:.1f} ms")
+            results.extend(account_results)
+
+        return results
+
+    def execute_short_trade(self, coin: str, symbol: str) -> List[Dict]:
+        """
+        在所有账户上并发执行单个币种的开空交易
+
+        Args:
+            coin: 币种 (ETH/BTC)
+            symbol: 交易对符号
+
+        Returns:
+            每个账户的执行结果列表（按完成顺序）
+        """
+        return self.execute_short_trades([{'coin': coin, 'symbol': symbol}])
+
+    def prime_symbols(self, symbols: List[str], account_names: Optional[List[str]] = None):
+        """
+        为所有账户预先设置交易对的保证金模式和杠杆并构建下单模板（低延迟模式启动时调用）
+
+        Args:
+            symbols: 交易对列表
+            account_names: 只预设这些账户（可选），默认所有账户
+        """
+        def prime(account: Dict) -> List[str]:
+            return [symbol for symbol in symbols if account['trader'].prime_symbol(symbol, account['leverage'])]
+
+        futures = {
+            account['name']: self.executor.submit(prime, account)
+            for account in self.accounts
+            if account_names is None or account['name'] in account_names
+        }
+        for name, future in futures.items():
+            primed = future.result()
+            logger.info(f"✅ 账户 {name} 已预设交易对: {', '.join(primed) or '无'}")
+
+    def forget_symbols(self, symbols: List[str]):
+        """
+        清除所有账户中交易对的缓存信息和预设（配置中移除交易对或重新预设前调用）
+
+        Args:
+            symbols: 交易对列表
+        """
+        for account in self.accounts:
+            for symbol in symbols:
+                account['trader'].forget_symbol(symbol)
+
+    def update_accounts(self, accounts: List[Dict]) -> List[str]:
+        """
+        更新已有账户的杠杆和保证金（配置热加载时调用，调用方需保证没有正在执行的下单）
+
+        新增或移除账户需要API密钥和新的客户端，不在这里处理，只记录警告
+
+        Args:
+            accounts: 账户参数列表，每项包含 name/leverage/position_size_usdc
+
+        Returns:
+            杠杆发生变化的账户名列表
+        """
+        current = {account['name']: account for account in self.accounts}
+        releveraged = []
+        for params in accounts:
+            account = current.get(params['name'])
+            if account is None:
+                logger.warning(f"⚠️ 新增账户 {params['name']} 需要重启才能生效")
+                continue
+            if account['leverage'] != params['leverage']:
+                releveraged.append(account['name'])
+            if (account['leverage'], account['position_size_usdc']) != (params['leverage'], params['position_size_usdc']):
+                logger.info(f"账户 {account['name']}: 杠杆 {account['leverage']}x → {params['leverage']}x, "
+                            f"保证金 {account['position_size_usdc']} → {params['position_size_usdc']} USDC")
+            account['leverage'] = params['leverage']
+            account['position_size_usdc'] = params['position_size_usdc']
+
+        removed = set(current) - {params['name'] for params in accounts}
+        if removed:
+            logger.warning(f"⚠️ 移除账户 {', '.join(sorted(removed))} 需要重启才能生效")
+        return releveraged
+
+    def get_account_info_summaries(self) -> Dict[str, Optional[Dict]]:
+        """
+        获取所有账户的信息摘要
+
+        在独立的临时线程池中并发查询，不占用下单线程：启动报告超时仍在执行时，信号照常立即下单
+
+        Returns:
+            账户名到账户信息摘要的字典
+        """
+        with ThreadPoolExecutor(max_workers=len(self.accounts), thread_name_prefix='account-info') as executor:
+            futures = {
+                account['name']: executor.submit(account['trader'].get_account_info_summary)
+                for account in self.accounts
+            }
+            return {name: future.result() for name, future in futures.items()}
+
+    def shutdown(self):
+        """关闭执行线程池"""
+        self.executor.shutdown(wait=True)
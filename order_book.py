@@ -0,0 +1,409 @@
+"""
+币安合约本地订单簿模块
+通过深度快照 + 增量深度流维护内存中的L2订单簿，供下单时本地计算价格
+
+根据官方文档: https://binance-docs.github.io/apidocs/futures/cn/#a7dc6b7a26
+"""
+import json
+import time
+import threading
+import logging
+from collections import deque
+from typing import Dict, List, Optional
+
+import requests
+import websocket
+
+logger = logging.getLogger(__name__)
+
+FUTURES_REST_URL = 'https://fapi.binance.com'
+FUTURES_WS_URL = 'wss://fstream.binance.com'
+TESTNET_REST_URL = 'https://testnet.binancefuture.com'
+TESTNET_WS_URL = 'wss://stream.binancefuture.com'
+
+SNAPSHOT_LIMIT = 1000  # 深度快照档位数
+MAX_BUFFERED_EVENTS = 1000  # 等待快照期间最多缓存的增量事件数
+
+
+class LocalOrderBook:
+    """单个交易对的本地L2订单簿"""
+
+    def __init__(self, symbol: str):
+        """
+        初始化本地订单簿
+
+        Args:
+            symbol: 交易对符号
+        """
+        self.symbol = symbol
+        self.bids = {}  # 价格 -> 数量
+        self.asks = {}
+        self.last_update_id = 0
+        self.synced = False
+        self.last_event_time = 0  # 最近一次应用增量的本地时间
+        self.buffer = deque(maxlen=MAX_BUFFERED_EVENTS)  # 快照到达前缓存的增量事件
+        self.lock = threading.RLock()
+
+        # 统计信息
+        self.update_count = 0
+        self.resync_count = 0
+
+    def reset(self):
+        """清空订单簿，等待重新同步"""
+        with self.lock:
+            self.bids.clear()
+            self.asks.clear()
+            self.last_update_id = 0
+            self.synced = False
+
+    def apply_snapshot(self, snapshot: Dict) -> bool:
+        """
+        应用深度快照，并回放快照之后的缓存增量
+
+        Args:
+            snapshot: /fapi/v1/depth 返回的快照
+
+        Returns:
+            是否同步成功
+        """
+        # 回放期间持有锁，避免深度流线程插入更新的事件
+        with self.lock:
+            self.bids = {float(p): float(q) for p, q in snapshot.get('bids', [])}
+            self.asks = {float(p): float(q) for p, q in snapshot.get('asks', [])}
+            self.last_update_id = snapshot['lastUpdateId']
+            self.synced = False
+            self.last_event_time = time.time()
+
+            buffered = list(self.buffer)
+            self.buffer.clear()
+
+            # 丢弃快照之前的事件，第一个事件必须满足 U <= lastUpdateId <= u
+            for event in buffered:
+                if not self.apply_diff(event):
+                    return False
+
+        return True
+
+    def apply_diff(self, event: Dict) -> bool:
+        """
+        应用一条增量深度事件
+
+        Args:
+            event: depthUpdate 事件（包含 U/u/pu/b/a）
+
+        Returns:
+            事件是否连续；不连续时订单簿失效，需要重新获取快照
+        """
+        with self.lock:
+            if self.last_update_id == 0:
+                # 尚未收到快照，先缓存
+                self.buffer.append(event)
+                return True
+
+            if not self.synced:
+                if event['u'] < self.last_update_id:
+                    return True
+                if event['U'] > self.last_update_id:
+                    logger.warning(f"⚠️  {self.symbol} 订单簿首个增量事件不连续 (U={event['U']}, lastUpdateId={self.last_update_id})")
+                    self._invalidate()
+                    return False
+                self.synced = True
+            elif event['pu'] != self.last_update_id:
+                logger.warning(f"⚠️  {self.symbol} 订单簿增量事件不连续 (pu={event['pu']}, 上一个u={self.last_update_id})")
+                self._invalidate()
+                return False
+
+            self._apply_levels(self.bids, event.get('b', []))
+            self._apply_levels(self.asks, event.get('a', []))
+            self.last_update_id = event['u']
+            self.last_event_time = time.time()
+            self.update_count += 1
+            return True
+
+    def _invalidate(self):
+        """订单簿失效（调用方需持有锁）"""
+        self.bids.clear()
+        self.asks.clear()
+        self.last_update_id = 0
+        self.synced = False
+        self.resync_count += 1
+
+    @staticmethod
+    def _apply_levels(side: Dict, levels: List):
+        """更新一侧的价格档位，数量为0表示删除该档位"""
+        for p, q in levels:
+            price = float(p)
+            quantity = float(q)
+            if quantity == 0:
+                side.pop(price, None)
+            else:
+                side[price] = quantity
+
+    def is_usable(self, max_age: float) -> bool:
+        """
+        订单簿是否可用于定价
+
+        Args:
+            max_age: 最近一次更新距今的最大秒数
+
+        Returns:
+            是否已同步且数据足够新
+        """
+        return self.synced and bool(self.bids) and time.time() - self.last_event_time <= max_age
+
+    def best_bid(self) -> Optional[float]:
+        """最优买价"""
+        with self.lock:
+            return max(self.bids) if self.bids else None
+
+    def best_ask(self) -> Optional[float]:
+        """最优卖价"""
+        with self.lock:
+            return min(self.asks) if self.asks else None
+
+    def mid_price(self) -> Optional[float]:
+        """中间价"""
+        with self.lock:
+            if not self.bids or not self.asks:
+                return None
+            return (max(self.bids) + min(self.asks)) / 2
+
+    def estimate_sell(self, quantity: float, limit_price: Optional[float] = None) -> Optional[Dict]:
+        """
+        估算按当前买盘卖出指定数量的成交情况
+
+        Args:
+            quantity: 卖出数量
+            limit_price: 限价（可选），低于限价的买盘档位不成交
+
+        Returns:
+            包含 best_bid/worst_price/vwap/filled 的字典，买盘为空时返回None
+        """
+        with self.lock:
+            if not self.bids:
+                return None
+            levels = sorted(self.bids.items(), reverse=True)
+
+        remaining = quantity
+        notional = 0.0
+        worst_price = levels[0][0]
+        for price, size in levels:
+            if limit_price is not None and price < limit_price:
+                break
+            take = min(size, remaining)
+            notional += take * price
+            remaining -= take
+            worst_price = price
+            if remaining <= 0:
+                break
+
+        filled = quantity - max(remaining, 0)
+        return {
+            'best_bid': levels[0][0],
+            'worst_price': worst_price,
+            'vwap': notional / filled if filled > 0 else levels[0][0],
+            'filled': filled
+        }
+
+
+class OrderBookManager:
+    """多个交易对的本地订单簿管理类（快照 + 增量深度流）"""
+
+    def __init__(self, symbols: List[str], testnet: bool = False, stale_seconds: float = 5,
+                 rest_url: Optional[str] = None, ws_url: Optional[str] = None):
+        """
+        初始化订单簿管理器
+
+        Args:
+            symbols: 交易对符号列表
+            testnet: 是否使用测试网
+            stale_seconds: 超过该秒数未更新的订单簿视为过期，不用于定价
+            rest_url: 自定义REST地址（可选），设置后忽略 testnet
+            ws_url: 自定义行情流地址（可选），设置后忽略 testnet
+        """
+        self.books = {symbol: LocalOrderBook(symbol) for symbol in symbols}
+        self.rest_url = rest_url or (TESTNET_REST_URL if testnet else FUTURES_REST_URL)
+        self.ws_base = ws_url or (TESTNET_WS_URL if testnet else FUTURES_WS_URL)
+        self.stale_seconds = stale_seconds
+
+        self.ws = None
+        self.ws_connected = False
+        self.request_id = 0  # 订阅/退订请求编号
+        self.ws_thread = None
+        self.running = False
+        self.reconnect_count = 0
+        self.session = requests.Session()
+
+    def get_book(self, symbol: str) -> Optional[LocalOrderBook]:
+        """
+        获取可用于定价的订单簿
+
+        Args:
+            symbol: 交易对符号
+
+        Returns:
+            订单簿，未同步或已过期时返回None
+        """
+        book = self.books.get(symbol)
+        if book and book.is_usable(self.stale_seconds):
+            return book
+        return None
+
+    @staticmethod
+    def stream_name(symbol: str) -> str:
+        """交易对的增量深度流名称"""
+        return f"{symbol.lower()}@depth@100ms"
+
+    @property
+    def ws_url(self) -> str:
+        """包含当前所有交易对的组合流地址（重连时使用）"""
+        return f"{self.ws_base}/stream?streams={'/'.join(self.stream_name(symbol) for symbol in self.books)}"
+
+    def _send_request(self, method: str, symbols: List[str]):
+        """在现有连接上发送 SUBSCRIBE/UNSUBSCRIBE 请求（未连接时由重连按当前交易对订阅）"""
+        ws = self.ws
+        if not ws or not self.ws_connected:
+            return
+        self.request_id += 1
+        try:
+            ws.send(json.dumps({
+                'method': method,
+                'params': [self.stream_name(symbol) for symbol in symbols],
+                'id': self.request_id
+            }))
+            logger.info(f"📤 深度流{'订阅' if method == 'SUBSCRIBE' else '退订'}: {', '.join(symbols)}")
+        except Exception as e:
+            logger.error(f"发送深度流{method}请求失败: {e}")
+
+    def add_symbols(self, symbols: List[str]):
+        """
+        在现有连接上增加交易对（不影响其他交易对的订单簿）
+
+        Args:
+            symbols: 新增的交易对列表
+        """
+        symbols = [symbol for symbol in symbols if symbol not in self.books]
+        if not symbols:
+            return
+        for symbol in symbols:
+            self.books[symbol] = LocalOrderBook(symbol)
+        self._send_request('SUBSCRIBE', symbols)
+        # 订阅后增量事件先缓存，快照到达后再应用
+        for symbol in symbols:
+            self._request_snapshot(symbol)
+
+    def remove_symbols(self, symbols: List[str]):
+        """
+        在现有连接上移除交易对
+
+        Args:
+            symbols: 移除的交易对列表
+        """
+        symbols = [symbol for symbol in symbols if symbol in self.books]
+        if not symbols:
+            return
+        self._send_request('UNSUBSCRIBE', symbols)
+        for symbol in symbols:
+            self.books.pop(symbol, None)
+
+    def _fetch_snapshot(self, symbol: str):
+        """获取深度快照并同步订单簿"""
+        try:
+            response = self.session.get(
+                f"{self.rest_url}/fapi/v1/depth",
+                params={'symbol': symbol, 'limit': SNAPSHOT_LIMIT},
+                timeout=10
+            )
+            if response.status_code != 200:
+                logger.error(f"获取 {symbol} 深度快照失败: {response.status_code}, {response.text}")
+                return
+
+            book = self.books.get(symbol)
+            if book is None:
+                # 等待快照期间交易对已被移除
+                return
+            if book.apply_snapshot(response.json()):
+                logger.info(f"📗 {symbol} 本地订单簿已同步 (lastUpdateId={book.last_update_id})")
+            else:
+                self._request_snapshot(symbol)
+        except Exception as e:
+            logger.error(f"获取 {symbol} 深度快照时发生错误: {e}")
+
+    def _request_snapshot(self, symbol: str):
+        """在后台线程中获取快照，期间增量事件继续缓存"""
+        thread = threading.Thread(target=self._fetch_snapshot, args=(symbol,))
+        thread.daemon = True
+        thread.start()
+
+    def _on_message(self, ws, message):
+        """深度流消息处理"""
+        try:
+            data = json.loads(message)
+            event = data.get('data', data)
+            if event.get('e') != 'depthUpdate':
+                return
+
+            book = self.books.get(event['s'])
+            if book is None:
+                return
+
+            if not book.apply_diff(event):
+                # 序列不连续，重新获取快照
+                self._request_snapshot(book.symbol)
+        except Exception as e:
+            logger.error(f"处理深度流消息时发生错误: {e}")
+
+    def _on_open(self, ws):
+        """深度流连接建立后为所有交易对获取快照"""
+        logger.info(f"✅ 深度流连接已建立: {', '.join(self.books)}")
+        self.ws_connected = True
+        self.reconnect_count = 0
+        for symbol, book in list(self.books.items()):
+            book.reset()
+            self._request_snapshot(symbol)
+
+    def _on_error(self, ws, error):
+        """深度流错误处理"""
+        logger.error(f"❌ 深度流错误: {error}")
+
+    def _on_close(self, ws, close_status_code, close_msg):
+        """深度流关闭处理"""
+        logger.warning(f"⚠️  深度流连接已关闭: {close_status_code} - {close_msg}")
+        self.ws_connected = False
+        for book in list(self.books.values()):
+            book.reset()
+
+        if self.running:
+            self.reconnect_count += 1
+            wait_time = min(1.5 ** (self.reconnect_count - 1), 30)
+            logger.info(f"尝试第 {self.reconnect_count} 次重新连接深度流（等待 {wait_time:.1f} 秒）...")
+            time.sleep(wait_time)
+            self._connect()
+
+    def _connect(self):
+        """连接深度流"""
+        self.ws = websocket.WebSocketApp(
+            self.ws_url,
+            on_open=self._on_open,
+            on_message=self._on_message,
+            on_error=self._on_error,
+            on_close=self._on_close
+        )
+        self.ws_thread = threading.Thread(
+            target=self.ws.run_forever,
+            kwargs={'ping_interval': 0, 'ping_timeout': None}
+        )
+        self.ws_thread.daemon = True
+        self.ws_thread.start()
+
+    def start(self):
+        """启动订单簿维护"""
+        logger.info(f"启动本地订单簿: {', '.join(self.books)}")
+        self.running = True
+        self._connect()
+
+    def stop(self):
+        """停止订单簿维护"""
+        self.running = False
+        if self.ws:
+            self.ws.close()
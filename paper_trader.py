@@ -0,0 +1,476 @@
+"""
+模拟盘交易模块
+与 BinanceTrader 接口相同的模拟执行后端：订单按本地价格源（本地订单簿或自定义价格函数）成交，
+下单延迟和滑点按可配置的模型模拟，余额和持仓只保存在内存中，不向交易所发送任何请求
+"""
+import math
+import random
+import time
+import logging
+import threading
+from typing import Callable, Dict, List, Optional
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# 与 binance_trader 中的定义一致（这里不导入 binance_trader，模拟盘不依赖 python-binance）
+BATCH_ORDER_LIMIT = 5
+EXECUTION_MODE_MARKET = 'MARKET'
+EXECUTION_MODE_IOC = 'IOC'
+
+
+class LatencyModel:
+    """下单延迟模型：正态分布（截断为非负），可选尾部延迟"""
+
+    def __init__(self, mean_ms: float = 50.0, jitter_ms: float = 20.0, tail_probability: float = 0.0,
+                 tail_ms: float = 500.0, seed: Optional[int] = None):
+        """
+        初始化延迟模型
+
+        Args:
+            mean_ms: 平均延迟（毫秒）
+            jitter_ms: 延迟标准差（毫秒）
+            tail_probability: 出现尾部延迟的概率
+            tail_ms: 尾部延迟额外增加的毫秒数
+            seed: 随机种子（可选），便于复现
+        """
+        self.mean_ms = mean_ms
+        self.jitter_ms = jitter_ms
+        self.tail_probability = tail_probability
+        self.tail_ms = tail_ms
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def sample(self) -> float:
+        """
+        采样一次延迟
+
+        Returns:
+            延迟毫秒数
+        """
+        with self.lock:
+            latency = max(0.0, self.random.gauss(self.mean_ms, self.jitter_ms))
+            if self.tail_probability and self.random.random() < self.tail_probability:
+                latency += self.tail_ms
+        return latency
+
+
+class SlippageModel:
+    """滑点模型：固定滑点加按成交金额线性增加的冲击成本"""
+
+    def __init__(self, fixed_bps: float = 2.0, impact_bps_per_10k: float = 0.0):
+        """
+        初始化滑点模型
+
+        Args:
+            fixed_bps: 固定滑点（基点）
+            impact_bps_per_10k: 每1万USDC成交金额增加的滑点（基点）
+        """
+        self.fixed_bps = fixed_bps
+        self.impact_bps_per_10k = impact_bps_per_10k
+
+    def apply_sell(self, price: float, quantity: float) -> float:
+        """
+        计算卖出的成交价（滑点使成交价降低）
+
+        Args:
+            price: 价格源给出的成交价
+            quantity: 成交数量
+
+        Returns:
+            计入滑点后的成交价
+        """
+        bps = self.fixed_bps + self.impact_bps_per_10k * price * quantity / 10000
+        return price * (1 - bps / 10000)
+
+
+class PaperTrader:
+    """模拟盘交易类（接口与 BinanceTrader 相同）"""
+
+    def __init__(self, api_key: str = '', api_secret: str = '', testnet: bool = False,
+                 order_book=None, execution_mode: str = EXECUTION_MODE_MARKET, max_slippage_bps: float = 20,
+                 price_source: Optional[Callable[[str], Optional[float]]] = None,
+                 latency_model: Optional[LatencyModel] = None, slippage_model: Optional[SlippageModel] = None,
+                 initial_balance: float = 10000.0, fee_rate: float = 0.0005, asset: str = 'USDC',
+                 quantity_step: float = 0.001):
+        """
+        初始化模拟盘
+
+        Args:
+            api_key: 未使用（保持与 BinanceTrader 相同的参数）
+            api_secret: 未使用
+            testnet: 未使用
+            order_book: 本地订单簿管理器（可选），可用时按买盘逐档成交
+            execution_mode: 下单模式 ('MARKET' 或 'IOC')
+            max_slippage_bps: IOC模式下相对最优买价的最大滑点（基点）
+            price_source: 价格函数 symbol -> 价格（可选），订单簿不可用时使用
+            latency_model: 下单延迟模型，默认无延迟
+            slippage_model: 滑点模型，默认无额外滑点
+            initial_balance: 初始余额
+            fee_rate: 手续费率
+            asset: 保证金资产
+            quantity_step: 数量精度
+        """
+        self.client = None
+        self.order_book = order_book
+        self.execution_mode = execution_mode
+        self.max_slippage_bps = max_slippage_bps
+        self.price_source = price_source
+        self.latency_model = latency_model
+        self.slippage_model = slippage_model or SlippageModel(fixed_bps=0.0)
+        self.fee_rate = fee_rate
+        self.asset = asset
+        self.quantity_step = quantity_step
+        self.primed_leverage = {}
+        self.order_templates = {}
+
+        self.lock = threading.Lock()
+        self.balance = initial_balance  # 钱包余额（扣除手续费和已实现盈亏）
+        self.leverage = {}  # 交易对 -> 杠杆
+        self.margin_type = {}  # 交易对 -> 保证金模式
+        self.positions = {}  # 交易对 -> {'amount': 持仓数量(空头为负), 'entry_price': 开仓均价}
+        self.next_order_id = 1
+        self.fills = []  # 全部模拟成交记录
+
+        logger.info(f"使用模拟盘执行 (初始余额: {initial_balance} {asset})")
+
+    def set_leverage(self, symbol: str, leverage: int) -> bool:
+        """设置杠杆倍数（只记录在内存中）"""
+        self.leverage[symbol] = leverage
+        logger.info(f"[模拟盘] 设置 {symbol} 杠杆为 {leverage}x")
+        return True
+
+    def set_margin_type(self, symbol: str, margin_type: str = 'CROSSED') -> bool:
+        """设置保证金模式（只记录在内存中）"""
+        self.margin_type[symbol] = margin_type
+        return True
+
+    def prime_symbol(self, symbol: str, leverage: int) -> bool:
+        """预设保证金模式和杠杆，之后下单时跳过"""
+        self.set_margin_type(symbol, 'CROSSED')
+        self.set_leverage(symbol, leverage)
+        self.primed_leverage[symbol] = leverage
+        return True
+
+    def forget_symbol(self, symbol: str):
+        """清除交易对的预设杠杆和下单模板"""
+        self.primed_leverage.pop(symbol, None)
+        self.order_templates.pop(symbol, None)
+
+    def get_symbol_info(self, symbol: str) -> Optional[Dict]:
+        """返回模拟的交易对信息（只包含数量精度过滤器）"""
+        return {
+            'symbol': symbol,
+            'filters': [{'filterType': 'LOT_SIZE', 'stepSize': str(self.quantity_step), 'minQty': str(self.quantity_step)}]
+        }
+
+    def get_price(self, symbol: str) -> Optional[float]:
+        """
+        获取当前价格：优先使用本地订单簿中间价，其次使用价格函数
+
+        Args:
+            symbol: 交易对符号
+
+        Returns:
+            价格，没有可用价格源时返回None
+        """
+        book = self.order_book.get_book(symbol) if self.order_book else None
+        price = book.mid_price() if book else None
+        if price is None and self.price_source:
+            price = self.price_source(symbol)
+        return price
+
+    def calculate_quantity(self, symbol: str, usdc_amount: float, leverage: int = 1,
+                           current_price: Optional[float] = None) -> float:
+        """
+        计算交易数量（按数量精度向下取整）
+
+        Args:
+            symbol: 交易对符号
+            usdc_amount: USDC保证金金额
+            leverage: 杠杆倍数
+            current_price: 当前价格（可选）
+
+        Returns:
+            交易数量，无法获取价格时返回0
+        """
+        price = current_price or self.get_price(symbol)
+        if not price:
+            return 0
+        steps = math.floor(usdc_amount * leverage / price / self.quantity_step + 1e-9)
+        return round(steps * self.quantity_step, 8)
+
+    def prepare_short_order(self, coin: str, symbol: str, leverage: int, usdc_amount: float) -> Optional[float]:
+        """
+        开空前的准备：设置杠杆、获取价格并计算数量
+
+        Args:
+            coin: 币种 (ETH/BTC)
+            symbol: 交易对符号
+            leverage: 杠杆倍数
+            usdc_amount: USDC保证金金额
+
+        Returns:
+            交易数量，失败时返回None
+        """
+        if self.primed_leverage.get(symbol) != leverage:
+            self.set_margin_type(symbol, 'CROSSED')
+            self.set_leverage(symbol, leverage)
+
+        current_price = self.get_price(symbol)
+        if current_price is None:
+            logger.error(f"[模拟盘] 没有 {symbol} 的可用价格，取消交易")
+            return None
+
+        quantity = self.calculate_quantity(symbol, usdc_amount, leverage, current_price)
+        if quantity <= 0:
+            logger.error("[模拟盘] 计算数量失败，取消交易")
+            return None
+        return quantity
+
+    def _fill_sell(self, symbol: str, quantity: float) -> Optional[Dict]:
+        """
+        模拟卖出成交：订单簿可用时按买盘逐档成交，否则按价格源成交
+
+        Returns:
+            包含 filled/price 的字典，无法成交时返回None
+        """
+        book = self.order_book.get_book(symbol) if self.order_book else None
+        if book:
+            limit_price = None
+            if self.execution_mode == EXECUTION_MODE_IOC:
+                best_bid = book.best_bid()
+                limit_price = best_bid * (1 - self.max_slippage_bps / 10000) if best_bid else None
+            estimate = book.estimate_sell(quantity, limit_price=limit_price)
+            if estimate:
+                if limit_price is not None:
+                    # IOC单只成交限价以内的档位，没有可成交档位时过期
+                    return {'filled': estimate['filled'], 'price': estimate['vwap']}
+                # 市价单超出订单簿深度的部分按最差档位成交
+                price = (estimate['vwap'] * estimate['filled'] + estimate['worst_price'] * (quantity - estimate['filled'])) / quantity
+                return {'filled': quantity, 'price': price}
+
+        price = self.price_source(symbol) if self.price_source else None
+        if price is None:
+            return None
+        return {'filled': quantity, 'price': price}
+
+    def open_short_position(self, symbol: str, quantity: float) -> Optional[Dict]:
+        """
+        模拟开空：等待模拟延迟后按当时的价格成交
+
+        Args:
+            symbol: 交易对符号
+            quantity: 交易数量
+
+        Returns:
+            与币安下单接口格式相同的订单信息，无法成交时返回None
+        """
+        self._simulate_latency()
+        return self._open_short(symbol, quantity)
+
+    def _simulate_latency(self):
+        """按延迟模型等待一次请求往返"""
+        if self.latency_model:
+            with tracing.span('paper.request'):
+                time.sleep(self.latency_model.sample() / 1000)
+
+    def _open_short(self, symbol: str, quantity: float) -> Optional[Dict]:
+        """按当前价格模拟开空成交并更新余额和持仓"""
+        fill = self._fill_sell(symbol, quantity)
+        if fill is None:
+            logger.error(f"[模拟盘] {symbol} 无法成交（没有可用价格）")
+            return None
+        if fill['filled'] <= 0:
+            logger.error(f"[模拟盘] {symbol} 开空单未成交 (IOC已过期)")
+            return None
+
+        filled = round(fill['filled'], 8)
+        price = self.slippage_model.apply_sell(fill['price'], filled)
+        fee = filled * price * self.fee_rate
+        with self.lock:
+            order_id = self.next_order_id
+            self.next_order_id += 1
+            position = self.positions.setdefault(symbol, {'amount': 0.0, 'entry_price': 0.0})
+            new_amount = position['amount'] - filled
+            position['entry_price'] = (
+                (abs(position['amount']) * position['entry_price'] + filled * price) / abs(new_amount)
+                if new_amount else 0.0
+            )
+            position['amount'] = new_amount
+            self.balance -= fee
+            self.fills.append({'order_id': order_id, 'symbol': symbol, 'quantity': filled, 'price': price,
+                               'fee': fee, 'time': int(time.time() * 1000)})
+
+        order_type = 'LIMIT' if self.execution_mode == EXECUTION_MODE_IOC else 'MARKET'
+        logger.info(f"[模拟盘] {symbol} 卖出 {filled} @ {price:.4f}, 手续费 {fee:.4f} {self.asset}")
+        return {
+            'orderId': order_id,
+            'symbol': symbol,
+            'status': 'FILLED' if filled >= quantity else 'EXPIRED',
+            'side': 'SELL',
+            'type': order_type,
+            'timeInForce': 'IOC' if order_type == 'LIMIT' else 'GTC',
+            'positionSide': 'SHORT',
+            'origQty': str(quantity),
+            'executedQty': str(filled),
+            'avgPrice': str(price),
+            'cumQuote': str(filled * price),
+            'updateTime': int(time.time() * 1000)
+        }
+
+    def open_short_batch(self, orders: List[Dict]) -> Dict[str, Optional[Dict]]:
+        """
+        模拟批量开空（每批最多 BATCH_ORDER_LIMIT 个订单，同一批共享一次模拟延迟）
+
+        Args:
+            orders: 订单列表，每项包含 symbol/quantity
+
+        Returns:
+            交易对到订单信息的字典
+        """
+        results = {}
+        for start in range(0, len(orders), BATCH_ORDER_LIMIT):
+            self._simulate_latency()
+            for order in orders[start:start + BATCH_ORDER_LIMIT]:
+                results[order['symbol']] = self._open_short(order['symbol'], order['quantity'])
+        return results
+
+    def execute_short_trade(self, coin: str, symbol: str, leverage: int, usdc_amount: float) -> Optional[Dict]:
+        """
+        执行完整的模拟开空流程
+
+        Args:
+            coin: 币种 (ETH/BTC)
+            symbol: 交易对符号
+            leverage: 杠杆倍数
+            usdc_amount: USDC保证金金额
+
+        Returns:
+            订单信息，失败时返回None
+        """
+        quantity = self.prepare_short_order(coin, symbol, leverage, usdc_amount)
+        if quantity is None:
+            return None
+        order = self.open_short_position(symbol, quantity)
+        if order:
+            logger.info(f"✅ [模拟盘] {coin} 开空成功! 订单ID: {order['orderId']}")
+        return order
+
+    def execute_short_batch(self, legs: List[Dict], leverage: int, usdc_amount: float) -> Dict[str, Optional[Dict]]:
+        """
+        同时对多个币种执行模拟开空
+
+        Args:
+            legs: 交易腿列表，每项包含 coin/symbol，可选 size_scale
+            leverage: 杠杆倍数
+            usdc_amount: 每个币种的USDC保证金金额（按 size_scale 缩放）
+
+        Returns:
+            币种到订单信息的字典，失败的币种为None
+        """
+        if len(legs) == 1:
+            leg = legs[0]
+            amount = usdc_amount * leg.get('size_scale', 1.0)
+            return {leg['coin']: self.execute_short_trade(leg['coin'], leg['symbol'], leverage, amount)}
+
+        results = {leg['coin']: None for leg in legs}
+        orders = []
+        symbol_to_coin = {}
+        for leg in legs:
+            quantity = self.prepare_short_order(leg['coin'], leg['symbol'], leverage,
+                                                usdc_amount * leg.get('size_scale', 1.0))
+            if quantity is not None:
+                orders.append({'symbol': leg['symbol'], 'quantity': quantity})
+                symbol_to_coin[leg['symbol']] = leg['coin']
+        for symbol, order in self.open_short_batch(orders).items():
+            results[symbol_to_coin[symbol]] = order
+        return results
+
+    def get_account_balance(self) -> Optional[List[Dict]]:
+        """
+        获取模拟账户余额（格式与币安接口相同）
+
+        Returns:
+            余额列表
+        """
+        with self.lock:
+            symbols = list(self.positions)
+        unrealized = sum(self._unrealized_pnl(symbol) for symbol in symbols)
+        return [{
+            'asset': self.asset,
+            'balance': str(self.balance),
+            'crossUnPnl': str(unrealized),
+            'availableBalance': str(self.balance + unrealized)
+        }]
+
+    def _unrealized_pnl(self, symbol: str) -> float:
+        """按当前价格计算未实现盈亏"""
+        with self.lock:
+            position = dict(self.positions.get(symbol, {}))
+        if not position.get('amount'):
+            return 0.0
+        price = self.get_price(symbol) or position['entry_price']
+        return position['amount'] * (price - position['entry_price'])
+
+    def get_position_info(self, symbol: Optional[str] = None) -> Optional[list]:
+        """
+        获取模拟持仓（格式与币安接口相同）
+
+        Args:
+            symbol: 交易对符号（可选）
+
+        Returns:
+            持仓信息列表
+        """
+        with self.lock:
+            symbols = [symbol] if symbol else list(self.positions)
+            positions = {s: dict(self.positions.get(s, {'amount': 0.0, 'entry_price': 0.0})) for s in symbols}
+        result = []
+        for s, position in positions.items():
+            mark_price = self.get_price(s) or position['entry_price']
+            result.append({
+                'symbol': s,
+                'positionAmt': str(position['amount']),
+                'entryPrice': str(position['entry_price']),
+                'markPrice': str(mark_price),
+                'unRealizedProfit': str(position['amount'] * (mark_price - position['entry_price'])),
+                'leverage': str(self.leverage.get(s, 0)),
+                'marginType': self.margin_type.get(s, 'CROSSED').lower(),
+                'positionSide': 'SHORT'
+            })
+        return result
+
+    def get_account_info_summary(self) -> Optional[Dict]:
+        """
+        获取模拟账户信息摘要（用于启动通知）
+
+        Returns:
+            包含余额和持仓信息的字典
+        """
+        active_positions = []
+        for pos in self.get_position_info():
+            position_amt = float(pos['positionAmt'])
+            if position_amt == 0:
+                continue
+            entry_price = float(pos['entryPrice'])
+            active_positions.append({
+                'symbol': pos['symbol'],
+                'side': '多头' if position_amt > 0 else '空头',
+                'quantity': abs(position_amt),
+                'entry_price': entry_price,
+                'position_value': abs(position_amt) * entry_price,
+                'unrealized_pnl': float(pos['unRealizedProfit']),
+                'leverage': pos['leverage']
+            })
+        return {
+            'balances': {self.asset: self.balance},
+            'total_balance': self.balance,
+            'positions': active_positions
+        }
+
+    @staticmethod
+    def is_order_filled(order: Dict) -> bool:
+        """判断订单是否有成交"""
+        return float(order.get('executedQty', 0)) > 0
@@ -0,0 +1,219 @@
+"""
+监控地址持仓镜像模块
+用一次 clearinghouseState 初始化内存中的持仓模型，之后根据每条 userFills 成交
+（startPosition / sz / side）增量更新，无需反复全量查询
+"""
+import threading
+import logging
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 浮点误差容忍度
+POSITION_EPSILON = 1e-9
+
+
+class WatchedAccountMirror:
+    """监控地址的持仓镜像类"""
+
+    def __init__(self):
+        """初始化持仓镜像"""
+        self.positions = {}  # 币种 -> 持仓字典（szi/entry_px/leverage/margin_used/unrealized_pnl/liquidation_px）
+        self.account_value = 0.0
+        self.total_margin_used = 0.0
+        self.seeded = False
+        self.lock = threading.Lock()
+
+        # 统计信息
+        self.fills_applied = 0
+        self.drift_count = 0  # 成交的startPosition与镜像不一致的次数
+
+    def seed(self, user_state: Dict):
+        """
+        用 clearinghouseState 全量初始化镜像
+
+        Args:
+            user_state: clearinghouseState 返回的用户状态
+        """
+        positions = {}
+        for pos in user_state.get('assetPositions', []):
+            position_value = pos.get('position', {})
+            size = float(position_value.get('szi', 0))
+            if size == 0:
+                continue
+            liquidation_px = position_value.get('liquidationPx')
+            positions[position_value.get('coin', 'UNKNOWN')] = {
+                'szi': size,
+                'entry_px': float(position_value.get('entryPx', 0) or 0),
+                'leverage': position_value.get('leverage', {}).get('value', 0),
+                'margin_used': float(position_value.get('marginUsed', 0)),
+                'unrealized_pnl': float(position_value.get('unrealizedPnl', 0)),
+                'liquidation_px': float(liquidation_px) if liquidation_px else None
+            }
+
+        margin_summary = user_state.get('marginSummary', {})
+        with self.lock:
+            self.positions = positions
+            self.account_value = float(margin_summary.get('accountValue', 0))
+            self.total_margin_used = float(margin_summary.get('totalMarginUsed', 0))
+            self.seeded = True
+
+    @staticmethod
+    def close_fraction(start_position: float, new_position: float) -> float:
+        """
+        计算一次成交平掉的持仓比例
+
+        Args:
+            start_position: 成交前持仓（带方向）
+            new_position: 成交后持仓（带方向）
+
+        Returns:
+            平仓比例 (0~1)，加仓或开仓时为0，反手时为1
+        """
+        if abs(start_position) <= POSITION_EPSILON:
+            return 0.0
+        if start_position * new_position < 0:
+            return 1.0
+        reduced = abs(start_position) - abs(new_position)
+        if reduced <= 0:
+            return 0.0
+        return min(reduced / abs(start_position), 1.0)
+
+    def apply_fill(self, fill: Dict) -> Optional[Dict]:
+        """
+        根据一条成交增量更新镜像
+
+        Args:
+            fill: userFills 中的原始成交
+
+        Returns:
+            包含 start_position/new_position/close_fraction 的字典，成交缺少必要字段时返回None
+        """
+        try:
+            coin = fill['coin']
+            start = float(fill['startPosition'])
+            size = float(fill['sz'])
+            price = float(fill['px'])
+        except (KeyError, TypeError, ValueError):
+            return None
+
+        delta = size if fill.get('side') == 'B' else -size
+        new = start + delta
+
+        with self.lock:
+            current = self.positions.get(coin)
+            current_size = current['szi'] if current else 0.0
+            if self.seeded and abs(current_size - start) > POSITION_EPSILON * max(1.0, abs(start)):
+                # 以交易所给出的startPosition为准，自动纠正镜像
+                self.drift_count += 1
+                logger.debug(f"持仓镜像偏差已纠正: {coin} 镜像={current_size}, startPosition={start}")
+
+            if abs(new) <= POSITION_EPSILON:
+                self.positions.pop(coin, None)
+            else:
+                position = current or {
+                    'szi': 0.0, 'entry_px': price, 'leverage': 0, 'margin_used': 0.0,
+                    'unrealized_pnl': 0.0, 'liquidation_px': None
+                }
+                if start * new < 0 or abs(start) <= POSITION_EPSILON:
+                    # 新开仓或反手：入场价为本次成交价
+                    position['entry_px'] = price
+                elif abs(new) > abs(start):
+                    # 加仓：按数量加权更新入场价
+                    position['entry_px'] = (abs(start) * position['entry_px'] + size * price) / abs(new)
+                position['szi'] = new
+                self.positions[coin] = position
+
+            self.fills_applied += 1
+
+        return {
+            'start_position': start,
+            'new_position': new,
+            'close_fraction': self.close_fraction(start, new)
+        }
+
+    def get_position_size(self, coin: str) -> float:
+        """
+        获取某币种当前持仓（带方向）
+
+        Args:
+            coin: 币种
+
+        Returns:
+            持仓数量，无持仓时为0
+        """
+        with self.lock:
+            position = self.positions.get(coin)
+            return position['szi'] if position else 0.0
+
+    def get_entry_price(self, coin: str) -> Optional[float]:
+        """
+        获取某币种当前持仓的入场价
+
+        Args:
+            coin: 币种
+
+        Returns:
+            入场价，无持仓时返回None
+        """
+        with self.lock:
+            position = self.positions.get(coin)
+            return position['entry_px'] if position else None
+
+    def get_positions_summary(self) -> Dict:
+        """
+        获取持仓信息摘要（格式与监控器的 get_positions_summary 相同）
+
+        未实现盈亏、保证金和强平价格来自最近一次全量同步
+
+        Returns:
+            包含持仓和账户信息的字典
+        """
+        with self.lock:
+            active_positions = []
+            for coin, position in self.positions.items():
+                size = position['szi']
+                active_positions.append({
+                    'coin': coin,
+                    'side': '多头' if size > 0 else '空头',
+                    'size': size,
+                    'entry_price': position['entry_px'],
+                    'position_value': abs(size) * position['entry_px'],
+                    'leverage': position['leverage'],
+                    'margin_used': position['margin_used'],
+                    'unrealized_pnl': position['unrealized_pnl'],
+                    'liquidation_price': position['liquidation_px']
+                })
+
+            return {
+                'positions': active_positions,
+                'account_value': self.account_value,
+                'total_margin_used': self.total_margin_used,
+                'available_balance': self.account_value - self.total_margin_used
+            }
+
+    def diff(self, user_state: Dict) -> List[str]:
+        """
+        与全量状态比较，找出持仓数量不一致的币种
+
+        Args:
+            user_state: clearinghouseState 返回的用户状态
+
+        Returns:
+            不一致描述列表
+        """
+        actual = {}
+        for pos in user_state.get('assetPositions', []):
+            position_value = pos.get('position', {})
+            size = float(position_value.get('szi', 0))
+            if size != 0:
+                actual[position_value.get('coin', 'UNKNOWN')] = size
+
+        differences = []
+        with self.lock:
+            for coin in set(actual) | set(self.positions):
+                mirrored = self.positions[coin]['szi'] if coin in self.positions else 0.0
+                real = actual.get(coin, 0.0)
+                if abs(mirrored - real) > POSITION_EPSILON * max(1.0, abs(real)):
+                    differences.append(f"{coin}: 镜像={mirrored}, 实际={real}")
+        return differences
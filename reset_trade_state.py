@@ -2,26 +2,25 @@
 开单状态管理脚本
 用于查看和重置开单状态
 """
-import json
-import os
 import sys
 from datetime import datetime
 
+from shared_state import SharedStateFile
+
 TRADE_STATE_FILE = 'trade_state.json'
 
+# 与运行中的机器人共用文件锁，避免同时写入
+state_file = SharedStateFile(TRADE_STATE_FILE)
+
 
 def load_trade_state():
     """加载开单状态"""
-    if os.path.exists(TRADE_STATE_FILE):
-        with open(TRADE_STATE_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return {}
+    return state_file.load() or {}
 
 
 def save_trade_state(state):
     """保存开单状态"""
-    with open(TRADE_STATE_FILE, 'w', encoding='utf-8') as f:
-        json.dump(state, f, ensure_ascii=False, indent=2)
+    state_file.save(state)
 
 
 def display_state(state):
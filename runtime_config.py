@@ -0,0 +1,311 @@
+"""
+运行时配置模块
+config.py 中可以在运行中修改的配置（监控地址、交易对、杠杆、保证金、信号规则和各种间隔）
+封装为经过校验的只读快照，收到 SIGHUP 或检测到 config.py 被修改时重新加载：
+- 新配置先完整加载并校验，任一项不合法时保留当前配置
+- 应用函数只处理变化的部分（增量订阅、重新预设杠杆等），未受影响的连接不会断开
+- 新快照整体替换旧快照，信号处理只会看到旧配置或新配置，不会看到一半
+其他配置（API密钥、执行后端、日志等）修改后仍需重启，重新加载时会提示
+"""
+import os
+import re
+import signal
+import runpy
+import importlib
+import threading
+import logging
+from typing import Callable, Dict, List, Optional
+
+from signal_rules import SignalRuleEngine
+
+logger = logging.getLogger(__name__)
+
+ADDRESS_PATTERN = re.compile(r'^0x[0-9a-fA-F]{40}$')
+POSITION_SIZING_MODES = ('FIXED', 'PROPORTIONAL')
+MAX_LEVERAGE = 125
+
+# 可以在运行中重新加载的配置项（其余配置项修改后需要重启）
+RELOADABLE_KEYS = (
+    'MONITOR_ADDRESS', 'TRADING_PAIRS', 'LEVERAGE', 'POSITION_SIZE_USDC', 'BINANCE_ACCOUNTS',
+    'POSITION_SIZING_MODE', 'POSITION_SIZE_MIN_SCALE', 'SIGNAL_RULES',
+    'SCAN_INTERVAL', 'POSITION_PRINT_INTERVAL', 'POSITION_CONSISTENCY_INTERVAL'
+)
+
+
+class RuntimeConfig:
+    """经过校验的运行时配置快照（只读，重新加载时整体替换）"""
+
+    FIELDS = (
+        'monitor_address', 'trading_pairs', 'accounts', 'position_sizing_mode', 'position_size_min_scale',
+        'signal_rules', 'scan_interval', 'position_print_interval', 'consistency_check_interval'
+    )
+
+    def __init__(self, monitor_address: str, trading_pairs: Dict[str, str], accounts: List[Dict],
+                 position_sizing_mode: str = 'FIXED', position_size_min_scale: float = 0.1,
+                 signal_rules: Optional[Dict] = None, scan_interval: float = 5,
+                 position_print_interval: float = 300, consistency_check_interval: float = 3600):
+        """
+        初始化配置快照（不做校验，通常通过 from_values 创建）
+
+        Args:
+            monitor_address: 监控地址（小写）
+            trading_pairs: 币种到交易对的映射
+            accounts: 账户参数列表，每项包含 name/leverage/position_size_usdc（不含API密钥）
+            position_sizing_mode: 开仓数量模式
+            position_size_min_scale: 按比例开仓时的最小缩放比例
+            signal_rules: 平仓信号规则
+            scan_interval: HTTP轮询间隔（秒）
+            position_print_interval: 持仓打印间隔（秒）
+            consistency_check_interval: 全量校验持仓镜像的间隔（秒）
+        """
+        self.monitor_address = monitor_address
+        self.trading_pairs = trading_pairs
+        self.accounts = accounts
+        self.position_sizing_mode = position_sizing_mode
+        self.position_size_min_scale = position_size_min_scale
+        self.signal_rules = signal_rules or {}
+        self.scan_interval = scan_interval
+        self.position_print_interval = position_print_interval
+        self.consistency_check_interval = consistency_check_interval
+
+    @classmethod
+    def from_values(cls, values: Dict) -> 'RuntimeConfig':
+        """
+        由配置文件中的变量创建并校验配置快照
+
+        Args:
+            values: 配置变量字典（如 config 模块的 __dict__）
+
+        Returns:
+            配置快照
+
+        Raises:
+            ValueError: 缺少配置项或配置不合法
+        """
+        missing = [key for key in RELOADABLE_KEYS if key not in values]
+        if missing:
+            raise ValueError(f"缺少配置项: {', '.join(missing)}")
+
+        address = values['MONITOR_ADDRESS']
+        if not isinstance(address, str) or not ADDRESS_PATTERN.match(address):
+            raise ValueError(f"MONITOR_ADDRESS 不是有效的地址: {address!r}")
+
+        pairs = values['TRADING_PAIRS']
+        if not isinstance(pairs, dict) or not pairs:
+            raise ValueError("TRADING_PAIRS 必须是非空字典")
+        for coin, symbol in pairs.items():
+            if not isinstance(coin, str) or not isinstance(symbol, str) or not symbol or symbol != symbol.upper():
+                raise ValueError(f"TRADING_PAIRS 中的交易对无效: {coin!r} → {symbol!r}")
+        if len(set(pairs.values())) != len(pairs):
+            raise ValueError("TRADING_PAIRS 中存在重复的交易对")
+
+        accounts = cls._build_accounts(values['BINANCE_ACCOUNTS'], values['LEVERAGE'], values['POSITION_SIZE_USDC'])
+
+        mode = values['POSITION_SIZING_MODE']
+        if mode not in POSITION_SIZING_MODES:
+            raise ValueError(f"POSITION_SIZING_MODE 必须是 {' / '.join(POSITION_SIZING_MODES)}: {mode!r}")
+        min_scale = values['POSITION_SIZE_MIN_SCALE']
+        if not isinstance(min_scale, (int, float)) or not 0 < min_scale <= 1:
+            raise ValueError(f"POSITION_SIZE_MIN_SCALE 必须在 (0, 1] 之间: {min_scale!r}")
+
+        rules = values['SIGNAL_RULES']
+        if not isinstance(rules, dict):
+            raise ValueError("SIGNAL_RULES 必须是字典")
+        # 编译一次，规则不合法时在这里报错而不是在收到成交时
+        SignalRuleEngine(rules)
+
+        intervals = {}
+        for key in ('SCAN_INTERVAL', 'POSITION_PRINT_INTERVAL', 'POSITION_CONSISTENCY_INTERVAL'):
+            value = values[key]
+            if not isinstance(value, (int, float)) or value <= 0:
+                raise ValueError(f"{key} 必须是正数: {value!r}")
+            intervals[key] = value
+
+        return cls(
+            monitor_address=address.lower(),
+            trading_pairs=dict(pairs),
+            accounts=accounts,
+            position_sizing_mode=mode,
+            position_size_min_scale=float(min_scale),
+            signal_rules=rules,
+            scan_interval=intervals['SCAN_INTERVAL'],
+            position_print_interval=intervals['POSITION_PRINT_INTERVAL'],
+            consistency_check_interval=intervals['POSITION_CONSISTENCY_INTERVAL']
+        )
+
+    @classmethod
+    def from_module(cls, module_name: str = 'config') -> 'RuntimeConfig':
+        """
+        由已导入的配置模块创建配置快照（启动时使用）
+
+        Args:
+            module_name: 配置模块名
+
+        Returns:
+            配置快照
+        """
+        return cls.from_values(vars(importlib.import_module(module_name)))
+
+    @staticmethod
+    def _build_accounts(binance_accounts, leverage, position_size_usdc) -> List[Dict]:
+        """校验并构建账户参数列表（规则与 TradingBot.build_account_configs 相同）"""
+        if not isinstance(binance_accounts, list):
+            raise ValueError("BINANCE_ACCOUNTS 必须是列表")
+
+        entries = binance_accounts or [{'name': 'main'}]
+        accounts = []
+        for index, account in enumerate(entries):
+            accounts.append({
+                'name': account.get('name', f'account{index + 1}'),
+                'leverage': account.get('leverage', leverage),
+                'position_size_usdc': account.get('position_size_usdc', position_size_usdc)
+            })
+
+        names = [account['name'] for account in accounts]
+        if len(set(names)) != len(names):
+            raise ValueError(f"账户名称重复: {names}")
+        for account in accounts:
+            if not isinstance(account['leverage'], int) or not 1 <= account['leverage'] <= MAX_LEVERAGE:
+                raise ValueError(f"账户 {account['name']} 的杠杆必须是 1~{MAX_LEVERAGE} 的整数: {account['leverage']!r}")
+            if not isinstance(account['position_size_usdc'], (int, float)) or account['position_size_usdc'] <= 0:
+                raise ValueError(f"账户 {account['name']} 的保证金必须是正数: {account['position_size_usdc']!r}")
+        return accounts
+
+    def diff(self, other: 'RuntimeConfig') -> List[str]:
+        """
+        比较两个配置快照
+
+        Args:
+            other: 另一个配置快照
+
+        Returns:
+            取值不同的字段名列表
+        """
+        return [field for field in self.FIELDS if getattr(self, field) != getattr(other, field)]
+
+
+def load_config_values(path: str) -> Dict:
+    """
+    重新执行配置文件并返回其中的大写变量（不影响已导入的 config 模块）
+
+    Args:
+        path: 配置文件路径
+
+    Returns:
+        变量名到值的字典
+    """
+    return {key: value for key, value in runpy.run_path(path).items() if key.isupper()}
+
+
+class ConfigReloader:
+    """配置热加载：SIGHUP 或配置文件修改时重新加载并应用变化"""
+
+    def __init__(self, current: RuntimeConfig, apply: Callable[[RuntimeConfig, List[str]], None],
+                 path: Optional[str] = None, poll_interval: float = 2.0):
+        """
+        初始化配置热加载
+
+        Args:
+            current: 当前配置快照
+            apply: 应用函数，参数为 (新配置快照, 变化的字段列表)，负责增量更新并替换配置快照
+            path: 配置文件路径，默认为 config 模块所在的文件
+            poll_interval: 检查配置文件是否修改的间隔（秒），0表示只响应 SIGHUP
+        """
+        self.current = current
+        self.apply = apply
+        self.path = path or importlib.import_module('config').__file__
+        self.poll_interval = poll_interval
+
+        self.lock = threading.Lock()
+        self.requested = threading.Event()
+        self.running = False
+        self.thread = None
+        self.signature = self._signature()
+        self.values = load_config_values(self.path)
+
+        # 统计信息
+        self.reload_count = 0
+        self.rejected_count = 0
+
+    def _signature(self):
+        """配置文件的修改标识（编辑器保存时可能替换文件，同时比较 inode）"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def reload(self, reason: str = '手动') -> bool:
+        """
+        重新加载配置文件，校验通过后应用变化的部分
+
+        Args:
+            reason: 触发原因（用于日志）
+
+        Returns:
+            是否应用了新配置
+        """
+        with self.lock:
+            self.signature = self._signature()
+            logger.info(f"🔄 重新加载配置 ({reason}): {self.path}")
+            try:
+                values = load_config_values(self.path)
+                new = RuntimeConfig.from_values(values)
+            except Exception as e:
+                self.rejected_count += 1
+                logger.error(f"❌ 新配置无效，继续使用当前配置: {e}")
+                return False
+
+            restart_keys = sorted(
+                key for key in set(values) | set(self.values)
+                if key not in RELOADABLE_KEYS and values.get(key) != self.values.get(key)
+            )
+            if restart_keys:
+                logger.warning(f"⚠️ 以下配置项需要重启才能生效: {', '.join(restart_keys)}")
+            self.values = values
+
+            changes = self.current.diff(new)
+            if not changes:
+                logger.info("配置无变化")
+                return False
+
+            logger.warning(f"⚙️ 配置已修改: {', '.join(changes)}")
+            self.apply(new, changes)
+            self.current = new
+            self.reload_count += 1
+            return True
+
+    def request_reload(self, signum=None, frame=None):
+        """请求重新加载（可作为 SIGHUP 处理函数，实际加载在后台线程中进行）"""
+        self.requested.set()
+
+    def _worker(self):
+        while self.running:
+            requested = self.requested.wait(self.poll_interval or None)
+            if not self.running:
+                break
+            try:
+                if requested:
+                    self.requested.clear()
+                    self.reload('SIGHUP')
+                elif self.poll_interval and self._signature() != self.signature:
+                    self.reload('配置文件已修改')
+            except Exception as e:
+                logger.error(f"重新加载配置时发生错误: {e}", exc_info=True)
+
+    def start(self):
+        """在后台线程中监视配置文件，并注册 SIGHUP（只能在主线程中调用）"""
+        self.running = True
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, self.request_reload)
+        self.thread = threading.Thread(target=self._worker, name='config-reloader', daemon=True)
+        self.thread.start()
+        watch = f"每 {self.poll_interval} 秒检查文件修改" if self.poll_interval else "只响应 SIGHUP"
+        logger.info(f"⚙️ 配置热加载已启用: {self.path} ({watch})")
+
+    def stop(self):
+        """停止监视"""
+        self.running = False
+        self.requested.set()
+        if self.thread:
+            self.thread.join(timeout=1)
@@ -0,0 +1,876 @@
+"""
+分片监控模块
+监控数千个地址时，按一致性哈希把地址分配给多个工作进程，每个工作进程使用少量 WebSocket 连接
+（每个连接订阅多个地址），平仓信号通过各自的信号总线汇总到下单进程：
+- 工作进程在 SQLite 成员表中定期心跳，并附带吞吐量和内存统计
+- 每个工作进程根据存活成员独立计算哈希环，只订阅分配给自己的地址；成员变化时只有少量地址迁移
+- 工作进程停止心跳（崩溃或卡死）超过有效期后，其地址由其他工作进程接管，
+  接管时历史快照中交接期间的成交按实时信号补处理（下单进程按地址和成交ID去重）
+- 交易所按出口IP限制用户订阅的地址数（HYPERLIQUID_MAX_USERS_PER_IP），每个工作进程配置自己的一组本机出口IP，
+  每个连接从其中一个IP发起，每个IP上的地址数不超过上限；超出本进程容量的地址记为未订阅
+- 交易所通过 error 通道拒绝的订阅以及超出容量的地址记为未订阅，不计入监控地址数并发送警报
+
+命令行: python sharding.py status            # 各工作进程的地址数、连接数、吞吐量和内存
+        python sharding.py plan --workers shard-0,shard-1,shard-2   # 预览地址分配和出口IP容量
+"""
+import os
+import sys
+import json
+import time
+import bisect
+import hashlib
+import sqlite3
+import argparse
+import logging
+import re
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import tracing
+from clock import SYSTEM_CLOCK
+from hyperliquid_monitor_ws import HyperliquidMonitorWS
+from signal_race import CHANNEL_USER_FILLS
+
+logger = logging.getLogger(__name__)
+
+RING_REPLICAS = 160  # 每个工作进程在哈希环上的虚拟节点数（越多分配越均匀）
+HYPERLIQUID_MAX_USERS_PER_IP = 10  # 交易所按IP限制：所有连接上的用户订阅（userFills 等）合计最多10个不同地址
+ADDRESS_PATTERN = re.compile(r'0x[0-9a-f]{40}')
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+
+class HashRing:
+    """一致性哈希环：工作进程增减时只有相邻区间的地址迁移"""
+
+    def __init__(self, nodes: Iterable[str], replicas: int = RING_REPLICAS, weights: Optional[Dict[str, int]] = None):
+        """
+        初始化哈希环
+
+        Args:
+            nodes: 工作进程名称
+            replicas: 每个工作进程的虚拟节点数
+            weights: 工作进程名称 -> 权重（可选，默认1），虚拟节点数按权重倍增（出口IP多的进程分到更多地址）
+        """
+        self.nodes = sorted(set(nodes))
+        weights = weights or {}
+        points = sorted((_hash(f"{node}#{index}"), node) for node in self.nodes
+                        for index in range(replicas * max(weights.get(node, 1), 1)))
+        self.keys = [point for point, _ in points]
+        self.owners = [node for _, node in points]
+
+    def node_for(self, key: str) -> Optional[str]:
+        """
+        获取地址所属的工作进程
+
+        Args:
+            key: 地址（按小写计算）
+
+        Returns:
+            工作进程名称，哈希环为空时返回None
+        """
+        if not self.keys:
+            return None
+        index = bisect.bisect(self.keys, _hash(key.lower())) % len(self.keys)
+        return self.owners[index]
+
+    def assign(self, keys: Iterable[str]) -> Dict[str, List[str]]:
+        """
+        分配一组地址
+
+        Args:
+            keys: 地址列表
+
+        Returns:
+            工作进程名称 -> 地址列表
+        """
+        assignment = {node: [] for node in self.nodes}
+        for key in keys:
+            node = self.node_for(key)
+            if node is not None:
+                assignment[node].append(key)
+        return assignment
+
+
+def load_addresses(path: str) -> List[str]:
+    """
+    读取监控地址列表文件（每行一个地址，# 开头为注释，重复地址只保留一个）
+
+    Args:
+        path: 文件路径
+
+    Returns:
+        小写地址列表
+    """
+    addresses = []
+    seen = set()
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            address = line.split('#', 1)[0].strip().lower()
+            if address and address not in seen:
+                seen.add(address)
+                addresses.append(address)
+    return addresses
+
+
+def egress_capacity(workers: List[str], source_addresses: Dict[str, List[str]], addresses_per_connection: int,
+                    users_per_ip: int = HYPERLIQUID_MAX_USERS_PER_IP) -> int:
+    """
+    校验各工作进程的出口IP配置，返回所有工作进程合计能监控的地址数
+
+    所有工作进程共用同一个成员表和信号总线，因此运行在同一台机器上：没有配置本机出口IP的工作进程
+    都使用默认出口IP，共享同一个按IP的地址数上限
+
+    Args:
+        workers: 工作进程名称
+        source_addresses: 工作进程名称 -> 本机出口IP列表
+        addresses_per_connection: 每个连接订阅的地址数上限
+        users_per_ip: 每个出口IP的地址数上限
+
+    Returns:
+        地址数上限
+
+    Raises:
+        ValueError: 配置超过交易所按IP的地址数上限
+    """
+    if addresses_per_connection > users_per_ip:
+        raise ValueError(f"每个连接的地址数 {addresses_per_connection} 超过交易所每个IP的上限 {users_per_ip}")
+    unknown = sorted(set(source_addresses) - set(workers))
+    if unknown:
+        raise ValueError(f"出口IP配置中的工作进程不在工作进程列表中: {', '.join(unknown)}")
+    owners = {}
+    for worker in workers:
+        for address in source_addresses.get(worker) or []:
+            if address in owners:
+                raise ValueError(f"出口IP {address} 同时配置给了 {owners[address]} 和 {worker}")
+            owners[address] = worker
+    defaults = [worker for worker in workers if not source_addresses.get(worker)]
+    if len(defaults) > 1:
+        raise ValueError(f"工作进程 {', '.join(defaults)} 都没有配置出口IP，会共用默认出口IP及其 {users_per_ip} 个地址的上限")
+    return (len(owners) + len(defaults)) * users_per_ip
+
+
+def egress_weights(workers: List[str], source_addresses: Dict[str, List[str]]) -> Dict[str, int]:
+    """
+    按出口IP数计算各工作进程在哈希环上的权重（没有配置出口IP的进程使用默认出口IP，权重为1）
+
+    Args:
+        workers: 工作进程名称
+        source_addresses: 工作进程名称 -> 本机出口IP列表
+
+    Returns:
+        工作进程名称 -> 权重
+    """
+    return {worker: max(len(source_addresses.get(worker) or []), 1) for worker in workers}
+
+
+def read_rss_mb() -> float:
+    """当前进程的常驻内存（MB）"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except (OSError, ValueError, IndexError):
+        import resource
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return usage / 1024 / 1024 if sys.platform == 'darwin' else usage / 1024
+
+
+class ShardMembership:
+    """工作进程成员表（SQLite 行 + 心跳，与热备租约相同的存储方式）"""
+
+    def __init__(self, path: str, worker_id: str, ttl: float = 10.0):
+        """
+        初始化成员表
+
+        Args:
+            path: SQLite 数据库路径（所有工作进程必须相同）
+            worker_id: 工作进程名称
+            ttl: 心跳有效期（秒），超过后视为已退出
+        """
+        self.path = path
+        self.worker_id = worker_id
+        self.ttl = ttl
+        self.conn = sqlite3.connect(path, timeout=ttl, isolation_level=None, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS shard_members ('
+            'worker TEXT PRIMARY KEY, heartbeat REAL, expires REAL, started REAL, stats TEXT)'
+        )
+        self.started = time.time()
+
+    def heartbeat(self, stats: Optional[Dict] = None) -> Dict[str, Tuple[float, float]]:
+        """
+        写入心跳和统计，并读取存活的工作进程
+
+        Args:
+            stats: 本工作进程的统计信息
+
+        Returns:
+            存活的工作进程名称 -> (最后心跳时间, 启动时间)（包括自己）
+        """
+        now = time.time()
+        self.conn.execute(
+            'INSERT INTO shard_members (worker, heartbeat, expires, started, stats) VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT(worker) DO UPDATE SET heartbeat = excluded.heartbeat, expires = excluded.expires, '
+            'started = excluded.started, stats = excluded.stats',
+            (self.worker_id, now, now + self.ttl, self.started, json.dumps(stats or {}))
+        )
+        rows = self.conn.execute('SELECT worker, heartbeat, started FROM shard_members WHERE expires > ?',
+                                 (now,)).fetchall()
+        return {worker: (heartbeat, started) for worker, heartbeat, started in rows}
+
+    def leave(self):
+        """正常退出时立即让出地址（其他工作进程在下一次心跳时接管）"""
+        try:
+            self.conn.execute('UPDATE shard_members SET expires = 0 WHERE worker = ?', (self.worker_id,))
+        except sqlite3.Error as e:
+            logger.error(f"退出成员表失败: {e}")
+
+    def close(self):
+        self.conn.close()
+
+
+def read_members(path: str) -> List[Dict]:
+    """
+    读取所有工作进程的状态（包括已退出的）
+
+    Args:
+        path: 成员表数据库路径
+
+    Returns:
+        工作进程状态列表
+    """
+    conn = sqlite3.connect(path)
+    try:
+        rows = conn.execute('SELECT worker, heartbeat, expires, started, stats FROM shard_members '
+                            'ORDER BY worker').fetchall()
+    except sqlite3.OperationalError:
+        rows = []
+    finally:
+        conn.close()
+    now = time.time()
+    return [{'worker': worker, 'alive': expires > now, 'heartbeat_age': now - heartbeat,
+             'uptime': now - started, 'stats': json.loads(stats or '{}')}
+            for worker, heartbeat, expires, started, stats in rows]
+
+
+def format_stats(stats: Dict) -> str:
+    """
+    格式化工作进程的统计信息
+
+    Args:
+        stats: ShardWorker.stats 的结果
+
+    Returns:
+        一行描述
+    """
+    rejected = stats.get('rejected', 0)
+    overflow = stats.get('overflow', 0)
+    capacity = stats.get('capacity', 0)
+    addresses = (f"{stats.get('addresses', 0)}" + (f"/{capacity}" if capacity else "")
+                 + (f" (订阅被拒绝 {rejected})" if rejected else "")
+                 + (f" (超出出口IP容量 {overflow})" if overflow else ""))
+    return (f"地址 {addresses}, 连接 {stats.get('connected', 0)}/{stats.get('connections', 0)}, "
+            f"消息 {stats.get('messages_per_second', 0):.1f}/秒, 成交 {stats.get('fills_per_second', 0):.2f}/秒, "
+            f"信号 {stats.get('signals', 0)}, 已处理成交ID {stats.get('processed_fills', 0)}, "
+            f"内存 {stats.get('rss_mb', 0):.1f}MB")
+
+
+def format_members(members: List[Dict]) -> List[str]:
+    """
+    格式化各工作进程的状态
+
+    Args:
+        members: read_members 的结果
+
+    Returns:
+        每个工作进程一行的描述
+    """
+    lines = []
+    for member in members:
+        state = '存活' if member['alive'] else '已退出'
+        lines.append(f"{member['worker']} [{state}, {member['heartbeat_age']:.1f}秒前心跳]: "
+                     f"{format_stats(member['stats'])}")
+    return lines
+
+
+class AddressGroupMonitor(HyperliquidMonitorWS):
+    """在一个 WebSocket 连接上订阅多个地址的 userFills（分片工作进程使用）"""
+
+    def __init__(self, api_url: str, ws_url: str, name: str, rule_engine=None, clock=None,
+                 source_address: Optional[str] = None, **link_options):
+        """
+        初始化地址组监控
+
+        Args:
+            api_url: Hyperliquid HTTP API地址
+            ws_url: Hyperliquid WebSocket地址
+            name: 连接名称（日志中使用）
+            rule_engine: 平仓信号规则引擎（可选）
+            clock: 时钟（可选）
+            source_address: 发起连接的本机出口IP（可选），None 表示默认出口IP
+            **link_options: 链路质量参数（ping_interval、rtt_recycle_ms、pong_loss_limit）
+        """
+        super().__init__(api_url, ws_url, name, rule_engine=rule_engine, clock=clock, source_address=source_address,
+                         **link_options)
+        self.name = name
+        self.address_lock = threading.Lock()
+        self.processed = {}  # 地址 -> 已处理的成交ID集合
+        self.catch_up = {}  # 接管的地址 -> 快照中按实时信号补处理的起始时间（毫秒）
+        self.pending = []  # 已发送订阅、尚未确认的地址（交易所按发送顺序应答）
+        self.rejected = {}  # 订阅被拒绝的地址 -> 交易所返回的错误
+        self.signals_count = 0
+
+    @property
+    def addresses(self) -> List[str]:
+        with self.address_lock:
+            return list(self.processed)
+
+    @property
+    def rejected_addresses(self) -> Dict[str, str]:
+        """订阅被拒绝的地址（重连或重新订阅前不会收到推送）"""
+        with self.address_lock:
+            return dict(self.rejected)
+
+    def processed_count(self) -> int:
+        """已处理的成交ID总数"""
+        with self.address_lock:
+            return sum(len(fills) for fills in self.processed.values())
+
+    def add_address(self, address: str, since_ms: Optional[int] = None, processed: Optional[set] = None):
+        """
+        增加订阅地址
+
+        Args:
+            address: 地址
+            since_ms: 接管其他工作进程的地址时，快照中该时间之后的成交按实时信号处理
+            processed: 已处理的成交ID（地址从本进程的其他连接迁入时沿用）
+        """
+        with self.address_lock:
+            self.processed[address] = set(processed or ())
+            if since_ms is not None:
+                self.catch_up[address] = since_ms
+        self._send(address, 'subscribe')
+
+    def remove_address(self, address: str):
+        """取消订阅地址"""
+        with self.address_lock:
+            self.processed.pop(address, None)
+            self.catch_up.pop(address, None)
+            self.rejected.pop(address, None)
+        self._send(address, 'unsubscribe')
+
+    def _send(self, address: str, method: str):
+        ws = self.ws
+        if ws and self.ws_connected:
+            with self.address_lock:
+                if address in self.pending:
+                    self.pending.remove(address)
+                if method == 'subscribe':
+                    self.pending.append(address)
+                    self.rejected.pop(address, None)
+            try:
+                ws.send(json.dumps({"method": method, "subscription": {"type": CHANNEL_USER_FILLS, "user": address}}))
+            except Exception as e:
+                # 发送失败时连接随后会重连，重连后按当前地址订阅
+                logger.error(f"[{self.name}] 发送{method}失败: {e}")
+
+    def _subscribe_all(self, ws):
+        """连接建立（或重连）后订阅当前所有地址（之前被拒绝的地址也重新订阅）"""
+        with self.address_lock:
+            addresses = list(self.processed)
+            self.pending = list(addresses)
+            self.rejected.clear()
+        for address in addresses:
+            ws.send(json.dumps({"method": "subscribe", "subscription": {"type": CHANNEL_USER_FILLS, "user": address}}))
+        logger.info(f"📤 [{self.name}] 已订阅 {len(addresses)} 个地址")
+
+    def _on_ws_message(self, ws, message):
+        """userFills 按推送中的地址分别处理，订阅确认和错误按地址记录，其他消息（pong）由基类处理"""
+        received_ns = tracing.now_ns()
+        try:
+            data = json.loads(message)
+        except json.JSONDecodeError:
+            return super()._on_ws_message(ws, message)
+        channel = data.get('channel')
+        if channel in ('subscriptionResponse', 'error'):
+            self.ws_message_count += 1
+            self.last_message_time = self.clock.time()
+            if channel == 'error':
+                self._on_subscription_error(str(data.get('data', '')))
+            else:
+                self._on_subscription_response(data.get('data') or {})
+            return
+        if channel != CHANNEL_USER_FILLS:
+            return super()._on_ws_message(ws, message)
+
+        self.ws_message_count += 1
+        self.last_message_time = self.clock.time()
+        try:
+            msg_data = data.get('data', {})
+            address = (msg_data.get('user') or '').lower()
+            fills = msg_data.get('fills', [])
+            is_snapshot = msg_data.get('isSnapshot', False)
+            with self.address_lock:
+                processed = self.processed.get(address)
+                since_ms = self.catch_up.pop(address, None) if is_snapshot else None
+            if processed is None:
+                # 已迁移到其他工作进程的地址，退订生效前推送的数据
+                return
+
+            if is_snapshot:
+                # 快照只标记为已处理；接管的地址中交接期间的成交按实时信号补处理
+                live = []
+                for fill in fills:
+                    if since_ms is not None and fill.get('time', 0) >= since_ms:
+                        live.append(fill)
+                    else:
+                        processed.add(fill.get('tid', ''))
+                if live:
+                    logger.warning(f"🔁 [{self.name}] 迁入地址 {address}，补处理交接期间的 {len(live)} 条成交")
+                fills = live
+            else:
+                self.fills_received_count += len(fills)
+            if not fills:
+                return
+
+            signals = self.rule_engine.parse_fills(fills, address, processed)
+            if not signals:
+                return
+            for signal in signals:
+                signal['channel'] = CHANNEL_USER_FILLS
+                logger.info(f"🎯 [{self.name}] {address} 平仓信号: {signal['coin']}, 数量: {signal['size']}, "
+                            f"价格: {signal['price']}")
+            tracing.start_traces(signals, received_ns, channel=CHANNEL_USER_FILLS)
+            self.signals_count += len(signals)
+            if self.batch_callback:
+                self.batch_callback(signals)
+        except Exception as e:
+            logger.error(f"[{self.name}] 处理成交推送时发生错误: {e}", exc_info=True)
+            self.ws_error_count += 1
+
+    def _on_subscription_response(self, response: Dict):
+        """订阅确认：该地址不再等待应答"""
+        address = (response.get('subscription', {}).get('user') or '').lower()
+        with self.address_lock:
+            if address in self.pending:
+                self.pending.remove(address)
+
+    def _on_subscription_error(self, error: str):
+        """
+        订阅被拒绝（如超过单个IP的地址数上限）：错误中带有地址时按地址对应，否则对应到最早未确认的订阅
+
+        Args:
+            error: 交易所返回的错误信息
+        """
+        with self.address_lock:
+            address = next((a for a in ADDRESS_PATTERN.findall(error.lower()) if a in self.processed), None)
+            if address is None and self.pending:
+                address = self.pending[0]
+            if address is not None:
+                if address in self.pending:
+                    self.pending.remove(address)
+                self.rejected[address] = error
+        self.ws_error_count += 1
+        if address is None:
+            logger.error(f"❌ [{self.name}] WebSocket错误: {error}")
+            return
+        logger.error(f"🚫 [{self.name}] 地址 {address} 订阅被拒绝: {error}")
+
+    def start(self, batch_callback: Callable[[List[Dict]], None]):
+        """
+        连接并开始接收（不阻塞，不执行持仓打印和镜像校验）
+
+        Args:
+            batch_callback: 平仓信号回调，参数为信号列表
+        """
+        self.batch_callback = batch_callback
+        self.running = True
+        self._start_websocket()
+
+
+class ShardWorker:
+    """分片工作进程：按哈希环认领地址，把地址分配到各出口IP上的 WebSocket 连接并报告统计"""
+
+    def __init__(self, worker_id: str, addresses_path: str, membership: ShardMembership,
+                 publish: Callable[[List[Dict]], None], api_url: str, ws_url: str,
+                 addresses_per_connection: int = HYPERLIQUID_MAX_USERS_PER_IP, heartbeat_interval: float = 2.0,
+                 stats_interval: float = 60.0, rule_engine=None, clock=None, link_options: Optional[Dict] = None,
+                 alert: Optional[Callable[[str], None]] = None, source_addresses: Optional[List[str]] = None,
+                 users_per_ip: int = HYPERLIQUID_MAX_USERS_PER_IP, ring_weights: Optional[Dict[str, int]] = None):
+        """
+        初始化分片工作进程
+
+        Args:
+            worker_id: 工作进程名称
+            addresses_path: 监控地址列表文件（修改后自动重新分配）
+            membership: 成员表
+            publish: 平仓信号的发布函数（信号总线）
+            api_url: Hyperliquid HTTP API地址
+            ws_url: Hyperliquid WebSocket地址
+            addresses_per_connection: 每个连接订阅的地址数上限
+            heartbeat_interval: 心跳和重新分配的间隔（秒）
+            stats_interval: 输出统计日志的间隔（秒）
+            rule_engine: 平仓信号规则引擎（可选）
+            clock: 时钟（可选）
+            link_options: 链路质量参数（可选）
+            alert: 警报函数（可选），参数为警报内容，地址订阅被拒绝时调用
+            source_addresses: 本进程使用的本机出口IP列表（可选），默认只使用系统选择的出口IP
+            users_per_ip: 每个出口IP上所有连接合计订阅的地址数上限
+            ring_weights: 哈希环上各工作进程的权重（可选），一般为各进程的出口IP数
+
+        Raises:
+            ValueError: 每个连接的地址数超过每个出口IP的上限
+        """
+        if addresses_per_connection > users_per_ip:
+            raise ValueError(f"每个连接的地址数 {addresses_per_connection} 超过每个出口IP的上限 {users_per_ip}")
+        self.worker_id = worker_id
+        self.addresses_path = addresses_path
+        self.membership = membership
+        self.publish = publish
+        self.api_url = api_url
+        self.ws_url = ws_url
+        self.addresses_per_connection = addresses_per_connection
+        self.heartbeat_interval = heartbeat_interval
+        self.stats_interval = stats_interval
+        self.rule_engine = rule_engine
+        self.clock = clock or SYSTEM_CLOCK
+        self.link_options = link_options or {}
+        self.alert = alert
+        self.source_addresses = list(source_addresses or []) or [None]
+        self.users_per_ip = users_per_ip
+        self.ring_weights = ring_weights
+
+        self.addresses = []
+        self.addresses_mtime = None
+        self.owned = {}  # 地址 -> 所在连接
+        self.overflow = []  # 分配给本进程但所有出口IP都已满、未订阅的地址
+        self.connections = []
+        self.connection_seq = 0
+        self.ring = None
+        self.members = {}  # 上一次心跳时存活的工作进程 -> (最后心跳时间, 启动时间)
+        self.lock = threading.Lock()
+        self.task = None
+        self.last_totals = None  # (时间, 消息数, 成交数)
+        self.rates = (0.0, 0.0)
+        self.last_stats = {}  # 最近一次心跳报告的统计
+        self.last_stats_log = self.clock.monotonic()
+        self.alerted = set()  # 已发送警报、仍被拒绝的地址
+
+        # 统计信息
+        self.rebalance_count = 0
+        self.takeover_count = 0
+        self.rejection_count = 0
+
+    def _load_addresses(self) -> List[str]:
+        """地址列表文件变化时重新读取"""
+        try:
+            mtime = os.stat(self.addresses_path).st_mtime_ns
+            if mtime != self.addresses_mtime:
+                self.addresses = load_addresses(self.addresses_path)
+                self.addresses_mtime = mtime
+                logger.info(f"📋 [{self.worker_id}] 地址列表: {len(self.addresses)} 个")
+        except OSError as e:
+            logger.error(f"读取地址列表失败: {e}")
+        return self.addresses
+
+    @property
+    def capacity(self) -> int:
+        """本进程所有出口IP合计能订阅的地址数"""
+        return len(self.source_addresses) * self.users_per_ip
+
+    def _egress_room(self, source_address: Optional[str]) -> int:
+        """出口IP上还能订阅的地址数（同一IP上所有连接合计计算）"""
+        used = sum(len(c.processed) for c in self.connections if c.source_address == source_address)
+        return self.users_per_ip - used
+
+    def _connection_for_new_address(self, create: bool = True) -> Optional[AddressGroupMonitor]:
+        """
+        选择连接和出口IP都还有空位的连接，没有时在还有空位的出口IP上新建连接
+
+        Args:
+            create: 是否允许新建连接
+
+        Returns:
+            连接，所有出口IP都已满（或不允许新建）时返回None
+        """
+        for connection in self.connections:
+            if (len(connection.processed) < self.addresses_per_connection
+                    and self._egress_room(connection.source_address) > 0):
+                return connection
+        if not create:
+            return None
+        available = [address for address in self.source_addresses if self._egress_room(address) > 0]
+        if not available:
+            return None
+        source_address = available[0]
+        self.connection_seq += 1
+        connection = AddressGroupMonitor(self.api_url, self.ws_url, f"{self.worker_id}/ws-{self.connection_seq}",
+                                         rule_engine=self.rule_engine, clock=self.clock,
+                                         source_address=source_address, **self.link_options)
+        self.connections.append(connection)
+        connection.start(self.publish)
+        return connection
+
+    def _release(self, address: str):
+        connection = self.owned.pop(address)
+        connection.remove_address(address)
+        if not connection.processed:
+            # 连接上没有地址时关闭
+            self.connections.remove(connection)
+            connection.stop()
+
+    def _compact(self) -> int:
+        """
+        地址迁出后连接数多于所需时，把地址最少的连接上的地址移到其他连接并关闭该连接
+        （先在新连接订阅再关闭旧连接，迁移期间不会漏掉成交）
+
+        Returns:
+            关闭的连接数
+        """
+        closed = 0
+        needed = -(-len(self.owned) // self.addresses_per_connection)
+        while len(self.connections) > max(needed, 1):
+            source = min(self.connections, key=lambda connection: len(connection.processed))
+            self.connections.remove(source)
+            with source.address_lock:
+                moving = {address: set(processed) for address, processed in source.processed.items()}
+            moved = []
+            for address, processed in moving.items():
+                # 只合并到已有的连接；出口IP的空位不够时保留该连接
+                target = self._connection_for_new_address(create=False)
+                if target is None:
+                    break
+                target.add_address(address, processed=processed)
+                self.owned[address] = target
+                moved.append(address)
+            if len(moved) < len(moving):
+                for address in moved:
+                    source.remove_address(address)
+                self.connections.append(source)
+                break
+            source.stop()
+            closed += 1
+        return closed
+
+    def tick(self):
+        """心跳一次：报告统计、读取存活成员，认领或释放地址"""
+        with self.lock:
+            addresses = self._load_addresses()
+            stats = self.last_stats = self.stats()
+            members = self.membership.heartbeat(stats)
+            ring = HashRing(members, weights=self.ring_weights)
+            mine = {address for address in addresses if ring.node_for(address) == self.worker_id}
+            added = [address for address in addresses if address in mine and address not in self.owned]
+            removed = [address for address in self.owned if address not in mine]
+
+            for address in removed:
+                self._release(address)
+            takeovers = 0
+            placed = []
+            for address in added:
+                connection = self._connection_for_new_address()
+                if connection is None:
+                    # 所有出口IP都已满，记为未订阅，有空位后在之后的心跳中订阅
+                    continue
+                since_ms = None
+                previous = self.ring.node_for(address) if self.ring else None
+                if previous and previous != self.worker_id:
+                    # 从其他工作进程迁入：从原工作进程最后一次心跳前一个有效期开始补处理
+                    # （原工作进程可能已崩溃，或在本进程订阅前已退订；重复的信号由下单进程去重），
+                    # 但不早于两个进程的启动时间，启动前的历史成交仍只作为快照
+                    last_heartbeat, started = members.get(previous) or self.members.get(previous) or (time.time(), 0)
+                    since = max(last_heartbeat - self.membership.ttl, started, self.membership.started)
+                    since_ms = int(since * 1000)
+                    if previous not in members:
+                        takeovers += 1
+                connection.add_address(address, since_ms)
+                self.owned[address] = connection
+                placed.append(address)
+            self.overflow = [address for address in addresses if address in mine and address not in self.owned]
+
+            compacted = self._compact() if removed else 0
+            if compacted:
+                logger.info(f"🔧 [{self.worker_id}] 合并连接: 关闭 {compacted} 个, 剩余 {len(self.connections)} 个")
+
+            if placed or removed:
+                if self.ring is not None:
+                    self.rebalance_count += 1
+                self.takeover_count += takeovers
+                departed = sorted(set(self.members) - set(members))
+                logger.warning(f"🔀 [{self.worker_id}] 地址重新分配: +{len(placed)} (接管 {takeovers}) -{len(removed)}, "
+                               f"负责 {len(self.owned)} 个地址 / {len(self.connections)} 个连接, "
+                               f"存活工作进程: {', '.join(sorted(members))}"
+                               + (f", 已退出: {', '.join(departed)}" if departed else "")
+                               + (f", 出口IP已满未订阅: {len(self.overflow)}" if self.overflow else ""))
+            self.ring = ring
+            self.members = members
+            rejected = self._new_rejections()
+
+        if rejected:
+            self._alert_rejected(rejected)
+
+        if self.clock.monotonic() - self.last_stats_log >= self.stats_interval:
+            self.last_stats_log = self.clock.monotonic()
+            logger.info(f"📊 [{self.worker_id}] {format_stats(stats)}")
+
+    def _rejected(self) -> Dict[str, str]:
+        """本进程负责但订阅被拒绝的地址 -> 错误"""
+        rejected = {}
+        for connection in self.connections:
+            rejected.update(connection.rejected_addresses)
+        return {address: error for address, error in rejected.items() if address in self.owned}
+
+    def _unwatched(self) -> Dict[str, str]:
+        """本进程负责但未被监控的地址（订阅被拒绝或超出出口IP容量）-> 原因"""
+        unwatched = self._rejected()
+        if self.overflow:
+            reason = f"超过本进程出口IP的地址数上限 ({len(self.source_addresses)} 个IP × {self.users_per_ip})"
+            unwatched.update(dict.fromkeys(self.overflow, reason))
+        return unwatched
+
+    def _new_rejections(self) -> Dict[str, str]:
+        """上次心跳以来新增的未监控地址（恢复订阅后再次被拒绝时重新警报）"""
+        rejected = self._unwatched()
+        new = {address: error for address, error in rejected.items() if address not in self.alerted}
+        self.alerted = set(rejected)
+        self.rejection_count += len(new)
+        return new
+
+    def _alert_rejected(self, rejected: Dict[str, str]):
+        """记录并发送订阅被拒绝的警报（一次心跳内的地址合并为一条）"""
+        errors = sorted(set(rejected.values()))
+        message = (f"[{self.worker_id}] {len(rejected)} 个地址订阅被拒绝或超出出口IP容量，这些地址当前未被监控: "
+                   f"{', '.join(sorted(rejected)[:10])}" + (" ..." if len(rejected) > 10 else "") +
+                   f"；交易所错误: {'; '.join(errors[:3])}")
+        logger.error(f"🚫 {message}")
+        if self.alert:
+            try:
+                self.alert(message)
+            except Exception as e:
+                logger.error(f"[{self.worker_id}] 发送订阅被拒绝警报失败: {e}")
+
+    def _tick_safe(self):
+        try:
+            self.tick()
+        except Exception as e:
+            logger.error(f"[{self.worker_id}] 分片心跳时发生错误: {e}", exc_info=True)
+
+    def stats(self) -> Dict:
+        """
+        获取本工作进程的统计信息（吞吐量按两次调用之间的增量计算）
+
+        Returns:
+            统计字典
+        """
+        connections = list(self.connections)
+        messages = sum(c.ws_message_count for c in connections)
+        fills = sum(c.fills_received_count for c in connections)
+        now = self.clock.monotonic()
+        if self.last_totals and now - self.last_totals[0] > 0:
+            elapsed = now - self.last_totals[0]
+            self.rates = (max(messages - self.last_totals[1], 0) / elapsed, max(fills - self.last_totals[2], 0) / elapsed)
+        self.last_totals = (now, messages, fills)
+        rejected = len(self._rejected())
+        overflow = len(self.overflow)
+        return {
+            'addresses': len(self.owned) - rejected,  # 实际监控的地址（不含订阅被拒绝和超出容量的地址）
+            'owned': len(self.owned) + overflow,
+            'rejected': rejected,
+            'overflow': overflow,
+            'capacity': self.capacity,
+            'egress': len(self.source_addresses),
+            'connections': len(connections),
+            'connected': sum(1 for c in connections if c.ws_connected),
+            'messages': messages,
+            'fills': fills,
+            'messages_per_second': round(self.rates[0], 2),
+            'fills_per_second': round(self.rates[1], 3),
+            'signals': sum(c.signals_count for c in connections),
+            'processed_fills': sum(c.processed_count() for c in connections),
+            'reconnects': sum(c.link.recycles for c in connections),
+            'rebalances': self.rebalance_count,
+            'takeovers': self.takeover_count,
+            'rejections': self.rejection_count,
+            'rss_mb': round(read_rss_mb(), 1),
+            'pid': os.getpid()
+        }
+
+    def start(self):
+        """立即认领一次地址，然后定期心跳"""
+        self.tick()
+        self.task = self.clock.call_every(self.heartbeat_interval, self._tick_safe, name='shard-heartbeat')
+        logger.info(f"🚀 [{self.worker_id}] 分片工作进程已启动: {len(self.owned)} 个地址, {len(self.connections)} 个连接, "
+                    f"{len(self.source_addresses)} 个出口IP (最多 {self.capacity} 个地址)")
+
+    def stop(self, leave: bool = True):
+        """
+        停止心跳并关闭所有连接
+
+        Args:
+            leave: 是否立即退出成员表（其他工作进程在下一次心跳时接管地址）
+        """
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        with self.lock:
+            if leave:
+                self.membership.leave()
+            for connection in self.connections:
+                connection.stop()
+            self.connections = []
+            self.owned = {}
+            self.overflow = []
+        logger.info(f"[{self.worker_id}] 分片工作进程已停止")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description='分片监控工具')
+    sub = parser.add_subparsers(dest='command', required=True)
+    status = sub.add_parser('status', help='各工作进程的地址数、连接数、吞吐量和内存')
+    status.add_argument('--db', default=None, help='成员表数据库路径（默认 SHARD_DB_PATH）')
+    plan = sub.add_parser('plan', help='预览地址分配')
+    plan.add_argument('--workers', required=True, help='工作进程名称，逗号分隔')
+    plan.add_argument('--addresses', default=None, help='地址列表文件（默认 SHARD_ADDRESSES_FILE）')
+    plan.add_argument('--ips', default=None,
+                      help='各工作进程的出口IP数，逗号分隔，与 --workers 一一对应（默认按 SHARD_SOURCE_ADDRESSES）')
+    args = parser.parse_args(argv)
+
+    if args.command == 'status':
+        db = args.db
+        if db is None:
+            from config import SHARD_DB_PATH
+            db = SHARD_DB_PATH
+        members = read_members(db)
+        if not members:
+            print(f"成员表中没有工作进程: {db}")
+            return 1
+        for line in format_members(members):
+            print(line)
+        return 0
+
+    path = args.addresses
+    if path is None:
+        from config import SHARD_ADDRESSES_FILE
+        path = SHARD_ADDRESSES_FILE
+    addresses = load_addresses(path)
+    workers = args.workers.split(',')
+    if args.ips is None:
+        from config import SHARD_SOURCE_ADDRESSES
+        weights = egress_weights(workers, SHARD_SOURCE_ADDRESSES)
+    else:
+        weights = dict(zip(workers, (max(int(count), 1) for count in args.ips.split(','))))
+    assignment = HashRing(workers, weights=weights).assign(addresses)
+    for worker, assigned in sorted(assignment.items()):
+        capacity = weights.get(worker, 1) * HYPERLIQUID_MAX_USERS_PER_IP
+        print(f"{worker}: {len(assigned)} 个地址 ({len(assigned) / max(len(addresses), 1):.1%}), "
+              f"出口IP容量 {capacity}" + (f"，超出 {len(assigned) - capacity} 个" if len(assigned) > capacity else ""))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,83 @@
+"""
+共享状态文件模块
+多个进程（如热备的两个实例、开单状态管理工具）读写同一个JSON状态文件：
+读写时持有跨进程文件锁，写入时先写临时文件再原子替换
+"""
+import json
+import os
+import fcntl
+import logging
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SharedStateFile:
+    """多个实例共享的JSON状态文件（文件锁 + 原子替换）"""
+
+    def __init__(self, path: str):
+        """
+        初始化共享状态文件
+
+        Args:
+            path: JSON文件路径，锁文件为 path + '.lock'
+        """
+        self.path = path
+        self.lock_path = f"{path}.lock"
+        self.loaded_signature = None
+
+    @contextmanager
+    def locked(self):
+        """持有跨进程的排他文件锁"""
+        with open(self.lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _signature(self) -> Optional[tuple]:
+        """文件标识：每次原子替换都会生成新的 inode，修改时间精度不足时也能区分"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def changed(self) -> bool:
+        """
+        文件是否在上次读写之后被其他进程修改（只调用一次 stat）
+
+        Returns:
+            是否需要重新加载
+        """
+        return self._signature() != self.loaded_signature
+
+    def load(self) -> Optional[Dict]:
+        """
+        读取状态
+
+        Returns:
+            状态字典，文件不存在时返回None
+        """
+        with self.locked():
+            self.loaded_signature = self._signature()
+            if self.loaded_signature is None:
+                return None
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+
+    def save(self, state: Dict):
+        """
+        写入状态（先写临时文件再原子替换，读取方不会看到写了一半的文件）
+
+        Args:
+            state: 状态字典
+        """
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with self.locked():
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+            self.loaded_signature = self._signature()
@@ -0,0 +1,194 @@
+"""
+优雅退出模块
+收到退出信号后按顺序关闭，不在信号处理函数中直接退出：
+1. 停止接收：停止监控订阅、信号总线和配置热加载（调用方注册的停止函数，只设置标志和关闭连接，不阻塞）
+2. 排空：输出聚合器和合并窗口中尚未处理的信号，等待正在处理的信号（下单、写入开单状态、通知）完成，最多等待截止时间
+3. 刷新：保存开单状态、停止对账和订单簿、让出热备租约、等待通知发送完毕、输出剩余日志
+最后报告排空了多少信号、是否有超时未完成的处理，以及每个步骤的耗时
+"""
+import threading
+import time
+import logging
+from typing import Callable, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ShutdownCoordinator:
+    """退出协调器：停止接收 → 排空正在处理的信号 → 刷新状态"""
+
+    def __init__(self, drain_timeout: float = 10.0):
+        """
+        初始化退出协调器
+
+        Args:
+            drain_timeout: 等待正在处理的信号完成的最长时间（秒）
+        """
+        self.drain_timeout = drain_timeout
+        self.stop_steps: List[Tuple[str, Callable]] = []
+        self.drain_steps: List[Tuple[str, Callable]] = []
+        self.flush_steps: List[Tuple[str, Callable]] = []
+
+        self.condition = threading.Condition()
+        self.in_flight = 0
+        self.stopping = False  # 已请求退出（停止接收）
+        self.closed = False  # 排空结束，之后到达的信号不再处理
+        self.reason = None
+        self.requested_at = None
+        self.drained = False
+
+        # 统计信息
+        self.in_flight_at_stop = 0  # 请求退出时正在处理的信号批次
+        self.started_after_stop = 0  # 请求退出后开始处理的信号批次（停止接收前已在缓冲中）
+        self.abandoned = 0  # 截止时间到达时仍在处理的批次
+        self.rejected = 0  # 排空结束后到达、未处理的批次
+        self.step_times: Dict[str, float] = {}
+
+    def on_stop(self, name: str, func: Callable):
+        """注册停止接收的函数（在请求退出时立即调用，不能阻塞）"""
+        self.stop_steps.append((name, func))
+
+    def on_drain(self, name: str, func: Callable):
+        """注册排空函数（输出缓冲中的信号，在等待正在处理的信号之前调用）"""
+        self.drain_steps.append((name, func))
+
+    def on_flush(self, name: str, func: Callable):
+        """注册刷新函数（正在处理的信号完成后按注册顺序调用）"""
+        self.flush_steps.append((name, func))
+
+    def begin(self) -> bool:
+        """
+        开始处理一批信号
+
+        Returns:
+            是否可以处理；排空结束后返回False
+        """
+        with self.condition:
+            if self.closed:
+                self.rejected += 1
+                return False
+            self.in_flight += 1
+            if self.stopping:
+                self.started_after_stop += 1
+            return True
+
+    def end(self):
+        """一批信号处理完成"""
+        with self.condition:
+            self.in_flight -= 1
+            if self.in_flight == 0:
+                self.condition.notify_all()
+
+    def _run_step(self, name: str, func: Callable):
+        """执行一个步骤并记录耗时，步骤出错不影响后续步骤"""
+        started = time.perf_counter()
+        try:
+            func()
+        except Exception as e:
+            logger.error(f"退出步骤 {name} 出错: {e}", exc_info=True)
+        self.step_times[name] = time.perf_counter() - started
+
+    def request(self, reason: str) -> bool:
+        """
+        请求退出：停止接收新信号（可在信号处理函数中调用）
+
+        Args:
+            reason: 退出原因
+
+        Returns:
+            是否为第一次请求
+        """
+        with self.condition:
+            if self.stopping:
+                return False
+            self.stopping = True
+            self.in_flight_at_stop = self.in_flight
+            self.reason = reason
+            self.requested_at = time.monotonic()
+        logger.warning(f"🛑 开始退出 ({reason})：停止接收新信号")
+        for name, func in self.stop_steps:
+            self._run_step(name, func)
+        return True
+
+    def wait_idle(self, timeout: float) -> bool:
+        """
+        等待正在处理的信号完成
+
+        Args:
+            timeout: 最长等待时间（秒）
+
+        Returns:
+            是否全部完成
+        """
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while self.in_flight > 0:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+        return True
+
+    def drain(self) -> Dict:
+        """
+        排空并刷新（在主线程中调用一次，重复调用直接返回）
+
+        Returns:
+            退出报告
+        """
+        self.request('主循环结束')
+        with self.condition:
+            if self.drained:
+                return self.summary()
+            self.drained = True
+
+        for name, func in self.drain_steps:
+            self._run_step(name, func)
+
+        started = time.perf_counter()
+        if self.in_flight:
+            logger.info(f"⏳ 等待 {self.in_flight} 批正在处理的信号完成（最多 {self.drain_timeout} 秒）...")
+        idle = self.wait_idle(self.drain_timeout)
+        with self.condition:
+            self.closed = True
+            if not idle:
+                self.abandoned = self.in_flight
+        self.step_times['等待处理中的信号'] = time.perf_counter() - started
+        if not idle:
+            logger.error(f"❌ 超过 {self.drain_timeout} 秒仍有 {self.abandoned} 批信号未处理完，开单状态可能未保存")
+
+        for name, func in self.flush_steps:
+            self._run_step(name, func)
+
+        for line in self.report():
+            logger.info(line)
+        return self.summary()
+
+    def summary(self) -> Dict:
+        """退出统计"""
+        elapsed = time.monotonic() - self.requested_at if self.requested_at else 0.0
+        return {
+            'reason': self.reason,
+            'elapsed': elapsed,
+            'drained': self.in_flight_at_stop + self.started_after_stop - self.abandoned,
+            'abandoned': self.abandoned,
+            'rejected': self.rejected,
+            'steps': dict(self.step_times)
+        }
+
+    def report(self) -> List[str]:
+        """
+        生成退出报告
+
+        Returns:
+            报告行列表
+        """
+        summary = self.summary()
+        status = '✅' if not summary['abandoned'] else '⚠️'
+        lines = [
+            f"{status} 退出完成 ({summary['reason']})，耗时 {summary['elapsed']:.2f}秒: "
+            f"排空 {summary['drained']} 批信号, 超时未完成 {summary['abandoned']} 批, 退出后到达 {summary['rejected']} 批"
+        ]
+        slow = sorted(summary['steps'].items(), key=lambda item: item[1], reverse=True)
+        lines.append("退出步骤耗时: " + ', '.join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in slow))
+        return lines
@@ -0,0 +1,72 @@
+"""
+信号批处理模块
+将同一帧或短时间窗口内的多个平仓信号合并为一批，便于批量下单
+"""
+import logging
+import threading
+from typing import Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+
+class SignalBatcher:
+    """平仓信号批处理类"""
+
+    def __init__(self, handler: Callable[[List[Dict]], None], window_ms: int = 0):
+        """
+        初始化信号批处理器
+
+        Args:
+            handler: 批量信号处理函数，参数为信号列表
+            window_ms: 合并窗口（毫秒），0表示只合并同一帧内的信号，立即处理
+        """
+        self.handler = handler
+        self.window = window_ms / 1000.0
+        self.pending = []
+        self.timer = None
+        self.lock = threading.Lock()
+        self.batch_count = 0
+
+    def add(self, positions: List[Dict]):
+        """
+        加入一批信号
+
+        Args:
+            positions: 平仓信号列表（通常来自同一帧）
+        """
+        if not positions:
+            return
+
+        if self.window <= 0:
+            self._dispatch(list(positions))
+            return
+
+        with self.lock:
+            self.pending.extend(positions)
+            # 窗口从第一条信号开始计时，后续信号不延长窗口
+            if self.timer is None:
+                self.timer = threading.Timer(self.window, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self):
+        """立即处理当前窗口内的所有信号"""
+        with self.lock:
+            positions = self.pending
+            self.pending = []
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+
+        if positions:
+            self._dispatch(positions)
+
+    def _dispatch(self, positions: List[Dict]):
+        """调用处理函数"""
+        self.batch_count += 1
+        if len(positions) > 1:
+            logger.info(f"📦 合并 {len(positions)} 个平仓信号为一批: {', '.join(p['coin'] for p in positions)}")
+        try:
+            self.handler(positions)
+        except Exception as e:
+            logger.error(f"处理批量信号时发生错误: {e}", exc_info=True)
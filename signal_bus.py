@@ -0,0 +1,373 @@
+"""
+本地信号总线模块
+监控进程通过 Unix 域套接字向一个或多个下单进程广播平仓信号，下单进程收到后回复确认
+
+帧格式: 帧头 (负载长度 uint32, 帧类型 uint8, 序号 uint64) + 负载
+信号负载: 信号数量 uint8，每个信号为定长数值字段 + 若干 uint8 长度前缀的 UTF-8 字符串
+"""
+import math
+import os
+import socket
+import struct
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from signal_rules import CloseSignal
+
+logger = logging.getLogger(__name__)
+
+FRAME_HEADER = struct.Struct('!IBQ')
+FRAME_SIGNALS = 1
+FRAME_ACK = 2
+
+# 标志位, oid, 时间戳, 数量, 价格, 已实现盈亏, 成交前持仓, 平仓比例
+SIGNAL_FIELDS = struct.Struct('!BqQddddd')
+FLAG_HAS_OID = 0x01
+FLAG_INT_FILL_ID = 0x02
+SIGNAL_STRINGS = ('coin', 'fill_id', 'dir', 'channel', 'address', 'trace_id')
+
+MAX_SIGNALS_PER_FRAME = 255
+ACK_TIMEOUT = 1.0  # 超过该秒数未确认的帧记录警告
+RECENT_FILL_IDS = 10000  # 下单进程去重保留的成交ID数量
+
+
+def encode_signals(signals: List[Dict]) -> bytes:
+    """
+    将平仓信号编码为信号负载
+
+    Args:
+        signals: 平仓信号列表（最多255个）
+
+    Returns:
+        负载字节串
+    """
+    parts = [struct.pack('!B', len(signals))]
+    for signal in signals:
+        oid = signal.get('oid')
+        fill_id = signal.get('fill_id', '')
+        flags = (FLAG_HAS_OID if oid is not None else 0) | (FLAG_INT_FILL_ID if isinstance(fill_id, int) else 0)
+        parts.append(SIGNAL_FIELDS.pack(
+            flags,
+            int(oid) if oid is not None else 0,
+            int(signal.get('timestamp', 0)),
+            signal['size'],
+            signal['price'],
+            math.nan if signal['closed_pnl'] is None else signal['closed_pnl'],  # 盈亏未知编码为NaN
+            signal.get('start_position', 0.0),
+            signal.get('close_fraction', 0.0)
+        ))
+        for key in SIGNAL_STRINGS:
+            value = str(signal.get(key) or '').encode('utf-8')[:255]
+            parts.append(struct.pack('!B', len(value)))
+            parts.append(value)
+    return b''.join(parts)
+
+
+def decode_signals(payload: bytes) -> List[CloseSignal]:
+    """
+    解码信号负载
+
+    Args:
+        payload: 负载字节串
+
+    Returns:
+        平仓信号列表
+    """
+    count = payload[0]
+    offset = 1
+    signals = []
+    for _ in range(count):
+        flags, oid, timestamp, size, price, closed_pnl, start_position, close_fraction = \
+            SIGNAL_FIELDS.unpack_from(payload, offset)
+        offset += SIGNAL_FIELDS.size
+
+        strings = {}
+        for key in SIGNAL_STRINGS:
+            length = payload[offset]
+            strings[key] = payload[offset + 1:offset + 1 + length].decode('utf-8')
+            offset += 1 + length
+
+        fill_id = strings['fill_id']
+        signal = CloseSignal(
+            fill_id=int(fill_id) if flags & FLAG_INT_FILL_ID else fill_id,
+            coin=strings['coin'],
+            size=size,
+            price=price,
+            closed_pnl=None if math.isnan(closed_pnl) else closed_pnl,
+            timestamp=timestamp,
+            start_position=start_position,
+            close_fraction=close_fraction,
+            oid=oid if flags & FLAG_HAS_OID else None,
+            dir=strings['dir'] or None,
+            address=strings['address']
+        )
+        if strings['channel']:
+            signal['channel'] = strings['channel']
+        if strings['trace_id']:
+            signal['trace_id'] = strings['trace_id']
+        signals.append(signal)
+    return signals
+
+
+def send_frame(sock: socket.socket, frame_type: int, seq: int, payload: bytes = b''):
+    """发送一帧"""
+    sock.sendall(FRAME_HEADER.pack(len(payload), frame_type, seq) + payload)
+
+
+def _recv_exact(sock: socket.socket, size: int) -> Optional[bytes]:
+    """读取指定长度的数据，连接关闭时返回None"""
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def recv_frame(sock: socket.socket) -> Optional[Tuple[int, int, bytes]]:
+    """
+    读取一帧
+
+    Returns:
+        (帧类型, 序号, 负载)，连接关闭时返回None
+    """
+    header = _recv_exact(sock, FRAME_HEADER.size)
+    if header is None:
+        return None
+    length, frame_type, seq = FRAME_HEADER.unpack(header)
+    payload = _recv_exact(sock, length) if length else b''
+    if payload is None:
+        return None
+    return frame_type, seq, payload
+
+
+class SignalBusServer:
+    """信号总线服务端（运行在监控进程中）"""
+
+    def __init__(self, path: str):
+        """
+        初始化信号总线服务端
+
+        Args:
+            path: Unix 域套接字路径
+        """
+        self.path = path
+        self.server = None
+        self.subscribers = {}  # 套接字 -> {'name', 'pending': {序号: 发送时间}}
+        self.lock = threading.Lock()
+        self.seq = 0
+        self.running = False
+
+        # 统计信息
+        self.frames_sent = 0
+        self.acks_received = 0
+        self.ack_latency_ms = 0.0  # 最近一次确认延迟
+
+    def start(self):
+        """监听套接字并在后台接受下单进程的连接"""
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(self.path)
+        self.server.listen()
+        self.running = True
+
+        thread = threading.Thread(target=self._accept_worker)
+        thread.daemon = True
+        thread.start()
+        logger.info(f"✅ 信号总线已启动: {self.path}")
+
+    def _accept_worker(self):
+        """接受下单进程连接"""
+        count = 0
+        while self.running:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                break
+            count += 1
+            name = f"executor-{count}"
+            with self.lock:
+                self.subscribers[conn] = {'name': name, 'pending': {}}
+            logger.info(f"🔗 下单进程已连接: {name}")
+
+            thread = threading.Thread(target=self._ack_worker, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    def _ack_worker(self, conn: socket.socket):
+        """读取某个下单进程的确认帧"""
+        try:
+            while self.running:
+                frame = recv_frame(conn)
+                if frame is None:
+                    break
+                frame_type, seq, _ = frame
+                if frame_type != FRAME_ACK:
+                    continue
+                with self.lock:
+                    subscriber = self.subscribers.get(conn)
+                    sent_at = subscriber['pending'].pop(seq, None) if subscriber else None
+                if sent_at is not None:
+                    self.acks_received += 1
+                    self.ack_latency_ms = (time.monotonic() - sent_at) * 1000
+        except OSError:
+            pass
+        self._drop(conn)
+
+    def _drop(self, conn: socket.socket):
+        """移除断开的下单进程"""
+        with self.lock:
+            subscriber = self.subscribers.pop(conn, None)
+        if subscriber:
+            logger.warning(f"⚠️  下单进程已断开: {subscriber['name']} (未确认帧: {len(subscriber['pending'])})")
+        try:
+            conn.close()
+        except OSError:
+            pass
+
+    def publish(self, signals: List[Dict]):
+        """
+        向所有下单进程广播平仓信号
+
+        Args:
+            signals: 平仓信号列表
+        """
+        if not signals:
+            return
+
+        for start in range(0, len(signals), MAX_SIGNALS_PER_FRAME):
+            payload = encode_signals(signals[start:start + MAX_SIGNALS_PER_FRAME])
+            with self.lock:
+                self.seq += 1
+                seq = self.seq
+                subscribers = list(self.subscribers.items())
+
+            if not subscribers:
+                logger.warning(f"⚠️  没有已连接的下单进程，信号未送达: {', '.join(s['coin'] for s in signals)}")
+                return
+
+            now = time.monotonic()
+            for conn, subscriber in subscribers:
+                self._check_pending(subscriber, now)
+                with self.lock:
+                    subscriber['pending'][seq] = now
+                try:
+                    send_frame(conn, FRAME_SIGNALS, seq, payload)
+                except OSError as e:
+                    logger.error(f"发送信号到 {subscriber['name']} 失败: {e}")
+                    self._drop(conn)
+            self.frames_sent += 1
+
+    def _check_pending(self, subscriber: Dict, now: float):
+        """记录超时未确认的帧"""
+        with self.lock:
+            expired = [seq for seq, sent_at in subscriber['pending'].items() if now - sent_at > ACK_TIMEOUT]
+            for seq in expired:
+                del subscriber['pending'][seq]
+        if expired:
+            logger.warning(f"⚠️  {subscriber['name']} 有 {len(expired)} 帧信号超时未确认")
+
+    def stop(self):
+        """关闭信号总线"""
+        self.running = False
+        if self.server:
+            self.server.close()
+        with self.lock:
+            conns = list(self.subscribers)
+        for conn in conns:
+            self._drop(conn)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class SignalBusClient:
+    """信号总线客户端（运行在下单进程中），可同时订阅多个监控进程"""
+
+    def __init__(self, paths: List[str], handler: Callable[[List[Dict]], None]):
+        """
+        初始化信号总线客户端
+
+        Args:
+            paths: 监控进程的 Unix 域套接字路径列表
+            handler: 平仓信号处理函数，参数为信号列表
+        """
+        self.paths = paths
+        self.handler = handler
+        self.recent_fill_ids = OrderedDict()  # 多个监控进程推送同一成交时去重
+        self.lock = threading.Lock()
+        self.running = False
+
+        # 统计信息
+        self.frames_received = 0
+        self.duplicates_dropped = 0
+
+    def _dedupe(self, signals: List[Dict]) -> List[Dict]:
+        """过滤已从其他监控进程收到的成交"""
+        fresh = []
+        with self.lock:
+            for signal in signals:
+                key = (signal['address'], signal['fill_id'])
+                if key in self.recent_fill_ids:
+                    self.duplicates_dropped += 1
+                    continue
+                self.recent_fill_ids[key] = True
+                if len(self.recent_fill_ids) > RECENT_FILL_IDS:
+                    self.recent_fill_ids.popitem(last=False)
+                fresh.append(signal)
+        return fresh
+
+    def _subscribe(self, path: str):
+        """连接某个监控进程并持续接收信号，断开后自动重连"""
+        retry = 0
+        while self.running:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(path)
+                logger.info(f"✅ 已连接信号总线: {path}")
+                retry = 0
+                while self.running:
+                    frame = recv_frame(sock)
+                    if frame is None:
+                        break
+                    frame_type, seq, payload = frame
+                    if frame_type != FRAME_SIGNALS:
+                        continue
+                    # 收到即确认，确认延迟只反映总线传输耗时
+                    send_frame(sock, FRAME_ACK, seq)
+                    self.frames_received += 1
+                    signals = self._dedupe(decode_signals(payload))
+                    if signals:
+                        try:
+                            self.handler(signals)
+                        except Exception as e:
+                            logger.error(f"处理总线信号时发生错误: {e}", exc_info=True)
+                logger.warning(f"⚠️  信号总线连接已断开: {path}")
+            except OSError as e:
+                if retry == 0:
+                    logger.warning(f"⚠️  无法连接信号总线 {path}: {e}，等待监控进程启动...")
+            finally:
+                sock.close()
+
+            retry += 1
+            time.sleep(min(0.5 * retry, 5))
+
+    def run(self):
+        """订阅所有监控进程（阻塞直到 stop 被调用）"""
+        self.running = True
+        threads = []
+        for path in self.paths:
+            thread = threading.Thread(target=self._subscribe, args=(path,))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        while self.running:
+            time.sleep(1)
+
+    def stop(self):
+        """停止订阅"""
+        self.running = False
@@ -0,0 +1,177 @@
+"""
+多通道信号竞速模块
+同一地址同时订阅 userFills / userEvents / orderUpdates，各通道的数据统一转换为成交格式，
+按订单ID去重，由最先到达的通道触发，并记录获胜通道及领先时间
+"""
+import time
+import logging
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional
+
+from position_mirror import POSITION_EPSILON
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_USER_FILLS = 'userFills'
+CHANNEL_USER_EVENTS = 'userEvents'
+CHANNEL_ORDER_UPDATES = 'orderUpdates'
+SIGNAL_CHANNELS = (CHANNEL_USER_FILLS, CHANNEL_USER_EVENTS, CHANNEL_ORDER_UPDATES)
+
+# 订阅类型 -> 推送消息中的 channel 字段
+CHANNEL_MESSAGE_NAMES = {
+    CHANNEL_USER_FILLS: 'userFills',
+    CHANNEL_USER_EVENTS: 'user',
+    CHANNEL_ORDER_UPDATES: 'orderUpdates'
+}
+
+LEAD_SAMPLE_SIZE = 1000  # 每个通道保留的领先时间样本数
+
+
+def fill_direction(start_position: float, side: str, size: float) -> str:
+    """
+    根据成交前持仓和成交方向推断 dir 字段（与 userFills 的取值一致）
+
+    Args:
+        start_position: 成交前持仓（带方向）
+        side: 成交方向，'A' 卖出 / 'B' 买入
+        size: 成交数量
+
+    Returns:
+        方向描述，如 'Close Long'
+    """
+    if side == 'A':
+        if start_position > POSITION_EPSILON:
+            return 'Close Long' if start_position - size >= -POSITION_EPSILON else 'Long > Short'
+        return 'Open Short'
+    if start_position < -POSITION_EPSILON:
+        return 'Close Short' if start_position + size <= POSITION_EPSILON else 'Short > Long'
+    return 'Open Long'
+
+
+def order_update_to_fill(update: Dict, mirror) -> Optional[Dict]:
+    """
+    将一条 orderUpdates 推送转换为成交格式
+
+    订单推送不含成交价和已实现盈亏，成交前持仓取自持仓镜像，价格使用订单限价；
+    市价和IOC订单的限价是滑点上限而不是成交价，无法据此计算盈亏，已实现盈亏记为未知（None），
+    规则引擎对未知盈亏跳过 pnl_sign 条件
+
+    Args:
+        update: orderUpdates 中的一条订单状态
+        mirror: 监控地址的持仓镜像
+
+    Returns:
+        成交格式的字典，订单未完全成交时返回None
+    """
+    if update.get('status') != 'filled':
+        return None
+
+    order = update.get('order', {})
+    coin = order.get('coin')
+    oid = order.get('oid')
+    if not coin or oid is None:
+        return None
+
+    size = float(order.get('origSz') or order.get('sz') or 0)
+    price = float(order.get('limitPx') or 0)
+    side = order.get('side', '')
+    start_position = mirror.get_position_size(coin)
+
+    return {
+        'tid': f"order-{oid}",
+        'oid': oid,
+        'coin': coin,
+        'side': side,
+        'sz': str(size),
+        'px': str(price),
+        'closedPnl': None,
+        'startPosition': str(start_position),
+        'dir': fill_direction(start_position, side, size),
+        'time': update.get('statusTimestamp') or order.get('timestamp', 0)
+    }
+
+
+class SignalRace:
+    """按订单ID记录各通道到达顺序的类"""
+
+    def __init__(self, max_orders: int = 1000):
+        """
+        初始化信号竞速记录
+
+        Args:
+            max_orders: 最多保留的订单数量
+        """
+        self.max_orders = max_orders
+        self.orders = OrderedDict()  # oid -> {'winner', 'time', 'seen'}
+        self.lock = threading.Lock()
+
+        # 统计信息
+        self.wins = {}  # 通道 -> 获胜次数
+        self.leads = {}  # 获胜通道 -> 领先时间样本（毫秒）
+
+    def arrive(self, channel: str, oid) -> bool:
+        """
+        记录某通道收到某订单的数据
+
+        Args:
+            channel: 通道名称
+            oid: 订单ID
+
+        Returns:
+            是否由该通道处理（最先到达的通道，或同一通道后续的部分成交）
+        """
+        if oid is None:
+            return True
+
+        now = time.monotonic()
+        with self.lock:
+            entry = self.orders.get(oid)
+            if entry is None:
+                self.orders[oid] = {'winner': channel, 'time': now, 'seen': {channel}}
+                self.wins[channel] = self.wins.get(channel, 0) + 1
+                while len(self.orders) > self.max_orders:
+                    self.orders.popitem(last=False)
+                return True
+
+            if entry['winner'] == channel:
+                return True
+
+            if channel not in entry['seen']:
+                entry['seen'].add(channel)
+                lead_ms = (now - entry['time']) * 1000
+                self.leads.setdefault(entry['winner'], deque(maxlen=LEAD_SAMPLE_SIZE)).append(lead_ms)
+                logger.debug(f"🏁 订单 {oid}: {entry['winner']} 领先 {channel} {lead_ms:.1f}ms")
+            return False
+
+    def winner(self, oid) -> Optional[str]:
+        """
+        获取某订单的获胜通道
+
+        Args:
+            oid: 订单ID
+
+        Returns:
+            通道名称，未记录时返回None
+        """
+        with self.lock:
+            entry = self.orders.get(oid)
+            return entry['winner'] if entry else None
+
+    def summary(self) -> List[str]:
+        """
+        获取各通道的获胜次数和领先时间统计
+
+        Returns:
+            每个通道一行的统计描述
+        """
+        lines = []
+        with self.lock:
+            for channel, wins in sorted(self.wins.items(), key=lambda item: -item[1]):
+                samples = sorted(self.leads.get(channel, []))
+                if samples:
+                    median = samples[len(samples) // 2]
+                    lines.append(f"{channel}: 获胜 {wins} 次, 领先中位数 {median:.1f}ms, 最大 {samples[-1]:.1f}ms")
+                else:
+                    lines.append(f"{channel}: 获胜 {wins} 次")
+        return lines
@@ -0,0 +1,215 @@
+"""
+信号规则引擎模块
+将配置中的平仓信号规则编译为直接作用于原始成交字典的判断函数，
+HTTP轮询和WebSocket两种监控器共用同一套解析逻辑
+"""
+import logging
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+from position_mirror import WatchedAccountMirror
+
+logger = logging.getLogger(__name__)
+
+# 默认规则：ETH/BTC 的平多仓（包括多翻空），且有已实现盈亏
+DEFAULT_SIGNAL_RULES = {
+    'coins': ['ETH', 'BTC'],  # 币种集合，为空表示不限
+    'directions': ['Close Long', 'Long > Short'],  # 成交的 dir 字段，为空表示不限
+    'side': 'A',  # 成交方向，成交缺少 dir 字段时使用；为空表示不限
+    'min_size': 0,  # 最小成交数量
+    'min_notional': 0,  # 最小成交金额（数量 × 价格）
+    'pnl_sign': 'nonzero',  # 已实现盈亏符号: 'any' / 'nonzero' / 'positive' / 'negative'（盈亏未知的成交不检查）
+    'address_overrides': {}  # 地址 -> 覆盖的规则字段
+}
+
+PNL_SIGN_CONDITIONS = {
+    'any': None,
+    'nonzero': 'pnl != 0.0',
+    'positive': 'pnl > 0.0',
+    'negative': 'pnl < 0.0'
+}
+
+
+class CloseSignal(dict):
+    """平仓信号字典，'datetime' 字段在首次读取时才格式化"""
+
+    def __missing__(self, key):
+        if key == 'datetime':
+            value = datetime.fromtimestamp(self['timestamp'] / 1000).strftime('%Y-%m-%d %H:%M:%S')
+            self['datetime'] = value
+            return value
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        if key == 'datetime' and 'datetime' not in self:
+            return self[key]
+        return super().get(key, default)
+
+
+def compile_rule(rule: Dict) -> Callable[[Dict], bool]:
+    """
+    将一条规则编译为判断函数
+
+    按开销从低到高排列判断条件（集合查找 → 字符串比较 → 浮点解析），
+    未配置的条件不会出现在生成的函数中
+
+    Args:
+        rule: 规则字典（字段见 DEFAULT_SIGNAL_RULES）
+
+    Returns:
+        判断函数，参数为原始成交字典
+    """
+    pnl_sign = rule.get('pnl_sign', 'nonzero')
+    if pnl_sign not in PNL_SIGN_CONDITIONS:
+        raise ValueError(f"无效的 pnl_sign: {pnl_sign}")
+
+    namespace = {}
+    lines = ['def predicate(fill):']
+
+    coins = rule.get('coins')
+    if coins:
+        namespace['coins'] = frozenset(c.upper() for c in coins)
+        lines.append("    coin = fill.get('coin', '')")
+        lines.append("    if coin not in coins and coin.upper() not in coins: return False")
+
+    directions = rule.get('directions')
+    side = rule.get('side')
+    if directions:
+        namespace['directions'] = frozenset(directions)
+        namespace['side'] = side
+        if side:
+            lines.append("    direction = fill.get('dir')")
+            lines.append("    if direction is None:")
+            lines.append("        if fill.get('side') != side: return False")
+            lines.append("    elif direction not in directions: return False")
+        else:
+            lines.append("    if fill.get('dir') not in directions: return False")
+    elif side:
+        namespace['side'] = side
+        lines.append("    if fill.get('side') != side: return False")
+
+    pnl_condition = PNL_SIGN_CONDITIONS[pnl_sign]
+    if pnl_condition:
+        # closedPnl 为 None 表示盈亏未知（由订单推送转换的成交），不检查盈亏条件
+        lines.append("    pnl = fill.get('closedPnl', 0)")
+        lines.append("    if pnl is not None:")
+        lines.append("        pnl = float(pnl or 0)")
+        lines.append(f"        if not ({pnl_condition}): return False")
+
+    min_size = float(rule.get('min_size') or 0)
+    min_notional = float(rule.get('min_notional') or 0)
+    if min_size > 0 or min_notional > 0:
+        namespace['min_size'] = min_size
+        namespace['min_notional'] = min_notional
+        lines.append("    size = float(fill.get('sz') or 0)")
+        if min_size > 0:
+            lines.append("    if size < min_size: return False")
+        if min_notional > 0:
+            lines.append("    if size * float(fill.get('px') or 0) < min_notional: return False")
+
+    lines.append("    return True")
+    exec(compile('\n'.join(lines), '<signal_rule>', 'exec'), namespace)
+    return namespace['predicate']
+
+
+class SignalRuleEngine:
+    """平仓信号规则引擎"""
+
+    def __init__(self, rules: Optional[Dict] = None):
+        """
+        初始化规则引擎，编译默认规则和每个地址的覆盖规则
+
+        Args:
+            rules: 规则配置（字段见 DEFAULT_SIGNAL_RULES），缺省字段使用默认值
+        """
+        base = dict(DEFAULT_SIGNAL_RULES)
+        base.update(rules or {})
+        overrides = base.pop('address_overrides', None) or {}
+
+        self.default_predicate = compile_rule(base)
+        self.address_predicates = {}
+        for address, override in overrides.items():
+            rule = dict(base)
+            rule.update(override)
+            self.address_predicates[address.lower()] = compile_rule(rule)
+
+        self.coins = base.get('coins')
+        logger.debug(f"信号规则已编译: 默认规则 + {len(self.address_predicates)} 个地址覆盖规则")
+
+    def predicate_for(self, address: str) -> Callable[[Dict], bool]:
+        """
+        获取某地址使用的判断函数
+
+        Args:
+            address: 监控地址
+
+        Returns:
+            判断函数
+        """
+        return self.address_predicates.get(address.lower(), self.default_predicate)
+
+    def parse_fills(self, fills: Iterable[Dict], address: str, processed_fills: Set) -> List[Dict]:
+        """
+        解析订单数据，识别平仓信号
+
+        只有通过规则的成交才会构造信号字典
+
+        Args:
+            fills: 原始订单列表
+            address: 成交所属的监控地址
+            processed_fills: 已处理的成交ID集合（会被更新）
+
+        Returns:
+            平仓信号列表
+        """
+        predicate = self.predicate_for(address)
+        signals = []
+
+        for fill in fills:
+            # 获取订单ID，避免重复处理
+            fill_id = fill.get('tid', '')
+            if fill_id in processed_fills:
+                continue
+
+            try:
+                if not predicate(fill):
+                    continue
+                signal = build_signal(fill, address)
+            except (TypeError, ValueError) as e:
+                logger.error(f"解析成交 {fill_id} 时发生错误: {e}")
+                continue
+
+            processed_fills.add(fill_id)
+            signals.append(signal)
+
+        return signals
+
+
+def build_signal(fill: Dict, address: str = '') -> CloseSignal:
+    """
+    由通过规则的原始成交构造平仓信号
+
+    Args:
+        fill: 原始成交字典
+        address: 成交所属的监控地址
+
+    Returns:
+        平仓信号
+    """
+    size = float(fill.get('sz', 0))
+    start_position = float(fill.get('startPosition', 0))
+    closed_pnl = fill.get('closedPnl', 0)
+    return CloseSignal(
+        fill_id=fill.get('tid', ''),
+        coin=fill.get('coin', '').upper(),
+        size=size,
+        price=float(fill.get('px', 0)),
+        closed_pnl=None if closed_pnl is None else float(closed_pnl or 0),  # None 表示盈亏未知
+        timestamp=fill.get('time', 0),
+        start_position=start_position,
+        close_fraction=WatchedAccountMirror.close_fraction(start_position, start_position - size),
+        oid=fill.get('oid'),
+        hash=fill.get('hash'),
+        dir=fill.get('dir'),
+        address=address
+    )
@@ -0,0 +1,217 @@
+"""
+热备模块
+同一台机器上的两个实例都保持监控订阅和下单准备，只有持有租约的主实例下单：
+- 租约保存在 SQLite 中，主实例定期续约，停止续约（崩溃、卡死或主动退出）超过有效期后备用实例接管
+- 主实例只在本地计算的租约有效期内下单，本地有效期（单调时钟）比数据库中的到期时间（墙上时钟）提前一个安全余量；
+  墙上时钟向前跳变超过安全余量时备用实例可能提前接管，因此下单前还会在数据库中确认持有者和纪元未变（fencing），
+  接管后原主实例不会再下单（确认与发出订单之间仍有一次数据库读取耗时的窗口）
+- 开单状态文件由两个实例共享（见 shared_state.py）
+"""
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+import logging
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+LEASE_NAME = 'executor'
+
+
+class LeaseManager:
+    """基于 SQLite 行和心跳的租约（主实例选举）"""
+
+    def __init__(self, path: str, ttl: float = 0.6, heartbeat_interval: float = 0.1,
+                 safety_margin: Optional[float] = None, holder_id: Optional[str] = None,
+                 health_check: Optional[Callable[[], bool]] = None,
+                 on_promote: Optional[Callable[[int], None]] = None,
+                 on_demote: Optional[Callable[[], None]] = None):
+        """
+        初始化租约管理器
+
+        Args:
+            path: SQLite 数据库路径（两个实例必须相同）
+            ttl: 租约有效期（秒）
+            heartbeat_interval: 续约/抢占的间隔（秒），应明显小于 ttl
+            safety_margin: 本地有效期相对数据库到期时间提前的秒数，默认 ttl 的四分之一
+            holder_id: 实例标识，默认 主机名:进程号:随机串
+            health_check: 健康检查函数（可选），返回False时主实例主动让出租约，备用实例不抢占
+            on_promote: 成为主实例时的回调，参数为租约纪元（每次易主加1）
+            on_demote: 失去主实例身份时的回调
+        """
+        self.path = path
+        self.ttl = ttl
+        self.heartbeat_interval = heartbeat_interval
+        self.safety_margin = ttl / 4 if safety_margin is None else safety_margin
+        self.holder_id = holder_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.health_check = health_check
+        self.on_promote = on_promote
+        self.on_demote = on_demote
+
+        self.valid_until = 0.0  # 本地单调时钟下的有效期
+        self.epoch = 0
+        self.leader = False
+        self.running = False
+        self.thread = None
+
+        # 统计信息
+        self.promote_count = 0
+        self.renew_errors = 0
+
+        self.conn = sqlite3.connect(path, timeout=ttl, isolation_level=None, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS lease ('
+            'name TEXT PRIMARY KEY, holder TEXT, expires REAL, epoch INTEGER, heartbeat REAL)'
+        )
+        # 下单前确认租约使用独立的只读连接，不与心跳线程的写事务共用
+        self.read_conn = sqlite3.connect(path, timeout=ttl, isolation_level=None, check_same_thread=False)
+
+    def is_leader(self) -> bool:
+        """
+        当前是否可以下单（只比较本地时钟，不访问数据库，可在下单热路径上调用）
+
+        Returns:
+            是否持有未过期的租约
+        """
+        return self.leader and time.monotonic() < self.valid_until
+
+    def confirm_leader(self) -> bool:
+        """
+        下单前确认仍持有租约：本地有效期未过，且数据库中的持有者和纪元仍是本实例
+        （墙上时钟跳变导致备用实例提前接管时，原主实例在这里发现并放弃下单）
+
+        Returns:
+            是否可以下单
+        """
+        if not self.is_leader():
+            return False
+        try:
+            row = self.read_conn.execute(
+                'SELECT holder, epoch FROM lease WHERE name = ?', (LEASE_NAME,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"确认租约失败: {e}")
+            return False
+        if row is None or row[0] != self.holder_id or row[1] != self.epoch:
+            logger.warning(f"⚠️ 租约已被其他实例持有 ({row[0] if row else '无'}, 纪元 {row[1] if row else 0})，放弃下单")
+            return False
+        return True
+
+    def try_acquire(self) -> bool:
+        """
+        续约或在租约过期后抢占
+
+        Returns:
+            是否持有租约
+        """
+        started = time.monotonic()
+        now = time.time()
+        try:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = self.conn.execute(
+                    'SELECT holder, expires, epoch FROM lease WHERE name = ?', (LEASE_NAME,)
+                ).fetchone()
+                if row is None:
+                    epoch = 1
+                    self.conn.execute(
+                        'INSERT INTO lease (name, holder, expires, epoch, heartbeat) VALUES (?, ?, ?, ?, ?)',
+                        (LEASE_NAME, self.holder_id, now + self.ttl, epoch, now)
+                    )
+                elif row[0] == self.holder_id or row[1] < now:
+                    epoch = row[2] if row[0] == self.holder_id else row[2] + 1
+                    self.conn.execute(
+                        'UPDATE lease SET holder = ?, expires = ?, epoch = ?, heartbeat = ? WHERE name = ?',
+                        (self.holder_id, now + self.ttl, epoch, now, LEASE_NAME)
+                    )
+                else:
+                    self.conn.execute('COMMIT')
+                    return False
+                self.conn.execute('COMMIT')
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+        except sqlite3.Error as e:
+            self.renew_errors += 1
+            logger.error(f"租约续约失败: {e}")
+            return False
+
+        # 以开始续约的时刻计算，数据库写入耗时不会延长本地有效期
+        self.valid_until = started + self.ttl - self.safety_margin
+        self.epoch = epoch
+        return True
+
+    def release(self):
+        """主动让出租约（正常退出或健康检查失败时），备用实例在下一次心跳时接管"""
+        self.leader = False
+        self.valid_until = 0.0
+        try:
+            self.conn.execute(
+                'UPDATE lease SET expires = 0 WHERE name = ? AND holder = ?', (LEASE_NAME, self.holder_id)
+            )
+        except sqlite3.Error as e:
+            logger.error(f"释放租约失败: {e}")
+
+    def current_holder(self) -> Optional[Dict]:
+        """当前租约持有者（用于显示）"""
+        row = self.conn.execute(
+            'SELECT holder, expires, epoch, heartbeat FROM lease WHERE name = ?', (LEASE_NAME,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {'holder': row[0], 'expires': row[1], 'epoch': row[2], 'heartbeat': row[3]}
+
+    def tick(self):
+        """执行一次心跳：按健康状态续约、抢占或让出，并在身份变化时回调"""
+        healthy = self.health_check() if self.health_check else True
+        was_leader = self.leader
+        if healthy:
+            self.leader = self.try_acquire()
+        elif was_leader:
+            logger.warning("⚠️ 健康检查失败，让出主实例租约")
+            self.release()
+
+        if self.leader and not was_leader:
+            self.promote_count += 1
+            logger.warning(f"👑 成为主实例 ({self.holder_id}, 纪元 {self.epoch})")
+            if self.on_promote:
+                self.on_promote(self.epoch)
+        elif was_leader and not self.leader:
+            self.valid_until = 0.0
+            logger.warning(f"⏸️ 失去主实例租约，转为备用实例 ({self.holder_id})")
+            if self.on_demote:
+                self.on_demote()
+
+    def _worker(self):
+        while self.running:
+            try:
+                self.tick()
+            except Exception as e:
+                logger.error(f"租约心跳时发生错误: {e}", exc_info=True)
+            time.sleep(self.heartbeat_interval)
+
+    def start(self):
+        """立即尝试一次获取租约，然后在后台线程中定期心跳"""
+        self.running = True
+        self.tick()
+        if not self.leader:
+            holder = self.current_holder()
+            logger.info(f"⏸️ 以备用实例启动，当前主实例: {holder['holder'] if holder else '无'}")
+        self.thread = threading.Thread(target=self._worker, name='standby-lease', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """停止心跳，持有租约时主动让出"""
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=self.ttl + self.heartbeat_interval)
+        if self.leader:
+            self.release()
+            logger.info("已让出主实例租约")
+        self.conn.close()
+        self.read_conn.close()
@@ -0,0 +1,188 @@
+"""
+启动流程计时模块
+关键路径上的步骤同步执行并计时；信息查询和通知等非关键步骤在后台并发执行，
+每个步骤有独立的时间预算，超时不阻塞其他步骤，全部完成后输出启动耗时汇总；
+较重的依赖通过 lazy_import 在首次使用时导入，并记录每个模块的导入耗时
+"""
+import sys
+import time
+import logging
+import importlib
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+STATUS_OK = '完成'
+STATUS_FAILED = '失败'
+STATUS_TIMEOUT = '超时'
+
+# 模块导入耗时 (模块名 -> 秒)
+_import_timings = {}
+_import_lock = threading.Lock()
+
+
+def record_import(name: str, elapsed: float):
+    """
+    记录一个模块的导入耗时
+
+    Args:
+        name: 模块名
+        elapsed: 导入耗时（秒）
+    """
+    with _import_lock:
+        _import_timings[name] = elapsed
+
+
+def lazy_import(module_name: str):
+    """
+    首次使用时导入模块并记录导入耗时（已导入的模块直接返回）
+
+    Args:
+        module_name: 模块名，如 'hyperliquid_monitor_ws'
+
+    Returns:
+        模块对象
+    """
+    module = sys.modules.get(module_name)
+    if module is not None:
+        return module
+    started = time.perf_counter()
+    module = importlib.import_module(module_name)
+    record_import(module_name, time.perf_counter() - started)
+    return module
+
+
+def import_report() -> List[str]:
+    """
+    获取模块导入耗时，按耗时从高到低排列
+
+    Returns:
+        每个模块一行的耗时描述
+    """
+    with _import_lock:
+        timings = sorted(_import_timings.items(), key=lambda item: item[1], reverse=True)
+    return [f"{elapsed * 1000:7.1f}ms  {name}" for name, elapsed in timings]
+
+
+class StartupTimer:
+    """启动步骤计时类"""
+
+    def __init__(self, default_budget: float = 10.0, max_workers: int = 4):
+        """
+        初始化启动计时器
+
+        Args:
+            default_budget: 后台步骤默认的时间预算（秒）
+            max_workers: 后台步骤的并发线程数
+        """
+        self.default_budget = default_budget
+        self.start_time = time.perf_counter()
+        self.timings = []  # (步骤名称, 是否后台, 开始偏移秒, 耗时秒, 状态)
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='startup')
+
+    def _record(self, name: str, background: bool, started: float, status: str):
+        """记录一个步骤的耗时"""
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            self.timings.append((name, background, started - self.start_time, elapsed, status))
+        return elapsed
+
+    @contextmanager
+    def measure(self, name: str, background: bool = False):
+        """
+        同步步骤计时
+
+        Args:
+            name: 步骤名称
+            background: 是否在后台启动流程中执行（只影响汇总中的标记）
+        """
+        started = time.perf_counter()
+        status = STATUS_FAILED
+        try:
+            yield
+            status = STATUS_OK
+        finally:
+            self._record(name, background, started, status)
+
+    def submit(self, name: str, func: Callable, *args, **kwargs) -> Future:
+        """
+        在后台执行一个步骤
+
+        Args:
+            name: 步骤名称
+            func: 步骤函数
+
+        Returns:
+            步骤的Future
+        """
+        def run():
+            started = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                self._record(name, True, started, STATUS_FAILED)
+                logger.error(f"启动步骤 [{name}] 失败: {e}")
+                return None
+            self._record(name, True, started, STATUS_OK)
+            return result
+
+        return self.executor.submit(run)
+
+    def wait(self, name: str, future: Future, budget: Optional[float] = None):
+        """
+        在时间预算内等待后台步骤完成
+
+        Args:
+            name: 步骤名称
+            future: submit 返回的Future
+            budget: 时间预算（秒），默认使用 default_budget
+
+        Returns:
+            步骤结果，失败或超出预算时返回None（超时的步骤仍在后台继续执行）
+        """
+        budget = self.default_budget if budget is None else budget
+        try:
+            return future.result(timeout=budget)
+        except FutureTimeoutError:
+            logger.warning(f"⚠️  启动步骤 [{name}] 超出时间预算 {budget}秒，跳过等待")
+            with self.lock:
+                self.timings.append((name, True, time.perf_counter() - self.start_time - budget, budget, STATUS_TIMEOUT))
+            return None
+
+    def run_in_background(self, func: Callable, *args):
+        """在独立线程中运行后台启动流程（不占用步骤线程池）"""
+        thread = threading.Thread(target=func, args=args, name='startup-background')
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def report(self) -> List[str]:
+        """
+        输出启动耗时汇总
+
+        Returns:
+            每个步骤一行的耗时描述
+        """
+        with self.lock:
+            timings = sorted(self.timings, key=lambda item: item[2])
+        lines = [
+            f"{'后台' if background else '同步'} +{offset * 1000:7.0f}ms  {elapsed * 1000:7.0f}ms  {status}  {name}"
+            for name, background, offset, elapsed, status in timings
+        ]
+        logger.info("⏱️  启动耗时汇总:")
+        for line in lines:
+            logger.info(f"  {line}")
+        imports = import_report()
+        if imports:
+            logger.info("📦 模块导入耗时:")
+            for line in imports:
+                logger.info(f"  {line}")
+        return lines
+
+    def shutdown(self):
+        """关闭步骤线程池（不等待超时仍在执行的步骤）"""
+        self.executor.shutdown(wait=False)
@@ -1,13 +1,16 @@
 """
 Telegram通知模块
 用于发送交易通知和系统状态消息
+python-telegram-bot 和 asyncio 只在启用通知并首次使用时导入，未启用时不增加启动耗时
 """
 import logging
-import asyncio
+import threading
+import time
 from typing import Optional
 from datetime import datetime
-from telegram import Bot
-from telegram.error import TelegramError
+
+import tracing
+from startup import lazy_import
 
 logger = logging.getLogger(__name__)
 
@@ -27,8 +30,11 @@ class TelegramNotifier:
         self.enabled = enabled
         self.chat_id = chat_id
         self.bot = None
+        self.telegram_error = ()  # 导入 telegram 后为 TelegramError，未导入时不匹配任何异常
         self.send_count = 0
         self.error_count = 0
+        self.sending = 0  # 正在发送的消息数（退出时等待发送完毕）
+        self.idle = threading.Condition()
         
         if not enabled:
             logger.info("Telegram通知已禁用")
@@ -45,7 +51,9 @@ class TelegramNotifier:
             return
         
         try:
-            self.bot = Bot(token=bot_token)
+            telegram = lazy_import('telegram')
+            self.telegram_error = lazy_import('telegram.error').TelegramError
+            self.bot = telegram.Bot(token=bot_token)
             logger.info("✅ Telegram通知器初始化成功")
         except Exception as e:
             logger.error(f"❌ Telegram通知器初始化失败: {e}")
@@ -71,7 +79,7 @@ class TelegramNotifier:
             self.send_count += 1
             logger.debug(f"Telegram消息发送成功 (总计: {self.send_count})")
             return True
-        except TelegramError as e:
+        except self.telegram_error as e:
             self.error_count += 1
             logger.error(f"Telegram消息发送失败: {e}")
             return False
@@ -94,7 +102,41 @@ class TelegramNotifier:
         if not self.enabled:
             return False
         
+        with self.idle:
+            self.sending += 1
+        try:
+            with tracing.span('telegram.send'):
+                return self._send(message, parse_mode)
+        finally:
+            with self.idle:
+                self.sending -= 1
+                if self.sending == 0:
+                    self.idle.notify_all()
+    
+    def wait_idle(self, timeout: float) -> bool:
+        """
+        等待正在发送的消息完成（退出时调用）
+        
+        Args:
+            timeout: 最长等待时间（秒）
+            
+        Returns:
+            是否全部发送完毕
+        """
+        deadline = time.monotonic() + timeout
+        with self.idle:
+            while self.sending > 0:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.idle.wait(remaining)
+        return True
+    
+    def _send(self, message: str, parse_mode: str) -> bool:
+        """在当前线程的事件循环中发送消息"""
         try:
+            asyncio = lazy_import('asyncio')
+            
             # 尝试获取当前事件循环
             try:
                 loop = asyncio.get_event_loop()
@@ -158,6 +200,8 @@ class TelegramNotifier:
         try:
             balances = account_info.get('balances', {})
             positions = account_info.get('positions', [])
+            account = account_info.get('account')
+            title = f"币安合约账户信息 ({account})" if account else "币安合约账户信息"
             
             # 构建余额信息
             balance_text = ""
@@ -184,7 +228,7 @@ class TelegramNotifier:
                 position_text = "\n• 当前无持仓\n"
             
             message = f"""
-💼 <b>币安合约账户信息</b>
+💼 <b>{title}</b>
 
 💰 <b>账户余额:</b>
 {balance_text}
@@ -264,8 +308,12 @@ class TelegramNotifier:
             closed_pnl = position_info.get('closed_pnl', 0)
             datetime_str = position_info.get('datetime', 'N/A')
             
-            # 根据盈亏显示emoji
-            pnl_emoji = '💰' if closed_pnl > 0 else '📉'
+            # 根据盈亏显示emoji（盈亏未知时来自订单推送，没有成交价）
+            if closed_pnl is None:
+                pnl_text = '未知（订单推送不含成交价）'
+            else:
+                pnl_emoji = '💰' if closed_pnl > 0 else '📉'
+                pnl_text = f"{pnl_emoji} ${closed_pnl:,.2f}"
             
             message = f"""
 🚨 <b>检测到平多仓操作！</b>
@@ -274,7 +322,7 @@ class TelegramNotifier:
 • 币种: <b>{coin}</b>
 • 数量: {size}
 • 价格: ${price:,.2f}
-• 已实现盈亏: {pnl_emoji} ${closed_pnl:,.2f}
+• 已实现盈亏: {pnl_text}
 • 时间: {datetime_str}
 
 ⚡️ 准备在币安开空单...
@@ -303,12 +351,14 @@ class TelegramNotifier:
             quantity = trade_info.get('quantity', 0)
             entry_price = trade_info.get('entry_price', 0)
             order_id = trade_info.get('order_id', 'N/A')
+            account = trade_info.get('account')
+            account_line = f"• 账户: {account}\n" if account else ""
             
             message = f"""
 ✅ <b>开空单成功！</b>
 
 💼 <b>交易详情:</b>
-• 币种: <b>{coin}</b> ({symbol})
+{account_line}• 币种: <b>{coin}</b> ({symbol})
 • 订单ID: <code>{order_id}</code>
 • 杠杆: {leverage}x
 • 保证金: ${margin:,.2f}
@@ -0,0 +1,161 @@
+"""
+测试平仓信号回测
+验证规则判定、同币种开单限制、止盈/强平离场、收益与回撤计算以及参数扫描速度（离线测试，不访问网络）
+"""
+import sys
+import os
+import time
+import logging
+
+import numpy as np
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logger_config import setup_logger
+from signal_rules import SignalRuleEngine
+from backtest import (
+    Backtester, extract_signals, make_grid, format_results,
+    EXIT_TAKE_PROFIT, EXIT_LIQUIDATION, TAKER_FEE_RATE
+)
+
+# 设置日志
+setup_logger(log_file='test_backtest.log', log_level='INFO')
+logger = logging.getLogger(__name__)
+
+MINUTE = 60 * 1000
+TRADING_PAIRS = {'BTC': 'BTCUSDT'}
+
+
+def make_bars(closes):
+    """由收盘价序列构造1分钟K线（开盘价为上一根收盘价）"""
+    closes = np.asarray(closes, dtype=np.float64)
+    opens = np.concatenate(([closes[0]], closes[:-1]))
+    return {
+        'time': np.arange(len(closes), dtype=np.int64) * MINUTE,
+        'open': opens,
+        'high': np.maximum(opens, closes),
+        'low': np.minimum(opens, closes),
+        'close': closes
+    }
+
+
+def make_fill(tid, time_ms, direction='Close Long', coin='BTC'):
+    """构造一笔平多仓成交"""
+    return {
+        'coin': coin, 'px': '100', 'sz': '1', 'side': 'A', 'time': time_ms, 'startPosition': '2',
+        'dir': direction, 'closedPnl': '5', 'oid': tid, 'tid': tid, 'hash': f'0x{tid}'
+    }
+
+
+def test_take_profit_and_gating():
+    """测试止盈离场、持仓期间信号被跳过以及平仓后重新开单"""
+    logger.info("测试止盈与开单限制...")
+    # 第10分钟开始下跌 5%，第40分钟回到100
+    closes = [100.0] * 10 + [95.0] * 30 + [100.0] * 60
+    fills = [
+        make_fill(1, 5 * MINUTE),
+        make_fill(2, 6 * MINUTE),  # 持仓期间，跳过
+        make_fill(3, 7 * MINUTE, direction='Open Long'),  # 不符合规则
+        make_fill(4, 50 * MINUTE),  # 止盈后重新开单，持仓到数据结束
+        make_fill(5, 8 * MINUTE, coin='DOGE')  # 不在交易列表
+    ]
+    # 规则不限币种，DOGE 由 TRADING_PAIRS 过滤
+    signals = extract_signals(sorted(fills, key=lambda f: f['time']), SignalRuleEngine({'coins': []}), '0xabc')
+    if len(signals['time']) != 4:
+        logger.error(f"❌ 信号数量错误: {len(signals['time'])}")
+        return False
+
+    grid = make_grid(leverage=[10], position_size_usdc=[100], take_profit_pct=[0.04], max_hold_hours=[1])
+    result = Backtester(signals, {'BTCUSDT': make_bars(closes)}, TRADING_PAIRS).run(grid)
+    trades = result['trades']
+
+    if len(trades['pnl']) != 2 or trades['exit_type'][0] != EXIT_TAKE_PROFIT:
+        logger.error(f"❌ 交易记录错误: {trades}")
+        return False
+    expected = 1000 * 0.04 - 1000 * TAKER_FEE_RATE * (1 + 0.96)
+    if abs(trades['pnl'][0] - expected) > 1e-6:
+        logger.error(f"❌ 止盈收益错误: {trades['pnl'][0]} != {expected}")
+        return False
+
+    # 只开一次：第二笔信号在止盈后也不再开单
+    once = Backtester(signals, {'BTCUSDT': make_bars(closes)}, TRADING_PAIRS, rearm=False).run(grid)
+    if len(once['trades']['pnl']) != 1:
+        logger.error(f"❌ 单次开单限制错误: {len(once['trades']['pnl'])} 笔")
+        return False
+
+    logger.info("✅ 止盈与开单限制正确")
+    return True
+
+
+def test_liquidation_and_drawdown():
+    """测试强平离场和最大回撤"""
+    logger.info("测试强平与回撤...")
+    # 先下跌获利，再上涨15%触发10倍杠杆强平
+    closes = [100.0] * 5 + [90.0] * 10 + [100.0] * 5 + [115.0] * 20
+    fills = [make_fill(1, 2 * MINUTE), make_fill(2, 16 * MINUTE)]
+    signals = extract_signals(fills, SignalRuleEngine(), '0xabc')
+    grid = make_grid(leverage=[10, 2], position_size_usdc=[100], max_hold_hours=[10 / 60])
+    result = Backtester(signals, {'BTCUSDT': make_bars(closes)}, TRADING_PAIRS, fee_rate=0.0).run(grid)
+    summary = result['summary']
+
+    # 10倍：第一笔持有10分钟获利100，第二笔强平亏损100
+    if summary['liquidations'][0] != 1 or abs(summary['total_pnl'][0]) > 1e-6:
+        logger.error(f"❌ 强平统计错误: {summary}")
+        return False
+    if abs(summary['max_drawdown'][0] - 100) > 1e-6:
+        logger.error(f"❌ 最大回撤错误: {summary['max_drawdown'][0]}")
+        return False
+    # 2倍杠杆不强平
+    if summary['liquidations'][1] != 0 or result['trades']['exit_type'][result['trades']['config'] == 1].max() == EXIT_LIQUIDATION:
+        logger.error(f"❌ 低杠杆不应强平: {summary}")
+        return False
+
+    logger.info(f"✅ 强平与回撤正确: {format_results(result, 1)[0]}")
+    return True
+
+
+def test_parameter_sweep_speed():
+    """测试数千个参数组合的扫描耗时"""
+    logger.info("测试参数扫描...")
+    rng = np.random.default_rng(7)
+    closes = 100 * np.exp(np.cumsum(rng.normal(0, 0.001, 30 * 24 * 60)))  # 30天1分钟K线
+    fills = [make_fill(i, int(t)) for i, t in enumerate(np.sort(rng.integers(0, 29 * 24 * 60 * MINUTE, 500)))]
+    signals = extract_signals(fills, SignalRuleEngine(), '0xabc')
+    grid = make_grid(
+        leverage=[2, 3, 5, 10, 20],
+        position_size_usdc=[50, 100],
+        take_profit_pct=list(np.linspace(0, 0.1, 11)),
+        stop_loss_pct=list(np.linspace(0, 0.05, 6)),
+        max_hold_hours=[1, 4, 12, 24, 48, 72],
+        proportional=[False, True]
+    )
+    started = time.perf_counter()
+    result = Backtester(signals, {'BTCUSDT': make_bars(closes)}, TRADING_PAIRS).run(grid)
+    elapsed = time.perf_counter() - started
+
+    configs = len(grid['leverage'])
+    if elapsed > 30 or result['summary']['trades'].min() == 0:
+        logger.error(f"❌ 参数扫描过慢或无交易: {configs} 个组合 {elapsed:.2f}秒")
+        return False
+
+    logger.info(f"✅ {configs} 个参数组合扫描耗时 {elapsed:.2f}秒")
+    return True
+
+
+if __name__ == "__main__":
+    print("\n" + "=" * 80)
+    print("测试平仓信号回测")
+    print("=" * 80 + "\n")
+
+    results = [
+        test_take_profit_and_gating(),
+        test_liquidation_and_drawdown(),
+        test_parameter_sweep_speed()
+    ]
+
+    if all(results):
+        print("\n✅ 所有回测测试通过！")
+    else:
+        print("\n❌ 部分回测测试失败，请查看日志文件 test_backtest.log")
+        sys.exit(1)
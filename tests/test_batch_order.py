@@ -0,0 +1,276 @@
+"""
+测试信号合并与批量下单
+验证合并窗口内的信号合并为一批、批量下单中单个订单失败时对应到币种、按 size_scale 缩放保证金，
+以及整批请求失败时的处理：明确被拒绝时逐个重新下单，结果未知时按自定义订单ID查询、不重复开仓
+（离线测试，使用模拟的币安客户端，不发送任何订单）
+"""
+import sys
+import os
+import json
+import time
+import threading
+import logging
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logger_config import setup_logger
+from signal_batcher import SignalBatcher
+from binance.exceptions import BinanceAPIException
+import binance_trader
+from binance_trader import BinanceTrader, ORDER_NOT_FOUND_CODE
+
+# 设置日志
+setup_logger(log_file='test_batch_order.log', log_level='INFO')
+logger = logging.getLogger(__name__)
+
+PRICES = {'ETHUSDC': 2000.0, 'BTCUSDC': 40000.0, 'SOLUSDC': 100.0}
+LEGS = [{'coin': 'ETH', 'symbol': 'ETHUSDC'}, {'coin': 'BTC', 'symbol': 'BTCUSDC'},
+        {'coin': 'SOL', 'symbol': 'SOLUSDC', 'size_scale': 0.5}]
+
+
+def api_error(code: int, msg: str = 'error') -> BinanceAPIException:
+    """构造带错误码的币安接口异常"""
+    error = BinanceAPIException(None, 400, json.dumps({'code': code, 'msg': msg}))
+    error.code = code
+    return error
+
+
+class FakeClient:
+    """模拟币安合约接口：记录所有被接受的订单（按自定义订单ID）"""
+
+    def __init__(self, *args, **kwargs):
+        self.lock = threading.Lock()
+        self.accepted = {}  # 自定义订单ID -> 订单
+        self.batch_requests = 0
+        self.single_orders = []
+        self.leg_errors = {}  # 交易对 -> 批量下单中该订单返回的 {code, msg}
+        self.batch_error = None  # 批量下单请求抛出的异常
+        self.batch_applied = False  # 抛出异常前是否已接受整批订单
+        self.query_error = None  # 查询订单时抛出的异常
+        self.order_id = 0
+
+    def ping(self):
+        return {}
+
+    def futures_exchange_info(self):
+        return {'symbols': [{'symbol': symbol, 'filters': [{'filterType': 'LOT_SIZE', 'stepSize': '0.001'}]}
+                            for symbol in PRICES]}
+
+    def futures_change_margin_type(self, symbol, marginType):
+        return {'code': 200}
+
+    def futures_change_leverage(self, symbol, leverage):
+        return {'symbol': symbol, 'leverage': leverage}
+
+    def futures_symbol_ticker(self, symbol):
+        return {'price': str(PRICES[symbol])}
+
+    def _accept(self, params):
+        with self.lock:
+            self.order_id += 1
+            order = {'orderId': self.order_id, 'symbol': params['symbol'], 'status': 'FILLED',
+                     'clientOrderId': params.get('newClientOrderId'), 'origQty': str(params['quantity']),
+                     'executedQty': str(params['quantity']), 'avgPrice': str(PRICES[params['symbol']])}
+            self.accepted[order['clientOrderId'] or f"auto-{self.order_id}"] = order
+            return order
+
+    def futures_place_batch_order(self, batchOrders):
+        self.batch_requests += 1
+        if self.batch_error is not None:
+            if self.batch_applied:
+                for params in batchOrders:
+                    self._accept(params)
+            raise self.batch_error
+        response = []
+        for params in batchOrders:
+            error = self.leg_errors.get(params['symbol'])
+            response.append(error if error else self._accept(params))
+        return response
+
+    def futures_create_order(self, **params):
+        self.single_orders.append(params['symbol'])
+        return self._accept(params)
+
+    def futures_get_order(self, symbol, origClientOrderId):
+        if self.query_error is not None:
+            raise self.query_error
+        order = self.accepted.get(origClientOrderId)
+        if order is None:
+            raise api_error(ORDER_NOT_FOUND_CODE, 'Order does not exist.')
+        return order
+
+    def positions(self):
+        """每个交易对被接受的订单数"""
+        counts = {}
+        for order in self.accepted.values():
+            counts[order['symbol']] = counts.get(order['symbol'], 0) + 1
+        return counts
+
+
+def make_trader() -> BinanceTrader:
+    """创建使用模拟客户端的交易实例（交易对已预设杠杆，下单前不再设置）"""
+    original = binance_trader.Client
+    binance_trader.Client = FakeClient
+    try:
+        trader = BinanceTrader('key', 'secret')
+    finally:
+        binance_trader.Client = original
+    for symbol in PRICES:
+        trader.prime_symbol(symbol, 10)
+    return trader
+
+
+def test_batcher_window():
+    """测试合并窗口内的信号合并为一批，flush 立即处理，窗口为0时逐帧处理"""
+    logger.info("测试信号合并窗口...")
+    batches = []
+    done = threading.Event()
+
+    def handler(positions):
+        batches.append([p['coin'] for p in positions])
+        done.set()
+
+    batcher = SignalBatcher(handler, window_ms=50)
+    batcher.add([{'coin': 'ETH'}])
+    batcher.add([{'coin': 'BTC'}, {'coin': 'SOL'}])
+    batcher.add([])
+    if batches or not done.wait(2) or batches != [['ETH', 'BTC', 'SOL']]:
+        logger.error(f"❌ 窗口内的信号未合并: {batches}")
+        return False
+
+    batcher.add([{'coin': 'ETH'}])
+    batcher.flush()
+    batcher.flush()
+    time.sleep(0.1)
+    if batches[1:] != [['ETH']] or batcher.timer is not None:
+        logger.error(f"❌ flush 结果错误: {batches}")
+        return False
+
+    immediate = []
+    SignalBatcher(immediate.append, window_ms=0).add([{'coin': 'BTC'}, {'coin': 'ETH'}])
+    if [[p['coin'] for p in batch] for batch in immediate] != [['BTC', 'ETH']]:
+        logger.error(f"❌ 窗口为0时应立即处理: {immediate}")
+        return False
+
+    # 处理函数出错不影响后续批次
+    failing = SignalBatcher(lambda positions: 1 / 0, window_ms=0)
+    failing.add([{'coin': 'ETH'}])
+    if failing.batch_count != 1:
+        logger.error("❌ 批次计数错误")
+        return False
+
+    logger.info("✅ 信号合并窗口正确")
+    return True
+
+
+def test_batch_leg_failures():
+    """测试批量下单中单个订单返回 {code, msg} 时只有对应币种失败，保证金按 size_scale 缩放"""
+    logger.info("测试批量下单结果...")
+    trader = make_trader()
+    client = trader.client._client
+    client.leg_errors['BTCUSDC'] = {'code': -2019, 'msg': 'Margin is insufficient.'}
+
+    results = trader.execute_short_batch(LEGS, leverage=10, usdc_amount=100)
+    if set(results) != {'ETH', 'BTC', 'SOL'} or results['BTC'] is not None:
+        logger.error(f"❌ 失败订单未对应到币种: {results}")
+        return False
+    if not results['ETH'] or not results['SOL'] or client.batch_requests != 1 or client.single_orders:
+        logger.error(f"❌ 其他订单应在一次批量请求中成功: {results}")
+        return False
+    # ETH: 100 × 10 / 2000 = 0.5；SOL 保证金减半: 50 × 10 / 100 = 5
+    if results['ETH']['origQty'] != '0.5' or results['SOL']['origQty'] != '5.0':
+        logger.error(f"❌ 数量计算错误: {results['ETH']['origQty']}, {results['SOL']['origQty']}")
+        return False
+    client_ids = [order['clientOrderId'] for order in client.accepted.values()]
+    if len(set(client_ids)) != 2 or not all(client_ids):
+        logger.error(f"❌ 每个订单应带有不同的自定义订单ID: {client_ids}")
+        return False
+
+    # 只有一个币种时直接下单，同样按 size_scale 缩放
+    single = trader.execute_short_batch([LEGS[2]], leverage=10, usdc_amount=100)
+    if single['SOL']['origQty'] != '5.0' or client.single_orders != ['SOLUSDC']:
+        logger.error(f"❌ 单个币种下单错误: {single}")
+        return False
+
+    logger.info("✅ 批量下单结果按币种对应")
+    return True
+
+
+def test_rejected_batch_fallback():
+    """测试整批请求被明确拒绝时改为逐个下单"""
+    logger.info("测试批量请求被拒绝...")
+    trader = make_trader()
+    client = trader.client._client
+    client.batch_error = api_error(-1003, 'Too many requests.')
+
+    results = trader.execute_short_batch(LEGS, leverage=10, usdc_amount=100)
+    if not all(results.values()) or sorted(client.single_orders) != ['BTCUSDC', 'ETHUSDC', 'SOLUSDC']:
+        logger.error(f"❌ 被拒绝后应逐个下单: {results}")
+        return False
+    if client.positions() != {'ETHUSDC': 1, 'BTCUSDC': 1, 'SOLUSDC': 1}:
+        logger.error(f"❌ 订单数量错误: {client.positions()}")
+        return False
+
+    logger.info("✅ 被拒绝的批量请求改为逐个下单")
+    return True
+
+
+def test_ambiguous_batch_failure():
+    """测试请求超时等结果未知的失败：已接受的订单不重新提交，未接受的重新提交，无法确认的记为失败"""
+    logger.info("测试批量请求结果未知...")
+
+    # 1. 超时但交易所已接受整批订单：查询到订单，不重复开仓
+    trader = make_trader()
+    client = trader.client._client
+    client.batch_error = TimeoutError('read timeout')
+    client.batch_applied = True
+    results = trader.execute_short_batch(LEGS, leverage=10, usdc_amount=100)
+    if not all(results.values()) or client.single_orders or client.positions() != {s: 1 for s in PRICES}:
+        logger.error(f"❌ 已接受的订单被重复提交: {client.positions()}, 逐个下单 {client.single_orders}")
+        return False
+
+    # 2. 服务端错误且订单未被接受：确认不存在后重新提交（沿用原自定义订单ID）
+    trader = make_trader()
+    client = trader.client._client
+    client.batch_error = api_error(-1001, 'Internal error; unable to process your request.')
+    results = trader.execute_short_batch(LEGS, leverage=10, usdc_amount=100)
+    if not all(results.values()) or client.positions() != {s: 1 for s in PRICES} or len(client.single_orders) != 3:
+        logger.error(f"❌ 未被接受的订单应重新提交一次: {client.positions()}")
+        return False
+    if not all(order['clientOrderId'].startswith('hb-') for order in client.accepted.values()):
+        logger.error("❌ 重新提交时应沿用自定义订单ID")
+        return False
+
+    # 3. 连接断开且查询也失败：状态未知，全部记为失败，不重新下单
+    trader = make_trader()
+    client = trader.client._client
+    client.batch_error = ConnectionResetError('connection reset')
+    client.batch_applied = True
+    client.query_error = TimeoutError('read timeout')
+    results = trader.execute_short_batch(LEGS, leverage=10, usdc_amount=100)
+    if any(results.values()) or client.single_orders or client.positions() != {s: 1 for s in PRICES}:
+        logger.error(f"❌ 状态未知的订单应记为失败且不重新下单: {results}, 逐个下单 {client.single_orders}")
+        return False
+
+    logger.info("✅ 结果未知的批量请求不会重复开仓")
+    return True
+
+
+if __name__ == "__main__":
+    print("\n" + "=" * 80)
+    print("测试信号合并与批量下单")
+    print("=" * 80 + "\n")
+
+    results = [
+        test_batcher_window(),
+        test_batch_leg_failures(),
+        test_rejected_batch_fallback(),
+        test_ambiguous_batch_failure()
+    ]
+
+    if all(results):
+        print("\n✅ 所有批量下单测试通过！")
+    else:
+        print("\n❌ 部分批量下单测试失败，请查看日志文件 test_batch_order.log")
+        sys.exit(1)
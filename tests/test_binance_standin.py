@@ -0,0 +1,238 @@
+"""
+测试币安本地替身服务器
+验证REST接口撮合与持仓、权重响应头、-1021/-2019/429/超时注入、接口延迟，
+以及深度流可以与快照同步成本地订单簿、用户数据流推送持仓变化（只访问本机）
+"""
+import sys
+import os
+import json
+import time
+import base64
+import socket
+import logging
+import urllib.error
+import urllib.request
+from urllib.parse import urlencode
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logger_config import setup_logger
+from order_book import LocalOrderBook
+from binance_standin import BinanceStandIn, read_frame
+
+# 设置日志
+setup_logger(log_file='test_binance_standin.log', log_level='INFO')
+logger = logging.getLogger(__name__)
+
+API_KEY = 'standin-test-key'
+
+
+def call(standin, method, path, params=None, signed=False, timeout=5):
+    """发送REST请求，返回 (状态码, 内容, 响应头)"""
+    params = dict(params or {})
+    if signed:
+        params.setdefault('timestamp', int(time.time() * 1000))
+    url = f"{standin.rest_url}{path}"
+    data = None
+    if method == 'GET':
+        url += '?' + urlencode(params)
+    else:
+        data = urlencode(params).encode()
+    request = urllib.request.Request(url, data=data, method=method, headers={'X-MBX-APIKEY': API_KEY})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, json.loads(response.read()), response.headers
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read()), e.headers
+
+
+def open_stream(standin, path):
+    """打开一个WebSocket连接，返回可读取帧的文件对象"""
+    sock = socket.create_connection((standin.host, standin.port), timeout=5)
+    key = base64.b64encode(os.urandom(16)).decode()
+    sock.sendall((
+        f"GET {path} HTTP/1.1\r\nHost: {standin.host}\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+        f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n"
+    ).encode())
+    stream = sock.makefile('rb')
+    status = stream.readline()
+    while stream.readline() not in (b'\r\n', b''):
+        pass
+    if b'101' not in status:
+        raise RuntimeError(f"握手失败: {status}")
+    return sock, stream
+
+
+def test_order_flow():
+    """测试下单撮合、持仓、余额和权重响应头"""
+    logger.info("测试下单流程...")
+    standin = BinanceStandIn(port=0, seed=1)
+    standin.start()
+    try:
+        status, info, _ = call(standin, 'GET', '/fapi/v1/exchangeInfo')
+        btc = next(s for s in info['symbols'] if s['symbol'] == 'BTCUSDC')
+        if status != 200 or {f['filterType'] for f in btc['filters']} < {'PRICE_FILTER', 'LOT_SIZE'}:
+            logger.error(f"❌ exchangeInfo错误: {btc}")
+            return False
+
+        call(standin, 'POST', '/fapi/v1/leverage', {'symbol': 'BTCUSDC', 'leverage': 10}, signed=True)
+        status, body, _ = call(standin, 'POST', '/fapi/v1/marginType', {'symbol': 'BTCUSDC', 'marginType': 'CROSSED'}, signed=True)
+        if status != 400 or body['code'] != -4046:
+            logger.error(f"❌ 重复设置保证金模式应返回-4046: {status} {body}")
+            return False
+
+        status, order, headers = call(standin, 'POST', '/fapi/v1/order', {
+            'symbol': 'BTCUSDC', 'side': 'SELL', 'type': 'MARKET', 'quantity': '0.5',
+            'positionSide': 'SHORT', 'newOrderRespType': 'RESULT'
+        }, signed=True)
+        if status != 200 or order['status'] != 'FILLED' or headers['X-MBX-ORDER-COUNT-1M'] != '1':
+            logger.error(f"❌ 市价单错误: {status} {order}")
+            return False
+        if int(headers['X-MBX-USED-WEIGHT-1M']) < 4:
+            logger.error(f"❌ 权重统计错误: {headers['X-MBX-USED-WEIGHT-1M']}")
+            return False
+
+        _, positions, _ = call(standin, 'GET', '/fapi/v2/positionRisk', {'symbol': 'BTCUSDC'}, signed=True)
+        short = next(p for p in positions if p['positionSide'] == 'SHORT')
+        if float(short['positionAmt']) != -0.5 or short['leverage'] != '10':
+            logger.error(f"❌ 持仓错误: {short}")
+            return False
+
+        _, balances, _ = call(standin, 'GET', '/fapi/v2/balance', signed=True)
+        usdc = next(b for b in balances if b['asset'] == 'USDC')
+        if not float(usdc['balance']) < 10000:
+            logger.error(f"❌ 手续费未扣除: {usdc}")
+            return False
+    finally:
+        standin.stop()
+
+    logger.info("✅ 下单流程正确")
+    return True
+
+
+def test_fault_injection():
+    """测试 -2019、-1021、429 和超时"""
+    logger.info("测试错误注入...")
+    standin = BinanceStandIn(
+        port=0, seed=1, weight_limit=30, timeout_seconds=0.5,
+        profiles={'order': {'errors': {'-2019': 1.0}}, 'batchOrders': {'errors': {'timeout': 1.0}}}
+    )
+    standin.start()
+    try:
+        order = {'symbol': 'ETHUSDC', 'side': 'SELL', 'type': 'MARKET', 'quantity': '0.1', 'positionSide': 'SHORT'}
+        status, body, _ = call(standin, 'POST', '/fapi/v1/order', order, signed=True)
+        if status != 400 or body['code'] != -2019:
+            logger.error(f"❌ -2019注入错误: {status} {body}")
+            return False
+
+        status, body, _ = call(standin, 'GET', '/fapi/v2/balance', {'timestamp': int(time.time() * 1000) - 10000}, signed=True)
+        if status != 400 or body['code'] != -1021:
+            logger.error(f"❌ 过期时间戳应返回-1021: {status} {body}")
+            return False
+
+        # 超时的批量下单不返回响应，但订单已成交
+        try:
+            call(standin, 'POST', '/fapi/v1/batchOrders', {'batchOrders': json.dumps([order])}, signed=True, timeout=2)
+            logger.error("❌ 批量下单应超时")
+            return False
+        except (urllib.error.URLError, ConnectionError, socket.timeout) as e:
+            logger.info(f"批量下单超时: {type(e).__name__}")
+        _, positions, _ = call(standin, 'GET', '/fapi/v2/positionRisk', {'symbol': 'ETHUSDC'}, signed=True)
+        if float(next(p for p in positions if p['positionSide'] == 'SHORT')['positionAmt']) != -0.1:
+            logger.error(f"❌ 超时的订单应已成交: {positions}")
+            return False
+
+        # 权重上限30：depth 权重20，第二次超限
+        call(standin, 'GET', '/fapi/v1/depth', {'symbol': 'ETHUSDC', 'limit': 1000})
+        status, body, headers = call(standin, 'GET', '/fapi/v1/depth', {'symbol': 'ETHUSDC', 'limit': 1000})
+        if status != 429 or body['code'] != -1003 or 'Retry-After' not in headers:
+            logger.error(f"❌ 权重超限应返回429: {status} {body}")
+            return False
+    finally:
+        standin.stop()
+
+    logger.info(f"✅ 错误注入正确: {standin.stats['faults']}")
+    return True
+
+
+def test_endpoint_latency():
+    """测试按接口配置的延迟分布"""
+    logger.info("测试接口延迟...")
+    standin = BinanceStandIn(port=0, seed=1, profiles={'ticker/price': {'latency_ms': 80, 'jitter_ms': 0}})
+    standin.start()
+    try:
+        started = time.perf_counter()
+        call(standin, 'GET', '/fapi/v1/ticker/price', {'symbol': 'BTCUSDC'})
+        slow = time.perf_counter() - started
+        started = time.perf_counter()
+        call(standin, 'GET', '/fapi/v1/time')
+        fast = time.perf_counter() - started
+    finally:
+        standin.stop()
+
+    if slow < 0.08 or fast > 0.05:
+        logger.error(f"❌ 接口延迟错误: ticker {slow * 1000:.0f}ms, time {fast * 1000:.0f}ms")
+        return False
+    logger.info(f"✅ 接口延迟正确: ticker {slow * 1000:.0f}ms, time {fast * 1000:.0f}ms")
+    return True
+
+
+def test_streams():
+    """测试深度流与快照同步，以及用户数据流推送持仓变化"""
+    logger.info("测试数据流...")
+    standin = BinanceStandIn(port=0, seed=1, depth_interval_ms=20)
+    standin.start()
+    try:
+        sock, stream = open_stream(standin, '/stream?streams=btcusdc@depth@100ms')
+        book = LocalOrderBook('BTCUSDC')
+        # 先缓存几条增量，再应用快照（与 OrderBookManager 的顺序一致）
+        for _ in range(3):
+            book.apply_diff(json.loads(read_frame(stream)[1])['data'])
+        _, snapshot, _ = call(standin, 'GET', '/fapi/v1/depth', {'symbol': 'BTCUSDC', 'limit': 1000})
+        book.apply_snapshot(snapshot)
+        for _ in range(20):
+            if not book.apply_diff(json.loads(read_frame(stream)[1])['data']):
+                logger.error("❌ 深度流不连续")
+                return False
+        sock.close()
+        if not book.synced or book.best_bid() is None or book.best_ask() <= book.best_bid():
+            logger.error(f"❌ 本地订单簿未同步: {book.best_bid()} / {book.best_ask()}")
+            return False
+
+        _, body, _ = call(standin, 'POST', '/fapi/v1/listenKey')
+        sock, stream = open_stream(standin, f"/ws/{body['listenKey']}")
+        call(standin, 'POST', '/fapi/v1/order', {
+            'symbol': 'BTCUSDC', 'side': 'SELL', 'type': 'MARKET', 'quantity': '0.01', 'positionSide': 'SHORT'
+        }, signed=True)
+        events = [json.loads(read_frame(stream)[1]) for _ in range(2)]
+        sock.close()
+        update = next(e for e in events if e['e'] == 'ACCOUNT_UPDATE')
+        position = next(p for p in update['a']['P'] if p['ps'] == 'SHORT')
+        if float(position['pa']) != -0.01:
+            logger.error(f"❌ 用户数据流持仓错误: {update}")
+            return False
+    finally:
+        standin.stop()
+
+    logger.info("✅ 数据流正确")
+    return True
+
+
+if __name__ == "__main__":
+    print("\n" + "=" * 80)
+    print("测试币安本地替身服务器")
+    print("=" * 80 + "\n")
+
+    results = [
+        test_order_flow(),
+        test_fault_injection(),
+        test_endpoint_latency(),
+        test_streams()
+    ]
+
+    if all(results):
+        print("\n✅ 所有替身服务器测试通过！")
+    else:
+        print("\n❌ 部分替身服务器测试失败，请查看日志文件 test_binance_standin.log")
+        sys.exit(1)
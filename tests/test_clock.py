@@ -0,0 +1,374 @@
+"""
+测试虚拟时钟
+验证模拟时钟按时间顺序执行定时任务且不漂移，并用模拟时钟在几秒内运行WebSocket监控一周的
+保活、断线重连、静默重连、持仓打印和镜像校验，检查定时漂移、线程和内存增长（离线测试，不访问网络）
+"""
+import sys
+import os
+import json
+import time
+import threading
+import tracemalloc
+import logging
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logger_config import setup_logger
+from clock import SystemClock, SimulatedClock
+import hyperliquid_monitor_ws
+from hyperliquid_monitor_ws import HyperliquidMonitorWS, KEEPALIVE_INTERVAL, RECONNECT_BASE_DELAY
+from hyperliquid_monitor import HyperliquidMonitor, API_REQUEST_DELAY
+
+# 设置日志
+setup_logger(log_file='test_clock.log', log_level='INFO')
+logger = logging.getLogger(__name__)
+
+ADDRESS = '0x' + 'ab' * 20
+DAY = 86400
+USER_STATE = {'assetPositions': [], 'marginSummary': {'accountValue': '0'}}
+
+
+class FakeServer:
+    """模拟 Hyperliquid WebSocket 服务端：响应订阅和应用层ping，可推送成交、断开连接、停止响应"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.apps = []  # 尚未结束的连接
+        self.current = None
+        self.responsive = True
+        self.connections = 0
+        self.pings = 0
+        self.client_closes = 0  # 客户端主动关闭（静默重连）
+        self.recent_fills = []  # 重连订阅时作为历史快照推送
+
+    def settle(self, timeout: float = 5.0):
+        """等待所有连接的线程完成建立或关闭回调（之后虚拟时间才能继续前进）"""
+        with self.lock:
+            apps = list(self.apps)
+        for app in apps:
+            done = app.finished if app.closed.is_set() else app.opened
+            if not done.wait(timeout):
+                raise RuntimeError("模拟连接未在超时时间内完成")
+        with self.lock:
+            self.apps = [app for app in self.apps if not app.finished.is_set()]
+
+    def push_fill(self, fill: dict):
+        """推送一条实时成交（停止响应时丢弃）"""
+        self.recent_fills = (self.recent_fills + [fill])[-10:]
+        app = self.current
+        if self.responsive and app and app.opened.is_set() and not app.closed.is_set():
+            app.on_message(app, json.dumps({'channel': 'userFills', 'data': {'user': ADDRESS, 'fills': [fill]}}))
+
+    def drop(self):
+        """服务端断开当前连接"""
+        app = self.current
+        if app and not app.closed.is_set():
+            app.server_closed = True
+            app.close()
+
+
+class FakeWebSocketApp:
+    """替换 websocket.WebSocketApp，连接到 FakeServer"""
+
+    server = None
+
+    def __init__(self, url, on_open=None, on_message=None, on_error=None, on_close=None, on_ping=None, on_pong=None):
+        self.on_open = on_open
+        self.on_message = on_message
+        self.on_close = on_close
+        self.opened = threading.Event()
+        self.closed = threading.Event()
+        self.finished = threading.Event()
+        self.server_closed = False
+        with self.server.lock:
+            self.server.apps.append(self)
+
+    def run_forever(self, **kwargs):
+        server = self.server
+        server.connections += 1
+        server.current = self
+        self.on_open(self)
+        self.opened.set()
+        self.closed.wait()
+        self.on_close(self, 1000, 'closed')
+        self.finished.set()
+
+    def send(self, message: str):
+        data = json.loads(message)
+        if data.get('method') == 'ping':
+            self.server.pings += 1
+        if not self.server.responsive:
+            return
+        if data.get('method') == 'ping':
+            self.on_message(self, json.dumps({'channel': 'pong'}))
+        elif data.get('method') == 'subscribe':
+            self.on_message(self, json.dumps({'channel': 'subscriptionResponse', 'data': data}))
+            snapshot = {'user': ADDRESS, 'isSnapshot': True, 'fills': list(self.server.recent_fills)}
+            self.on_message(self, json.dumps({'channel': 'userFills', 'data': snapshot}))
+
+    def close(self):
+        if not self.closed.is_set():
+            if not self.server_closed:
+                self.server.client_closes += 1
+            self.closed.set()
+
+
+class Schedule:
+    """记录周期任务的执行次数和偏离预期时间的执行（不保存每次的时间，避免影响内存测量）"""
+
+    def __init__(self, clock: SimulatedClock, interval: float, func):
+        self.clock = clock
+        self.interval = interval
+        self.func = func
+        self.count = 0
+        self.drifted = []
+
+    def __call__(self):
+        self.count += 1
+        if self.clock.monotonic() != self.count * self.interval and len(self.drifted) < 10:
+            self.drifted.append(self.clock.monotonic())
+        return self.func()
+
+
+def make_fill(tid: int) -> dict:
+    """构造一条平多成交"""
+    return {'coin': 'ETH', 'side': 'A', 'dir': 'Close Long', 'sz': '1.0', 'px': '2000.0', 'closedPnl': '10.0',
+            'tid': tid, 'oid': tid, 'time': 1700000000000 + tid, 'startPosition': '2.0', 'hash': f'0x{tid}'}
+
+
+def run_until(clock: SimulatedClock, server: FakeServer, end: float):
+    """按任务到期时间推进虚拟时间，每批任务执行后等待连接线程完成"""
+    while clock.now < end:
+        deadline = clock.next_deadline()
+        clock.advance(min(deadline if deadline is not None else end, end) - clock.now)
+        server.settle()
+
+
+def test_simulated_clock():
+    """测试模拟时钟的任务顺序、周期任务不漂移、取消和其他线程中的等待"""
+    logger.info("测试模拟时钟...")
+    clock = SimulatedClock(start_time=1000.0)
+    order = []
+    clock.call_later(5, lambda: order.append(('once', clock.monotonic())))
+    periodic = clock.call_every(3, lambda: order.append(('every', clock.monotonic())))
+    cancelled = clock.call_later(4, lambda: order.append(('cancelled', clock.monotonic())))
+    cancelled.cancel()
+    clock.advance(10)
+    periodic.cancel()
+    clock.advance(10)
+    expected = [('every', 3), ('once', 5), ('every', 6), ('every', 9)]
+    if order != expected or clock.time() != 1020.0 or clock.pending() != 0:
+        logger.error(f"❌ 任务顺序或时间错误: {order}, time={clock.time()}")
+        return False
+
+    # 其他线程中的等待在虚拟时间到达时返回，事件设置时立即返回
+    results = []
+    event = threading.Event()
+    waiter = threading.Thread(target=lambda: results.append(clock.wait(event, 30)))
+    waiter.start()
+    while clock.pending() == 0:
+        time.sleep(0.001)
+    clock.advance(29)
+    time.sleep(0.02)
+    if results:
+        logger.error("❌ 虚拟时间未到时等待不应返回")
+        return False
+    clock.advance(1)
+    waiter.join(1)
+    waiter = threading.Thread(target=lambda: results.append(clock.wait(event, 30)))
+    waiter.start()
+    event.set()
+    waiter.join(1)
+    if results != [False, True]:
+        logger.error(f"❌ 等待结果错误: {results}")
+        return False
+
+    # 定时任务中等待会阻塞时钟，应报错而不是死锁
+    errors = []
+
+    def blocking_task():
+        try:
+            clock.sleep(1)
+        except RuntimeError as e:
+            errors.append(e)
+    clock.call_later(1, blocking_task)
+    clock.advance(1)
+    if len(errors) != 1:
+        logger.error("❌ 定时任务中等待应报错")
+        return False
+
+    # 系统时钟的周期任务按固定间隔执行
+    ticks = []
+    task = SystemClock().call_every(0.05, lambda: ticks.append(time.monotonic()), name='test-periodic')
+    time.sleep(0.28)
+    task.cancel()
+    if not 4 <= len(ticks) <= 6:
+        logger.error(f"❌ 系统时钟周期任务次数错误: {len(ticks)}")
+        return False
+
+    logger.info("✅ 模拟时钟正确")
+    return True
+
+
+def test_rate_limit():
+    """测试HTTP监控的速率限制使用注入的时钟"""
+    logger.info("测试速率限制...")
+    clock = SimulatedClock()
+    monitor = HyperliquidMonitor('http://127.0.0.1:9/info', ADDRESS, clock=clock)
+    worker = threading.Thread(target=lambda: [monitor._rate_limit_check() for _ in range(3)])
+    worker.start()
+    for _ in range(2):
+        while clock.pending() == 0:
+            time.sleep(0.001)
+        clock.advance(API_REQUEST_DELAY)
+    worker.join(1)
+    if worker.is_alive() or monitor.api_request_count != 3 or \
+            abs(monitor.last_api_request_time - clock.start_time - 2 * API_REQUEST_DELAY) > 1e-6:
+        logger.error(f"❌ 速率限制错误: 请求 {monitor.api_request_count}, 时间 {monitor.last_api_request_time}")
+        return False
+    logger.info("✅ 速率限制使用虚拟时间")
+    return True
+
+
+def test_polling_schedule():
+    """测试HTTP轮询监控在虚拟时间中按扫描间隔扫描、按间隔打印持仓"""
+    logger.info("测试HTTP轮询调度...")
+    clock = SimulatedClock()
+    monitor = HyperliquidMonitor('http://127.0.0.1:9/info', ADDRESS, clock=clock)
+    scans, prints = [], []
+
+    def get_user_fills(limit=20, address=None):
+        monitor._rate_limit_check()
+        scans.append(clock.monotonic())
+        return []
+    monitor.get_user_fills = get_user_fills
+    monitor.print_positions = lambda: prints.append(clock.monotonic())
+
+    worker = threading.Thread(target=monitor.start_monitoring,
+                              kwargs={'scan_interval': 5, 'callback': lambda p: None, 'startup_checks': False})
+    worker.start()
+    end = 2 * 3600
+    while clock.now < end:
+        # 等待扫描线程进入下一次扫描间隔的等待
+        while clock.pending() == 0:
+            time.sleep(0.0005)
+        clock.advance(5)
+    while clock.pending() == 0:
+        time.sleep(0.0005)
+    monitor.stop()
+    worker.join(2)
+
+    if worker.is_alive() or len(scans) != end // 5 + 1 or scans != [i * 5.0 for i in range(len(scans))]:
+        logger.error(f"❌ 扫描时间错误: {len(scans)} 次, {scans[:5]}")
+        return False
+    if prints != [300.0 * i for i in range(1, end // 300 + 1)]:
+        logger.error(f"❌ 持仓打印时间错误: {prints}")
+        return False
+    logger.info(f"✅ {len(scans)} 次扫描和 {len(prints)} 次持仓打印按虚拟时间执行")
+    return True
+
+
+def test_week_soak():
+    """测试WebSocket监控在模拟时钟下运行一周：保活、重连、持仓打印不漂移，线程和内存不增长"""
+    logger.info("测试一周模拟运行...")
+    clock = SimulatedClock()
+    server = FakeServer()
+    FakeWebSocketApp.server = server
+    original_app = hyperliquid_monitor_ws.websocket.WebSocketApp
+    hyperliquid_monitor_ws.websocket.WebSocketApp = FakeWebSocketApp
+    baseline_threads = threading.active_count()
+
+    monitor = HyperliquidMonitorWS('http://127.0.0.1:9/info', 'ws://127.0.0.1:9/ws', ADDRESS, clock=clock)
+    monitor._request_user_state = lambda: USER_STATE
+    keepalive = monitor._keepalive_check = Schedule(clock, KEEPALIVE_INTERVAL, monitor._keepalive_check)
+    prints = monitor.print_mirror_positions = Schedule(clock, 300, monitor.print_mirror_positions)
+    checks = monitor.check_mirror_consistency = Schedule(clock, 3600, monitor.check_mirror_consistency)
+    signals = []
+
+    worker = threading.Thread(target=monitor.start_monitoring, name='monitor-main', kwargs={
+        'callback': None, 'batch_callback': lambda batch: signals.append(len(batch)), 'position_print_interval': 300,
+        'consistency_check_interval': 3600, 'startup_checks': False
+    })
+    started = time.perf_counter()
+    try:
+        worker.start()
+        deadline = time.monotonic() + 5
+        while monitor.periodic_task is None and time.monotonic() < deadline:
+            time.sleep(0.001)
+        if monitor.periodic_task is None:
+            logger.error("❌ 监控未启动")
+            return False
+
+        # 每小时推送一条平仓成交，每6小时服务端断开一次，第3天有5分钟服务端停止响应
+        fill_ids = iter(range(1, 10000))
+        clock.call_every(3600, lambda: server.push_fill(make_fill(next(fill_ids))))
+        clock.call_every(6 * 3600, lambda: clock.call_later(7, server.drop))
+        clock.call_later(3 * DAY + 615, lambda: setattr(server, 'responsive', False))
+        clock.call_later(3 * DAY + 915, lambda: setattr(server, 'responsive', True))
+
+        run_until(clock, server, DAY)
+        tracemalloc.start()
+        day_one = tracemalloc.take_snapshot()
+        run_until(clock, server, 7 * DAY)
+        day_seven = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        growth = sum(stat.size_diff for stat in day_seven.compare_to(day_one, 'filename'))
+        connected = monitor.ws_connected
+        client_closes = server.client_closes
+    finally:
+        monitor.stop()
+        worker.join(2)
+        server.settle()
+        hyperliquid_monitor_ws.websocket.WebSocketApp = original_app
+    elapsed = time.perf_counter() - started
+
+    week = 7 * DAY
+    scheduled_drops = week // (6 * 3600) - 1  # 最后一次断开在一周之后
+    if keepalive.count != week // KEEPALIVE_INTERVAL or keepalive.drifted:
+        logger.error(f"❌ 保活检查时间漂移: {keepalive.count} 次, {keepalive.drifted}")
+        return False
+    if server.pings != keepalive.count - client_closes:
+        logger.error(f"❌ 保活ping次数错误: {server.pings}, 检查 {keepalive.count}, 静默重连 {client_closes}")
+        return False
+    if prints.count != week // 300 or checks.count != week // 3600 or prints.drifted or checks.drifted:
+        logger.error(f"❌ 持仓打印或镜像校验漂移: {prints.count} 次打印 {prints.drifted}, "
+                     f"{checks.count} 次校验 {checks.drifted}")
+        return False
+    if not 3 <= client_closes <= 7 or server.connections != 1 + scheduled_drops + client_closes or not connected:
+        logger.error(f"❌ 重连错误: 连接 {server.connections} 次, 静默重连 {client_closes}, 断开 {scheduled_drops}")
+        return False
+    if sum(signals) != week // 3600 or len(monitor.processed_fills) != week // 3600:
+        logger.error(f"❌ 平仓信号错误（断线重连后的快照不应重复触发）: {len(signals)}")
+        return False
+    if threading.active_count() > baseline_threads or len(clock.tasks) > 5:
+        logger.error(f"❌ 线程或定时任务增长: 线程 {threading.active_count()}/{baseline_threads}, 任务 {len(clock.tasks)}")
+        return False
+    if growth > 64 * 1024:
+        logger.error(f"❌ 6天内存增长 {growth / 1024:.0f}KB")
+        return False
+
+    logger.info(f"✅ 模拟运行一周用时 {elapsed:.1f}秒 (加速 {week / elapsed:,.0f} 倍): "
+                f"保活 {keepalive.count} 次, 持仓打印 {prints.count} 次, 连接 {server.connections} 次 "
+                f"(静默重连 {client_closes} 次, 退避 {RECONNECT_BASE_DELAY}秒), 信号 {sum(signals)} 个, "
+                f"6天内存增长 {growth / 1024:.1f}KB")
+    return True
+
+
+if __name__ == "__main__":
+    print("\n" + "=" * 80)
+    print("测试虚拟时钟")
+    print("=" * 80 + "\n")
+
+    results = [
+        test_simulated_clock(),
+        test_rate_limit(),
+        test_polling_schedule(),
+        test_week_soak()
+    ]
+
+    if all(results):
+        print("\n✅ 所有虚拟时钟测试通过！")
+    else:
+        print("\n❌ 部分虚拟时钟测试失败，请查看日志文件 test_clock.log")
+        sys.exit(1)
@@ -0,0 +1,181 @@
+"""
+测试运行时诊断
+验证通过管理套接字和信号输出线程栈、采样分析定位热点函数、内存快照比较定位增长的代码行，
+且诊断期间主线程的处理不中断（离线测试，只使用本机 Unix 域套接字）
+"""
+import sys
+import os
+import time
+import signal
+import tempfile
+import threading
+import logging
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logger_config import setup_logger
+from diagnostics import Diagnostics, send_command, main as diagnostics_main
+
+# 设置日志
+setup_logger(log_file='test_diagnostics.log', log_level='INFO')
+logger = logging.getLogger(__name__)
+
+stop = threading.Event()
+
+
+def simulated_reader():
+    """模拟阻塞等待推送的 WebSocket 读取线程"""
+    stop.wait()
+
+
+def busy_snapshot_loop():
+    """模拟 CPU 突增（反复处理快照）"""
+    while not stop.is_set():
+        sum(i * i for i in range(2000))
+
+
+def wait_for_file(path: str, timeout: float = 5.0) -> bool:
+    """等待结果文件写入"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def read(path: str) -> str:
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+def test_socket_commands(diagnostics: Diagnostics, processed_fills: set):
+    """测试管理套接字的线程栈、采样分析、内存快照和状态命令"""
+    logger.info("测试管理套接字命令...")
+    socket_path = diagnostics.socket_path
+
+    path = send_command(socket_path, 'threads')
+    text = read(path)
+    if 'ws-reader' not in text or 'simulated_reader' not in text or 'snapshot-worker' not in text:
+        logger.error(f"❌ 线程栈缺少模拟线程: {path}")
+        return False
+
+    path = send_command(socket_path, 'profile 0.5')
+    if not send_command(socket_path, 'profile 1').startswith('ERROR'):
+        logger.error("❌ 采样分析进行中时应拒绝新的采样")
+        return False
+    if not wait_for_file(path):
+        logger.error("❌ 采样分析结果未写入")
+        return False
+    summary = read(path)
+    folded = read(path[:-len('.txt')] + '.folded')
+    worker_section = summary.split('线程 snapshot-worker')[1]
+    hottest = worker_section.splitlines()[1]
+    if 'snapshot-worker;' not in folded or ('genexpr' not in hottest and 'busy_snapshot_loop' not in hottest):
+        logger.error(f"❌ 采样分析未定位到热点函数: {hottest}")
+        return False
+
+    # 第一次内存快照记录基线，之后的增长定位到具体代码行
+    send_command(socket_path, 'mem')
+    for index in range(50000):
+        processed_fills.add(f'fill-{index}')
+    path = send_command(socket_path, 'mem')
+    text = read(path)
+    diff_section = text.split('增长最多的代码行')[1].split('增长最多的调用栈')[0]
+    if 'test_diagnostics.py' not in diff_section.splitlines()[1] or 'processed_fills=50000' not in text:
+        logger.error(f"❌ 内存快照比较未定位到增长的代码行: {diff_section[:300]}")
+        return False
+
+    status = send_command(socket_path, 'status')
+    if 'processed_fills=50000' not in status or 'tracemalloc=开启' not in status:
+        logger.error(f"❌ 状态错误: {status}")
+        return False
+    send_command(socket_path, 'mem stop')
+    if 'tracemalloc=关闭' not in send_command(socket_path, 'status'):
+        logger.error("❌ tracemalloc 未停止")
+        return False
+
+    if not send_command(socket_path, 'unknown').startswith('ERROR'):
+        logger.error("❌ 未知命令应返回错误")
+        return False
+    if diagnostics_main(['status', '--socket', socket_path]) != 0:
+        logger.error("❌ 命令行客户端执行失败")
+        return False
+
+    logger.info(f"✅ 管理套接字命令正确 ({hottest.strip()})")
+    return True
+
+
+def test_signal_trigger(diagnostics: Diagnostics):
+    """测试 SIGUSR1 输出线程栈并开始采样分析，主线程处理不中断"""
+    logger.info("测试信号触发...")
+    before = set(os.listdir(diagnostics.output_dir))
+    diagnostics.profile_seconds = 0.3
+
+    os.kill(os.getpid(), signal.SIGUSR1)
+    # 主线程继续处理（信号处理函数只放入命令）
+    iterations = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < 1.0:
+        iterations += 1
+        time.sleep(0.001)
+
+    new = sorted(set(os.listdir(diagnostics.output_dir)) - before)
+    kinds = {name.split('_')[0] for name in new}
+    if kinds != {'threads', 'profile'} or iterations < 100:
+        logger.error(f"❌ 信号触发结果错误: {new}, 主线程迭代 {iterations} 次")
+        return False
+    main_stack = read(os.path.join(diagnostics.output_dir, next(n for n in new if n.startswith('threads'))))
+    if 'MainThread' not in main_stack:
+        logger.error("❌ 线程栈缺少主线程")
+        return False
+
+    os.kill(os.getpid(), signal.SIGUSR2)
+    time.sleep(0.5)
+    memory = [name for name in set(os.listdir(diagnostics.output_dir)) - before if name.startswith('memory')]
+    diagnostics.stop_memory()
+    if len(memory) != 1:
+        logger.error(f"❌ SIGUSR2 未记录内存快照: {memory}")
+        return False
+
+    logger.info(f"✅ 信号触发正确: {', '.join(new + memory)}")
+    return True
+
+
+if __name__ == "__main__":
+    print("\n" + "=" * 80)
+    print("测试运行时诊断")
+    print("=" * 80 + "\n")
+
+    work_dir = tempfile.mkdtemp()
+    processed = set()
+    diag = Diagnostics(output_dir=os.path.join(work_dir, 'diagnostics'),
+                       socket_path=os.path.join(work_dir, 'diag.sock'), sample_interval_ms=2)
+    diag.add_status('processed_fills', lambda: len(processed))
+    diag.start()
+    workers = [
+        threading.Thread(target=simulated_reader, name='ws-reader', daemon=True),
+        threading.Thread(target=busy_snapshot_loop, name='snapshot-worker', daemon=True)
+    ]
+    for worker in workers:
+        worker.start()
+
+    try:
+        results = [
+            test_socket_commands(diag, processed),
+            test_signal_trigger(diag)
+        ]
+    finally:
+        stop.set()
+        diag.stop()
+
+    if os.path.exists(diag.socket_path):
+        logger.error("❌ 停止后管理套接字未删除")
+        results.append(False)
+
+    if all(results):
+        print("\n✅ 所有运行时诊断测试通过！")
+    else:
+        print("\n❌ 部分运行时诊断测试失败，请查看日志文件 test_diagnostics.log")
+        sys.exit(1)
@@ -0,0 +1,126 @@
+"""
+测试部分成交聚合
+验证按订单ID合并成交、两种聚合模式以及内存上限（离线测试，不访问网络）
+"""
+import sys
+import os
+import time
+import logging
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logger_config import setup_logger
+from fill_aggregator import FillAggregator
+from signal_rules import build_signal
+
+# 设置日志
+setup_logger(log_file='test_fill_aggregator.log', log_level='INFO')
+logger = logging.getLogger(__name__)
+
+
+def make_signal(tid, oid, size, price, pnl):
+    """构造一条 parse_fills 输出的平仓信号"""
+    return build_signal({
+        'tid': tid,
+        'oid': oid,
+        'coin': 'ETH',
+        'side': 'A',
+        'dir': 'Close Long',
+        'sz': str(size),
+        'px': str(price),
+        'closedPnl': str(pnl),
+        'startPosition': '10.0',
+        'time': 1700000000000
+    })
+
+
+def test_latency_mode():
+    """测试LATENCY模式：第一条成交立即输出，后续成交只合并"""
+    logger.info("测试LATENCY模式...")
+    emitted = []
+    aggregator = FillAggregator(emitted.extend, mode='LATENCY')
+
+    aggregator.add([make_signal(1, 100, 1.0, 2000.0, 5.0), make_signal(2, 100, 3.0, 2004.0, 20.0)])
+    aggregator.add([make_signal(3, 100, 1.0, 2010.0, 6.0)])
+
+    if len(emitted) != 1 or emitted[0]['fill_id'] != 1:
+        logger.error(f"❌ 输出信号错误: {emitted}")
+        return False
+
+    merged = aggregator.get_order(100)
+    if merged['size'] != 5.0 or abs(merged['price'] - 2004.4) > 1e-9 or merged['closed_pnl'] != 31.0:
+        logger.error(f"❌ 合并结果错误: {dict(merged)}")
+        return False
+
+    # 由订单推送转换的成交盈亏未知，合并后的盈亏也未知
+    unknown = make_signal(4, 100, 1.0, 2000.0, 0.0)
+    unknown['closed_pnl'] = None
+    aggregator.add([unknown])
+    if aggregator.get_order(100)['closed_pnl'] is not None:
+        logger.error("❌ 合并未知盈亏的结果错误")
+        return False
+
+    logger.info("✅ LATENCY模式正确")
+    return True
+
+
+def test_accuracy_mode():
+    """测试ACCURACY模式：静默期结束后输出一个合并信号"""
+    logger.info("测试ACCURACY模式...")
+    emitted = []
+    aggregator = FillAggregator(emitted.extend, mode='ACCURACY', quiet_ms=50)
+
+    aggregator.add([make_signal(1, 200, 2.0, 2000.0, 10.0), make_signal(2, 201, 1.0, 60000.0, 3.0)])
+    aggregator.add([make_signal(3, 200, 2.0, 2002.0, 12.0)])
+    if emitted:
+        logger.error("❌ 静默期内提前输出")
+        return False
+
+    time.sleep(0.2)
+    aggregator.stop()
+
+    by_oid = {signal['oid']: signal for signal in emitted}
+    if len(emitted) != 2 or by_oid[200]['fill_count'] != 2 or by_oid[200]['size'] != 4.0:
+        logger.error(f"❌ 合并输出错误: {emitted}")
+        return False
+    if abs(by_oid[200]['close_fraction'] - 0.4) > 1e-9:
+        logger.error(f"❌ 合并后平仓比例错误: {by_oid[200]['close_fraction']}")
+        return False
+
+    logger.info("✅ ACCURACY模式正确")
+    return True
+
+
+def test_bounded_memory():
+    """测试超出订单上限时淘汰最早的订单"""
+    logger.info("测试订单数量上限...")
+    emitted = []
+    aggregator = FillAggregator(emitted.extend, mode='ACCURACY', quiet_ms=10000, max_orders=3)
+
+    aggregator.add([make_signal(i, i, 1.0, 2000.0, 1.0) for i in range(5)])
+    if len(aggregator.orders) != 3 or [signal['oid'] for signal in emitted] != [0, 1]:
+        logger.error(f"❌ 淘汰结果错误: 订单数={len(aggregator.orders)}, 输出={emitted}")
+        return False
+
+    aggregator.stop()
+    logger.info("✅ 订单数量上限正确")
+    return True
+
+
+if __name__ == "__main__":
+    print("\n" + "=" * 80)
+    print("测试部分成交聚合")
+    print("=" * 80 + "\n")
+
+    results = [
+        test_latency_mode(),
+        test_accuracy_mode(),
+        test_bounded_memory()
+    ]
+
+    if all(results):
+        print("\n✅ 所有成交聚合测试通过！")
+    else:
+        print("\n❌ 部分成交聚合测试失败，请查看日志文件 test_fill_aggregator.log")
+        sys.exit(1)
@@ -0,0 +1,217 @@
+"""
+测试历史成交列式存档和回填
+验证增量追加去重、按时间查询、合并存档、分页回填以及共享限速（离线测试，不访问网络）
+"""
+import sys
+import os
+import time
+import tempfile
+import logging
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logger_config import setup_logger
+from fill_archive import FillArchive
+from fill_backfill import FillBackfiller, WeightRateLimiter, PAGE_LIMIT
+
+# 设置日志
+setup_logger(log_file='test_fill_archive.log', log_level='INFO')
+logger = logging.getLogger(__name__)
+
+ADDRESS = '0xABC0000000000000000000000000000000000001'
+
+
+def make_fill(tid: int, time_ms: int, coin: str = 'BTC', direction: str = 'Close Long'):
+    """构造一笔 userFills 格式的成交"""
+    return {
+        'coin': coin, 'px': '50000.5', 'sz': '0.1', 'side': 'A', 'time': time_ms,
+        'startPosition': '1.0', 'dir': direction, 'closedPnl': '12.5', 'fee': '0.3',
+        'oid': 1000 + tid, 'tid': tid, 'crossed': True
+    }
+
+
+def test_append_and_load():
+    """测试追加去重、按时间查询和还原成交"""
+    logger.info("测试存档追加与查询...")
+    archive = FillArchive(tempfile.mkdtemp(), ADDRESS)
+
+    first = archive.append([make_fill(i, 1000 + i * 10) for i in range(100)])
+    # 与已存档部分重叠，批内也有重复
+    second = archive.append([make_fill(i, 1000 + i * 10, coin='ETH') for i in range(90, 150)] + [make_fill(149, 2490)])
+    if first != 100 or second != 50 or archive.row_count != 150:
+        logger.error(f"❌ 去重错误: first={first}, second={second}, total={archive.row_count}")
+        return False
+
+    # 重新打开存档，从 index.json 恢复
+    archive = FillArchive(os.path.dirname(archive.directory), ADDRESS)
+    data = archive.load(1500, 2000, columns=['tid', 'px'])
+    expected = list(range(50, 101))
+    if data['tid'].tolist() != expected or archive.time_range != (1000, 2490):
+        logger.error(f"❌ 时间查询错误: {data['tid'].tolist()[:5]}..., 范围 {archive.time_range}")
+        return False
+
+    fills = list(archive.iter_fills(2400, None))
+    if [f['tid'] for f in fills] != list(range(140, 150)) or fills[0]['coin'] != 'ETH' or fills[0]['dir'] != 'Close Long':
+        logger.error(f"❌ 成交还原错误: {fills[:1]}")
+        return False
+    if float(fills[0]['px']) != 50000.5 or fills[0]['side'] != 'A':
+        logger.error(f"❌ 成交字段错误: {fills[0]}")
+        return False
+
+    logger.info("✅ 存档追加与查询正确")
+    return True
+
+
+def test_compact():
+    """测试合并小块后查询结果不变"""
+    logger.info("测试合并存档...")
+    archive = FillArchive(tempfile.mkdtemp(), ADDRESS)
+    # 乱序追加，块之间时间范围重叠
+    for start in (500, 0, 250):
+        archive.append([make_fill(start + i, start * 10 + i * 10) for i in range(250)])
+    before = archive.load()
+    chunks = archive.compact(chunk_rows=300)
+    after = archive.load()
+
+    if chunks != 3 or after['tid'].tolist() != before['tid'].tolist() or after['tid'].tolist() != list(range(750)):
+        logger.error(f"❌ 合并结果错误: {chunks} 块")
+        return False
+    if len(os.listdir(archive.directory)) != 4:  # 3个块目录 + index.json
+        logger.error(f"❌ 旧块未删除: {os.listdir(archive.directory)}")
+        return False
+
+    logger.info("✅ 合并存档正确")
+    return True
+
+
+class PagedBackfiller(FillBackfiller):
+    """从内存中的成交列表分页返回的回填器"""
+
+    def __init__(self, fills, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fills = fills
+
+    def fetch_page(self, start_ms, end_ms):
+        self.limiter.acquire(20)
+        with self.lock:
+            self.request_count += 1
+        page = [f for f in self.fills if start_ms <= f['time'] <= end_ms]
+        return page[:PAGE_LIMIT]
+
+
+def test_paged_backfill():
+    """测试按窗口并发分页回填，同一毫秒跨页的成交不丢失"""
+    logger.info("测试分页回填...")
+    # 每毫秒3笔成交，单个窗口需要多页
+    fills = [make_fill(i, 10_000 + i // 3) for i in range(9000)]
+    archive = FillArchive(tempfile.mkdtemp(), ADDRESS)
+    backfiller = PagedBackfiller(
+        fills, api_url='', archive=archive, limiter=WeightRateLimiter(100_000), workers=3, window_ms=1000
+    )
+    stats = backfiller.run(10_000, 13_000)
+
+    if archive.row_count != 9000 or stats['stored'] != 9000:
+        logger.error(f"❌ 回填条数错误: {archive.row_count}, {stats}")
+        return False
+    if archive.load(columns=['tid'])['tid'].tolist() != list(range(9000)):
+        logger.error("❌ 回填结果顺序错误")
+        return False
+
+    # 重复运行不新增
+    stats = backfiller.run(10_000, 13_000)
+    if archive.row_count != 9000:
+        logger.error(f"❌ 重复回填产生重复数据: {archive.row_count}")
+        return False
+
+    logger.info(f"✅ 分页回填正确 (请求 {backfiller.request_count} 次)")
+    return True
+
+
+class FlakyBackfiller(PagedBackfiller):
+    """请求指定时间窗口时失败的回填器"""
+
+    def __init__(self, failing_start, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.failing_start = failing_start
+
+    def fetch_page(self, start_ms, end_ms):
+        if self.failing_start is not None and self.failing_start <= start_ms <= end_ms < self.failing_start + 1000:
+            return None
+        return super().fetch_page(start_ms, end_ms)
+
+
+def test_failed_window_resume():
+    """测试中间窗口失败后下次运行从该窗口继续，不留下缺口"""
+    logger.info("测试失败窗口续传...")
+    fills = [make_fill(i, 10_000 + i) for i in range(3000)]
+    archive = FillArchive(tempfile.mkdtemp(), ADDRESS)
+    backfiller = FlakyBackfiller(
+        11_000, fills, api_url='', archive=archive, limiter=WeightRateLimiter(100_000), workers=3, window_ms=1000
+    )
+    stats = backfiller.run(10_000, 12_999)
+
+    if stats['failed'] != 1 or archive.row_count != 2000:
+        logger.error(f"❌ 失败窗口统计错误: {stats}, 存档 {archive.row_count} 条")
+        return False
+    if archive.incomplete_windows != [[11_000, 11_999]]:
+        logger.error(f"❌ 未完成窗口记录错误: {archive.incomplete_windows}")
+        return False
+    # 存档最新时间已到最后一个窗口，续传必须从失败的中间窗口开始
+    if archive.time_range[1] != 12_999 or archive.resume_time != 11_000:
+        logger.error(f"❌ 续传时间错误: {archive.resume_time}")
+        return False
+
+    # 重新打开存档（模拟下次运行），从续传时间回填
+    archive = FillArchive(archive.directory.rsplit(os.sep, 1)[0], ADDRESS)
+    backfiller = FlakyBackfiller(
+        None, fills, api_url='', archive=archive, limiter=WeightRateLimiter(100_000), workers=3, window_ms=1000
+    )
+    stats = backfiller.run(archive.resume_time, 12_999)
+
+    if stats['failed'] or archive.row_count != 3000 or archive.incomplete_windows:
+        logger.error(f"❌ 续传后存档不完整: {stats}, 存档 {archive.row_count} 条, 未完成 {archive.incomplete_windows}")
+        return False
+    if archive.load(columns=['tid'])['tid'].tolist() != list(range(3000)):
+        logger.error("❌ 续传后存档有缺口")
+        return False
+
+    logger.info("✅ 失败窗口续传正确")
+    return True
+
+
+def test_shared_rate_limit():
+    """测试共享限速器限制总请求速率"""
+    logger.info("测试共享限速...")
+    limiter = WeightRateLimiter(weight_per_minute=6000)  # 每秒100
+    limiter.tokens = 0
+    started = time.perf_counter()
+    for _ in range(5):
+        limiter.acquire(20)
+    elapsed = time.perf_counter() - started
+    if elapsed < 0.9:
+        logger.error(f"❌ 限速未生效: {elapsed:.2f}秒")
+        return False
+
+    logger.info(f"✅ 共享限速正确 ({elapsed:.2f}秒)")
+    return True
+
+
+if __name__ == "__main__":
+    print("\n" + "=" * 80)
+    print("测试历史成交存档与回填")
+    print("=" * 80 + "\n")
+
+    results = [
+        test_append_and_load(),
+        test_compact(),
+        test_paged_backfill(),
+        test_failed_window_resume(),
+        test_shared_rate_limit()
+    ]
+
+    if all(results):
+        print("\n✅ 所有存档与回填测试通过！")
+    else:
+        print("\n❌ 部分存档与回填测试失败，请查看日志文件 test_fill_archive.log")
+        sys.exit(1)
@@ -0,0 +1,110 @@
+"""
+测试低延迟模式
+验证热路径内暂停垃圾回收、退出后恢复、推迟回收计数以及回收停顿统计（离线测试，不访问网络）
+"""
+import sys
+import os
+import gc
+import threading
+import logging
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logger_config import setup_logger
+from latency_mode import LatencyMode
+
+# 设置日志
+setup_logger(log_file='test_latency_mode.log', log_level='INFO')
+logger = logging.getLogger(__name__)
+
+
+def test_hot_path_defers_gc():
+    """测试热路径内暂停回收，退出后恢复并记录推迟的回收"""
+    logger.info("测试热路径回收控制...")
+    latency = LatencyMode(enabled=True)
+    latency.start()
+
+    try:
+        with latency.hot_path():
+            with latency.hot_path():
+                if gc.isenabled():
+                    logger.error("❌ 热路径内垃圾回收未暂停")
+                    return False
+                # 分配足够多的容器对象，超过第0代回收阈值
+                garbage = [[] for _ in range(gc.get_threshold()[0] * 2)]
+            if gc.isenabled():
+                logger.error("❌ 嵌套热路径退出后过早恢复回收")
+                return False
+        del garbage
+
+        if not gc.isenabled() or latency.deferred_count != 1 or latency.hot_path_count != 2:
+            logger.error(f"❌ 回收未恢复或计数错误: deferred={latency.deferred_count}, hot_path={latency.hot_path_count}")
+            return False
+
+        gc.collect()
+        if latency.pause_count == 0:
+            logger.error("❌ 未记录回收停顿")
+            return False
+    finally:
+        latency.stop()
+        gc.unfreeze()
+
+    logger.info(f"✅ 热路径回收控制正确: {latency.summary()}")
+    return True
+
+
+def test_concurrent_hot_paths():
+    """测试多个线程同时进入热路径时，最后一个退出后才恢复回收"""
+    logger.info("测试多线程热路径...")
+    latency = LatencyMode(enabled=True)
+    inside = threading.Barrier(2)
+    release = threading.Event()
+
+    def worker():
+        with latency.hot_path():
+            inside.wait()
+            release.wait()
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    with latency.hot_path():
+        inside.wait()
+    still_disabled = not gc.isenabled()
+    release.set()
+    thread.join()
+
+    if not still_disabled or not gc.isenabled():
+        logger.error("❌ 多线程热路径回收状态错误")
+        return False
+
+    logger.info("✅ 多线程热路径正确")
+    return True
+
+
+def test_disabled_is_noop():
+    """测试未启用时热路径不改变回收状态"""
+    latency = LatencyMode(enabled=False)
+    with latency.hot_path():
+        if not gc.isenabled():
+            logger.error("❌ 未启用时不应暂停回收")
+            return False
+    return latency.summary() == []
+
+
+if __name__ == "__main__":
+    print("\n" + "=" * 80)
+    print("测试低延迟模式")
+    print("=" * 80 + "\n")
+
+    results = [
+        test_hot_path_defers_gc(),
+        test_concurrent_hot_paths(),
+        test_disabled_is_noop()
+    ]
+
+    if all(results):
+        print("\n✅ 所有低延迟模式测试通过！")
+    else:
+        print("\n❌ 部分低延迟模式测试失败，请查看日志文件 test_latency_mode.log")
+        sys.exit(1)
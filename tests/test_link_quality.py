@@ -0,0 +1,271 @@
+"""
+测试链路质量检测
+验证应用层ping与pong匹配计算RTT和抖动，连接变慢（RTT超过阈值）或丢失pong时主动重连，
+以及链路质量指标（离线测试，使用模拟时钟和模拟的 WebSocket 服务端）
+"""
+import sys
+import os
+import json
+import threading
+import logging
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logger_config import setup_logger
+from clock import SimulatedClock
+from link_quality import LinkQuality, RTT_ALPHA
+import hyperliquid_monitor_ws
+from hyperliquid_monitor_ws import HyperliquidMonitorWS, KEEPALIVE_INTERVAL
+
+# 设置日志
+setup_logger(log_file='test_link_quality.log', log_level='INFO')
+logger = logging.getLogger(__name__)
+
+ADDRESS = '0x' + 'ab' * 20
+HOUR = 3600
+
+
+class FakeServer:
+    """模拟服务端：pong按设定的延迟返回，可丢弃pong；定期推送消息使连接不会因静默而重连"""
+
+    def __init__(self, clock: SimulatedClock):
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.apps = []
+        self.current = None
+        self.latency_ms = 80.0
+        self.jitter_ms = 20.0
+        self.drop_pongs = False
+        self.pongs = 0
+        self.connections = 0
+        self.client_closes = 0
+        self.recycle_times = []  # 客户端主动关闭的虚拟时间
+
+    def settle(self, timeout: float = 5.0):
+        """等待所有连接的线程完成建立或关闭回调"""
+        with self.lock:
+            apps = list(self.apps)
+        for app in apps:
+            done = app.finished if app.closed.is_set() else app.opened
+            if not done.wait(timeout):
+                raise RuntimeError("模拟连接未在超时时间内完成")
+        with self.lock:
+            self.apps = [app for app in self.apps if not app.finished.is_set()]
+
+    def next_latency(self) -> float:
+        """交替偏高偏低的延迟（确定性的抖动）"""
+        self.pongs += 1
+        offset = self.jitter_ms if self.pongs % 2 else -self.jitter_ms
+        return (self.latency_ms + offset) / 1000
+
+    def push_heartbeat(self):
+        """推送一条非成交消息（保持连接有消息，只有pong丢失）"""
+        app = self.current
+        if app and app.opened.is_set() and not app.closed.is_set():
+            app.on_message(app, json.dumps({'channel': 'subscriptionResponse', 'data': {}}))
+
+
+class FakeWebSocketApp:
+    """替换 websocket.WebSocketApp，连接到 FakeServer"""
+
+    server = None
+
+    def __init__(self, url, on_open=None, on_message=None, on_error=None, on_close=None, on_ping=None, on_pong=None):
+        self.on_open = on_open
+        self.on_message = on_message
+        self.on_close = on_close
+        self.opened = threading.Event()
+        self.closed = threading.Event()
+        self.finished = threading.Event()
+        with self.server.lock:
+            self.server.apps.append(self)
+
+    def run_forever(self, **kwargs):
+        self.server.connections += 1
+        self.server.current = self
+        self.on_open(self)
+        self.opened.set()
+        self.closed.wait()
+        self.on_close(self, 1000, 'closed')
+        self.finished.set()
+
+    def _deliver_pong(self):
+        if not self.closed.is_set():
+            self.on_message(self, json.dumps({'channel': 'pong'}))
+
+    def send(self, message: str):
+        if json.loads(message).get('method') == 'ping' and not self.server.drop_pongs:
+            self.server.clock.call_later(self.server.next_latency(), self._deliver_pong)
+
+    def close(self):
+        if not self.closed.is_set():
+            self.server.client_closes += 1
+            self.server.recycle_times.append(self.server.clock.monotonic())
+            self.closed.set()
+
+
+def run_until(clock: SimulatedClock, server: FakeServer, end: float):
+    """按任务到期时间推进虚拟时间，每批任务执行后等待连接线程完成"""
+    while clock.now < end:
+        deadline = clock.next_deadline()
+        clock.advance(min(deadline if deadline is not None else end, end) - clock.now)
+        server.settle()
+
+
+def test_estimator():
+    """测试RTT、抖动估算和丢失统计"""
+    logger.info("测试RTT估算...")
+    link = LinkQuality()
+    if link.pong_received(1.0) is not None:
+        logger.error("❌ 没有等待中的ping时不应记录RTT")
+        return False
+    for index in range(40):
+        link.ping_sent(index * 30.0)
+        link.pong_received(index * 30.0 + 0.1)
+    stats = link.snapshot()
+    if abs(stats['rtt_ms'] - 100) > 0.1 or stats['jitter_ms'] > 1 or link.degraded(1000, 2):
+        logger.error(f"❌ 稳定RTT估算错误: {stats}")
+        return False
+
+    # 一次突增只按权重影响平滑RTT，不会立即判定为链路变慢
+    link.ping_sent(1200.0)
+    link.pong_received(1200.9)
+    stats = link.snapshot()
+    if abs(stats['rtt_ms'] - (100 + RTT_ALPHA * 800)) > 0.1 or stats['max_rtt_ms'] != 900.0 or link.degraded(1000, 2):
+        logger.error(f"❌ RTT突增估算错误: {stats}")
+        return False
+
+    # 连续丢失pong达到上限时判定需要重连，收到pong后清零
+    link.ping_sent(1230.0)
+    if not link.expire_ping() or link.degraded(0, 2):
+        logger.error("❌ 第一次丢失pong不应判定重连")
+        return False
+    link.ping_sent(1260.0)
+    link.expire_ping()
+    if not link.degraded(0, 2) or link.snapshot()['pongs_lost'] != 2:
+        logger.error("❌ 连续丢失pong应判定重连")
+        return False
+
+    # 新连接重新估算：样本不足时不按RTT判断，累计统计保留
+    link.reset()
+    link.ping_sent(1300.0)
+    link.pong_received(1302.0)
+    if link.degraded(1000, 2) or link.snapshot()['rtt_ms'] != 2000.0 or link.snapshot()['pings_sent'] != 44:
+        logger.error(f"❌ 重置后估算错误: {link.snapshot()}")
+        return False
+
+    logger.info(f"✅ RTT估算正确: {link.summary()}")
+    return True
+
+
+def run_monitor(scenario, end: float, **kwargs):
+    """
+    在模拟时钟下运行监控，按场景改变链路状态
+
+    Args:
+        scenario: 接收 (clock, server) 并安排链路变化的函数
+        end: 运行的虚拟时长（秒）
+        **kwargs: 传给监控器的链路质量参数
+
+    Returns:
+        (监控器, 模拟服务端)
+    """
+    clock = SimulatedClock()
+    server = FakeServer(clock)
+    FakeWebSocketApp.server = server
+    original_app = hyperliquid_monitor_ws.websocket.WebSocketApp
+    hyperliquid_monitor_ws.websocket.WebSocketApp = FakeWebSocketApp
+    monitor = HyperliquidMonitorWS('http://127.0.0.1:9/info', 'ws://127.0.0.1:9/ws', ADDRESS, clock=clock, **kwargs)
+    monitor._request_user_state = lambda: None
+    worker = threading.Thread(target=monitor.start_monitoring, kwargs={
+        'callback': None, 'position_print_interval': 600, 'startup_checks': False
+    })
+    try:
+        worker.start()
+        while monitor.periodic_task is None:
+            worker.join(0.001)
+        clock.call_every(10, server.push_heartbeat)
+        scenario(clock, server)
+        run_until(clock, server, end)
+    finally:
+        monitor.stop()
+        worker.join(2)
+        server.settle()
+        hyperliquid_monitor_ws.websocket.WebSocketApp = original_app
+    return monitor, server
+
+
+def test_degraded_link():
+    """测试链路变慢和丢失pong时主动重连，链路恢复后不再重连"""
+    logger.info("测试链路质量下降时主动重连...")
+
+    def scenario(clock: SimulatedClock, server: FakeServer):
+        # 第1小时正常，之后10分钟RTT升到1.5秒，第2小时起5分钟丢失pong
+        clock.call_later(HOUR, lambda: setattr(server, 'latency_ms', 1500.0))
+        clock.call_later(HOUR + 600, lambda: setattr(server, 'latency_ms', 80.0))
+        clock.call_later(2 * HOUR, lambda: setattr(server, 'drop_pongs', True))
+        clock.call_later(2 * HOUR + 300, lambda: setattr(server, 'drop_pongs', False))
+
+    monitor, server = run_monitor(scenario, 4 * HOUR, rtt_recycle_ms=1000, pong_loss_limit=2)
+    stats = monitor.link.snapshot()
+    server.recycle_times.pop()  # 最后一次是停止监控时的关闭
+    slow = [t for t in server.recycle_times if HOUR <= t < 2 * HOUR]
+    lossy = [t for t in server.recycle_times if 2 * HOUR <= t < 3 * HOUR]
+
+    if any(t < HOUR for t in server.recycle_times) or any(t >= 3 * HOUR for t in server.recycle_times):
+        logger.error(f"❌ 链路正常时不应重连: {server.recycle_times}")
+        return False
+    # 平滑RTT从80ms升到1000ms以上需要8个样本
+    if not slow or slow[0] - HOUR > 9 * KEEPALIVE_INTERVAL:
+        logger.error(f"❌ RTT升高后未及时重连: {slow}")
+        return False
+    # 连续2个ping未收到pong时重连
+    if not lossy or lossy[0] - 2 * HOUR > 3 * KEEPALIVE_INTERVAL:
+        logger.error(f"❌ 丢失pong后未及时重连: {lossy}")
+        return False
+    if stats['recycles'] != server.client_closes - 1 or server.connections != stats['recycles'] + 1:
+        logger.error(f"❌ 重连次数错误: {stats}, 连接 {server.connections} 次, 关闭 {server.client_closes} 次")
+        return False
+    if abs(stats['rtt_ms'] - 80) > 20 or stats['jitter_ms'] > 40 or stats['pongs_lost'] < 4:
+        logger.error(f"❌ 恢复后的链路指标错误: {stats}")
+        return False
+
+    logger.info(f"✅ RTT升高 {slow[0] - HOUR:.0f}秒后重连（共 {len(slow)} 次），"
+                f"丢失pong {lossy[0] - 2 * HOUR:.0f}秒后重连（共 {len(lossy)} 次）: {monitor.link.summary()}")
+    return True
+
+
+def test_recycle_disabled():
+    """测试未配置阈值时只统计RTT，不主动重连"""
+    logger.info("测试未配置阈值...")
+
+    def scenario(clock: SimulatedClock, server: FakeServer):
+        server.latency_ms = 1500.0
+        clock.call_later(HOUR, lambda: setattr(server, 'drop_pongs', True))
+
+    monitor, server = run_monitor(scenario, HOUR + 300)
+    stats = monitor.link.snapshot()
+    if server.connections != 1 or stats['recycles'] != 0 or stats['rtt_ms'] < 1000 or stats['pongs_lost'] < 5:
+        logger.error(f"❌ 未配置阈值时不应主动重连: {stats}, 连接 {server.connections} 次")
+        return False
+    logger.info(f"✅ 只统计不重连: {monitor.link.summary()}")
+    return True
+
+
+if __name__ == "__main__":
+    print("\n" + "=" * 80)
+    print("测试链路质量检测")
+    print("=" * 80 + "\n")
+
+    results = [
+        test_estimator(),
+        test_degraded_link(),
+        test_recycle_disabled()
+    ]
+
+    if all(results):
+        print("\n✅ 所有链路质量测试通过！")
+    else:
+        print("\n❌ 部分链路质量测试失败，请查看日志文件 test_link_quality.log")
+        sys.exit(1)
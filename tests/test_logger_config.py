@@ -0,0 +1,129 @@
+"""
+测试队列日志系统
+验证日志在后台线程写入、JSON-lines 输出以及高频日志限流（离线测试，不访问网络）
+"""
+import sys
+import os
+import json
+import time
+import tempfile
+import logging
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logger_config import setup_logger, shutdown_logger, RateLimitFilter, RATE_LIMITED
+
+logger = logging.getLogger(__name__)
+
+
+def test_queue_and_json_lines():
+    """测试日志经队列写入文本文件和JSON-lines文件"""
+    directory = tempfile.mkdtemp()
+    log_file = os.path.join(directory, 'test.log')
+    json_file = os.path.join(directory, 'test.jsonl')
+    setup_logger(log_file=log_file, log_level='DEBUG', json_log_file=json_file, rate_limit_max=0)
+
+    logger.debug("调试日志")
+    logger.warning("⚠️  警告日志")
+    shutdown_logger()
+
+    with open(log_file, encoding='utf-8') as f:
+        text = f.read()
+    with open(json_file, encoding='utf-8') as f:
+        entries = [json.loads(line) for line in f]
+
+    if "调试日志" not in text or "警告日志" not in text:
+        print(f"❌ 文本日志缺少内容: {text}")
+        return False
+    if entries[-1]['lvl'] != 'WARNING' or entries[-1]['msg'] != "⚠️  警告日志":
+        print(f"❌ JSON-lines 日志错误: {entries[-1]}")
+        return False
+
+    print("✅ 队列日志与 JSON-lines 输出正确")
+    return True
+
+
+def test_rate_limit():
+    """测试同一调用位置的DEBUG日志和声明限流的INFO日志被限流，其他INFO日志和警告不受影响，退出时输出抑制条数"""
+    directory = tempfile.mkdtemp()
+    log_file = os.path.join(directory, 'test.log')
+    setup_logger(log_file=log_file, log_level='DEBUG', rate_limit_window=60, rate_limit_max=5)
+
+    for i in range(100):
+        logger.debug(f"💓 收到Ping (总计: {i})")
+    for i in range(100):
+        logger.info(f"📥 收到实时订单数据: {i} 条", extra=RATE_LIMITED)
+    for i in range(30):
+        logger.info(f"✅ 开空成功! 订单ID: {i}")
+    for i in range(10):
+        logger.warning(f"⚠️  警告 {i}")
+    shutdown_logger()
+
+    with open(log_file, encoding='utf-8') as f:
+        text = f.read()
+    pings = text.count("收到Ping")
+    frames = text.count("收到实时订单数据")
+    orders = text.count("开空成功")
+    warnings = text.count("警告 ")
+    if pings != 5 or frames != 5 or orders != 30 or warnings != 10:
+        print(f"❌ 限流结果错误: ping={pings}, 逐帧={frames}, 下单={orders}, 警告={warnings}")
+        return False
+    # 窗口未结束时退出，抑制的条数也会输出
+    if text.count("已抑制 95 条同类日志") != 2:
+        print("❌ 退出时未输出抑制条数")
+        return False
+
+    # 新窗口的第一条日志附带被抑制的条数
+    rate_filter = RateLimitFilter(window=0.0, max_per_window=1)
+    record = logging.LogRecord('x', logging.DEBUG, 'a.py', 1, 'msg', None, None)
+    rate_filter.filter(record)
+    rate_filter.sites[('a.py', 1)][2] = 3
+    record = logging.LogRecord('x', logging.DEBUG, 'a.py', 1, 'msg', None, None)
+    if not rate_filter.filter(record) or '已抑制 3 条' not in record.getMessage():
+        print(f"❌ 抑制计数未输出: {record.getMessage()}")
+        return False
+
+    print("✅ 高频日志限流正确")
+    return True
+
+
+def test_shutdown_closed_stream():
+    """测试控制台输出流已被关闭时退出不抛出异常"""
+    directory = tempfile.mkdtemp()
+    stdout = sys.stdout
+    stream = open(os.path.join(directory, 'stdout.txt'), 'w', encoding='utf-8')
+    sys.stdout = stream
+    try:
+        setup_logger(log_file=os.path.join(directory, 'test.log'), log_level='INFO')
+        logger.info("输出流即将关闭")
+    finally:
+        sys.stdout = stdout
+    time.sleep(0.1)  # 等待监听线程写完已入队的日志
+    stream.close()
+    try:
+        shutdown_logger()
+    except (OSError, ValueError) as e:
+        print(f"❌ 输出流关闭后退出时抛出异常: {e}")
+        return False
+
+    print("✅ 输出流关闭后正常退出")
+    return True
+
+
+if __name__ == "__main__":
+    print("\n" + "=" * 80)
+    print("测试队列日志系统")
+    print("=" * 80 + "\n")
+
+    results = [
+        test_queue_and_json_lines(),
+        test_rate_limit(),
+        test_shutdown_closed_stream()
+    ]
+
+    if all(results):
+        print("\n✅ 所有日志系统测试通过！")
+    else:
+        print("\n❌ 部分日志系统测试失败")
+        sys.exit(1)
@@ -0,0 +1,238 @@
+"""
+测试多账户交易
+验证信号按账户和币种返回结果、单个账户出错不影响其他账户，以及热加载时更新账户参数
+（离线测试，使用模拟的执行后端，不发送任何订单）
+"""
+import sys
+import os
+import time
+import threading
+import logging
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logger_config import setup_logger
+from multi_account_trader import MultiAccountTrader
+
+# 设置日志
+setup_logger(log_file='test_multi_account_trader.log', log_level='INFO')
+logger = logging.getLogger(__name__)
+
+LEGS = [{'coin': 'ETH', 'symbol': 'ETHUSDC'}, {'coin': 'BTC', 'symbol': 'BTCUSDC', 'size_scale': 0.5}]
+
+
+class StubTrader:
+    """模拟执行后端：按 API 密钥决定行为，记录每次批量下单的参数"""
+
+    def __init__(self, api_key, api_secret, testnet=False, **options):
+        if api_key == 'broken':
+            raise RuntimeError("初始化失败")
+        self.api_key = api_key
+        self.calls = []
+        self.position_queries = []
+        self.threads = set()
+        self.lock = threading.Lock()
+
+    def execute_short_batch(self, legs, leverage, usdc_amount):
+        with self.lock:
+            self.calls.append((tuple(leg['coin'] for leg in legs), leverage, usdc_amount))
+            self.threads.add(threading.current_thread().name)
+        if self.api_key == 'raises':
+            raise RuntimeError("账户接口异常")
+        if self.api_key == 'partial':
+            # 只有ETH下单成功
+            return {'ETH': {'orderId': 7}}
+        return {leg['coin']: {'orderId': index + 1} for index, leg in enumerate(legs)}
+
+    def get_account_info_summary(self):
+        with self.lock:
+            self.threads.add(threading.current_thread().name)
+        time.sleep(0.2)
+        return {'balances': {'USDC': 100.0}}
+
+    def get_position_info(self, symbol):
+        with self.lock:
+            self.position_queries.append(symbol)
+        return [{'symbol': symbol, 'positionAmt': '-0.5', 'entryPrice': '2000.0'}]
+
+
+def make_account(name, api_key, leverage=10, margin=100.0):
+    return {'name': name, 'api_key': api_key, 'api_secret': 's', 'leverage': leverage, 'position_size_usdc': margin}
+
+
+def test_results_per_account_and_coin():
+    """测试每个账户每个币种各有一个结果，初始化失败的账户被跳过且保持配置顺序"""
+    logger.info("测试按账户和币种返回结果...")
+    trader = MultiAccountTrader([make_account('a', 'ok'), make_account('broken', 'broken'),
+                                 make_account('b', 'partial', leverage=20, margin=50.0)], trader_class=StubTrader)
+    try:
+        if [account['name'] for account in trader.accounts] != ['a', 'b']:
+            logger.error(f"❌ 账户列表错误: {[account['name'] for account in trader.accounts]}")
+            return False
+
+        results = trader.execute_short_trades(LEGS)
+        by_key = {(r['account'], r['coin']): r for r in results}
+        if len(results) != 4 or set(by_key) != {('a', 'ETH'), ('a', 'BTC'), ('b', 'ETH'), ('b', 'BTC')}:
+            logger.error(f"❌ 结果数量错误: {sorted(by_key)}")
+            return False
+        if not all(by_key[('a', coin)]['success'] for coin in ('ETH', 'BTC')):
+            logger.error("❌ 正常账户的结果应全部成功")
+            return False
+        if not by_key[('b', 'ETH')]['success'] or by_key[('b', 'BTC')]['success']:
+            logger.error("❌ 部分成功的账户结果错误")
+            return False
+        if by_key[('b', 'ETH')]['order_id'] != 7 or by_key[('a', 'ETH')]['quantity'] != 0.5:
+            logger.error(f"❌ 订单ID或持仓错误: {by_key[('b', 'ETH')]}, {by_key[('a', 'ETH')]}")
+            return False
+        # 保证金按账户配置和 size_scale 计算，每个账户只批量下单一次
+        if by_key[('b', 'BTC')]['margin'] != 25.0 or by_key[('b', 'BTC')]['position_value'] != 500.0:
+            logger.error(f"❌ 保证金计算错误: {by_key[('b', 'BTC')]}")
+            return False
+        calls = {account['name']: account['trader'].calls for account in trader.accounts}
+        if calls != {'a': [(('ETH', 'BTC'), 10, 100.0)], 'b': [(('ETH', 'BTC'), 20, 50.0)]}:
+            logger.error(f"❌ 批量下单参数错误: {calls}")
+            return False
+    finally:
+        trader.shutdown()
+
+    logger.info("✅ 每个账户每个币种各有一个结果")
+    return True
+
+
+def test_account_failure_isolated():
+    """测试单个账户抛出异常时其他账户照常下单，出错账户的每个币种记为失败"""
+    logger.info("测试账户错误隔离...")
+    trader = MultiAccountTrader([make_account('a', 'ok'), make_account('bad', 'raises'), make_account('c', 'ok')],
+                                trader_class=StubTrader)
+    try:
+        results = trader.execute_short_trades(LEGS)
+        failed = sorted((r['account'], r['coin']) for r in results if not r['success'])
+        succeeded = sorted((r['account'], r['coin']) for r in results if r['success'])
+        if failed != [('bad', 'BTC'), ('bad', 'ETH')]:
+            logger.error(f"❌ 失败结果错误: {failed}")
+            return False
+        if succeeded != [('a', 'BTC'), ('a', 'ETH'), ('c', 'BTC'), ('c', 'ETH')]:
+            logger.error(f"❌ 其他账户应成功: {succeeded}")
+            return False
+        # 下一个信号仍然在所有账户上执行
+        results = trader.execute_short_trades(LEGS[:1])
+        if sorted(r['account'] for r in results if r['success']) != ['a', 'c']:
+            logger.error("❌ 出错后的下一个信号执行错误")
+            return False
+    finally:
+        trader.shutdown()
+
+    logger.info("✅ 单个账户出错不影响其他账户")
+    return True
+
+
+def test_deferred_positions():
+    """测试下单时不查询持仓，fill_positions 在之后补充成功订单的持仓（低延迟模式的热路径只包含下单）"""
+    logger.info("测试推迟查询持仓...")
+    trader = MultiAccountTrader([make_account('a', 'ok'), make_account('b', 'partial')], trader_class=StubTrader)
+    try:
+        results = trader.execute_short_trades(LEGS, fetch_positions=False)
+        queries = {account['name']: account['trader'].position_queries for account in trader.accounts}
+        if any(queries.values()) or any(r['quantity'] for r in results):
+            logger.error(f"❌ 下单时不应查询持仓: {queries}")
+            return False
+
+        trader.fill_positions(results)
+        queries = {name: sorted(symbols) for name, symbols in queries.items()}
+        if queries != {'a': ['BTCUSDC', 'ETHUSDC'], 'b': ['ETHUSDC']}:
+            logger.error(f"❌ 只应查询下单成功的交易对: {queries}")
+            return False
+        filled = sorted((r['account'], r['coin']) for r in results if r['quantity'] == 0.5)
+        if filled != [('a', 'BTC'), ('a', 'ETH'), ('b', 'ETH')]:
+            logger.error(f"❌ 持仓未写入结果: {filled}")
+            return False
+    finally:
+        trader.shutdown()
+
+    logger.info("✅ 持仓查询可推迟到下单之后")
+    return True
+
+
+def test_account_info_off_order_pool():
+    """测试启动时查询账户信息不占用下单线程，查询期间信号照常下单"""
+    logger.info("测试账户信息查询线程...")
+    trader = MultiAccountTrader([make_account('a', 'ok'), make_account('b', 'ok')], trader_class=StubTrader)
+    try:
+        summaries = {}
+        reports = threading.Thread(target=lambda: summaries.update(trader.get_account_info_summaries()))
+        reports.start()
+        time.sleep(0.05)
+        started = time.perf_counter()
+        results = trader.execute_short_trades(LEGS[:1], fetch_positions=False)
+        elapsed = time.perf_counter() - started
+        reports.join()
+
+        if not all(r['success'] for r in results) or elapsed > 0.1:
+            logger.error(f"❌ 查询账户信息时下单被阻塞: {elapsed * 1000:.0f}ms")
+            return False
+        if set(summaries) != {'a', 'b'} or not all(summaries.values()):
+            logger.error(f"❌ 账户信息错误: {summaries}")
+            return False
+        threads = set().union(*(account['trader'].threads for account in trader.accounts))
+        if not any(name.startswith('account-info') for name in threads):
+            logger.error(f"❌ 账户信息应在独立线程中查询: {threads}")
+            return False
+    finally:
+        trader.shutdown()
+
+    logger.info("✅ 账户信息查询不占用下单线程")
+    return True
+
+
+def test_update_accounts():
+    """测试热加载更新杠杆和保证金，新增和移除账户只记录警告"""
+    logger.info("测试更新账户参数...")
+    trader = MultiAccountTrader([make_account('a', 'ok'), make_account('b', 'ok')], trader_class=StubTrader)
+    try:
+        releveraged = trader.update_accounts([
+            {'name': 'a', 'leverage': 10, 'position_size_usdc': 200.0},
+            {'name': 'b', 'leverage': 5, 'position_size_usdc': 100.0},
+            {'name': 'new', 'leverage': 3, 'position_size_usdc': 10.0}
+        ])
+        params = {a['name']: (a['leverage'], a['position_size_usdc']) for a in trader.accounts}
+        if releveraged != ['b'] or params != {'a': (10, 200.0), 'b': (5, 100.0)}:
+            logger.error(f"❌ 更新结果错误: {releveraged}, {params}")
+            return False
+
+        trader.execute_short_trades(LEGS[:1])
+        calls = {account['name']: account['trader'].calls[-1] for account in trader.accounts}
+        if calls != {'a': (('ETH',), 10, 200.0), 'b': (('ETH',), 5, 100.0)}:
+            logger.error(f"❌ 更新后下单未使用新参数: {calls}")
+            return False
+
+        # 配置中移除的账户仍保留（需要重启），未变化时不返回需要重新设置杠杆的账户
+        releveraged = trader.update_accounts([{'name': 'a', 'leverage': 10, 'position_size_usdc': 200.0}])
+        if releveraged or [a['name'] for a in trader.accounts] != ['a', 'b']:
+            logger.error(f"❌ 移除账户的处理错误: {releveraged}")
+            return False
+    finally:
+        trader.shutdown()
+
+    logger.info("✅ 账户参数更新正确")
+    return True
+
+
+if __name__ == "__main__":
+    print("\n" + "=" * 80)
+    print("测试多账户交易")
+    print("=" * 80 + "\n")
+
+    results = [
+        test_results_per_account_and_coin(),
+        test_account_failure_isolated(),
+        test_deferred_positions(),
+        test_account_info_off_order_pool(),
+        test_update_accounts()
+    ]
+
+    if all(results):
+        print("\n✅ 所有多账户交易测试通过！")
+    else:
+        print("\n❌ 部分多账户交易测试失败，请查看日志文件 test_multi_account_trader.log")
+        sys.exit(1)
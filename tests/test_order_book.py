@@ -0,0 +1,114 @@
+"""
+测试本地订单簿
+验证快照 + 增量事件的序列校验，以及IOC限价计算（离线测试，不访问网络）
+"""
+import sys
+import os
+import logging
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logger_config import setup_logger
+from order_book import LocalOrderBook
+
+# 设置日志
+setup_logger(log_file='test_order_book.log', log_level='INFO')
+logger = logging.getLogger(__name__)
+
+
+def make_event(first_id, last_id, prev_id, bids=None, asks=None):
+    """构造一条depthUpdate事件"""
+    return {
+        'e': 'depthUpdate',
+        's': 'ETHUSDC',
+        'U': first_id,
+        'u': last_id,
+        'pu': prev_id,
+        'b': bids or [],
+        'a': asks or []
+    }
+
+
+def test_snapshot_and_diff():
+    """测试快照之前缓存的事件能正确回放"""
+    logger.info("测试快照与增量事件回放...")
+    book = LocalOrderBook('ETHUSDC')
+
+    # 快照到达之前的事件先缓存
+    book.apply_diff(make_event(90, 95, 89, bids=[['2000.0', '1.0']]))
+    book.apply_diff(make_event(96, 105, 95, bids=[['2000.5', '2.0']]))
+    book.apply_diff(make_event(106, 110, 105, bids=[['2000.0', '0']]))
+
+    snapshot = {
+        'lastUpdateId': 100,
+        'bids': [['2000.0', '3.0'], ['1999.5', '5.0']],
+        'asks': [['2001.0', '4.0']]
+    }
+    if not book.apply_snapshot(snapshot):
+        logger.error("❌ 快照回放失败")
+        return False
+
+    # 第一个事件 u < lastUpdateId 被丢弃，后两个事件按顺序应用
+    expected_bids = {2000.5: 2.0, 1999.5: 5.0}
+    if book.bids != expected_bids or book.last_update_id != 110 or not book.synced:
+        logger.error(f"❌ 订单簿状态错误: bids={book.bids}, lastUpdateId={book.last_update_id}")
+        return False
+
+    logger.info("✅ 快照与增量事件回放正确")
+    return True
+
+
+def test_sequence_gap():
+    """测试增量事件不连续时订单簿失效"""
+    logger.info("测试增量事件序列校验...")
+    book = LocalOrderBook('ETHUSDC')
+    book.apply_snapshot({'lastUpdateId': 100, 'bids': [['2000.0', '1.0']], 'asks': []})
+    book.apply_diff(make_event(99, 101, 98))
+
+    if book.apply_diff(make_event(105, 106, 104)):
+        logger.error("❌ 未检测到不连续的事件")
+        return False
+    if book.synced or book.bids:
+        logger.error("❌ 事件不连续后订单簿未失效")
+        return False
+
+    logger.info("✅ 事件不连续时订单簿正确失效")
+    return True
+
+
+def test_estimate_sell():
+    """测试按买盘估算卖出均价"""
+    logger.info("测试卖出成交估算...")
+    book = LocalOrderBook('ETHUSDC')
+    book.apply_snapshot({
+        'lastUpdateId': 1,
+        'bids': [['2000.0', '1.0'], ['1999.0', '1.0'], ['1998.0', '10.0']],
+        'asks': [['2001.0', '1.0']]
+    })
+
+    estimate = book.estimate_sell(2.5)
+    if estimate['worst_price'] != 1998.0 or abs(estimate['vwap'] - 1999.2) > 1e-9:
+        logger.error(f"❌ 估算结果错误: {estimate}")
+        return False
+
+    logger.info(f"✅ 估算结果正确: {estimate}")
+    return True
+
+
+if __name__ == "__main__":
+    print("\n" + "=" * 80)
+    print("测试本地订单簿")
+    print("=" * 80 + "\n")
+
+    results = [
+        test_snapshot_and_diff(),
+        test_sequence_gap(),
+        test_estimate_sell()
+    ]
+
+    if all(results):
+        print("\n✅ 所有订单簿测试通过！")
+    else:
+        print("\n❌ 部分订单簿测试失败，请查看日志文件 test_order_book.log")
+        sys.exit(1)
@@ -0,0 +1,170 @@
+"""
+测试模拟盘执行后端
+验证按订单簿逐档成交、IOC限价部分成交、价格源成交、持仓和余额记录以及模拟延迟（离线测试，不发送任何订单）
+"""
+import sys
+import os
+import time
+import logging
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logger_config import setup_logger
+from order_book import LocalOrderBook
+from multi_account_trader import MultiAccountTrader
+from paper_trader import PaperTrader, LatencyModel, SlippageModel
+
+# 设置日志
+setup_logger(log_file='test_paper_trader.log', log_level='INFO')
+logger = logging.getLogger(__name__)
+
+
+class StaticBooks:
+    """返回固定订单簿的订单簿管理器"""
+
+    def __init__(self, books):
+        self.books = books
+
+    def get_book(self, symbol):
+        return self.books.get(symbol)
+
+
+def make_book(symbol, bids, asks):
+    """由 [(价格, 数量)] 构造本地订单簿"""
+    book = LocalOrderBook(symbol)
+    book.apply_snapshot({
+        'lastUpdateId': 1,
+        'bids': [[str(p), str(q)] for p, q in bids],
+        'asks': [[str(p), str(q)] for p, q in asks]
+    })
+    return book
+
+
+def test_market_fill_against_book():
+    """测试市价单逐档吃买盘、持仓均价和手续费"""
+    logger.info("测试订单簿成交...")
+    books = StaticBooks({'ETHUSDC': make_book('ETHUSDC', [(100, 1), (99, 1), (98, 10)], [(101, 5)])})
+    trader = PaperTrader(order_book=books, initial_balance=1000, fee_rate=0.001, quantity_step=0.1)
+
+    # 中间价100.5，10倍杠杆 30.15 USDC → 3张，成交 100 + 99 + 98
+    order = trader.execute_short_trade('ETH', 'ETHUSDC', 10, 30.15)
+    if not order or order['status'] != 'FILLED' or abs(float(order['avgPrice']) - 99.0) > 1e-9:
+        logger.error(f"❌ 成交错误: {order}")
+        return False
+
+    positions = trader.get_position_info('ETHUSDC')
+    if float(positions[0]['positionAmt']) != -3.0 or abs(float(positions[0]['entryPrice']) - 99.0) > 1e-9:
+        logger.error(f"❌ 持仓错误: {positions}")
+        return False
+
+    summary = trader.get_account_info_summary()
+    if abs(summary['total_balance'] - (1000 - 3 * 99 * 0.001)) > 1e-9 or summary['positions'][0]['side'] != '空头':
+        logger.error(f"❌ 账户摘要错误: {summary}")
+        return False
+    if not trader.is_order_filled(order) or trader.get_position_info('ETHUSDC')[0]['leverage'] != '10':
+        logger.error("❌ 订单状态或杠杆错误")
+        return False
+
+    logger.info("✅ 订单簿成交正确")
+    return True
+
+
+def test_ioc_partial_fill():
+    """测试IOC单只成交限价以内的档位，没有买盘时不成交"""
+    logger.info("测试IOC成交...")
+    books = StaticBooks({'BTCUSDC': make_book('BTCUSDC', [(100, 1), (99, 5)], [(100.2, 1)])})
+    trader = PaperTrader(order_book=books, execution_mode='IOC', max_slippage_bps=50, quantity_step=0.5)
+
+    # 限价 99.5：只成交第一档
+    order = trader.open_short_position('BTCUSDC', 3)
+    if not order or order['status'] != 'EXPIRED' or float(order['executedQty']) != 1.0 or order['type'] != 'LIMIT':
+        logger.error(f"❌ IOC部分成交错误: {order}")
+        return False
+
+    # 买盘为空且没有价格源时无法成交
+    books.books['BTCUSDC'] = make_book('BTCUSDC', [], [(100.2, 1)])
+    if trader.open_short_position('BTCUSDC', 1) is not None:
+        logger.error("❌ 没有买盘时不应成交")
+        return False
+
+    logger.info("✅ IOC成交正确")
+    return True
+
+
+def test_price_source_and_batch():
+    """测试没有订单簿时按价格源成交、滑点模型和批量开空"""
+    logger.info("测试价格源与批量开空...")
+    prices = {'ETHUSDC': 2000.0, 'BTCUSDC': 50000.0}
+    trader = PaperTrader(price_source=prices.get, slippage_model=SlippageModel(fixed_bps=10))
+
+    results = trader.execute_short_batch(
+        [{'coin': 'ETH', 'symbol': 'ETHUSDC'}, {'coin': 'BTC', 'symbol': 'BTCUSDC', 'size_scale': 0.5},
+         {'coin': 'SOL', 'symbol': 'SOLUSDC'}],
+        leverage=10, usdc_amount=100
+    )
+    if results['SOL'] is not None or not results['ETH'] or not results['BTC']:
+        logger.error(f"❌ 批量结果错误: {results}")
+        return False
+    if abs(float(results['ETH']['avgPrice']) - 1998.0) > 1e-9 or float(results['BTC']['executedQty']) != 0.01:
+        logger.error(f"❌ 滑点或数量错误: {results}")
+        return False
+
+    # 价格上涨后空头出现浮亏
+    prices['ETHUSDC'] = 2100.0
+    balance = trader.get_account_balance()[0]
+    if float(balance['crossUnPnl']) >= 0:
+        logger.error(f"❌ 未实现盈亏错误: {balance}")
+        return False
+
+    logger.info("✅ 价格源与批量开空正确")
+    return True
+
+
+def test_latency_and_multi_account():
+    """测试模拟延迟，以及通过 MultiAccountTrader 使用模拟盘（无需API密钥）"""
+    logger.info("测试模拟延迟与多账户...")
+    accounts = [
+        {'name': 'a', 'api_key': '', 'api_secret': '', 'leverage': 5, 'position_size_usdc': 100},
+        {'name': 'b', 'api_key': '', 'api_secret': '', 'leverage': 10, 'position_size_usdc': 50}
+    ]
+    trader = MultiAccountTrader(
+        accounts, trader_class=PaperTrader, price_source=lambda symbol: 2000.0,
+        latency_model=LatencyModel(mean_ms=100, jitter_ms=0, seed=1)
+    )
+    try:
+        started = time.perf_counter()
+        results = trader.execute_short_trades([{'coin': 'ETH', 'symbol': 'ETHUSDC'}])
+        elapsed = time.perf_counter() - started
+    finally:
+        trader.shutdown()
+
+    # 两个账户并发下单，总耗时约等于一次延迟
+    if sorted(r['account'] for r in results) != ['a', 'b'] or not all(r['success'] for r in results):
+        logger.error(f"❌ 多账户结果错误: {results}")
+        return False
+    if elapsed < 0.09 or elapsed > 0.5:
+        logger.error(f"❌ 模拟延迟错误: {elapsed * 1000:.0f}ms")
+        return False
+
+    logger.info(f"✅ 模拟延迟与多账户正确 ({elapsed * 1000:.0f}ms)")
+    return True
+
+
+if __name__ == "__main__":
+    print("\n" + "=" * 80)
+    print("测试模拟盘执行后端")
+    print("=" * 80 + "\n")
+
+    results = [
+        test_market_fill_against_book(),
+        test_ioc_partial_fill(),
+        test_price_source_and_batch(),
+        test_latency_and_multi_account()
+    ]
+
+    if all(results):
+        print("\n✅ 所有模拟盘测试通过！")
+    else:
+        print("\n❌ 部分模拟盘测试失败，请查看日志文件 test_paper_trader.log")
+        sys.exit(1)
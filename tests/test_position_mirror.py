@@ -0,0 +1,130 @@
+"""
+测试监控地址持仓镜像
+验证 clearinghouseState 初始化、userFills 增量更新和平仓比例计算（离线测试，不访问网络）
+"""
+import sys
+import os
+import logging
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logger_config import setup_logger
+from position_mirror import WatchedAccountMirror
+
+# 设置日志
+setup_logger(log_file='test_position_mirror.log', log_level='INFO')
+logger = logging.getLogger(__name__)
+
+USER_STATE = {
+    'assetPositions': [
+        {'position': {'coin': 'ETH', 'szi': '10.0', 'entryPx': '2000.0', 'leverage': {'value': 20},
+                      'marginUsed': '1000.0', 'unrealizedPnl': '50.0', 'liquidationPx': '1500.0'}},
+        {'position': {'coin': 'BTC', 'szi': '0.0', 'entryPx': None, 'leverage': {'value': 20},
+                      'marginUsed': '0.0', 'unrealizedPnl': '0.0', 'liquidationPx': None}}
+    ],
+    'marginSummary': {'accountValue': '10000.0', 'totalMarginUsed': '1000.0'}
+}
+
+
+def make_fill(coin, side, size, price, start_position):
+    """构造一条userFills成交"""
+    return {
+        'coin': coin,
+        'side': side,
+        'sz': str(size),
+        'px': str(price),
+        'startPosition': str(start_position),
+        'closedPnl': '0.0'
+    }
+
+
+def test_incremental_updates():
+    """测试增量成交更新持仓"""
+    logger.info("测试持仓镜像增量更新...")
+    mirror = WatchedAccountMirror()
+    mirror.seed(USER_STATE)
+
+    # 平掉ETH多头的40%
+    result = mirror.apply_fill(make_fill('ETH', 'A', 4.0, 2100.0, 10.0))
+    if abs(result['close_fraction'] - 0.4) > 1e-9 or mirror.get_position_size('ETH') != 6.0:
+        logger.error(f"❌ 部分平仓结果错误: {result}, 持仓={mirror.get_position_size('ETH')}")
+        return False
+
+    # 新开BTC空头
+    result = mirror.apply_fill(make_fill('BTC', 'A', 0.5, 60000.0, 0.0))
+    if result['close_fraction'] != 0.0 or mirror.get_position_size('BTC') != -0.5:
+        logger.error(f"❌ 开仓结果错误: {result}")
+        return False
+
+    # ETH全部平仓后从镜像中移除
+    mirror.apply_fill(make_fill('ETH', 'A', 6.0, 2100.0, 6.0))
+    if 'ETH' in mirror.positions:
+        logger.error("❌ 平仓后持仓未移除")
+        return False
+
+    logger.info("✅ 持仓镜像增量更新正确")
+    return True
+
+
+def test_drift_and_diff():
+    """测试startPosition纠正镜像偏差以及与全量状态比较"""
+    logger.info("测试持仓镜像偏差纠正...")
+    mirror = WatchedAccountMirror()
+    mirror.seed(USER_STATE)
+
+    # 镜像中ETH为10，但成交显示成交前为12（错过了一笔加仓）
+    mirror.apply_fill(make_fill('ETH', 'A', 2.0, 2100.0, 12.0))
+    if mirror.drift_count != 1 or mirror.get_position_size('ETH') != 10.0:
+        logger.error(f"❌ 偏差未纠正: drift={mirror.drift_count}, 持仓={mirror.get_position_size('ETH')}")
+        return False
+
+    if mirror.diff(USER_STATE):
+        logger.error(f"❌ 持仓一致时比较结果不为空: {mirror.diff(USER_STATE)}")
+        return False
+
+    mirror.apply_fill(make_fill('ETH', 'A', 1.0, 2100.0, 10.0))
+    if len(mirror.diff(USER_STATE)) != 1:
+        logger.error("❌ 未检测到持仓不一致")
+        return False
+
+    logger.info("✅ 持仓镜像偏差纠正与比较正确")
+    return True
+
+
+def test_close_fraction():
+    """测试平仓比例计算"""
+    logger.info("测试平仓比例计算...")
+    cases = [
+        ((10.0, 5.0), 0.5),
+        ((10.0, 12.0), 0.0),
+        ((10.0, -2.0), 1.0),
+        ((0.0, -1.0), 0.0),
+        ((-4.0, -1.0), 0.75)
+    ]
+    for (start, new), expected in cases:
+        fraction = WatchedAccountMirror.close_fraction(start, new)
+        if abs(fraction - expected) > 1e-9:
+            logger.error(f"❌ 平仓比例错误: start={start}, new={new}, 结果={fraction}, 期望={expected}")
+            return False
+
+    logger.info("✅ 平仓比例计算正确")
+    return True
+
+
+if __name__ == "__main__":
+    print("\n" + "=" * 80)
+    print("测试监控地址持仓镜像")
+    print("=" * 80 + "\n")
+
+    results = [
+        test_incremental_updates(),
+        test_drift_and_diff(),
+        test_close_fraction()
+    ]
+
+    if all(results):
+        print("\n✅ 所有持仓镜像测试通过！")
+    else:
+        print("\n❌ 部分持仓镜像测试失败，请查看日志文件 test_position_mirror.log")
+        sys.exit(1)
@@ -0,0 +1,294 @@
+"""
+测试配置热加载
+验证配置校验、文件修改和 SIGHUP 触发重新加载、无效配置被拒绝、账户杠杆更新后重新预设，
+以及监控地址和深度流在现有连接上增量退订/订阅（离线测试，只访问本机）
+"""
+import sys
+import os
+import json
+import time
+import base64
+import signal
+import socket
+import tempfile
+import logging
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logger_config import setup_logger
+from runtime_config import RuntimeConfig, ConfigReloader, load_config_values
+from multi_account_trader import MultiAccountTrader
+from paper_trader import PaperTrader
+from order_book import OrderBookManager
+from hyperliquid_monitor_ws import HyperliquidMonitorWS
+from binance_standin import BinanceStandIn, encode_frame, read_frame
+
+# 设置日志
+setup_logger(log_file='test_runtime_config.log', log_level='INFO')
+logger = logging.getLogger(__name__)
+
+ADDRESS_A = '0x' + 'a' * 40
+ADDRESS_B = '0x' + 'b' * 40
+
+CONFIG_TEMPLATE = """
+BINANCE_API_KEY = 'key'
+MONITOR_ADDRESS = {address!r}
+TRADING_PAIRS = {pairs!r}
+LEVERAGE = {leverage!r}
+POSITION_SIZE_USDC = 50
+BINANCE_ACCOUNTS = []
+POSITION_SIZING_MODE = 'FIXED'
+POSITION_SIZE_MIN_SCALE = 0.1
+SIGNAL_RULES = {{'coins': ['ETH', 'BTC'], 'pnl_sign': {pnl_sign!r}}}
+SCAN_INTERVAL = 5
+POSITION_PRINT_INTERVAL = 300
+POSITION_CONSISTENCY_INTERVAL = 3600
+"""
+
+
+def write_config(path, address=ADDRESS_A, pairs=None, leverage=10, pnl_sign='nonzero', extra=''):
+    """写入测试用配置文件"""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(CONFIG_TEMPLATE.format(address=address, pairs=pairs or {'ETH': 'ETHUSDC'},
+                                       leverage=leverage, pnl_sign=pnl_sign) + extra)
+
+
+def open_stream(standin, path):
+    """打开一个WebSocket连接，返回 (套接字, 可读取帧的文件对象)"""
+    sock = socket.create_connection((standin.host, standin.port), timeout=5)
+    key = base64.b64encode(os.urandom(16)).decode()
+    sock.sendall((
+        f"GET {path} HTTP/1.1\r\nHost: {standin.host}\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+        f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n"
+    ).encode())
+    stream = sock.makefile('rb')
+    while stream.readline() not in (b'\r\n', b''):
+        pass
+    return sock, stream
+
+
+def send_request(sock, method, streams, request_id):
+    """在行情连接上发送 SUBSCRIBE/UNSUBSCRIBE 请求（客户端帧需要掩码）"""
+    payload = json.dumps({'method': method, 'params': streams, 'id': request_id}).encode()
+    sock.sendall(encode_frame(payload, mask=True))
+
+
+class RecordingSocket:
+    """记录发送内容的WebSocket连接"""
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, message):
+        self.sent.append(json.loads(message))
+
+
+def test_validation():
+    """测试配置校验和比较"""
+    logger.info("测试配置校验...")
+    path = os.path.join(tempfile.mkdtemp(), 'config.py')
+    write_config(path)
+    values = load_config_values(path)
+    config = RuntimeConfig.from_values(values)
+    if config.monitor_address != ADDRESS_A or config.accounts != [{'name': 'main', 'leverage': 10, 'position_size_usdc': 50}]:
+        logger.error(f"❌ 配置解析错误: {vars(config)}")
+        return False
+
+    invalid = [
+        {'MONITOR_ADDRESS': '0x123'},
+        {'TRADING_PAIRS': {}},
+        {'TRADING_PAIRS': {'ETH': 'ethusdc'}},
+        {'LEVERAGE': 0},
+        {'BINANCE_ACCOUNTS': [{'name': 'a'}, {'name': 'a'}]},
+        {'SIGNAL_RULES': {'pnl_sign': 'sometimes'}},
+        {'SCAN_INTERVAL': 0},
+    ]
+    for override in invalid:
+        try:
+            RuntimeConfig.from_values(dict(values, **override))
+            logger.error(f"❌ 无效配置未被拒绝: {override}")
+            return False
+        except ValueError as e:
+            logger.info(f"已拒绝: {e}")
+
+    changed = RuntimeConfig.from_values(dict(values, LEVERAGE=20, SCAN_INTERVAL=1))
+    if config.diff(changed) != ['accounts', 'scan_interval']:
+        logger.error(f"❌ 配置比较错误: {config.diff(changed)}")
+        return False
+
+    logger.info("✅ 配置校验正确")
+    return True
+
+
+def test_reload_triggers():
+    """测试文件修改和 SIGHUP 触发重新加载，无效配置保留当前配置"""
+    logger.info("测试重新加载触发...")
+    path = os.path.join(tempfile.mkdtemp(), 'config.py')
+    write_config(path)
+    applied = []
+    reloader = ConfigReloader(
+        current=RuntimeConfig.from_values(load_config_values(path)),
+        apply=lambda config, changes: applied.append((config, changes)),
+        path=path,
+        poll_interval=0.05
+    )
+    reloader.start()
+    try:
+        # 文件修改（交易对和监控地址）
+        write_config(path, address=ADDRESS_B, pairs={'ETH': 'ETHUSDC', 'BTC': 'BTCUSDC'})
+        deadline = time.time() + 3
+        while not applied and time.time() < deadline:
+            time.sleep(0.01)
+        if not applied or applied[0][1] != ['monitor_address', 'trading_pairs']:
+            logger.error(f"❌ 文件修改未触发重新加载: {applied}")
+            return False
+
+        # 无效配置：保留当前配置
+        write_config(path, address=ADDRESS_B, pairs={'ETH': 'ETHUSDC', 'BTC': 'BTCUSDC'}, leverage=500)
+        deadline = time.time() + 3
+        while reloader.rejected_count == 0 and time.time() < deadline:
+            time.sleep(0.01)
+        if reloader.rejected_count != 1 or len(applied) != 1 or reloader.current.monitor_address != ADDRESS_B:
+            logger.error("❌ 无效配置应被拒绝且保留当前配置")
+            return False
+
+        # 停止文件检查后用 SIGHUP 触发（修改需要重启的配置项不触发应用）
+        reloader.poll_interval = 0
+        write_config(path, address=ADDRESS_B, pairs={'ETH': 'ETHUSDC', 'BTC': 'BTCUSDC'}, pnl_sign='positive',
+                     extra="BINANCE_API_KEY = 'other'\n")
+        reloader.request_reload()  # 唤醒按旧的检查间隔等待的线程
+        time.sleep(0.1)
+        os.kill(os.getpid(), signal.SIGHUP)
+        deadline = time.time() + 3
+        while len(applied) < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        if len(applied) != 2 or applied[1][1] != ['signal_rules']:
+            logger.error(f"❌ SIGHUP未触发重新加载: {[changes for _, changes in applied]}")
+            return False
+    finally:
+        reloader.stop()
+        signal.signal(signal.SIGHUP, signal.SIG_DFL)
+
+    logger.info(f"✅ 重新加载触发正确 (应用 {reloader.reload_count} 次, 拒绝 {reloader.rejected_count} 次)")
+    return True
+
+
+def test_account_update_and_prime():
+    """测试更新账户杠杆后只为杠杆变化的账户重新预设"""
+    logger.info("测试账户更新...")
+    trader = MultiAccountTrader(
+        [{'name': 'a', 'api_key': '', 'api_secret': '', 'leverage': 5, 'position_size_usdc': 100},
+         {'name': 'b', 'api_key': '', 'api_secret': '', 'leverage': 10, 'position_size_usdc': 50}],
+        trader_class=PaperTrader
+    )
+    try:
+        trader.prime_symbols(['ETHUSDC'])
+        releveraged = trader.update_accounts([
+            {'name': 'a', 'leverage': 20, 'position_size_usdc': 100},
+            {'name': 'b', 'leverage': 10, 'position_size_usdc': 80},
+            {'name': 'c', 'leverage': 10, 'position_size_usdc': 80}
+        ])
+        trader.prime_symbols(['ETHUSDC'], account_names=releveraged)
+        trader.forget_symbols(['BTCUSDC'])
+        a, b = trader.accounts
+        if releveraged != ['a'] or a['trader'].primed_leverage['ETHUSDC'] != 20 or b['position_size_usdc'] != 80:
+            logger.error(f"❌ 账户更新错误: {releveraged}, {a}, {b}")
+            return False
+        if len(trader.accounts) != 2 or b['trader'].primed_leverage['ETHUSDC'] != 10:
+            logger.error("❌ 新增账户不应生效，未变化的账户不应重新预设")
+            return False
+    finally:
+        trader.shutdown()
+
+    logger.info("✅ 账户更新正确")
+    return True
+
+
+def test_incremental_subscriptions():
+    """测试深度流和监控地址在现有连接上增量退订/订阅"""
+    logger.info("测试增量订阅...")
+
+    # 替身服务器：同一个组合流连接上增加和移除交易对
+    standin = BinanceStandIn(port=0, seed=1, depth_interval_ms=20)
+    standin.start()
+    try:
+        sock, stream = open_stream(standin, '/stream?streams=btcusdc@depth@100ms')
+        send_request(sock, 'SUBSCRIBE', ['ethusdc@depth@100ms'], 1)
+        streams, acked = set(), False
+        for _ in range(40):
+            message = json.loads(read_frame(stream)[1])
+            if message.get('id') == 1:
+                acked = True
+            elif 'stream' in message:
+                streams.add(message['stream'])
+            if acked and len(streams) == 2:
+                break
+        send_request(sock, 'UNSUBSCRIBE', ['btcusdc@depth@100ms'], 2)
+        while json.loads(read_frame(stream)[1]).get('id') != 2:
+            pass
+        after = {json.loads(read_frame(stream)[1])['stream'] for _ in range(10)}
+        sock.close()
+    finally:
+        standin.stop()
+    if not acked or streams != {'btcusdc@depth@100ms', 'ethusdc@depth@100ms'} or after != {'ethusdc@depth@100ms'}:
+        logger.error(f"❌ 替身服务器订阅错误: {streams} / {after}")
+        return False
+
+    # 订单簿管理器：已连接时发送 SUBSCRIBE/UNSUBSCRIBE，重连地址包含当前交易对
+    manager = OrderBookManager(['BTCUSDC'], rest_url='http://127.0.0.1:9', ws_url='ws://127.0.0.1:9')
+    manager.ws, manager.ws_connected = RecordingSocket(), True
+    manager._request_snapshot = lambda symbol: None
+    manager.add_symbols(['ETHUSDC', 'BTCUSDC'])
+    manager.remove_symbols(['BTCUSDC'])
+    sent = [(m['method'], m['params']) for m in manager.ws.sent]
+    if sent != [('SUBSCRIBE', ['ethusdc@depth@100ms']), ('UNSUBSCRIBE', ['btcusdc@depth@100ms'])]:
+        logger.error(f"❌ 订单簿订阅请求错误: {sent}")
+        return False
+    if list(manager.books) != ['ETHUSDC'] or not manager.ws_url.endswith('streams=ethusdc@depth@100ms'):
+        logger.error(f"❌ 订单簿交易对错误: {list(manager.books)}, {manager.ws_url}")
+        return False
+
+    # WebSocket监控器：切换地址只退订旧地址、订阅新地址，旧地址的推送被忽略
+    monitor = HyperliquidMonitorWS('http://127.0.0.1:9/info', 'ws://127.0.0.1:9/ws', ADDRESS_A)
+    monitor.ws, monitor.ws_connected = RecordingSocket(), True
+    monitor._resync_mirror_async = lambda: None
+    signals = []
+    monitor.batch_callback = signals.extend
+    monitor.set_monitor_address(ADDRESS_B)
+    sent = [(m['method'], m['subscription']['user']) for m in monitor.ws.sent]
+    if sent != [('unsubscribe', ADDRESS_A), ('subscribe', ADDRESS_B)]:
+        logger.error(f"❌ 监控地址切换请求错误: {sent}")
+        return False
+    fill = {'coin': 'ETH', 'dir': 'Close Long', 'side': 'A', 'sz': '1', 'px': '2000', 'closedPnl': '5',
+            'tid': 1, 'oid': 1, 'time': int(time.time() * 1000)}
+    monitor._on_ws_message(None, json.dumps({'channel': 'userFills', 'data': {'user': ADDRESS_A, 'fills': [fill]}}))
+    if signals:
+        logger.error("❌ 旧地址的推送不应触发信号")
+        return False
+    monitor._on_ws_message(None, json.dumps({'channel': 'userFills', 'data': {'user': ADDRESS_B, 'fills': [fill]}}))
+    if len(signals) != 1 or signals[0]['coin'] != 'ETH':
+        logger.error(f"❌ 新地址的推送应触发信号: {signals}")
+        return False
+
+    logger.info("✅ 增量订阅正确")
+    return True
+
+
+if __name__ == "__main__":
+    print("\n" + "=" * 80)
+    print("测试配置热加载")
+    print("=" * 80 + "\n")
+
+    results = [
+        test_validation(),
+        test_reload_triggers(),
+        test_account_update_and_prime(),
+        test_incremental_subscriptions()
+    ]
+
+    if all(results):
+        print("\n✅ 所有配置热加载测试通过！")
+    else:
+        print("\n❌ 部分配置热加载测试失败，请查看日志文件 test_runtime_config.log")
+        sys.exit(1)
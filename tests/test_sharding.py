@@ -0,0 +1,618 @@
+"""
+测试分片监控
+验证一致性哈希分配均匀且成员变化时只迁移少量地址，多个工作进程的地址不重不漏，
+平仓信号经信号总线汇总到下单进程，工作进程崩溃后其地址被接管且交接期间的成交不丢不重，
+以及交易所拒绝订阅的地址不计入监控地址数
+（离线测试，使用本地 SQLite、Unix 域套接字和模拟的 WebSocket 服务端）
+"""
+import sys
+import os
+import io
+import json
+import socket
+import time
+import tempfile
+import threading
+import logging
+from contextlib import redirect_stdout
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logger_config import setup_logger
+from clock import SimulatedClock
+from signal_bus import SignalBusServer, SignalBusClient
+import hyperliquid_monitor_ws
+import sharding
+from sharding import HashRing, ShardMembership, ShardWorker, load_addresses, read_members
+
+# 设置日志
+setup_logger(log_file='test_sharding.log', log_level='INFO')
+logger = logging.getLogger(__name__)
+
+WORKERS = ['shard-0', 'shard-1', 'shard-2']
+ADDRESS_COUNT = 300
+PER_CONNECTION = 40
+USERS_PER_IP = ADDRESS_COUNT  # 模拟交易所默认不按IP限制地址数
+TTL = 0.5
+
+
+def make_address(index: int) -> str:
+    return '0x' + f'{index:040x}'
+
+
+class FakeExchange:
+    """
+    模拟交易所：记录每个连接订阅的地址，订阅时推送该地址的历史快照，成交推送给订阅该地址的连接；
+    设置 user_cap 时，同一出口IP的所有连接订阅的不同地址数超过上限后通过 error 通道拒绝订阅（模拟单个IP的地址数上限）
+    """
+
+    def __init__(self, user_cap=None):
+        self.lock = threading.Lock()
+        self.user_cap = user_cap
+        self.apps = []
+        self.history = {}  # 地址 -> 成交列表
+        self.tid = 0
+
+    def wait_open(self, timeout: float = 5.0):
+        """等待所有连接建立"""
+        with self.lock:
+            apps = list(self.apps)
+        for app in apps:
+            if not app.opened.wait(timeout):
+                raise RuntimeError("模拟连接未在超时时间内建立")
+
+    def push_fill(self, address: str):
+        """地址产生一条平仓成交，推送给订阅该地址的连接"""
+        with self.lock:
+            self.tid += 1
+            fill = {'tid': self.tid, 'oid': self.tid * 10, 'coin': 'ETH', 'side': 'A', 'dir': 'Close Long',
+                    'sz': '1.0', 'px': '2000.0', 'closedPnl': '-1.0', 'startPosition': '2.0',
+                    'time': int(time.time() * 1000)}
+            self.history.setdefault(address, []).append(fill)
+            apps = [app for app in self.apps if address in app.subscriptions and not app.closed.is_set()]
+        for app in apps:
+            app.on_message(app, json.dumps({'channel': 'userFills', 'data': {'user': address, 'fills': [fill]}}))
+        return self.tid
+
+    def subscribers(self, address: str) -> int:
+        with self.lock:
+            return sum(1 for app in self.apps if address in app.subscriptions and not app.closed.is_set())
+
+    def users_by_ip(self) -> dict:
+        """出口IP -> 订阅的不同地址数"""
+        with self.lock:
+            users = {}
+            for app in self.apps:
+                if not app.closed.is_set():
+                    users.setdefault(app.source, set()).update(app.subscriptions)
+            return {source: len(addresses) for source, addresses in users.items()}
+
+
+class FakeWebSocketApp:
+    """替换 websocket.WebSocketApp，连接到 FakeExchange"""
+
+    exchange = None
+
+    def __init__(self, url, on_open=None, on_message=None, on_error=None, on_close=None, on_ping=None, on_pong=None,
+                 socket=None):
+        self.source = socket  # 指定出口IP时为 open_source_socket 的结果（测试中替换为出口IP本身）
+        self.on_open = on_open
+        self.on_message = on_message
+        self.on_close = on_close
+        self.subscriptions = set()
+        self.opened = threading.Event()
+        self.closed = threading.Event()
+        with self.exchange.lock:
+            self.exchange.apps.append(self)
+
+    def run_forever(self, **kwargs):
+        self.on_open(self)
+        self.opened.set()
+        self.closed.wait()
+        self.on_close(self, 1000, 'closed')
+
+    def send(self, message: str):
+        request = json.loads(message)
+        subscription = request.get('subscription', {})
+        address = subscription.get('user')
+        if subscription.get('type') != 'userFills':
+            return
+        if request['method'] == 'subscribe':
+            with self.exchange.lock:
+                tracked = set().union(*(app.subscriptions for app in self.exchange.apps
+                                        if not app.closed.is_set() and app.source == self.source))
+                cap = self.exchange.user_cap
+                fills = list(self.exchange.history.get(address, []))
+            if cap is not None and address not in tracked and len(tracked) >= cap:
+                self.on_message(self, json.dumps({'channel': 'error',
+                                                  'data': f'Cannot track more than {cap} total users.'}))
+                return
+            self.subscriptions.add(address)
+            self.on_message(self, json.dumps({'channel': 'subscriptionResponse', 'data': request}))
+            self.on_message(self, json.dumps({'channel': 'userFills',
+                                              'data': {'user': address, 'fills': fills, 'isSnapshot': True}}))
+        else:
+            self.subscriptions.discard(address)
+
+    def close(self):
+        self.closed.set()
+
+
+def test_ring():
+    """测试哈希环分配均匀，增减工作进程时只迁移相邻区间的地址"""
+    logger.info("测试一致性哈希...")
+    addresses = [make_address(index) for index in range(10000)]
+    ring = HashRing(WORKERS)
+    counts = [len(assigned) for assigned in ring.assign(addresses).values()]
+    if sum(counts) != len(addresses) or max(counts) > 1.25 * len(addresses) / len(WORKERS):
+        logger.error(f"❌ 分配不均匀: {counts}")
+        return False
+
+    grown = HashRing(WORKERS + ['shard-3'])
+    moved = [address for address in addresses if ring.node_for(address) != grown.node_for(address)]
+    if any(grown.node_for(address) != 'shard-3' for address in moved) or len(moved) > 0.35 * len(addresses):
+        logger.error(f"❌ 增加工作进程时迁移了 {len(moved)} 个地址")
+        return False
+
+    shrunk = HashRing(['shard-0', 'shard-2'])
+    moved = [address for address in addresses if ring.node_for(address) != shrunk.node_for(address)]
+    if any(ring.node_for(address) != 'shard-1' for address in moved):
+        logger.error("❌ 减少工作进程时迁移了其他工作进程的地址")
+        return False
+    if ring.node_for(addresses[0].upper().replace('0X', '0x')) != ring.node_for(addresses[0]):
+        logger.error("❌ 地址大小写不同时分配结果不同")
+        return False
+
+    logger.info(f"✅ 分配均匀 {counts}，增加工作进程迁移 "
+                f"{sum(1 for a in addresses if ring.node_for(a) != grown.node_for(a)) / len(addresses):.1%} 的地址")
+    return True
+
+
+class Cluster:
+    """在同一进程中运行多个分片工作进程和一个下单端"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.addresses_path = os.path.join(directory, 'addresses.txt')
+        with open(self.addresses_path, 'w') as f:
+            f.write("# 监控地址\n")
+            for index in range(ADDRESS_COUNT):
+                f.write(make_address(index) + "\n")
+        self.db = os.path.join(directory, 'members.db')
+        self.clock = SimulatedClock()
+        self.buses = {}
+        self.workers = {}
+        self.received = []
+        self.received_lock = threading.Lock()
+        for worker_id in WORKERS:
+            bus = SignalBusServer(os.path.join(directory, f'{worker_id}.sock'))
+            bus.start()
+            self.buses[worker_id] = bus
+            self.workers[worker_id] = ShardWorker(
+                worker_id, self.addresses_path, ShardMembership(self.db, worker_id, ttl=TTL), bus.publish,
+                'http://127.0.0.1:9/info', 'ws://127.0.0.1:9/ws', addresses_per_connection=PER_CONNECTION,
+                heartbeat_interval=1, clock=self.clock, users_per_ip=USERS_PER_IP)
+        self.client = SignalBusClient([bus.path for bus in self.buses.values()], handler=self._receive)
+        threading.Thread(target=self.client.run, daemon=True).start()
+
+    def _receive(self, signals):
+        with self.received_lock:
+            self.received.extend(signals)
+
+    def tick(self, workers=None):
+        for worker_id in workers or self.workers:
+            self.workers[worker_id].tick()
+        FakeWebSocketApp.exchange.wait_open()
+
+    def wait_received(self, count: int, timeout: float = 5.0) -> bool:
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            with self.received_lock:
+                if len(self.received) >= count:
+                    return True
+            time.sleep(0.01)
+        return False
+
+    def owner_of(self) -> dict:
+        owners = {}
+        for worker_id, worker in self.workers.items():
+            for address in worker.owned:
+                owners.setdefault(address, []).append(worker_id)
+        return owners
+
+    def stop(self):
+        for worker in self.workers.values():
+            worker.stop()
+        self.client.stop()
+        for bus in self.buses.values():
+            bus.stop()
+
+
+def test_cluster():
+    """测试多个工作进程分配地址、汇总信号，以及工作进程崩溃后接管地址"""
+    logger.info("测试分片工作进程...")
+    exchange = FakeExchange()
+    FakeWebSocketApp.exchange = exchange
+    original_app = hyperliquid_monitor_ws.websocket.WebSocketApp
+    hyperliquid_monitor_ws.websocket.WebSocketApp = FakeWebSocketApp
+    # 启动前的历史成交只作为快照，不触发信号
+    for index in range(20):
+        exchange.push_fill(make_address(index))
+    time.sleep(0.01)
+    cluster = Cluster(tempfile.mkdtemp())
+    try:
+        addresses = load_addresses(cluster.addresses_path)
+
+        # 依次启动的工作进程看到的成员不同，第二轮心跳后分配收敛
+        cluster.tick()
+        cluster.tick()
+        owners = cluster.owner_of()
+        if len(owners) != ADDRESS_COUNT or any(len(owner) != 1 for owner in owners.values()):
+            logger.error(f"❌ 地址分配有重复或遗漏: {len(owners)} 个地址")
+            return False
+        ring = HashRing(WORKERS)
+        if any(owners[address] != [ring.node_for(address)] for address in addresses):
+            logger.error("❌ 分配结果与哈希环不一致")
+            return False
+        if any(exchange.subscribers(address) != 1 for address in addresses):
+            logger.error("❌ 交易所端的订阅与分配不一致")
+            return False
+        for worker in cluster.workers.values():
+            expected = -(-len(worker.owned) // PER_CONNECTION)
+            if len(worker.connections) > expected + 1:
+                logger.error(f"❌ {worker.worker_id} 连接数过多: {len(worker.connections)} (地址 {len(worker.owned)})")
+                return False
+
+        # 每个地址的实时成交只由一个工作进程发出一次信号
+        tids = [exchange.push_fill(address) for address in addresses]
+        if not cluster.wait_received(ADDRESS_COUNT) or sorted(s['fill_id'] for s in cluster.received) != sorted(tids):
+            logger.error(f"❌ 信号汇总错误: 收到 {len(cluster.received)} 个")
+            return False
+        time.sleep(0.1)
+        if len(cluster.received) != ADDRESS_COUNT:
+            logger.error(f"❌ 历史快照或重复信号被发送: {len(cluster.received)}")
+            return False
+
+        # shard-1 崩溃：停止心跳和连接，但不退出成员表
+        crashed = cluster.workers['shard-1']
+        crashed_addresses = list(crashed.owned)
+        for connection in crashed.connections:
+            connection.running = False
+            connection.ws.close()
+        time.sleep(0.05)
+
+        # 存活的工作进程在有效期内继续心跳，不会重新分配
+        cluster.tick(['shard-0', 'shard-2'])
+        if set(cluster.owner_of()) != set(addresses):
+            logger.error("❌ 有效期内不应重新分配")
+            return False
+
+        # 崩溃期间产生的成交由接管的工作进程在快照中补处理
+        gap_tids = [exchange.push_fill(address) for address in crashed_addresses[:30]]
+        # 存活的工作进程持续心跳，直到崩溃的工作进程超过有效期
+        deadline = time.time() + TTL + 0.1
+        while time.time() < deadline:
+            cluster.tick(['shard-0', 'shard-2'])
+            time.sleep(0.1)
+        cluster.workers.pop('shard-1')
+        owners = cluster.owner_of()
+        survivors = HashRing(['shard-0', 'shard-2'])
+        if any(owners.get(address) != [survivors.node_for(address)] for address in addresses):
+            logger.error("❌ 崩溃的工作进程的地址未被接管")
+            return False
+        if not cluster.wait_received(ADDRESS_COUNT + len(gap_tids)):
+            logger.error(f"❌ 交接期间的成交丢失: 收到 {len(cluster.received) - ADDRESS_COUNT}/{len(gap_tids)}")
+            return False
+        time.sleep(0.1)
+        fill_ids = [s['fill_id'] for s in cluster.received]
+        if len(fill_ids) != len(set(fill_ids)) or sorted(fill_ids[ADDRESS_COUNT:]) != gap_tids:
+            logger.error(f"❌ 接管后信号重复或错误: {fill_ids[ADDRESS_COUNT:]}")
+            return False
+        takeovers = sum(worker.takeover_count for worker in cluster.workers.values())
+        if takeovers != len(crashed_addresses):
+            logger.error(f"❌ 接管数错误: {takeovers} != {len(crashed_addresses)}")
+            return False
+
+        # 接管后的实时成交仍然只有一个信号
+        before = len(cluster.received)
+        exchange.push_fill(crashed_addresses[-1])
+        if not cluster.wait_received(before + 1):
+            logger.error("❌ 接管后的实时成交未送达")
+            return False
+
+        # 成员表中记录各工作进程的统计，崩溃的工作进程标记为已退出
+        cluster.tick()
+        members = {member['worker']: member for member in read_members(cluster.db)}
+        if members['shard-1']['alive'] or not members['shard-0']['alive']:
+            logger.error(f"❌ 成员状态错误: {members}")
+            return False
+        live_addresses = sum(members[w]['stats']['addresses'] for w in ('shard-0', 'shard-2'))
+        if live_addresses != ADDRESS_COUNT or members['shard-0']['stats']['rss_mb'] <= 0:
+            logger.error(f"❌ 统计信息错误: {members}")
+            return False
+        output = io.StringIO()
+        with redirect_stdout(output):
+            sharding.main(['status', '--db', cluster.db])
+        if '已退出' not in output.getvalue() or output.getvalue().count('存活') != 2:
+            logger.error(f"❌ 状态输出错误: {output.getvalue()}")
+            return False
+        logger.info("工作进程状态:\n" + output.getvalue())
+    finally:
+        cluster.stop()
+        hyperliquid_monitor_ws.websocket.WebSocketApp = original_app
+
+    logger.info(f"✅ {ADDRESS_COUNT} 个地址分配到 {len(WORKERS)} 个工作进程，"
+                f"崩溃后 {len(crashed_addresses)} 个地址被接管，交接期间 {len(gap_tids)} 条成交补处理无重复")
+    return True
+
+
+def test_address_file_reload():
+    """测试修改地址列表后自动增减订阅，正常退出的工作进程立即让出地址"""
+    logger.info("测试地址列表变化...")
+    exchange = FakeExchange()
+    FakeWebSocketApp.exchange = exchange
+    original_app = hyperliquid_monitor_ws.websocket.WebSocketApp
+    hyperliquid_monitor_ws.websocket.WebSocketApp = FakeWebSocketApp
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'addresses.txt')
+    db = os.path.join(directory, 'members.db')
+    clock = SimulatedClock()
+    workers = {}
+    try:
+        with open(path, 'w') as f:
+            f.write("\n".join(make_address(index) for index in range(50)))
+        for worker_id in WORKERS[:2]:
+            workers[worker_id] = ShardWorker(worker_id, path, ShardMembership(db, worker_id, ttl=TTL), lambda s: None,
+                                             'http://127.0.0.1:9/info', 'ws://127.0.0.1:9/ws',
+                                             addresses_per_connection=PER_CONNECTION, clock=clock,
+                                             users_per_ip=USERS_PER_IP)
+            workers[worker_id].start()
+        workers['shard-0'].tick()
+        exchange.wait_open()
+
+        with open(path, 'w') as f:
+            f.write("\n".join(make_address(index) for index in range(20, 80)))
+        os.utime(path, ns=(time.time_ns(), time.time_ns() + 1))
+        for worker in workers.values():
+            worker.tick()
+        exchange.wait_open()
+        owned = set(workers['shard-0'].owned) | set(workers['shard-1'].owned)
+        expected = {make_address(index) for index in range(20, 80)}
+        if owned != expected or exchange.subscribers(make_address(0)) != 0:
+            logger.error(f"❌ 地址列表变化后订阅错误: {len(owned)} 个")
+            return False
+
+        # 正常退出不需要等待有效期
+        workers.pop('shard-1').stop()
+        workers['shard-0'].tick()
+        exchange.wait_open()
+        if set(workers['shard-0'].owned) != expected or exchange.subscribers(make_address(79)) != 1:
+            logger.error("❌ 正常退出的工作进程的地址未立即迁移")
+            return False
+    finally:
+        for worker in workers.values():
+            worker.stop()
+        hyperliquid_monitor_ws.websocket.WebSocketApp = original_app
+
+    logger.info("✅ 地址列表变化和正常退出后重新分配正确")
+    return True
+
+
+def test_subscription_rejected():
+    """测试交易所拒绝订阅（单个IP的地址数上限）时地址记为未订阅、不计入监控地址数并只警报一次"""
+    logger.info("测试订阅被拒绝...")
+    exchange = FakeExchange(user_cap=10)
+    FakeWebSocketApp.exchange = exchange
+    original_app = hyperliquid_monitor_ws.websocket.WebSocketApp
+    hyperliquid_monitor_ws.websocket.WebSocketApp = FakeWebSocketApp
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'addresses.txt')
+    addresses = [make_address(index) for index in range(15)]
+    alerts = []
+    worker = None
+    try:
+        with open(path, 'w') as f:
+            f.write("\n".join(addresses))
+        # 本进程不知道出口IP上的其他订阅（如与其他程序共用出口IP），超出的订阅由交易所拒绝
+        worker = ShardWorker('shard-0', path, ShardMembership(os.path.join(directory, 'members.db'), 'shard-0', ttl=TTL),
+                             lambda s: None, 'http://127.0.0.1:9/info', 'ws://127.0.0.1:9/ws',
+                             addresses_per_connection=5, clock=SimulatedClock(), alert=alerts.append,
+                             users_per_ip=USERS_PER_IP)
+        worker.start()
+        exchange.wait_open()
+        time.sleep(0.05)
+        worker.tick()
+        worker.tick()
+
+        stats = worker.stats()
+        rejected = sorted(worker._rejected())
+        if (stats['owned'], stats['addresses'], stats['rejected']) != (15, 10, 5) or len(rejected) != 5:
+            logger.error(f"❌ 被拒绝的地址不应计入监控地址数: {stats}")
+            return False
+        if any(exchange.subscribers(address) for address in rejected):
+            logger.error("❌ 被拒绝的地址对应错误")
+            return False
+        if len(alerts) != 1 or '5 个地址订阅被拒绝' not in alerts[0]:
+            logger.error(f"❌ 警报错误: {alerts}")
+            return False
+        line = sharding.format_stats(stats)
+        expected = f"地址 10/{USERS_PER_IP} (订阅被拒绝 5), 连接 {stats['connected']}/{stats['connections']}, "
+        if stats['connections'] != 3 or not line.startswith(expected):
+            logger.error(f"❌ 统计输出错误: {line}")
+            return False
+
+        # 错误中带有地址时按地址对应（即使该地址已确认订阅）
+        watched = sorted(set(addresses) - set(rejected))[0]
+        connection = worker.owned[watched]
+        connection._on_ws_message(None, json.dumps({'channel': 'error', 'data': f'Invalid subscription: {watched}'}))
+        worker.tick()
+        if len(alerts) != 2 or watched not in alerts[1] or worker.stats()['rejected'] != 6:
+            logger.error(f"❌ 带地址的错误对应错误: {alerts}")
+            return False
+
+        # 从地址列表中移除被拒绝的地址后不再计入
+        with open(path, 'w') as f:
+            f.write("\n".join(address for address in addresses if address not in rejected and address != watched))
+        os.utime(path, ns=(time.time_ns(), time.time_ns() + 1))
+        worker.tick()
+        stats = worker.stats()
+        if (stats['owned'], stats['addresses'], stats['rejected']) != (9, 9, 0) or len(alerts) != 2:
+            logger.error(f"❌ 移除后统计错误: {stats}")
+            return False
+    finally:
+        if worker:
+            worker.stop()
+        hyperliquid_monitor_ws.websocket.WebSocketApp = original_app
+
+    logger.info("✅ 订阅被拒绝的地址记为未监控并发送警报")
+    return True
+
+
+def test_egress_config():
+    """测试启动时拒绝超过每个出口IP地址数上限的配置"""
+    logger.info("测试出口IP配置校验...")
+    capacity = sharding.egress_capacity(['shard-0', 'shard-1'], {'shard-0': ['10.0.0.1', '10.0.0.2']}, 10)
+    if capacity != 30:
+        logger.error(f"❌ 容量计算错误: {capacity}")
+        return False
+    invalid = [
+        (['shard-0'], {}, 100),  # 每个连接的地址数超过每个IP的上限
+        (['shard-0', 'shard-1'], {}, 10),  # 两个工作进程共用默认出口IP
+        (['shard-0', 'shard-1'], {'shard-0': ['10.0.0.1'], 'shard-1': ['10.0.0.1']}, 10),  # 同一IP分配给两个进程
+        (['shard-0'], {'shard-9': ['10.0.0.1']}, 10)  # 配置了不存在的工作进程
+    ]
+    for workers, source_addresses, per_connection in invalid:
+        try:
+            sharding.egress_capacity(workers, source_addresses, per_connection)
+        except ValueError as e:
+            logger.info(f"  拒绝: {e}")
+            continue
+        logger.error(f"❌ 未拒绝超过上限的配置: {workers}, {source_addresses}, {per_connection}")
+        return False
+    try:
+        ShardWorker('shard-0', '', None, lambda s: None, '', '', addresses_per_connection=11)
+        logger.error("❌ 工作进程未拒绝超过上限的每连接地址数")
+        return False
+    except ValueError:
+        pass
+
+    weights = sharding.egress_weights(['shard-0', 'shard-1'], {'shard-0': ['10.0.0.1', '10.0.0.2', '10.0.0.3']})
+    counts = {worker: len(assigned) for worker, assigned in
+              HashRing(['shard-0', 'shard-1'], weights=weights).assign([make_address(i) for i in range(8000)]).items()}
+    if not 2.5 < counts['shard-0'] / counts['shard-1'] < 3.5:
+        logger.error(f"❌ 未按出口IP数分配地址: {counts}")
+        return False
+
+    logger.info(f"✅ 出口IP配置校验正确，按出口IP数分配 {counts}")
+    return True
+
+
+def test_egress_capacity():
+    """测试每个出口IP上的地址数不超过上限，超出本进程容量的地址记为未订阅并警报"""
+    logger.info("测试出口IP容量...")
+    exchange = FakeExchange(user_cap=10)
+    FakeWebSocketApp.exchange = exchange
+    original_app = hyperliquid_monitor_ws.websocket.WebSocketApp
+    original_open = hyperliquid_monitor_ws.open_source_socket
+    hyperliquid_monitor_ws.websocket.WebSocketApp = FakeWebSocketApp
+    hyperliquid_monitor_ws.open_source_socket = lambda url, source_address: source_address
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'addresses.txt')
+    addresses = [make_address(index) for index in range(25)]
+    alerts = []
+    worker = None
+    try:
+        with open(path, 'w') as f:
+            f.write("\n".join(addresses))
+        worker = ShardWorker('shard-0', path, ShardMembership(os.path.join(directory, 'members.db'), 'shard-0', ttl=TTL),
+                             lambda s: None, 'http://127.0.0.1:9/info', 'ws://127.0.0.1:9/ws',
+                             addresses_per_connection=5, clock=SimulatedClock(), alert=alerts.append,
+                             source_addresses=['10.0.0.1', '10.0.0.2'])
+        worker.start()
+        exchange.wait_open()
+        worker.tick()
+
+        stats = worker.stats()
+        users = exchange.users_by_ip()
+        if (stats['owned'], stats['addresses'], stats['overflow'], stats['rejected']) != (25, 20, 5, 0):
+            logger.error(f"❌ 超出容量的地址统计错误: {stats}")
+            return False
+        if users != {'10.0.0.1': 10, '10.0.0.2': 10} or stats['connections'] != 4:
+            logger.error(f"❌ 出口IP上的地址数超过上限: {users}, 连接 {stats['connections']}")
+            return False
+        if len(alerts) != 1 or '5 个地址' not in alerts[0] or '超过本进程出口IP的地址数上限' not in alerts[0]:
+            logger.error(f"❌ 警报错误: {alerts}")
+            return False
+        if '(超出出口IP容量 5)' not in sharding.format_stats(stats):
+            logger.error(f"❌ 统计输出错误: {sharding.format_stats(stats)}")
+            return False
+
+        # 地址列表缩小后超出的地址全部订阅，之后不再警报
+        with open(path, 'w') as f:
+            f.write("\n".join(addresses[:18]))
+        os.utime(path, ns=(time.time_ns(), time.time_ns() + 1))
+        worker.tick()
+        exchange.wait_open()
+        worker.tick()
+        stats = worker.stats()
+        if (stats['owned'], stats['addresses'], stats['overflow']) != (18, 18, 0) or len(alerts) != 1:
+            logger.error(f"❌ 缩小地址列表后统计错误: {stats}, 警报 {len(alerts)}")
+            return False
+        if any(count > 10 for count in exchange.users_by_ip().values()):
+            logger.error(f"❌ 合并连接后出口IP上的地址数超过上限: {exchange.users_by_ip()}")
+            return False
+    finally:
+        if worker:
+            worker.stop()
+        hyperliquid_monitor_ws.websocket.WebSocketApp = original_app
+        hyperliquid_monitor_ws.open_source_socket = original_open
+
+    logger.info("✅ 每个出口IP最多 10 个地址，超出容量的地址记为未订阅")
+    return True
+
+
+def test_source_socket():
+    """测试从指定的本机地址发起 WebSocket 连接"""
+    logger.info("测试指定出口IP...")
+    if not sys.platform.startswith('linux'):
+        logger.info("✅ 跳过（只有 Linux 的回环接口接受 127.0.0.2）")
+        return True
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+    try:
+        sock = hyperliquid_monitor_ws.open_source_socket(f"ws://127.0.0.1:{server.getsockname()[1]}/ws", '127.0.0.2')
+        conn, peer = server.accept()
+        conn.close()
+        sock.close()
+    finally:
+        server.close()
+    if peer[0] != '127.0.0.2' or sock.gettimeout() is not None:
+        logger.error(f"❌ 连接未从指定地址发起: {peer}")
+        return False
+
+    logger.info(f"✅ 连接从 {peer[0]} 发起")
+    return True
+
+
+if __name__ == "__main__":
+    print("\n" + "=" * 80)
+    print("测试分片监控")
+    print("=" * 80 + "\n")
+
+    results = [
+        test_ring(),
+        test_cluster(),
+        test_address_file_reload(),
+        test_subscription_rejected(),
+        test_egress_config(),
+        test_egress_capacity(),
+        test_source_socket()
+    ]
+
+    if all(results):
+        print("\n✅ 所有分片监控测试通过！")
+    else:
+        print("\n❌ 部分分片监控测试失败，请查看日志文件 test_sharding.log")
+        sys.exit(1)
@@ -0,0 +1,184 @@
+"""
+测试优雅退出
+验证请求退出后正在处理的信号在截止时间内完成、超时的批次被统计、排空结束后到达的信号被拒绝、
+退出步骤按顺序执行且单个步骤出错不影响后续步骤，以及通知器等待发送完毕（离线测试，不访问网络）
+"""
+import sys
+import os
+import time
+import threading
+import logging
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logger_config import setup_logger
+from shutdown import ShutdownCoordinator
+from telegram_notifier import TelegramNotifier
+
+# 设置日志
+setup_logger(log_file='test_shutdown.log', log_level='INFO')
+logger = logging.getLogger(__name__)
+
+
+def process(shutdown: ShutdownCoordinator, seconds: float, done: list):
+    """模拟一批信号的处理（下单并写入开单状态）"""
+    if not shutdown.begin():
+        return
+    try:
+        time.sleep(seconds)
+        done.append(seconds)
+    finally:
+        shutdown.end()
+
+
+def test_drain_in_flight():
+    """测试请求退出时正在处理的信号完成后才执行刷新步骤"""
+    logger.info("测试排空正在处理的信号...")
+    shutdown = ShutdownCoordinator(drain_timeout=2)
+    done = []
+    order = []
+    shutdown.on_flush('保存开单状态', lambda: order.append(('保存', len(done))))
+
+    workers = [threading.Thread(target=process, args=(shutdown, 0.2, done)) for _ in range(3)]
+    for worker in workers:
+        worker.start()
+    time.sleep(0.05)
+
+    if not shutdown.request('测试'):
+        logger.error("❌ 第一次请求退出应返回True")
+        return False
+    if shutdown.request('重复'):
+        logger.error("❌ 重复请求退出应返回False")
+        return False
+
+    # 停止接收前已在缓冲中的信号仍会处理
+    late = threading.Thread(target=process, args=(shutdown, 0.1, done))
+    late.start()
+
+    summary = shutdown.drain()
+    for worker in workers + [late]:
+        worker.join()
+
+    if order != [('保存', 4)] or summary['drained'] != 4 or summary['abandoned'] or summary['reason'] != '测试':
+        logger.error(f"❌ 排空结果错误: order={order}, summary={summary}")
+        return False
+
+    logger.info(f"✅ 排空 {summary['drained']} 批后保存状态，耗时 {summary['elapsed'] * 1000:.0f}ms")
+    return True
+
+
+def test_timeout_and_reject():
+    """测试超过截止时间的批次计为未完成，排空结束后到达的信号被拒绝"""
+    logger.info("测试截止时间和拒绝...")
+    shutdown = ShutdownCoordinator(drain_timeout=0.2)
+    done = []
+    slow = threading.Thread(target=process, args=(shutdown, 1.0, done))
+    slow.start()
+    time.sleep(0.05)
+
+    started = time.perf_counter()
+    summary = shutdown.drain()
+    elapsed = time.perf_counter() - started
+    if summary['abandoned'] != 1 or summary['drained'] != 0 or elapsed > 0.5:
+        logger.error(f"❌ 超时统计错误: {summary}, 耗时 {elapsed:.2f}秒")
+        return False
+
+    if shutdown.begin():
+        logger.error("❌ 排空结束后不应再处理信号")
+        return False
+    if shutdown.summary()['rejected'] != 1:
+        logger.error("❌ 拒绝的信号未统计")
+        return False
+
+    # 重复调用直接返回报告
+    if shutdown.drain()['abandoned'] != 1:
+        logger.error("❌ 重复排空结果错误")
+        return False
+    slow.join()
+
+    logger.info(f"✅ 超时 {elapsed * 1000:.0f}ms 后继续退出，之后到达的信号被拒绝")
+    return True
+
+
+def test_step_order():
+    """测试退出步骤按 停止 → 排空 → 刷新 的顺序执行，出错的步骤不影响后续步骤"""
+    logger.info("测试退出步骤顺序...")
+    shutdown = ShutdownCoordinator(drain_timeout=1)
+    calls = []
+
+    def broken():
+        calls.append('对账')
+        raise RuntimeError('模拟错误')
+
+    shutdown.on_stop('停止监控', lambda: calls.append('监控'))
+    shutdown.on_drain('输出合并窗口', lambda: calls.append('合并窗口'))
+    shutdown.on_flush('停止对账', broken)
+    shutdown.on_flush('保存开单状态', lambda: calls.append('保存'))
+    shutdown.on_flush('让出租约', lambda: calls.append('租约'))
+
+    shutdown.request('测试')
+    if calls != ['监控']:
+        logger.error(f"❌ 请求退出时只应执行停止步骤: {calls}")
+        return False
+
+    summary = shutdown.drain()
+    expected = ['监控', '合并窗口', '对账', '保存', '租约']
+    if calls != expected:
+        logger.error(f"❌ 步骤顺序错误: {calls}")
+        return False
+    if set(summary['steps']) != {'停止监控', '输出合并窗口', '等待处理中的信号', '停止对账', '保存开单状态', '让出租约'}:
+        logger.error(f"❌ 步骤耗时缺失: {summary['steps']}")
+        return False
+
+    for line in shutdown.report():
+        logger.info(f"  {line}")
+    logger.info("✅ 退出步骤顺序正确")
+    return True
+
+
+def test_notifier_wait_idle():
+    """测试通知器等待正在发送的消息完成"""
+    logger.info("测试通知器等待发送完毕...")
+    notifier = TelegramNotifier(bot_token='', chat_id='', enabled=False)
+    if not notifier.wait_idle(0.1):
+        logger.error("❌ 没有正在发送的消息时应立即返回True")
+        return False
+
+    # 用慢速发送代替真实的 Telegram 请求
+    sent = []
+    notifier.enabled = True
+    notifier._send = lambda message, parse_mode: time.sleep(0.3) or sent.append(message) or True
+    sender = threading.Thread(target=notifier.send_message, args=('退出前的通知',))
+    sender.start()
+    time.sleep(0.05)
+
+    if notifier.wait_idle(0.05):
+        logger.error("❌ 发送中的消息未完成时应返回False")
+        return False
+    if not notifier.wait_idle(1) or sent != ['退出前的通知']:
+        logger.error(f"❌ 未等到消息发送完毕: {sent}")
+        return False
+    sender.join()
+
+    logger.info("✅ 通知器等待发送完毕正确")
+    return True
+
+
+if __name__ == "__main__":
+    print("\n" + "=" * 80)
+    print("测试优雅退出")
+    print("=" * 80 + "\n")
+
+    results = [
+        test_drain_in_flight(),
+        test_timeout_and_reject(),
+        test_step_order(),
+        test_notifier_wait_idle()
+    ]
+
+    if all(results):
+        print("\n✅ 所有优雅退出测试通过！")
+    else:
+        print("\n❌ 部分优雅退出测试失败，请查看日志文件 test_shutdown.log")
+        sys.exit(1)
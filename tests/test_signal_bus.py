@@ -0,0 +1,103 @@
+"""
+测试本地信号总线
+验证信号帧编解码、多个下单进程订阅同一监控进程以及确认机制（离线测试，只使用本地 Unix 域套接字）
+"""
+import sys
+import os
+import time
+import tempfile
+import threading
+import logging
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logger_config import setup_logger
+from signal_bus import SignalBusServer, SignalBusClient, encode_signals, decode_signals
+from signal_rules import build_signal
+
+# 设置日志
+setup_logger(log_file='test_signal_bus.log', log_level='INFO')
+logger = logging.getLogger(__name__)
+
+
+def make_signal(tid, coin='ETH'):
+    """构造一条平仓信号"""
+    signal = build_signal({
+        'tid': tid, 'oid': tid * 10, 'coin': coin, 'side': 'A', 'dir': 'Close Long', 'sz': '1.5',
+        'px': '2000.25', 'closedPnl': '-3.5', 'startPosition': '3.0', 'time': 1700000000000
+    }, '0xabc')
+    signal['channel'] = 'userFills'
+    return signal
+
+
+def test_codec():
+    """测试信号编解码后字段不变"""
+    logger.info("测试信号编解码...")
+    signals = [make_signal(1), make_signal(2, 'BTC')]
+    signals.append(dict(make_signal(3), fill_id='order-30', oid=None, closed_pnl=None))  # 盈亏未知（订单推送）
+
+    decoded = decode_signals(encode_signals(signals))
+    for original, restored in zip(signals, decoded):
+        expected = {key: value for key, value in original.items() if key != 'hash'}
+        if dict(restored) != expected:
+            logger.error(f"❌ 编解码结果不一致: {dict(restored)} != {expected}")
+            return False
+
+    logger.info(f"✅ 信号编解码正确（3个信号 {len(encode_signals(signals))} 字节）")
+    return True
+
+
+def test_fan_out():
+    """测试两个下单进程都收到信号并确认"""
+    logger.info("测试信号广播与确认...")
+    path = os.path.join(tempfile.mkdtemp(), 'signals.sock')
+    server = SignalBusServer(path)
+    server.start()
+
+    received = {'a': [], 'b': []}
+    clients = [SignalBusClient([path], handler=received[name].extend) for name in received]
+    for client in clients:
+        threading.Thread(target=client.run, daemon=True).start()
+
+    deadline = time.time() + 5
+    while len(server.subscribers) < 2 and time.time() < deadline:
+        time.sleep(0.01)
+
+    server.publish([make_signal(1)])
+    server.publish([make_signal(1), make_signal(2)])
+
+    while server.acks_received < 4 and time.time() < deadline:
+        time.sleep(0.01)
+
+    for client in clients:
+        client.stop()
+    server.stop()
+
+    # 重复的成交ID在下单进程中去重
+    if [s['fill_id'] for s in received['a']] != [1, 2] or [s['fill_id'] for s in received['b']] != [1, 2]:
+        logger.error(f"❌ 接收结果错误: {received}")
+        return False
+    if server.acks_received != 4:
+        logger.error(f"❌ 确认数量错误: {server.acks_received}")
+        return False
+
+    logger.info(f"✅ 信号广播与确认正确（最近确认延迟 {server.ack_latency_ms:.3f}ms）")
+    return True
+
+
+if __name__ == "__main__":
+    print("\n" + "=" * 80)
+    print("测试本地信号总线")
+    print("=" * 80 + "\n")
+
+    results = [
+        test_codec(),
+        test_fan_out()
+    ]
+
+    if all(results):
+        print("\n✅ 所有信号总线测试通过！")
+    else:
+        print("\n❌ 部分信号总线测试失败，请查看日志文件 test_signal_bus.log")
+        sys.exit(1)
@@ -0,0 +1,119 @@
+"""
+测试多通道信号竞速
+验证订单推送转换、按订单ID去重以及获胜通道统计（离线测试，不访问网络）
+"""
+import sys
+import os
+import json
+import logging
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logger_config import setup_logger
+from hyperliquid_monitor_ws import HyperliquidMonitorWS
+from position_mirror import WatchedAccountMirror
+from signal_race import SignalRace, order_update_to_fill
+
+# 设置日志
+setup_logger(log_file='test_signal_race.log', log_level='INFO')
+logger = logging.getLogger(__name__)
+
+USER_STATE = {
+    'assetPositions': [
+        {'position': {'coin': 'ETH', 'szi': '4.0', 'entryPx': '2000.0', 'leverage': {'value': 20},
+                      'marginUsed': '400.0', 'unrealizedPnl': '0.0', 'liquidationPx': None}}
+    ],
+    'marginSummary': {'accountValue': '10000.0', 'totalMarginUsed': '400.0'}
+}
+
+ORDER_UPDATE = {
+    'order': {'coin': 'ETH', 'side': 'A', 'limitPx': '2100.0', 'sz': '0.0', 'origSz': '1.0',
+              'oid': 42, 'timestamp': 1700000000000},
+    'status': 'filled',
+    'statusTimestamp': 1700000000005
+}
+
+FILL = {
+    'tid': 7, 'oid': 42, 'coin': 'ETH', 'side': 'A', 'dir': 'Close Long', 'sz': '1.0', 'px': '2101.0',
+    'closedPnl': '101.0', 'startPosition': '4.0', 'time': 1700000000004
+}
+
+
+def test_order_update_to_fill():
+    """测试订单推送转换为成交格式"""
+    logger.info("测试订单推送转换...")
+    mirror = WatchedAccountMirror()
+    mirror.seed(USER_STATE)
+
+    fill = order_update_to_fill(ORDER_UPDATE, mirror)
+    # 限价不是成交价，盈亏记为未知而不是按限价估算
+    if fill['dir'] != 'Close Long' or fill['closedPnl'] is not None or fill['startPosition'] != '4.0':
+        logger.error(f"❌ 转换结果错误: {fill}")
+        return False
+    if order_update_to_fill(dict(ORDER_UPDATE, status='open'), mirror) is not None:
+        logger.error("❌ 未完全成交的订单不应转换")
+        return False
+
+    logger.info("✅ 订单推送转换正确")
+    return True
+
+
+def test_race_dedupe():
+    """测试同一订单只由最先到达的通道处理"""
+    logger.info("测试通道竞速去重...")
+    race = SignalRace()
+
+    if not race.arrive('orderUpdates', 42) or race.arrive('userFills', 42) or race.arrive('userEvents', 42):
+        logger.error("❌ 去重结果错误")
+        return False
+    if not race.arrive('orderUpdates', 42) or race.winner(42) != 'orderUpdates':
+        logger.error("❌ 获胜通道的后续数据应继续处理")
+        return False
+    if len(race.leads['orderUpdates']) != 2:
+        logger.error(f"❌ 领先时间记录错误: {race.leads}")
+        return False
+
+    logger.info(f"✅ 通道竞速去重正确: {race.summary()}")
+    return True
+
+
+def test_monitor_channels():
+    """测试WebSocket监控器多通道只触发一次，且持仓镜像仍由userFills更新"""
+    logger.info("测试监控器多通道处理...")
+    monitor = HyperliquidMonitorWS('http://localhost', 'ws://localhost', '0xabc',
+                                   channels=['userFills', 'orderUpdates'])
+    monitor.mirror.seed(USER_STATE)
+    triggered = []
+    monitor.batch_callback = triggered.extend
+
+    monitor._on_ws_message(None, json.dumps({'channel': 'orderUpdates', 'data': [ORDER_UPDATE]}))
+    monitor._on_ws_message(None, json.dumps({'channel': 'userFills', 'data': {'fills': [FILL]}}))
+
+    if len(triggered) != 1 or triggered[0]['channel'] != 'orderUpdates':
+        logger.error(f"❌ 触发结果错误: {triggered}")
+        return False
+    if monitor.mirror.get_position_size('ETH') != 3.0:
+        logger.error(f"❌ 持仓镜像未更新: {monitor.mirror.get_position_size('ETH')}")
+        return False
+
+    logger.info("✅ 监控器多通道处理正确")
+    return True
+
+
+if __name__ == "__main__":
+    print("\n" + "=" * 80)
+    print("测试多通道信号竞速")
+    print("=" * 80 + "\n")
+
+    results = [
+        test_order_update_to_fill(),
+        test_race_dedupe(),
+        test_monitor_channels()
+    ]
+
+    if all(results):
+        print("\n✅ 所有信号竞速测试通过！")
+    else:
+        print("\n❌ 部分信号竞速测试失败，请查看日志文件 test_signal_race.log")
+        sys.exit(1)
@@ -0,0 +1,123 @@
+"""
+测试平仓信号规则引擎
+验证规则编译、按地址覆盖规则以及信号的延迟格式化（离线测试，不访问网络）
+"""
+import sys
+import os
+import logging
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logger_config import setup_logger
+from signal_rules import SignalRuleEngine, compile_rule, DEFAULT_SIGNAL_RULES
+
+# 设置日志
+setup_logger(log_file='test_signal_rules.log', log_level='INFO')
+logger = logging.getLogger(__name__)
+
+WATCHED = '0xabc'
+WHALE = '0xdef'
+
+
+def make_fill(tid, coin='ETH', side='A', direction='Close Long', size='1.0', price='2000.0', pnl='12.5'):
+    """构造一条userFills成交"""
+    fill = {
+        'tid': tid,
+        'oid': tid * 10,
+        'coin': coin,
+        'side': side,
+        'sz': size,
+        'px': price,
+        'closedPnl': pnl,
+        'startPosition': '4.0',
+        'time': 1700000000000
+    }
+    if direction is not None:
+        fill['dir'] = direction
+    return fill
+
+
+def test_default_rule():
+    """测试默认规则与原有判断一致，且 '0.0' 盈亏不会被误判为平仓"""
+    logger.info("测试默认规则...")
+    predicate = compile_rule(DEFAULT_SIGNAL_RULES)
+    cases = [
+        (make_fill(1), True),
+        (make_fill(2, direction='Long > Short'), True),
+        (make_fill(3, coin='SOL'), False),
+        (make_fill(4, direction='Open Short'), False),
+        (make_fill(5, pnl='0.0'), False),
+        (make_fill(8, pnl=None), True),  # 盈亏未知（订单推送）时不检查盈亏条件
+        (make_fill(6, direction=None), True),
+        (make_fill(7, direction=None, side='B'), False)
+    ]
+    for fill, expected in cases:
+        if predicate(fill) != expected:
+            logger.error(f"❌ 判断结果错误: {fill}, 期望={expected}")
+            return False
+
+    logger.info("✅ 默认规则判断正确")
+    return True
+
+
+def test_address_overrides():
+    """测试按地址覆盖最小成交金额"""
+    logger.info("测试地址覆盖规则...")
+    engine = SignalRuleEngine({'address_overrides': {WHALE.upper(): {'min_notional': 10000}}})
+    fill = make_fill(1, size='1.0', price='2000.0')
+
+    if not engine.predicate_for(WATCHED)(fill) or engine.predicate_for(WHALE)(fill):
+        logger.error("❌ 地址覆盖规则未生效")
+        return False
+    if not engine.predicate_for(WHALE)(make_fill(2, size='5.0', price='2000.0')):
+        logger.error("❌ 满足最小金额的成交被过滤")
+        return False
+
+    logger.info("✅ 地址覆盖规则正确")
+    return True
+
+
+def test_parse_fills():
+    """测试去重以及datetime字段延迟格式化"""
+    logger.info("测试成交解析...")
+    engine = SignalRuleEngine({'pnl_sign': 'positive'})
+    processed = set()
+    fills = [make_fill(1), make_fill(2, pnl='-3.0'), make_fill(3, coin='BTC')]
+
+    signals = engine.parse_fills(fills, WATCHED, processed)
+    if [s['fill_id'] for s in signals] != [1, 3] or processed != {1, 3}:
+        logger.error(f"❌ 解析结果错误: {signals}")
+        return False
+    if engine.parse_fills(fills, WATCHED, processed):
+        logger.error("❌ 重复成交未被过滤")
+        return False
+
+    signal = signals[0]
+    if 'datetime' in signal:
+        logger.error("❌ datetime字段未延迟格式化")
+        return False
+    if not signal.get('datetime') or 'datetime' not in signal or abs(signal['close_fraction'] - 0.25) > 1e-9:
+        logger.error(f"❌ 信号字段错误: {dict(signal)}")
+        return False
+
+    logger.info("✅ 成交解析正确")
+    return True
+
+
+if __name__ == "__main__":
+    print("\n" + "=" * 80)
+    print("测试平仓信号规则引擎")
+    print("=" * 80 + "\n")
+
+    results = [
+        test_default_rule(),
+        test_address_overrides(),
+        test_parse_fills()
+    ]
+
+    if all(results):
+        print("\n✅ 所有信号规则测试通过！")
+    else:
+        print("\n❌ 部分信号规则测试失败，请查看日志文件 test_signal_rules.log")
+        sys.exit(1)
@@ -0,0 +1,224 @@
+"""
+测试热备租约和共享开单状态
+验证主实例崩溃后备用实例在1秒内接管、任意时刻最多一个实例可以下单、健康检查失败时让出租约、
+时钟跳变后被接管的主实例下单前确认失败，
+以及共享状态文件的跨进程更新检测（离线测试，不访问网络）
+"""
+import sys
+import os
+import time
+import signal
+import tempfile
+import subprocess
+import logging
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logger_config import setup_logger
+import standby
+from standby import LeaseManager
+from shared_state import SharedStateFile
+
+# 设置日志
+setup_logger(log_file='test_standby.log', log_level='INFO')
+logger = logging.getLogger(__name__)
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TTL = 0.6
+INTERVAL = 0.1
+
+# 在子进程中持有租约，直到被 kill -9
+HOLDER_SCRIPT = f"""
+import sys, time
+sys.path.insert(0, {PACKAGE_DIR!r})
+from standby import LeaseManager
+lease = LeaseManager(sys.argv[1], ttl={TTL}, heartbeat_interval={INTERVAL}, holder_id='crashing')
+lease.start()
+print('leader' if lease.is_leader() else 'standby', flush=True)
+time.sleep(60)
+"""
+
+
+def test_crash_failover():
+    """测试主实例进程被 kill -9 后备用实例接管，且不会同时有两个主实例"""
+    logger.info("测试崩溃切换...")
+    path = os.path.join(tempfile.mkdtemp(), 'lease.db')
+    holder = subprocess.Popen([sys.executable, '-c', HOLDER_SCRIPT, path], stdout=subprocess.PIPE, text=True)
+    try:
+        if holder.stdout.readline().strip() != 'leader':
+            logger.error("❌ 子进程未成为主实例")
+            return False
+
+        promoted = []
+        standby = LeaseManager(path, ttl=TTL, heartbeat_interval=INTERVAL, holder_id='standby',
+                               on_promote=lambda epoch: promoted.append((time.perf_counter(), epoch)))
+        standby.start()
+        time.sleep(0.5)
+        if standby.is_leader():
+            logger.error("❌ 主实例存活时备用实例不应持有租约")
+            return False
+
+        os.kill(holder.pid, signal.SIGKILL)
+        holder.wait()
+        crashed_at = time.perf_counter()
+        while not standby.is_leader() and time.perf_counter() - crashed_at < 3:
+            time.sleep(0.005)
+        failover = time.perf_counter() - crashed_at
+        standby.stop()
+    finally:
+        if holder.poll() is None:
+            holder.kill()
+
+    if not promoted or failover >= 1.0 or promoted[0][1] != 2:
+        logger.error(f"❌ 切换失败或过慢: {failover * 1000:.0f}ms, {promoted}")
+        return False
+
+    logger.info(f"✅ 崩溃切换耗时 {failover * 1000:.0f}ms")
+    return True
+
+
+def test_single_leader_and_handover():
+    """测试两个实例竞争时任意时刻最多一个主实例，健康检查失败和正常退出时让出租约"""
+    logger.info("测试租约互斥与让出...")
+    path = os.path.join(tempfile.mkdtemp(), 'lease.db')
+    healthy = {'a': True}
+    a = LeaseManager(path, ttl=TTL, heartbeat_interval=INTERVAL, holder_id='a', health_check=lambda: healthy['a'])
+    b = LeaseManager(path, ttl=TTL, heartbeat_interval=INTERVAL, holder_id='b')
+    a.start()
+    b.start()
+    try:
+        overlaps = 0
+        deadline = time.perf_counter() + 1.0
+        while time.perf_counter() < deadline:
+            if a.is_leader() and b.is_leader():
+                overlaps += 1
+            time.sleep(0.001)
+        if overlaps or not a.is_leader():
+            logger.error(f"❌ 租约互斥错误: 重叠 {overlaps} 次, a={a.is_leader()}, b={b.is_leader()}")
+            return False
+
+        # 主实例健康检查失败：主动让出，备用实例在下一次心跳接管
+        healthy['a'] = False
+        started = time.perf_counter()
+        while not b.is_leader() and time.perf_counter() - started < 2:
+            if a.is_leader() and b.is_leader():
+                overlaps += 1
+            time.sleep(0.001)
+        handover = time.perf_counter() - started
+        if overlaps or not b.is_leader() or a.is_leader() or handover > 3 * INTERVAL + 0.1:
+            logger.error(f"❌ 健康检查让出错误: {handover * 1000:.0f}ms, 重叠 {overlaps} 次")
+            return False
+
+        # 恢复健康后不抢占，主实例正常退出后再接管
+        healthy['a'] = True
+        time.sleep(3 * INTERVAL)
+        if a.is_leader():
+            logger.error("❌ 租约有效期内不应被抢占")
+            return False
+        b.stop()
+        started = time.perf_counter()
+        while not a.is_leader() and time.perf_counter() - started < 2:
+            time.sleep(0.001)
+        if not a.is_leader() or time.perf_counter() - started > 3 * INTERVAL + 0.1:
+            logger.error("❌ 正常退出后未及时接管")
+            return False
+    finally:
+        a.stop()
+        if b.running:
+            b.stop()
+
+    logger.info(f"✅ 租约互斥与让出正确 (健康检查让出 {handover * 1000:.0f}ms)")
+    return True
+
+
+def test_clock_step_fencing():
+    """测试墙上时钟向前跳变使备用实例提前接管时，原主实例下单前的确认失败"""
+    logger.info("测试时钟跳变后的下单确认...")
+    path = os.path.join(tempfile.mkdtemp(), 'lease.db')
+    a = LeaseManager(path, ttl=TTL, heartbeat_interval=INTERVAL, holder_id='a')
+    b = LeaseManager(path, ttl=TTL, heartbeat_interval=INTERVAL, holder_id='b')
+    try:
+        a.tick()
+        if not a.confirm_leader():
+            logger.error("❌ 持有租约时确认应成功")
+            return False
+
+        # 墙上时钟向前跳变10秒：备用实例认为租约已过期并接管，原主实例的本地（单调时钟）有效期仍未过
+        class SteppedTime:
+            def __getattr__(self, name):
+                return getattr(time, name)
+
+            def time(self):
+                return time.time() + 10
+
+        standby.time = SteppedTime()
+        try:
+            b.tick()
+        finally:
+            standby.time = time
+        if not b.is_leader() or not a.is_leader():
+            logger.error(f"❌ 未模拟出时钟跳变: a={a.is_leader()}, b={b.is_leader()}")
+            return False
+        if a.confirm_leader() or not b.confirm_leader():
+            logger.error("❌ 被接管后原主实例仍可下单")
+            return False
+    finally:
+        a.stop()
+        b.stop()
+
+    logger.info("✅ 时钟跳变后只有数据库中的持有者可以下单")
+    return True
+
+
+def test_shared_state_file():
+    """测试共享状态文件的原子写入和更新检测"""
+    logger.info("测试共享开单状态...")
+    path = os.path.join(tempfile.mkdtemp(), 'trade_state.json')
+    first = SharedStateFile(path)
+    second = SharedStateFile(path)
+
+    if second.load() is not None or second.changed():
+        logger.error("❌ 文件不存在时应返回None且未变化")
+        return False
+
+    first.save({'BTC': {'opened': True, 'order_id': '1'}})
+    if not second.changed() or second.load()['BTC']['order_id'] != '1' or second.changed():
+        logger.error("❌ 未检测到其他实例的写入")
+        return False
+
+    # 连续两次写入（修改时间可能相同）也能检测到
+    first.save({'BTC': {'opened': True, 'order_id': '2'}})
+    second.load()
+    first.save({'BTC': {'opened': True, 'order_id': '3'}})
+    if not second.changed() or second.load()['BTC']['order_id'] != '3':
+        logger.error("❌ 连续写入未检测到")
+        return False
+    if first.changed():
+        logger.error("❌ 自己的写入不应视为变化")
+        return False
+    if [f for f in os.listdir(os.path.dirname(path)) if f.endswith('.tmp')]:
+        logger.error("❌ 临时文件未清理")
+        return False
+
+    logger.info("✅ 共享开单状态正确")
+    return True
+
+
+if __name__ == "__main__":
+    print("\n" + "=" * 80)
+    print("测试热备租约")
+    print("=" * 80 + "\n")
+
+    results = [
+        test_crash_failover(),
+        test_single_leader_and_handover(),
+        test_clock_step_fencing(),
+        test_shared_state_file()
+    ]
+
+    if all(results):
+        print("\n✅ 所有热备测试通过！")
+    else:
+        print("\n❌ 部分热备测试失败，请查看日志文件 test_standby.log")
+        sys.exit(1)
@@ -0,0 +1,115 @@
+"""
+测试启动流程计时
+验证后台步骤并发执行、超出时间预算时不阻塞、失败步骤不影响其他步骤、启动耗时汇总以及延迟导入计时（离线测试，不访问网络）
+"""
+import sys
+import os
+import time
+import logging
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logger_config import setup_logger
+from startup import StartupTimer, lazy_import, import_report, STATUS_OK, STATUS_FAILED, STATUS_TIMEOUT
+
+# 设置日志
+setup_logger(log_file='test_startup.log', log_level='INFO')
+logger = logging.getLogger(__name__)
+
+
+def test_parallel_steps():
+    """测试后台步骤并发执行"""
+    logger.info("测试后台步骤并发执行...")
+    startup = StartupTimer(default_budget=2.0)
+    started = time.perf_counter()
+    futures = [startup.submit(f'步骤{i}', time.sleep, 0.2) for i in range(3)]
+    for i, future in enumerate(futures):
+        startup.wait(f'步骤{i}', future)
+    elapsed = time.perf_counter() - started
+    startup.shutdown()
+
+    if elapsed > 0.5:
+        logger.error(f"❌ 后台步骤未并发执行: {elapsed:.2f}秒")
+        return False
+
+    logger.info(f"✅ 3个步骤并发完成: {elapsed:.2f}秒")
+    return True
+
+
+def test_budget_and_failure():
+    """测试超出预算的步骤不阻塞等待，失败步骤返回None"""
+    logger.info("测试时间预算和失败步骤...")
+    startup = StartupTimer(default_budget=0.1)
+
+    def fail():
+        raise RuntimeError("接口不可用")
+
+    with startup.measure('同步步骤'):
+        pass
+
+    slow = startup.submit('慢步骤', time.sleep, 1.0)
+    failed = startup.submit('失败步骤', fail)
+    fast = startup.submit('快步骤', lambda: 42)
+
+    started = time.perf_counter()
+    slow_result = startup.wait('慢步骤', slow)
+    waited = time.perf_counter() - started
+    failed_result = startup.wait('失败步骤', failed)
+    fast_result = startup.wait('快步骤', fast)
+    startup.shutdown()
+
+    if slow_result is not None or waited > 0.5:
+        logger.error(f"❌ 超出预算的步骤阻塞了等待: {waited:.2f}秒")
+        return False
+    if failed_result is not None or fast_result != 42:
+        logger.error(f"❌ 步骤结果错误: 失败={failed_result}, 快={fast_result}")
+        return False
+
+    statuses = {timing[0]: timing[4] for timing in startup.timings}
+    expected = {'同步步骤': STATUS_OK, '慢步骤': STATUS_TIMEOUT, '失败步骤': STATUS_FAILED, '快步骤': STATUS_OK}
+    if statuses != expected:
+        logger.error(f"❌ 步骤状态错误: {statuses}")
+        return False
+
+    lines = startup.report()
+    if len(lines) != 4:
+        logger.error(f"❌ 启动耗时汇总行数错误: {lines}")
+        return False
+
+    logger.info("✅ 时间预算和失败步骤处理正确")
+    return True
+
+
+def test_lazy_import():
+    """测试延迟导入只在首次使用时导入并记录耗时"""
+    logger.info("测试延迟导入...")
+    sys.modules.pop('colorsys', None)
+    module = lazy_import('colorsys')
+    if lazy_import('colorsys') is not module or 'colorsys' not in sys.modules:
+        logger.error("❌ 延迟导入未复用已导入的模块")
+        return False
+    if not any(line.endswith('colorsys') for line in import_report()):
+        logger.error(f"❌ 导入耗时未记录: {import_report()}")
+        return False
+
+    logger.info("✅ 延迟导入计时正确")
+    return True
+
+
+if __name__ == "__main__":
+    print("\n" + "=" * 80)
+    print("测试启动流程计时")
+    print("=" * 80 + "\n")
+
+    results = [
+        test_parallel_steps(),
+        test_budget_and_failure(),
+        test_lazy_import()
+    ]
+
+    if all(results):
+        print("\n✅ 所有启动流程测试通过！")
+    else:
+        print("\n❌ 部分启动流程测试失败，请查看日志文件 test_startup.log")
+        sys.exit(1)
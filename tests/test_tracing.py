@@ -0,0 +1,196 @@
+"""
+测试信号追踪
+验证平仓信号从WebSocket推送、解析、多账户下单到请求级时间段都带有同一个追踪ID，
+追踪ID经过信号总线保留，追踪文件为合法的 trace-event 格式，以及未处理信号时的开销（离线测试，不访问网络）
+"""
+import sys
+import os
+import json
+import time
+import tempfile
+import logging
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logger_config import setup_logger
+import tracing
+from hyperliquid_monitor_ws import HyperliquidMonitorWS
+from multi_account_trader import MultiAccountTrader
+from paper_trader import PaperTrader, LatencyModel
+from signal_bus import encode_signals, decode_signals
+
+# 设置日志
+setup_logger(log_file='test_tracing.log', log_level='INFO')
+logger = logging.getLogger(__name__)
+
+ADDRESS = '0x' + 'ab' * 20
+
+
+def make_fill(tid: int, coin: str) -> dict:
+    """构造一条平多成交"""
+    return {'coin': coin, 'side': 'A', 'dir': 'Close Long', 'sz': '1.0', 'px': '2000.0', 'closedPnl': '10.0',
+            'tid': tid, 'oid': tid, 'time': 1700000000000, 'startPosition': '2.0', 'hash': f'0x{tid}'}
+
+
+def test_signal_trace():
+    """测试一帧内的平仓信号经过解析、多账户下单，所有时间段都记录在各自的追踪ID下"""
+    logger.info("测试信号追踪...")
+    path = tracing.setup_tracer(tempfile.mkdtemp(), process_name='test')
+
+    monitor = HyperliquidMonitorWS('http://127.0.0.1:9/info', 'ws://127.0.0.1:9/ws', ADDRESS)
+    signals = []
+    monitor.batch_callback = signals.extend
+    monitor._on_ws_message(None, json.dumps({
+        'channel': 'userFills',
+        'data': {'user': ADDRESS, 'fills': [make_fill(1, 'ETH'), make_fill(2, 'BTC')]}
+    }))
+    trace_ids = tracing.trace_ids_of(signals)
+    if len(signals) != 2 or len(set(trace_ids)) != 2:
+        logger.error(f"❌ 每个信号应有独立的追踪ID: {signals}")
+        return False
+
+    # 追踪ID经过信号总线保留（多进程部署时下单进程沿用监控进程的追踪ID）
+    decoded = decode_signals(encode_signals(signals))
+    if tracing.trace_ids_of(decoded) != trace_ids:
+        logger.error(f"❌ 信号总线未保留追踪ID: {decoded}")
+        return False
+
+    accounts = [
+        {'name': 'a', 'api_key': '', 'api_secret': '', 'leverage': 5, 'position_size_usdc': 100},
+        {'name': 'b', 'api_key': '', 'api_secret': '', 'leverage': 10, 'position_size_usdc': 50}
+    ]
+    trader = MultiAccountTrader(
+        accounts, trader_class=PaperTrader, price_source=lambda symbol: 2000.0,
+        latency_model=LatencyModel(mean_ms=20, jitter_ms=0, seed=1)
+    )
+    try:
+        # 启动时（没有追踪ID）的调用不记录
+        trader.get_account_info_summaries()
+        with tracing.activate(tracing.trace_ids_of(decoded)), tracing.span('bot.handle_batch'):
+            results = trader.execute_short_trades([{'coin': 'ETH', 'symbol': 'ETHUSDC'},
+                                                   {'coin': 'BTC', 'symbol': 'BTCUSDC'}])
+    finally:
+        trader.shutdown()
+    if not all(r['success'] for r in results):
+        logger.error(f"❌ 下单失败: {results}")
+        return False
+
+    tracing.shutdown_tracer()
+    with open(path, encoding='utf-8') as f:
+        raw = json.load(f)  # 正常关闭的文件是合法的 JSON
+    events = tracing.load_events([path])
+    thread_names = {e['tid']: e['args']['name'] for e in raw if e.get('name') == 'thread_name'}
+
+    summaries = {s['trace_id']: s for s in tracing.summarize_traces(events)}
+    if set(summaries) != set(trace_ids):
+        logger.error(f"❌ 追踪ID不一致: {list(summaries)}")
+        return False
+
+    for trace_id in trace_ids:
+        names = [name for name, _, _, _ in summaries[trace_id]['spans']]
+        for expected in ('monitor.parse', 'bot.handle_batch', 'trader.order', 'trader.position', 'paper.request'):
+            if expected not in names:
+                logger.error(f"❌ 追踪 {trace_id} 缺少时间段 {expected}: {names}")
+                return False
+        if names[0] != 'monitor.parse' or names.count('trader.order') != 2:
+            logger.error(f"❌ 时间段顺序或数量错误: {names}")
+            return False
+
+    # 各账户的下单时间段在不同线程，且位于批处理时间段之内
+    batch = next(e for e in events if e['name'] == 'bot.handle_batch')
+    orders = [e for e in events if e['name'] == 'trader.order']
+    if len({e['tid'] for e in orders}) != 2 or not all(thread_names[e['tid']].startswith('binance-account') for e in orders):
+        logger.error(f"❌ 账户下单时间段应在各自的账户线程: {orders}")
+        return False
+    if not all(batch['ts'] <= e['ts'] and e['ts'] + e['dur'] <= batch['ts'] + batch['dur'] for e in orders):
+        logger.error("❌ 下单时间段不在批处理时间段之内")
+        return False
+    if sorted(e['args']['account'] for e in orders) != ['a', 'b'] or any(e['dur'] < 15000 for e in orders):
+        logger.error(f"❌ 下单时间段信息错误: {orders}")
+        return False
+
+    slowest = tracing.summarize_traces(events)[0]
+    logger.info(f"✅ 信号追踪正确: {len(events)} 个时间段, 最慢信号 {slowest['trace_id']} {slowest['total_ms']:.1f}ms")
+    for name, offset, duration, extra in slowest['spans']:
+        logger.info(f"  +{offset:6.1f}ms {duration:6.1f}ms {name} {extra}")
+    return True
+
+
+def test_retention_and_crash():
+    """测试旧追踪文件清理，以及读取未写完（进程崩溃时）的追踪文件"""
+    logger.info("测试追踪文件清理与崩溃容错...")
+    trace_dir = tempfile.mkdtemp()
+    for index in range(5):
+        old = os.path.join(trace_dir, f'trace_old_{index}.json')
+        with open(old, 'w') as f:
+            f.write('[]')
+        os.utime(old, (index, index))
+    path = tracing.setup_tracer(trace_dir, max_files=3)
+    tracing.shutdown_tracer()
+    remaining = sorted(os.listdir(trace_dir))
+    if len(remaining) != 3 or 'trace_old_4.json' not in remaining or os.path.basename(path) not in remaining:
+        logger.error(f"❌ 旧追踪文件清理错误: {remaining}")
+        return False
+
+    # 崩溃时文件缺少数组结尾，最后一个事件后还有逗号
+    crashed = os.path.join(trace_dir, 'crashed.json')
+    event = {'name': 'bot.gate', 'ph': 'X', 'ts': 10.0, 'dur': 5.0, 'pid': 1, 'tid': 1, 'args': {'trace_id': 'abc'}}
+    with open(crashed, 'w') as f:
+        f.write('[\n' + json.dumps(event) + ',\n')
+    events = tracing.load_events([crashed])
+    if len(events) != 1 or tracing.summarize_traces(events)[0]['trace_id'] != 'abc':
+        logger.error(f"❌ 未写完的追踪文件读取错误: {events}")
+        return False
+
+    logger.info("✅ 追踪文件清理与崩溃容错正确")
+    return True
+
+
+def test_overhead():
+    """测试未处理信号时（或未启用追踪时）时间段的开销"""
+    logger.info("测试追踪开销...")
+    count = 100000
+
+    def measure() -> float:
+        started = time.perf_counter()
+        for _ in range(count):
+            with tracing.span('binance.futures_create_order'):
+                pass
+        return (time.perf_counter() - started) / count * 1e6
+
+    disabled_us = measure()
+    tracing.setup_tracer(tempfile.mkdtemp())
+    idle_us = measure()
+    with tracing.activate(['abc']):
+        started = time.perf_counter()
+        for _ in range(1000):
+            with tracing.span('binance.futures_create_order'):
+                pass
+        active_us = (time.perf_counter() - started) / 1000 * 1e6
+    tracing.shutdown_tracer()
+
+    if disabled_us > 2 or idle_us > 2 or active_us > 50:
+        logger.error(f"❌ 追踪开销过高: 未启用 {disabled_us:.2f}µs, 无信号 {idle_us:.2f}µs, 记录 {active_us:.2f}µs")
+        return False
+
+    logger.info(f"✅ 每个时间段开销: 未启用 {disabled_us:.2f}µs, 无信号 {idle_us:.2f}µs, 记录 {active_us:.2f}µs")
+    return True
+
+
+if __name__ == "__main__":
+    print("\n" + "=" * 80)
+    print("测试信号追踪")
+    print("=" * 80 + "\n")
+
+    results = [
+        test_signal_trace(),
+        test_retention_and_crash(),
+        test_overhead()
+    ]
+
+    if all(results):
+        print("\n✅ 所有信号追踪测试通过！")
+    else:
+        print("\n❌ 部分信号追踪测试失败，请查看日志文件 test_tracing.log")
+        sys.exit(1)
@@ -0,0 +1,192 @@
+"""
+测试开单状态对账
+验证持仓缓存由REST快照初始化并按 ACCOUNT_UPDATE 增量更新，持仓归零后在宽限时间之后才重置开单状态，
+以及开单状态与交易所持仓不一致时只警报一次（离线测试，不连接用户数据流）
+"""
+import sys
+import os
+import json
+import logging
+from datetime import datetime, timedelta
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logger_config import setup_logger
+from trade_reconciler import TradeStateReconciler
+
+# 设置日志
+setup_logger(log_file='test_trade_reconciler.log', log_level='INFO')
+logger = logging.getLogger(__name__)
+
+GRACE_SECONDS = 60
+TRADING_PAIRS = {'ETH': 'ETHUSDC', 'BTC': 'BTCUSDC'}
+
+
+class StubTrader:
+    """返回固定持仓快照的执行后端"""
+
+    def __init__(self, positions):
+        self.positions = positions
+
+    def get_position_info(self, symbol=None):
+        return [{'symbol': s, 'positionSide': side, 'positionAmt': str(amount)}
+                for s, side, amount in self.positions]
+
+
+def account_update(positions) -> str:
+    """构造用户数据流的 ACCOUNT_UPDATE 消息"""
+    return json.dumps({'e': 'ACCOUNT_UPDATE', 'a': {'P': [{'s': s, 'ps': side, 'pa': str(amount)}
+                                                          for s, side, amount in positions]}})
+
+
+def opened_state(seconds_ago: float, accounts=('a', 'b')):
+    """已开单的币种状态"""
+    timestamp = (datetime.now() - timedelta(seconds=seconds_ago)).strftime('%Y-%m-%d %H:%M:%S')
+    return {'opened': True, 'timestamp': timestamp, 'accounts': {name: {'success': True} for name in accounts}}
+
+
+class Harness:
+    """两个账户的对账器，记录重置和警报"""
+
+    def __init__(self, state):
+        self.state = state
+        self.rearms = []
+        self.alerts = []
+        accounts = [
+            {'name': 'a', 'trader': StubTrader([('ETHUSDC', 'SHORT', -0.5), ('BTCUSDC', 'SHORT', 0)])},
+            {'name': 'b', 'trader': StubTrader([('ETHUSDC', 'BOTH', -0.5), ('BTCUSDC', 'BOTH', 0)])}
+        ]
+        self.reconciler = TradeStateReconciler(accounts, TRADING_PAIRS, lambda: self.state, self._rearm,
+                                               self.alerts.append, grace_seconds=GRACE_SECONDS)
+        self.caches = {cache.name: cache for cache in self.reconciler.caches}
+
+    def _rearm(self, coin, reason):
+        self.rearms.append(coin)
+        self.state[coin] = {'opened': False}
+
+    def seed(self):
+        for cache in self.caches.values():
+            cache.refresh()
+
+    def push(self, account, positions):
+        self.caches[account]._on_message(None, account_update(positions))
+
+
+def test_cache_seed_and_updates():
+    """测试REST快照和增量更新后的空头持仓数量（对冲模式和单向持仓模式）"""
+    logger.info("测试持仓缓存...")
+    harness = Harness({})
+    cache_a, cache_b = harness.caches['a'], harness.caches['b']
+    if cache_a.get_short_amount('ETHUSDC') is not None:
+        logger.error("❌ 初始化前应返回None")
+        return False
+
+    harness.seed()
+    if cache_a.get_short_amount('ETHUSDC') != 0.5 or cache_b.get_short_amount('ETHUSDC') != 0.5:
+        logger.error("❌ REST快照初始化错误")
+        return False
+    if cache_a.get_short_amount('SOLUSDC') != 0:
+        logger.error("❌ 未持仓的交易对应为0")
+        return False
+
+    harness.push('a', [('ETHUSDC', 'SHORT', -1.25)])
+    harness.push('b', [('ETHUSDC', 'BOTH', 0.3)])  # 单向持仓模式下的多头不计入空头
+    if cache_a.get_short_amount('ETHUSDC') != 1.25 or cache_b.get_short_amount('ETHUSDC') != 0:
+        logger.error("❌ 增量更新错误")
+        return False
+    if cache_a.event_count != 1:
+        logger.error("❌ 事件计数错误")
+        return False
+
+    logger.info("✅ 持仓缓存正确")
+    return True
+
+
+def test_rearm_after_grace():
+    """测试持仓归零后宽限时间内不重置，宽限时间之后重置一次"""
+    logger.info("测试持仓归零后重置...")
+    harness = Harness({'ETH': opened_state(10)})
+    # 缓存未初始化时不对账
+    harness.reconciler.reconcile_coin('ETH')
+    harness.seed()
+
+    # 刚开单，持仓推送尚未到达：宽限时间内不重置
+    harness.push('a', [('ETHUSDC', 'SHORT', 0)])
+    harness.push('b', [('ETHUSDC', 'BOTH', 0)])
+    if harness.rearms or not harness.state['ETH']['opened']:
+        logger.error(f"❌ 宽限时间内不应重置: {harness.rearms}")
+        return False
+
+    # 宽限时间之后持仓仍为空：重置（只在最后一个账户平仓后）
+    harness.state['ETH'] = opened_state(GRACE_SECONDS + 1)
+    harness.push('a', [('ETHUSDC', 'SHORT', -0.5)])
+    if harness.rearms:
+        logger.error("❌ 仍有持仓时不应重置")
+        return False
+    harness.push('a', [('ETHUSDC', 'SHORT', 0)])
+    if harness.rearms != ['ETH'] or harness.reconciler.rearm_count != 1:
+        logger.error(f"❌ 宽限时间之后应重置一次: {harness.rearms}")
+        return False
+
+    # 已重置的币种不再重复重置，其他币种不受影响（宽限时间内部分账户归零时的警报不在这里检查）
+    harness.alerts.clear()
+    harness.push('b', [('ETHUSDC', 'BOTH', 0), ('BTCUSDC', 'BOTH', 0)])
+    harness.reconciler.reconcile_all()
+    if harness.rearms != ['ETH'] or harness.alerts:
+        logger.error(f"❌ 重复重置或误报: {harness.rearms}, {harness.alerts}")
+        return False
+
+    logger.info("✅ 宽限时间之后才重置开单状态")
+    return True
+
+
+def test_mismatch_alerts():
+    """测试未记录开单但有持仓、记录开单但部分账户无持仓时警报，相同内容只警报一次"""
+    logger.info("测试不一致警报...")
+    harness = Harness({'ETH': {'opened': False}, 'BTC': opened_state(10)})
+    harness.seed()
+
+    # ETH 未记录开单但两个账户有空头持仓
+    harness.reconciler.reconcile_all()
+    harness.reconciler.reconcile_all()
+    eth_alerts = [alert for alert in harness.alerts if alert.startswith('ETH')]
+    if len(eth_alerts) != 1 or 'a, b' not in eth_alerts[0]:
+        logger.error(f"❌ 未记录开单的持仓警报错误: {harness.alerts}")
+        return False
+
+    # BTC 刚记录开单（持仓推送尚未到达）：只有账户 a 有持仓时警报账户 b
+    harness.alerts.clear()
+    harness.push('a', [('BTCUSDC', 'SHORT', -0.01)])
+    harness.push('a', [('BTCUSDC', 'SHORT', -0.02)])
+    if len(harness.alerts) != 1 or '账户 b' not in harness.alerts[0] or harness.rearms:
+        logger.error(f"❌ 部分账户无持仓的警报错误: {harness.alerts}")
+        return False
+
+    # 恢复一致后清除警报记录，再次不一致时重新警报
+    harness.push('b', [('BTCUSDC', 'BOTH', -0.02)])
+    harness.push('b', [('BTCUSDC', 'BOTH', 0)])
+    if len(harness.alerts) != 2 or harness.reconciler.mismatch_count != 3:
+        logger.error(f"❌ 恢复后再次不一致应重新警报: {harness.alerts}")
+        return False
+
+    logger.info("✅ 不一致警报正确")
+    return True
+
+
+if __name__ == "__main__":
+    print("\n" + "=" * 80)
+    print("测试开单状态对账")
+    print("=" * 80 + "\n")
+
+    results = [
+        test_cache_seed_and_updates(),
+        test_rearm_after_grace(),
+        test_mismatch_alerts()
+    ]
+
+    if all(results):
+        print("\n✅ 所有对账测试通过！")
+    else:
+        print("\n❌ 部分对账测试失败，请查看日志文件 test_trade_reconciler.log")
+        sys.exit(1)
@@ -0,0 +1,404 @@
+"""
+信号追踪模块
+每个检测到的平仓信号分配一个追踪ID（写入信号字典的 'trace_id' 字段），解析、开单检查、每个币安请求、
+写入开单状态和Telegram通知都记录为带追踪ID的时间段（span），以 Chrome trace-event 格式写入本地文件，
+可在 Perfetto（https://ui.perfetto.dev）或 chrome://tracing 中打开，查看某一笔慢交易的时间花在了哪里
+
+- 时间使用单调时钟（perf_counter_ns），不受系统时间调整影响
+- 当前线程正在处理的追踪ID保存在线程局部变量中；提交到线程池的任务需要用 wrap() 传递
+- 未启用追踪或当前线程没有追踪ID时 span() 返回共享的空上下文，开销只有一次函数调用
+- 事件由后台线程序列化和写入，处理信号的线程只把元组放入队列
+
+也可以在命令行中汇总追踪文件（可同时传入监控进程和下单进程的文件）：
+    python tracing.py traces/*.json --top 5
+    python tracing.py traces/*.json --trace-id 3f2a9c0d1e4b5a6c
+"""
+import os
+import sys
+import json
+import glob
+import time
+import queue
+import atexit
+import argparse
+import threading
+from contextlib import nullcontext
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence
+
+TRACE_ID_KEY = 'trace_id'
+
+_tracer = None
+_local = threading.local()
+_NULL_SPAN = nullcontext()
+
+
+def now_ns() -> int:
+    """单调时钟（纳秒），用于记录在追踪ID分配之前开始的时间段"""
+    return time.perf_counter_ns()
+
+
+def new_trace_id() -> str:
+    """生成追踪ID（16位十六进制）"""
+    return os.urandom(8).hex()
+
+
+class TraceWriter:
+    """追踪事件写入器：后台线程把事件写入 JSON 数组格式的 trace-event 文件"""
+
+    def __init__(self, path: str, process_name: str = 'hyper-binance'):
+        """
+        初始化写入器并启动写入线程
+
+        Args:
+            path: 追踪文件路径
+            process_name: 追踪查看器中显示的进程名
+        """
+        self.path = path
+        self.pid = os.getpid()
+        self.queue = queue.SimpleQueue()
+        self.thread_names = {}
+        self.event_count = 0
+        self.file = open(path, 'w', encoding='utf-8')
+        self.first = True
+        # 进程名和追踪开始时的系统时间（trace 中的时间戳是单调时钟，便于和日志对照）
+        self._write({'name': 'process_name', 'ph': 'M', 'pid': self.pid, 'tid': 0, 'args': {'name': process_name}})
+        self._write({'name': 'trace_started', 'ph': 'i', 's': 'p', 'pid': self.pid, 'tid': 0,
+                     'ts': now_ns() / 1000, 'args': {'wall_time': datetime.now().isoformat(timespec='milliseconds')}})
+        self.thread = threading.Thread(target=self._worker, name='trace-writer', daemon=True)
+        self.thread.start()
+
+    def record(self, name: str, start_ns: int, end_ns: int, trace_ids: Sequence[str], args: Optional[Dict]):
+        """记录一个时间段（在调用线程中只放入队列）"""
+        thread = threading.current_thread()
+        self.queue.put((name, start_ns, end_ns, trace_ids, args, thread.native_id, thread.name))
+
+    def _write(self, event: Dict):
+        self.file.write(('[\n' if self.first else ',\n') + json.dumps(event, ensure_ascii=False))
+        self.first = False
+
+    def _worker(self):
+        while True:
+            item = self.queue.get()
+            while True:
+                if item is None:
+                    self._close()
+                    return
+                self._write_span(*item)
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            # 队列清空后再刷新，进程崩溃时最多丢失最后一批事件
+            self.file.flush()
+
+    def _write_span(self, name, start_ns, end_ns, trace_ids, args, tid, thread_name):
+        if tid not in self.thread_names:
+            self.thread_names[tid] = thread_name
+            self._write({'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tid, 'args': {'name': thread_name}})
+        event_args = {TRACE_ID_KEY: ','.join(trace_ids)}
+        if args:
+            event_args.update(args)
+        self._write({
+            'name': name,
+            'cat': name.split('.', 1)[0],
+            'ph': 'X',
+            'ts': start_ns / 1000,
+            'dur': (end_ns - start_ns) / 1000,
+            'pid': self.pid,
+            'tid': tid,
+            'args': event_args
+        })
+        self.event_count += 1
+
+    def _close(self):
+        # 正常退出时补上数组结尾；崩溃时缺少结尾的文件查看器同样可以打开
+        self.file.write('\n]\n')
+        self.file.close()
+
+    def close(self, timeout: float = 5.0):
+        """写完队列中的事件并关闭文件"""
+        self.queue.put(None)
+        self.thread.join(timeout=timeout)
+
+
+class _Span:
+    """追踪时间段上下文"""
+
+    __slots__ = ('writer', 'name', 'trace_ids', 'args', 'start')
+
+    def __init__(self, writer: TraceWriter, name: str, trace_ids: Sequence[str], args: Dict):
+        self.writer = writer
+        self.name = name
+        self.trace_ids = trace_ids
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter_ns()
+        if exc_type is not None:
+            self.args['error'] = repr(exc)
+        self.writer.record(self.name, self.start, end, self.trace_ids, self.args)
+        return False
+
+
+class activate:
+    """在当前线程中激活追踪ID（一批信号可同时激活多个），退出时恢复之前的追踪ID"""
+
+    __slots__ = ('trace_ids', 'previous')
+
+    def __init__(self, trace_ids: Iterable[str]):
+        self.trace_ids = tuple(trace_id for trace_id in trace_ids if trace_id)
+
+    def __enter__(self):
+        self.previous = getattr(_local, 'trace_ids', ())
+        _local.trace_ids = self.trace_ids
+        return self.trace_ids
+
+    def __exit__(self, exc_type, exc, tb):
+        _local.trace_ids = self.previous
+        return False
+
+
+def current_trace_ids() -> tuple:
+    """当前线程正在处理的追踪ID"""
+    return getattr(_local, 'trace_ids', ())
+
+
+def trace_ids_of(positions: Iterable[Dict]) -> List[str]:
+    """一批信号的追踪ID"""
+    return [position[TRACE_ID_KEY] for position in positions if position.get(TRACE_ID_KEY)]
+
+
+def span(name: str, **args):
+    """
+    记录一个时间段（当前线程没有追踪ID时不记录）
+
+    Args:
+        name: 时间段名称，'.' 之前的部分作为分类（如 'binance.futures_create_order'）
+        args: 附加信息（显示在追踪查看器中）
+
+    Returns:
+        上下文管理器
+    """
+    writer = _tracer
+    if writer is None:
+        return _NULL_SPAN
+    trace_ids = getattr(_local, 'trace_ids', ())
+    if not trace_ids:
+        return _NULL_SPAN
+    return _Span(writer, name, trace_ids, args)
+
+
+def record_span(name: str, start_ns: int, trace_ids: Sequence[str], end_ns: Optional[int] = None, **args):
+    """
+    记录一个已经结束的时间段（开始时还没有追踪ID，如收到推送到解析出平仓信号）
+
+    Args:
+        name: 时间段名称
+        start_ns: 开始时间（now_ns()）
+        trace_ids: 追踪ID列表
+        end_ns: 结束时间，默认为现在
+        args: 附加信息
+    """
+    if _tracer is not None and trace_ids:
+        _tracer.record(name, start_ns, end_ns or time.perf_counter_ns(), tuple(trace_ids), args)
+
+
+def start_traces(positions: List[Dict], received_ns: int, name: str = 'monitor.parse', **args) -> List[str]:
+    """
+    为新检测到的平仓信号分配追踪ID，并记录从收到数据到解析完成的时间段
+
+    Args:
+        positions: 平仓信号列表（原地写入 'trace_id'）
+        received_ns: 收到数据的时间（now_ns()）
+        name: 时间段名称
+        args: 附加信息
+
+    Returns:
+        追踪ID列表
+    """
+    trace_ids = []
+    for position in positions:
+        trace_id = position.get(TRACE_ID_KEY) or new_trace_id()
+        position[TRACE_ID_KEY] = trace_id
+        trace_ids.append(trace_id)
+    if trace_ids:
+        record_span(name, received_ns, trace_ids, signals=len(positions), **args)
+    return trace_ids
+
+
+def wrap(func):
+    """
+    把当前线程的追踪ID传递给在其他线程中执行的函数（提交到线程池前调用）
+
+    Args:
+        func: 函数
+
+    Returns:
+        在执行时激活当前追踪ID的函数；当前没有追踪ID时返回原函数
+    """
+    trace_ids = getattr(_local, 'trace_ids', ())
+    if _tracer is None or not trace_ids:
+        return func
+
+    def traced(*args, **kwargs):
+        with activate(trace_ids):
+            return func(*args, **kwargs)
+    return traced
+
+
+class TracedClient:
+    """为客户端的每个方法调用记录时间段（只在处理信号的线程中记录，其他调用直接转发）"""
+
+    def __init__(self, client, category: str):
+        """
+        初始化
+
+        Args:
+            client: 被包装的客户端（如 binance.client.Client）
+            category: 时间段分类，时间段名称为 '<分类>.<方法名>'
+        """
+        self._client = client
+        self._category = category
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not callable(attr) or _tracer is None or not getattr(_local, 'trace_ids', ()):
+            return attr
+
+        def traced(*args, **kwargs):
+            with span(f"{self._category}.{name}"):
+                return attr(*args, **kwargs)
+        return traced
+
+
+def setup_tracer(trace_dir: str = 'traces', max_files: int = 20, process_name: str = 'hyper-binance') -> str:
+    """
+    启用追踪：在目录中创建本次运行的追踪文件，并删除超出数量的旧文件
+
+    Args:
+        trace_dir: 追踪文件目录
+        max_files: 最多保留的追踪文件数量（包括本次）
+        process_name: 追踪查看器中显示的进程名
+
+    Returns:
+        本次运行的追踪文件路径
+    """
+    global _tracer
+    shutdown_tracer()
+    os.makedirs(trace_dir, exist_ok=True)
+    old_files = sorted(glob.glob(os.path.join(trace_dir, 'trace_*.json')), key=os.path.getmtime)
+    for path in old_files[:max(len(old_files) - max_files + 1, 0)]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    path = os.path.join(trace_dir, f"trace_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.getpid()}.json")
+    _tracer = TraceWriter(path, process_name)
+    return path
+
+
+def shutdown_tracer():
+    """写完剩余事件并关闭追踪文件"""
+    global _tracer
+    if _tracer is None:
+        return
+    writer, _tracer = _tracer, None
+    writer.close()
+
+
+def is_enabled() -> bool:
+    """是否已启用追踪"""
+    return _tracer is not None
+
+
+atexit.register(shutdown_tracer)
+
+
+def load_events(paths: Iterable[str]) -> List[Dict]:
+    """
+    读取追踪文件中的时间段事件（兼容进程崩溃时未写完的文件）
+
+    Args:
+        paths: 追踪文件路径列表
+
+    Returns:
+        'X' 类型事件列表
+    """
+    events = []
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            text = f.read().strip()
+        if not text.endswith(']'):
+            text = text.rstrip(',') + ']'
+        events.extend(event for event in json.loads(text) if event.get('ph') == 'X')
+    return events
+
+
+def summarize_traces(events: List[Dict]) -> List[Dict]:
+    """
+    按追踪ID汇总时间段
+
+    一批信号共享的时间段（追踪ID以逗号分隔）计入其中每个信号
+
+    Args:
+        events: 'X' 类型事件列表
+
+    Returns:
+        每个追踪ID的汇总 {trace_id, start_us, total_ms, spans}，按总耗时从高到低排列；
+        spans 为 (名称, 相对开始时间ms, 耗时ms, 附加信息) 列表
+    """
+    traces = {}
+    for event in events:
+        for trace_id in event['args'].get(TRACE_ID_KEY, '').split(','):
+            if trace_id:
+                traces.setdefault(trace_id, []).append(event)
+
+    summaries = []
+    for trace_id, trace_events in traces.items():
+        trace_events.sort(key=lambda e: e['ts'])
+        start = trace_events[0]['ts']
+        end = max(e['ts'] + e['dur'] for e in trace_events)
+        summaries.append({
+            'trace_id': trace_id,
+            'start_us': start,
+            'total_ms': (end - start) / 1000,
+            'spans': [
+                (e['name'], (e['ts'] - start) / 1000, e['dur'] / 1000,
+                 {k: v for k, v in e['args'].items() if k != TRACE_ID_KEY})
+                for e in trace_events
+            ]
+        })
+    summaries.sort(key=lambda s: s['total_ms'], reverse=True)
+    return summaries
+
+
+def main(argv: Optional[List[str]] = None):
+    """命令行：汇总追踪文件，列出最慢的信号及其时间段"""
+    parser = argparse.ArgumentParser(description='汇总信号追踪文件')
+    parser.add_argument('paths', nargs='+', help='追踪文件（可同时传入多个进程的文件）')
+    parser.add_argument('--top', type=int, default=5, help='列出最慢的信号数量')
+    parser.add_argument('--trace-id', help='只显示指定追踪ID')
+    args = parser.parse_args(argv)
+
+    summaries = summarize_traces(load_events(args.paths))
+    if args.trace_id:
+        summaries = [s for s in summaries if s['trace_id'] == args.trace_id]
+        if not summaries:
+            print(f"未找到追踪ID: {args.trace_id}")
+            return 1
+    print(f"共 {len(summaries)} 个信号")
+    for summary in summaries[:args.top]:
+        print(f"\n追踪ID {summary['trace_id']}: 总耗时 {summary['total_ms']:.1f}ms")
+        for name, offset, duration, extra in summary['spans']:
+            detail = ' '.join(f"{k}={v}" for k, v in extra.items())
+            print(f"  +{offset:8.1f}ms {duration:8.1f}ms  {name} {detail}".rstrip())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,351 @@
+"""
+开单状态对账模块
+通过币安用户数据流维护各账户的持仓缓存，并与 trade_state 对账：
+- 持仓归零后自动重置该币种的开单状态
+- 开单状态与交易所持仓不一致时发出警报
+
+信号处理路径只读取 trade_state，对账全部在后台线程中完成，不增加下单前的请求
+"""
+import json
+import time
+import threading
+import logging
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+import websocket
+
+from order_book import FUTURES_WS_URL, TESTNET_WS_URL
+
+logger = logging.getLogger(__name__)
+
+LISTEN_KEY_KEEPALIVE_INTERVAL = 30 * 60  # listenKey有效期60分钟，每30分钟延长一次
+
+
+class AccountPositionCache:
+    """单个币安账户的持仓缓存（REST种子 + 用户数据流增量）"""
+
+    def __init__(self, name: str, trader, testnet: bool = False,
+                 on_change: Optional[Callable[[str, str], None]] = None, ws_url: Optional[str] = None):
+        """
+        初始化持仓缓存
+
+        Args:
+            name: 账户名称
+            trader: 该账户的BinanceTrader
+            testnet: 是否使用测试网
+            on_change: 持仓变化回调，参数为 (账户名称, 交易对)
+            ws_url: 自定义用户数据流地址（可选），设置后忽略 testnet
+        """
+        self.name = name
+        self.trader = trader
+        self.ws_base = ws_url or (TESTNET_WS_URL if testnet else FUTURES_WS_URL)
+        self.on_change = on_change
+
+        self.positions = {}  # 交易对 -> {持仓方向: 持仓数量}
+        self.seeded = False
+        self.last_refresh_time = 0
+        self.lock = threading.Lock()
+
+        self.ws = None
+        self.listen_key = None
+        self.running = False
+        self.reconnect_count = 0
+        self.event_count = 0
+
+    def refresh(self) -> bool:
+        """
+        通过REST接口全量刷新持仓（仅在后台调用）
+
+        Returns:
+            是否刷新成功
+        """
+        positions = self.trader.get_position_info()
+        if positions is None:
+            return False
+
+        snapshot = {}
+        for pos in positions:
+            side = pos.get('positionSide', 'BOTH')
+            snapshot.setdefault(pos['symbol'], {})[side] = float(pos.get('positionAmt', 0))
+
+        with self.lock:
+            self.positions = snapshot
+            self.seeded = True
+            self.last_refresh_time = time.time()
+        return True
+
+    def get_short_amount(self, symbol: str) -> Optional[float]:
+        """
+        获取某交易对的空头持仓数量（绝对值）
+
+        Args:
+            symbol: 交易对符号
+
+        Returns:
+            空头持仓数量，缓存尚未初始化时返回None
+        """
+        with self.lock:
+            if not self.seeded:
+                return None
+            sides = self.positions.get(symbol, {})
+            amount = sides.get('SHORT', 0)
+            # 单向持仓模式下负数表示空头
+            both = sides.get('BOTH', 0)
+            if both < 0:
+                amount += both
+            return abs(amount)
+
+    def _on_message(self, ws, message):
+        """用户数据流消息处理"""
+        try:
+            data = json.loads(message)
+            event_type = data.get('e')
+
+            if event_type == 'ACCOUNT_UPDATE':
+                self.event_count += 1
+                changed = []
+                with self.lock:
+                    for pos in data.get('a', {}).get('P', []):
+                        symbol = pos['s']
+                        self.positions.setdefault(symbol, {})[pos.get('ps', 'BOTH')] = float(pos['pa'])
+                        changed.append(symbol)
+
+                if self.on_change:
+                    for symbol in changed:
+                        self.on_change(self.name, symbol)
+
+            elif event_type == 'listenKeyExpired':
+                logger.warning(f"⚠️  账户 {self.name} listenKey已过期，重新连接用户数据流")
+                self.listen_key = None
+                ws.close()
+
+        except Exception as e:
+            logger.error(f"处理账户 {self.name} 用户数据流消息时发生错误: {e}")
+
+    def _on_open(self, ws):
+        """用户数据流连接建立"""
+        logger.info(f"✅ 账户 {self.name} 用户数据流已连接")
+        self.reconnect_count = 0
+
+    def _on_error(self, ws, error):
+        """用户数据流错误处理"""
+        logger.error(f"❌ 账户 {self.name} 用户数据流错误: {error}")
+
+    def _on_close(self, ws, close_status_code, close_msg):
+        """用户数据流关闭处理"""
+        logger.warning(f"⚠️  账户 {self.name} 用户数据流已关闭: {close_status_code} - {close_msg}")
+        if self.running:
+            self.reconnect_count += 1
+            wait_time = min(5 * (1.5 ** (self.reconnect_count - 1)), 30)
+            time.sleep(wait_time)
+            # 断线期间可能错过持仓变化，重连前全量刷新一次
+            self.refresh()
+            self._connect()
+
+    def _keepalive_worker(self):
+        """定期延长listenKey有效期"""
+        while self.running:
+            time.sleep(LISTEN_KEY_KEEPALIVE_INTERVAL)
+            if not self.running or not self.listen_key:
+                continue
+            try:
+                self.trader.client.futures_stream_keepalive(listenKey=self.listen_key)
+                logger.debug(f"账户 {self.name} listenKey已延期")
+            except Exception as e:
+                logger.error(f"账户 {self.name} listenKey延期失败: {e}")
+
+    def _connect(self):
+        """连接用户数据流"""
+        try:
+            if not self.listen_key:
+                self.listen_key = self.trader.client.futures_stream_get_listen_key()
+
+            self.ws = websocket.WebSocketApp(
+                f"{self.ws_base}/ws/{self.listen_key}",
+                on_open=self._on_open,
+                on_message=self._on_message,
+                on_error=self._on_error,
+                on_close=self._on_close
+            )
+            thread = threading.Thread(target=self.ws.run_forever, kwargs={'ping_interval': 0, 'ping_timeout': None})
+            thread.daemon = True
+            thread.start()
+        except Exception as e:
+            logger.error(f"连接账户 {self.name} 用户数据流失败: {e}")
+
+    def start(self):
+        """初始化持仓缓存并订阅用户数据流"""
+        self.running = True
+        if self.refresh():
+            logger.info(f"✅ 账户 {self.name} 持仓缓存已初始化")
+        self._connect()
+
+        thread = threading.Thread(target=self._keepalive_worker)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        """停止用户数据流"""
+        self.running = False
+        if self.ws:
+            self.ws.close()
+
+
+class TradeStateReconciler:
+    """开单状态对账类"""
+
+    def __init__(self, accounts: List[Dict], trading_pairs: Dict[str, str],
+                 get_trade_state: Callable[[], Dict], rearm: Callable[[str, str], None],
+                 alert: Callable[[str], None], testnet: bool = False,
+                 refresh_interval: int = 300, grace_seconds: int = 60,
+                 state_lock: Optional[threading.Lock] = None, ws_url: Optional[str] = None):
+        """
+        初始化对账器
+
+        Args:
+            accounts: 账户列表（MultiAccountTrader.accounts）
+            trading_pairs: 币种到交易对的映射
+            get_trade_state: 获取当前开单状态的函数
+            rearm: 重置某币种开单状态的函数，参数为 (币种, 原因)
+            alert: 发送不一致警报的函数，参数为警报内容
+            testnet: 是否使用测试网
+            refresh_interval: 后台REST全量刷新持仓的间隔（秒）
+            grace_seconds: 开单后的宽限时间（秒），期间不因持仓为空而重置（等待持仓推送到达）
+            state_lock: 开单状态锁（可选），与信号处理共用，避免在下单过程中对账
+            ws_url: 自定义用户数据流地址（可选），设置后忽略 testnet
+        """
+        self.trading_pairs = trading_pairs
+        self.symbol_to_coin = {symbol: coin for coin, symbol in trading_pairs.items()}
+        self.get_trade_state = get_trade_state
+        self.rearm = rearm
+        self.alert = alert
+        self.refresh_interval = refresh_interval
+        self.grace_seconds = grace_seconds
+
+        self.caches = [
+            AccountPositionCache(account['name'], account['trader'], testnet,
+                                 on_change=self._on_position_change, ws_url=ws_url)
+            for account in accounts
+        ]
+        self.flagged = {}  # 币种 -> 最近一次警报内容，避免重复警报
+        self.lock = state_lock or threading.Lock()
+        self.running = False
+
+        # 统计信息
+        self.rearm_count = 0
+        self.mismatch_count = 0
+
+    def set_trading_pairs(self, trading_pairs: Dict[str, str]):
+        """
+        更新对账的交易对（配置热加载时调用，持仓缓存包含所有交易对，无需重新订阅）
+
+        Args:
+            trading_pairs: 币种到交易对的映射
+        """
+        self.symbol_to_coin = {symbol: coin for coin, symbol in trading_pairs.items()}
+        self.trading_pairs = trading_pairs
+
+    def _on_position_change(self, account_name: str, symbol: str):
+        """持仓变化时只对账对应币种"""
+        coin = self.symbol_to_coin.get(symbol)
+        if coin:
+            self.reconcile_coin(coin)
+
+    def _opened_seconds_ago(self, state: Dict) -> Optional[float]:
+        """计算开单时间距今的秒数"""
+        try:
+            opened_at = datetime.strptime(state.get('timestamp', ''), '%Y-%m-%d %H:%M:%S')
+            return (datetime.now() - opened_at).total_seconds()
+        except ValueError:
+            return None
+
+    def reconcile_coin(self, coin: str):
+        """
+        对账单个币种
+
+        Args:
+            coin: 币种名称
+        """
+        symbol = self.trading_pairs.get(coin)
+        if not symbol:
+            return
+
+        with self.lock:
+            amounts = {cache.name: cache.get_short_amount(symbol) for cache in self.caches}
+            if any(amount is None for amount in amounts.values()):
+                # 仍有账户的持仓缓存未初始化，无法判断
+                return
+
+            state = self.get_trade_state().get(coin, {})
+            opened = state.get('opened', False)
+            open_accounts = [name for name, amount in amounts.items() if amount > 0]
+
+            if opened and not open_accounts:
+                elapsed = self._opened_seconds_ago(state)
+                if elapsed is not None and elapsed < self.grace_seconds:
+                    return
+                self.flagged.pop(coin, None)
+                self.rearm_count += 1
+                self.rearm(coin, f"{symbol} 在所有账户的空头持仓已归零")
+                return
+
+            if not opened and open_accounts:
+                self._flag(coin, f"{coin} 未记录开单，但账户 {', '.join(open_accounts)} 存在 {symbol} 空头持仓")
+                return
+
+            if opened:
+                # 记录中开单成功的账户应当都有持仓
+                expected = [name for name, info in state.get('accounts', {}).items() if info.get('success')]
+                missing = [name for name in expected if name in amounts and amounts[name] == 0]
+                if missing:
+                    self._flag(coin, f"{coin} 已记录开单，但账户 {', '.join(missing)} 的 {symbol} 空头持仓已归零")
+                    return
+
+            self.flagged.pop(coin, None)
+
+    def _flag(self, coin: str, message: str):
+        """记录并发送状态不一致警报（相同内容只警报一次）"""
+        if self.flagged.get(coin) == message:
+            return
+        self.flagged[coin] = message
+        self.mismatch_count += 1
+        logger.warning(f"⚠️  开单状态与交易所持仓不一致: {message}")
+        self.alert(message)
+
+    def reconcile_all(self):
+        """对账所有币种"""
+        for coin in self.trading_pairs:
+            self.reconcile_coin(coin)
+
+    def _refresh_worker(self):
+        """后台定期全量刷新持仓并对账，兜底用户数据流可能遗漏的变化"""
+        while self.running:
+            time.sleep(self.refresh_interval)
+            if not self.running:
+                break
+            for cache in self.caches:
+                cache.refresh()
+            self.reconcile_all()
+
+    def _start_worker(self):
+        """初始化所有账户的持仓缓存，完成后立即对账（校验启动时加载的开单状态）"""
+        for cache in self.caches:
+            cache.start()
+        self.reconcile_all()
+        logger.info(f"✅ 启动对账完成 (重置: {self.rearm_count}, 不一致: {self.mismatch_count})")
+        self._refresh_worker()
+
+    def start(self):
+        """在后台线程中启动对账"""
+        logger.info("启动开单状态对账...")
+        self.running = True
+        thread = threading.Thread(target=self._start_worker)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        """停止对账"""
+        self.running = False
+        for cache in self.caches:
+            cache.stop()